@@ -12,8 +12,13 @@ from config.settings import Config
 # 创建扩展
 db = SQLAlchemy()
 
-def create_app(config_class=Config):
-    """应用工厂函数"""
+def create_app(config_class=Config, init_sensors=True):
+    """应用工厂函数
+    
+    Args:
+        config_class: 配置类
+        init_sensors: 是否初始化并启动传感器采集（管理脚本中关闭）
+    """
     # 获取项目根目录的绝对路径
     base_dir = Path(__file__).parent.parent
     
@@ -37,14 +42,141 @@ def create_app(config_class=Config):
     template_path = Path(app.template_folder) / 'sensor_dashboard_dual.html'
     print(f"  模板文件存在: {template_path.exists()}")
     
-    # 初始化传感器管理器
+    # 选择原始数据模型（standard / compact）
+    from app.models import SENSOR_MODELS, SensorData
+    schema = app.config.get('STORAGE_SCHEMA', 'standard')
+    app.sensor_model = SENSOR_MODELS.get(schema, SensorData)
+    if schema not in SENSOR_MODELS:
+        print(f"⚠️ 未知的存储模式 {schema}，使用standard")
+    print(f"  原始数据表: {app.sensor_model.__tablename__}")
+    
+    # 读写分离的数据库连接（写入长连接 + 只读连接池）
+    from app.storage.engines import DatabaseEngines
+    app.storage = DatabaseEngines(
+        app.config['DATABASE_PATH'],
+        pragmas=app.config.get('SQLITE_PRAGMAS'),
+        read_pool_size=app.config.get('READ_POOL_SIZE', 4),
+        slow_ms=app.config.get('SLOW_QUERY_MS', 200)
+    )
+    
+    # 初始化按月分区存储（可选）
+    app.partition_store = None
+    if app.config.get('STORAGE_PARTITIONING') == 'monthly':
+        try:
+            from app.storage.partitions import MonthlyPartitionStore
+            app.partition_store = MonthlyPartitionStore(
+                app.config['PARTITION_DIR'],
+                app.sensor_model.__table__,
+                pragmas=app.config.get('SQLITE_PRAGMAS')
+            )
+            print(f"  分区存储目录: {app.config['PARTITION_DIR']}")
+        except Exception as e:
+            print(f"❌ 分区存储初始化失败: {e}")
+    
+    # 初始化列式归档（可选）
+    app.archive = None
+    if app.config.get('ARCHIVE_ENABLED'):
+        try:
+            from app.storage.archive import ColumnarArchive
+            app.archive = ColumnarArchive(app.config['ARCHIVE_DIR'], app.sensor_model.__table__,
+                                          app.config['NODE_ID'])
+            print(f"  归档目录: {app.config['ARCHIVE_DIR']}")
+        except Exception as e:
+            print(f"❌ 列式归档初始化失败: {e}")
+    
+    # 初始化SGP41原始信号环形文件（可选）
+    app.raw_ring = None
+    if app.config.get('SGP41_RAW_RING_ENABLED'):
+        try:
+            from app.storage.ring import RawRingFile
+            app.raw_ring = RawRingFile(
+                app.config['SGP41_RAW_RING_PATH'],
+                capacity=app.config.get('SGP41_RAW_RING_DAYS', 30) * 86400
+            )
+            print(f"  SGP41原始信号文件: {app.config['SGP41_RAW_RING_PATH']}")
+        except Exception as e:
+            print(f"❌ SGP41原始信号文件初始化失败: {e}")
+    
+    # 初始化存储后端（API查询和批量写入都通过它进行）
+    from app.storage.backends import create_backend, SQLAlchemyBackend
     try:
-        from app.sensors.manager import SensorManager
-        sensor_manager = SensorManager(app)  # 传递应用实例
-        app.sensor_manager = sensor_manager
+        app.storage_backend = create_backend(app)
     except Exception as e:
-        print(f"警告: 传感器管理器初始化失败: {e}")
-        app.sensor_manager = None
+        print(f"❌ 存储后端 {app.config.get('STORAGE_BACKEND')} 初始化失败，使用SQLite: {e}")
+        app.storage_backend = SQLAlchemyBackend(
+            app.storage, app.sensor_model.__table__,
+            partition_store=app.partition_store, archive=app.archive
+        )
+    print(f"  存储后端: {app.storage_backend.name}")
+    
+    # 初始化写入缓冲文件（数据库不可写时暂存采集数据）
+    app.write_spool = None
+    if app.config.get('WRITE_SPOOL_ENABLED'):
+        try:
+            from app.storage.spool import WriteSpool
+            app.write_spool = WriteSpool(
+                app.config['WRITE_SPOOL_PATH'],
+                dead_letter_path=app.config.get('WRITE_SPOOL_DEAD_LETTER_PATH')
+            )
+            print(f"  写入缓冲文件: {app.config['WRITE_SPOOL_PATH']} (待回放 {app.write_spool.pending} 条)")
+        except Exception as e:
+            print(f"❌ 写入缓冲文件初始化失败: {e}")
+    
+    # 初始化批量接收服务（其他节点通过 /api/ingest 上传读数）
+    app.ingest_service = None
+    if app.config.get('INGEST_ENABLED'):
+        if app.config.get('INGEST_TOKEN'):
+            from app.storage.ingest import IngestService
+            app.ingest_service = IngestService(app)
+            print("  批量接收: /api/ingest")
+        else:
+            print("⚠️ 已启用批量接收但未设置 INGEST_TOKEN，/api/ingest 不可用")
+    
+    # 初始化数据保留管理器
+    from app.storage.retention import RetentionManager
+    app.retention_manager = RetentionManager(
+        app,
+        policies=app.config.get('RETENTION_POLICIES'),
+        interval=app.config.get('RETENTION_INTERVAL', 3600),
+        chunk_size=app.config.get('RETENTION_CHUNK_SIZE', 500),
+        chunk_pause=app.config.get('RETENTION_CHUNK_PAUSE', 0.2),
+        vacuum_pages=app.config.get('RETENTION_VACUUM_PAGES', 2000),
+        analyze_interval=app.config.get('RETENTION_ANALYZE_INTERVAL', 86400),
+        archive=app.archive,
+        archive_after_days=app.config.get('ARCHIVE_AFTER_DAYS')
+    )
+    
+    # 初始化存储转发上传器（本机记录推送到中心节点）
+    app.uploader = None
+    if app.config.get('UPLOAD_ENABLED'):
+        if app.config.get('UPLOAD_URL'):
+            from app.storage.uploader import Uploader
+            app.uploader = Uploader(
+                app,
+                url=app.config['UPLOAD_URL'],
+                token=app.config.get('UPLOAD_TOKEN'),
+                state_path=app.config.get('UPLOAD_STATE_PATH'),
+                batch_size=app.config.get('UPLOAD_BATCH_SIZE', 2000),
+                interval=app.config.get('UPLOAD_INTERVAL', 300),
+                timeout=app.config.get('UPLOAD_TIMEOUT', 30),
+                retry_min=app.config.get('UPLOAD_RETRY_MIN', 10),
+                retry_max=app.config.get('UPLOAD_RETRY_MAX', 900),
+                compress_level=app.config.get('UPLOAD_COMPRESS_LEVEL', 6)
+            )
+            print(f"  上传目标: {app.uploader.url} (高水位: {app.uploader.state.get('last_timestamp')})")
+        else:
+            print("⚠️ 已启用上传但未设置 UPLOAD_URL")
+    
+    # 初始化传感器管理器
+    app.sensor_manager = None
+    if init_sensors:
+        try:
+            from app.sensors.manager import SensorManager
+            sensor_manager = SensorManager(app)  # 传递应用实例
+            app.sensor_manager = sensor_manager
+        except Exception as e:
+            print(f"警告: 传感器管理器初始化失败: {e}")
+            app.sensor_manager = None
     
     # 注册蓝图
     try:
@@ -105,14 +237,50 @@ def create_app(config_class=Config):
     
     # 在应用上下文中初始化数据库
     with app.app_context():
+        # 注册SQLite连接PRAGMA（必须在首次连接前完成）
+        try:
+            from app.storage.sqlite_tuning import install_sqlite_pragmas
+            install_sqlite_pragmas(db.engine, app.config.get('SQLITE_PRAGMAS', {}))
+        except Exception as e:
+            print(f"❌ SQLite PRAGMA配置失败: {e}")
+        
         # 导入模型并创建表
         try:
-            from app.models import SensorData
             db.create_all()
             print("✅ 数据库表已创建")
         except Exception as e:
             print(f"❌ 数据库表创建失败: {e}")
         
+        # 为已有数据库补建索引，并打印端点查询计划
+        try:
+            from app.models import SensorRollup
+            from app.storage.migrations import ensure_columns, ensure_indexes, print_query_plans
+            # 升级前的记录都来自本机，节点列用本机标识回填
+            node_default = {'node_id': app.config['NODE_ID']}
+            for table in (app.sensor_model.__table__, SensorRollup.__table__):
+                added = ensure_columns(db.engine, table, node_default)
+                if added:
+                    print(f"✅ {table.name} 已补建列: {', '.join(added)}")
+            if app.partition_store is not None:
+                app.partition_store.open_all()
+            created = ensure_indexes(db.engine, app.sensor_model.__table__)
+            if created:
+                print(f"✅ 已补建索引: {', '.join(created)}")
+            if app.config.get('EXPLAIN_QUERIES_ON_STARTUP'):
+                print_query_plans(db.session)
+        except Exception as e:
+            print(f"❌ 索引迁移失败: {e}")
+        
+        # 汇总表为空但已有原始数据时提示回填
+        try:
+            from app.models import SensorRollup
+            from app.storage.query import count_rows
+            if app.storage_backend.name == 'sqlite' and SensorRollup.query.first() is None \
+                    and count_rows() > 0:
+                print("⚠️ 汇总表为空，请运行 python manage_db.py rebuild-rollups 回填历史数据")
+        except Exception as e:
+            print(f"❌ 汇总表检查失败: {e}")
+        
         # 启动传感器管理器
         if app.sensor_manager:
             try:
@@ -120,6 +288,22 @@ def create_app(config_class=Config):
                 print("✅ 传感器管理器已启动")
             except Exception as e:
                 print(f"❌ 传感器管理器启动失败: {e}")
+        
+        # 启动数据保留任务
+        if init_sensors and app.config.get('RETENTION_ENABLED'):
+            try:
+                app.retention_manager.start(app)
+                print("✅ 数据保留任务已启动")
+            except Exception as e:
+                print(f"❌ 数据保留任务启动失败: {e}")
+        
+        # 启动存储转发上传
+        if init_sensors and app.uploader:
+            try:
+                app.uploader.start(app)
+                print("✅ 存储转发上传已启动")
+            except Exception as e:
+                print(f"❌ 存储转发上传启动失败: {e}")
     
     return app
 
@@ -3,70 +3,308 @@
 图表API模块
 """
 
+import math
 from flask import Blueprint, jsonify, request
 from datetime import datetime, timedelta
-from app import db
-from app.models import SensorData
+from app.storage.query import fetch_series, fetch_buckets
+from app.storage.rollups import from_epoch, window_columns
+from app.storage.deadband import resample_steps
+from app.api.routes import node_arg, parse_utc_arg
 from app.utils.time_utils import utc_to_local
+from app.utils.downsample import envelope, pick, select_indices, to_seconds
 from app.utils.data_utils import generate_co2_sample_data, generate_temp_humi_sample_data
 from config.settings import Config
+from config.sensors import SensorConfig
 from config.logging_config import get_logger
 
 logger = get_logger(__name__)
 
 charts_bp = Blueprint('charts', __name__)
 
+
+# 各图表读取的列（与模型中的部分覆盖索引一一对应）
+CO2_COLUMNS = ['scd40_co2']
+TEMP_HUMI_COLUMNS = ['dht22_temperature', 'dht22_humidity']
+VOC_NOX_COLUMNS = ['sgp41_voc_index', 'sgp41_nox_index']
+
+# 自动选择桶宽度时的候选值（秒），包含各汇总层级，长时间范围直接合并汇总表
+CHART_STEPS = (60, 120, 300, 600, 900, 1800, 3600, 7200, 10800, 21600, 43200, 86400)
+
+
+def format_chart_label(utc_dt, hours):
+    """将UTC时间转换为本地时间标签"""
+    local_time = utc_to_local(utc_dt)
+    if hours <= 24:
+        # 24小时内显示小时:分钟
+        return local_time.strftime('%H:%M')
+    # 超过24小时显示月-日 小时:分钟
+    return local_time.strftime('%m-%d %H:%M')
+
+
+def wants_bands():
+    """请求是否需要最小/最大值区间（?bands=true）"""
+    return request.args.get('bands', default='false').lower() in ('1', 'true', 'yes')
+
+
+def band_columns(columns):
+    """图表区间需要额外读取的窗口最小/最大值列"""
+    return [name for name in window_columns(columns) if not name.endswith('_count')]
+
+
+def raw_chart_bands(records, columns):
+    """原始数据的区间：每条记录的窗口最小/最大值（没有窗口统计时取该值本身）"""
+    bands = {}
+    for column in columns:
+        low, high = [], []
+        for record in records:
+            value = getattr(record, column)
+            record_low = getattr(record, f'{column}_min', None)
+            record_high = getattr(record, f'{column}_max', None)
+            low.append(value if record_low is None else record_low)
+            high.append(value if record_high is None else record_high)
+        bands[column] = {'min': low, 'max': high}
+    return bands
+
+
+def with_bands(response, bands, names):
+    """按需在图表响应中加入区间数据（names: 列名 -> 响应中的名称），datasets保持不变"""
+    if bands is not None:
+        response['bands'] = {key: bands[column] for column, key in names.items()}
+    return response
+
+
+def max_points_arg():
+    """?max_points= 每个图表最多返回的点数：返回 (点数, 错误响应)，0表示不降采样"""
+    max_points = request.args.get('max_points', default=Config.CHART_MAX_POINTS, type=int)
+    if max_points < 0:
+        return None, (jsonify({'error': 'max_points不能为负数'}), 400)
+    return max_points, None
+
+
+def reduce_chart(max_points, times, labels, series, bands=None):
+    """点数超过max_points时按LTTB降采样：返回 (labels, series, bands)
+
+    series为各数据集的值列表（共用同一组选中点）；区间改为每个选中点覆盖的原始点的最小/最大值，
+    降采样后区间仍包含全部原始值
+    """
+    indices = select_indices(to_seconds(times), series, max_points)
+    if indices is None:
+        return labels, series, bands
+    labels = pick(labels, indices)
+    series = [pick(values, indices) for values in series]
+    if bands is not None:
+        bands = {
+            column: {stat: envelope(values[stat], indices, stat) for stat in ('min', 'max')}
+            for column, values in bands.items()
+        }
+    return labels, series, bands
+
+
+def raw_interval():
+    """原始记录的采集间隔（秒）"""
+    return min(SensorConfig.DHT22_CONFIG['poll_interval'], SensorConfig.SCD40_CONFIG['poll_interval'])
+
+
+def auto_step(span_seconds, max_points):
+    """按点数上限选择桶宽度（秒）；返回None时读取原始数据（点数超过max_points时LTTB降采样）
+
+    范围内的原始记录不超过CHART_RAW_MAX_ROWS（默认7天）时读取原始数据，LTTB保留峰谷形状；
+    更长的范围才按 时间范围/max_points 选择桶宽度，由汇总表或SQL聚合得到桶平均值。max_points为0时始终读取原始数据
+    """
+    interval = raw_interval()
+    if not max_points or span_seconds / interval <= Config.CHART_RAW_MAX_ROWS:
+        return None
+    target = span_seconds / max_points
+    if target <= interval:
+        return None
+    for step in CHART_STEPS:
+        if step >= target:
+            return step
+    return math.ceil(target / 86400) * 86400
+
+
+def chart_range(max_points):
+    """图表时间范围参数：返回 (start, end, step, 错误响应)
+
+    start/end 为ISO格式（不带时区时视为UTC），省略时为到现在为止的最近hours小时（默认24）；
+    step 为桶宽度（秒），省略时按max_points自动选择，为None表示读取原始数据
+    """
+    start, error = parse_utc_arg('start')
+    if error:
+        return None, None, None, error
+    end, error = parse_utc_arg('end')
+    if error:
+        return None, None, None, error
+    
+    hours = request.args.get('hours', default=24, type=int)
+    end = end or datetime.utcnow()
+    start = start or end - timedelta(hours=hours)
+    if start >= end:
+        return None, None, None, (jsonify({'error': 'start必须早于end'}), 400)
+    
+    span = (end - start).total_seconds()
+    step = request.args.get('step', type=int)
+    if step is None:
+        return start, end, auto_step(span, max_points), None
+    if step < 1:
+        return None, None, None, (jsonify({'error': 'step必须为正整数（秒）'}), 400)
+    if span / step > Config.CHART_MAX_BUCKETS:
+        return None, None, None, (jsonify({'error': f'桶数超过上限{Config.CHART_MAX_BUCKETS}，请增大step'}), 400)
+    return start, end, step, None
+
+
+def raw_chart_records(columns, start, end, extra=(), node=None):
+    """读取图表的原始数据（按时间升序）
+
+    extra: 额外读取的列（如窗口最小/最大值），不参与非空筛选
+    死区存储模式下原始表只有变化的值，按阶梯序列重采样为采集间隔的等间隔点
+    """
+    names = list(columns) + list(extra)
+    if not Config.DEADBAND_ENABLED:
+        return fetch_series(names, start=start, end=end, require=columns, node=node)
+
+    hold = Config.DEADBAND_HOLD
+    # 向前多读一个保持时长，取得时间范围起点处的值
+    rows = fetch_series(names, start=start - timedelta(seconds=hold), end=end, require=columns, node=node)
+    return resample_steps(rows, names, start, end, raw_interval(), hold)
+
+
+def bucket_chart_series(columns, start, end, step, hours, precision=1, node=None):
+    """按step秒的时间桶读取图表数据（一条GROUP BY语句；每个桶取平均值，区间为每个桶的最小/最大值）
+
+    返回None表示时间范围内没有数据
+    """
+    buckets = fetch_buckets(columns, step, start, end, node=node)
+    if not buckets:
+        return None
+    
+    times = []
+    labels = []
+    data = {column: [] for column in columns}
+    bands = {column: {'min': [], 'max': []} for column in columns}
+    totals = {column: {'count': 0, 'sum': 0.0, 'min': None, 'max': None} for column in columns}
+    
+    for bucket, metrics in buckets:
+        times.append(from_epoch(bucket))
+        labels.append(format_chart_label(times[-1], hours))
+        
+        for column in columns:
+            row = metrics.get(column)
+            if row is None or not row.count:
+                data[column].append(None)
+                bands[column]['min'].append(None)
+                bands[column]['max'].append(None)
+                continue
+            
+            avg = row.sum / row.count
+            data[column].append(int(round(avg)) if precision == 0 else round(avg, precision))
+            bands[column]['min'].append(row.min)
+            bands[column]['max'].append(row.max)
+            
+            total = totals[column]
+            total['count'] += row.count
+            total['sum'] += row.sum
+            total['min'] = row.min if total['min'] is None else min(total['min'], row.min)
+            total['max'] = row.max if total['max'] is None else max(total['max'], row.max)
+    
+    ranges = {
+        column: {
+            'min': total['min'],
+            'max': total['max'],
+            'avg': total['sum'] / total['count'] if total['count'] else None
+        }
+        for column, total in totals.items()
+    }
+    
+    return {
+        'step': step,
+        'times': times,
+        'labels': labels,
+        'data': data,
+        'bands': bands,
+        'range': ranges
+    }
+
+
+def empty_voc_nox_response():
+    """没有VOC/NOx数据时的响应"""
+    return jsonify({
+        'success': True,
+        'count': 0,
+        'labels': [],
+        'datasets': [],
+        'units': 'index',
+        'source': 'SGP41',
+        'timezone': f"UTC+{Config.TIMEZONE_OFFSET}",
+        'range': {
+            'voc': {'min': None, 'max': None, 'avg': None},
+            'nox': {'min': None, 'max': None, 'avg': None}
+        }
+    })
+
 @charts_bp.route('/co2', methods=['GET'])
 def get_co2_chart_data():
     """获取CO2历史数据图表"""
     try:
-        hours = request.args.get('hours', default=24, type=int)
-        
-        # 先检查是否有真实数据
-        record_count = SensorData.query.filter(
-            SensorData.scd40_co2.isnot(None)
-        ).count()
-        
-        if record_count == 0:
-            # 没有数据，返回示例数据
-            return jsonify(generate_co2_sample_data(hours))
-        
-        # 计算时间范围（UTC时间）
-        time_limit = datetime.utcnow() - timedelta(hours=hours)
-        query = SensorData.query.filter(
-            SensorData.timestamp >= time_limit,
-            SensorData.scd40_co2.isnot(None)
-        )
-        
-        # 获取数据并按时间排序
-        records = query.order_by(SensorData.timestamp.asc()).all()
-        
-        if not records:
-            # 指定时间范围内没有数据，返回示例数据
-            return jsonify(generate_co2_sample_data(hours))
-        
-        timestamps = []
-        co2_data = []
+        bands = wants_bands()
+        node, error = node_arg()
+        if error:
+            return error
+        max_points, error = max_points_arg()
+        if error:
+            return error
+        start, end, step, error = chart_range(max_points)
+        if error:
+            return error
+        hours = (end - start).total_seconds() / 3600
         
-        for record in records:
-            if record.timestamp:
-                # 转换为本地时间
-                local_time = utc_to_local(record.timestamp)
+        # 按桶聚合（一条GROUP BY语句），范围内原始记录不多时直接读取原始数据
+        if step:
+            series = bucket_chart_series(CO2_COLUMNS, start, end, step, hours, precision=0, node=node)
+            
+            if series is None:
+                # 指定时间范围内没有数据，返回示例数据
+                return jsonify(generate_co2_sample_data(max(1, round(hours))))
+            
+            times = series['times']
+            timestamps = series['labels']
+            co2_data = series['data']['scd40_co2']
+            co2_range = series['range']['scd40_co2']
+            band = series['bands'] if bands else None
+            resolution = step
+        else:
+            # 获取数据并按时间排序
+            records = raw_chart_records(CO2_COLUMNS, start, end, band_columns(CO2_COLUMNS) if bands else (),
+                                        node=node)
+            
+            if not records:
+                # 指定时间范围内没有数据，返回示例数据
+                return jsonify(generate_co2_sample_data(max(1, round(hours))))
+            
+            times = [record.timestamp for record in records]
+            timestamps = []
+            co2_data = []
+            
+            for record in records:
+                if record.timestamp:
+                    timestamps.append(format_chart_label(record.timestamp, hours))
                 
-                # 根据时间范围格式化时间标签
-                if hours <= 24:
-                    # 24小时内显示小时:分钟
-                    timestamps.append(local_time.strftime('%H:%M'))
-                else:
-                    # 超过24小时显示月-日 小时:分钟
-                    timestamps.append(local_time.strftime('%m-%d %H:%M'))
+                # 只使用SCD40的CO2数据
+                co2_data.append(record.scd40_co2)
             
-            # 只使用SCD40的CO2数据
-            co2_data.append(record.scd40_co2)
+            co2_range = {
+                'min': min(co2_data) if co2_data else None,
+                'max': max(co2_data) if co2_data else None,
+                'avg': sum(co2_data)/len(co2_data) if co2_data else None
+            }
+            band = raw_chart_bands(records, CO2_COLUMNS) if bands else None
+            resolution = 'raw'
         
-        return jsonify({
+        timestamps, (co2_data,), band = reduce_chart(max_points, times, timestamps, [co2_data], band)
+        
+        return jsonify(with_bands({
             'success': True,
-            'count': len(records),
+            'count': len(co2_data),
             'labels': timestamps,
             'datasets': [{
                 'label': 'CO₂浓度',
@@ -79,12 +317,9 @@ def get_co2_chart_data():
             'units': 'ppm',
             'source': 'SCD40',
             'timezone': f"UTC+{Config.TIMEZONE_OFFSET}",
-            'range': {
-                'min': min(co2_data) if co2_data else None,
-                'max': max(co2_data) if co2_data else None,
-                'avg': sum(co2_data)/len(co2_data) if co2_data else None
-            }
-        })
+            'resolution': resolution,
+            'range': co2_range
+        }, band, {'scd40_co2': 'co2'}))
     
     except Exception as e:
         logger.error(f"获取CO2图表数据失败: {e}")
@@ -95,61 +330,63 @@ def get_co2_chart_data():
 def get_temperature_humidity_chart_data():
     """获取温湿度历史数据图表"""
     try:
-        hours = request.args.get('hours', default=24, type=int)
-        
-        # 先检查是否有真实数据
-        record_count = SensorData.query.filter(
-            db.or_(
-                SensorData.dht22_temperature.isnot(None),
-                SensorData.dht22_humidity.isnot(None)
-            )
-        ).count()
-        
-        if record_count == 0:
-            # 没有数据，返回示例数据
-            return jsonify(generate_temp_humi_sample_data(hours))
-        
-        # 计算时间范围（UTC时间）
-        time_limit = datetime.utcnow() - timedelta(hours=hours)
-        query = SensorData.query.filter(
-            SensorData.timestamp >= time_limit,
-            db.or_(
-                SensorData.dht22_temperature.isnot(None),
-                SensorData.dht22_humidity.isnot(None)
-            )
-        )
+        bands = wants_bands()
+        node, error = node_arg()
+        if error:
+            return error
+        max_points, error = max_points_arg()
+        if error:
+            return error
+        start, end, step, error = chart_range(max_points)
+        if error:
+            return error
+        hours = (end - start).total_seconds() / 3600
         
-        # 获取数据并按时间排序
-        records = query.order_by(SensorData.timestamp.asc()).all()
-        
-        if not records:
-            # 指定时间范围内没有数据，返回示例数据
-            return jsonify(generate_temp_humi_sample_data(hours))
-        
-        timestamps = []
-        temperature_data = []
-        humidity_data = []
-        
-        for record in records:
-            if record.timestamp:
-                # 转换为本地时间
-                local_time = utc_to_local(record.timestamp)
+        # 按桶聚合（一条GROUP BY语句），范围内原始记录不多时直接读取原始数据
+        if step:
+            series = bucket_chart_series(TEMP_HUMI_COLUMNS, start, end, step, hours, precision=1, node=node)
+            
+            if series is None:
+                # 指定时间范围内没有数据，返回示例数据
+                return jsonify(generate_temp_humi_sample_data(max(1, round(hours))))
+            
+            times = series['times']
+            timestamps = series['labels']
+            temperature_data = series['data']['dht22_temperature']
+            humidity_data = series['data']['dht22_humidity']
+            band = series['bands'] if bands else None
+            resolution = step
+        else:
+            # 获取数据并按时间排序
+            records = raw_chart_records(TEMP_HUMI_COLUMNS, start, end,
+                                        band_columns(TEMP_HUMI_COLUMNS) if bands else (), node=node)
+            
+            if not records:
+                # 指定时间范围内没有数据，返回示例数据
+                return jsonify(generate_temp_humi_sample_data(max(1, round(hours))))
+            
+            times = [record.timestamp for record in records]
+            timestamps = []
+            temperature_data = []
+            humidity_data = []
+            
+            for record in records:
+                if record.timestamp:
+                    timestamps.append(format_chart_label(record.timestamp, hours))
                 
-                # 根据时间范围格式化时间标签
-                if hours <= 24:
-                    # 24小时内显示小时:分钟
-                    timestamps.append(local_time.strftime('%H:%M'))
-                else:
-                    # 超过24小时显示月-日 小时:分钟
-                    timestamps.append(local_time.strftime('%m-%d %H:%M'))
+                # 只使用DHT22的温湿度数据
+                temperature_data.append(record.dht22_temperature)
+                humidity_data.append(record.dht22_humidity)
             
-            # 只使用DHT22的温湿度数据
-            temperature_data.append(record.dht22_temperature)
-            humidity_data.append(record.dht22_humidity)
+            band = raw_chart_bands(records, TEMP_HUMI_COLUMNS) if bands else None
+            resolution = 'raw'
         
-        return jsonify({
+        timestamps, (temperature_data, humidity_data), band = reduce_chart(
+            max_points, times, timestamps, [temperature_data, humidity_data], band)
+        
+        return jsonify(with_bands({
             'success': True,
-            'count': len(records),
+            'count': len(timestamps),
             'labels': timestamps,
             'datasets': [
                 {
@@ -179,8 +416,9 @@ def get_temperature_humidity_chart_data():
                 'temperature': 'DHT22',
                 'humidity': 'DHT22'
             },
-            'timezone': f"UTC+{Config.TIMEZONE_OFFSET}"
-        })
+            'timezone': f"UTC+{Config.TIMEZONE_OFFSET}",
+            'resolution': resolution
+        }, band, {'dht22_temperature': 'temperature', 'dht22_humidity': 'humidity'}))
     
     except Exception as e:
         logger.error(f"获取温湿度图表数据失败: {e}")
@@ -191,89 +429,80 @@ def get_temperature_humidity_chart_data():
 def get_voc_nox_chart_data():
     """获取VOC/NOx图表数据（使用真实数据）"""
     try:
-        hours = request.args.get('hours', default=24, type=int)
-        
-        # 先检查是否有真实数据
-        record_count = SensorData.query.filter(
-            db.or_(
-                SensorData.sgp41_voc_index.isnot(None),
-                SensorData.sgp41_nox_index.isnot(None)
-            )
-        ).count()
-        
-        if record_count == 0:
-            # 没有数据，返回空数据
-            return jsonify({
-                'success': True,
-                'count': 0,
-                'labels': [],
-                'datasets': [],
-                'units': 'index',
-                'source': 'SGP41',
-                'timezone': f"UTC+{Config.TIMEZONE_OFFSET}",
-                'range': {
-                    'voc': {'min': None, 'max': None, 'avg': None},
-                    'nox': {'min': None, 'max': None, 'avg': None}
-                }
-            })
-        
-        # 计算时间范围（UTC时间）
-        time_limit = datetime.utcnow() - timedelta(hours=hours)
-        query = SensorData.query.filter(
-            SensorData.timestamp >= time_limit,
-            db.or_(
-                SensorData.sgp41_voc_index.isnot(None),
-                SensorData.sgp41_nox_index.isnot(None)
-            )
-        )
-        
-        # 获取数据并按时间排序
-        records = query.order_by(SensorData.timestamp.asc()).all()
-        
-        if not records:
-            # 指定时间范围内没有数据
-            return jsonify({
-                'success': True,
-                'count': 0,
-                'labels': [],
-                'datasets': [],
-                'units': 'index',
-                'source': 'SGP41',
-                'timezone': f"UTC+{Config.TIMEZONE_OFFSET}",
-                'range': {
-                    'voc': {'min': None, 'max': None, 'avg': None},
-                    'nox': {'min': None, 'max': None, 'avg': None}
-                }
-            })
+        bands = wants_bands()
+        node, error = node_arg()
+        if error:
+            return error
+        max_points, error = max_points_arg()
+        if error:
+            return error
         
-        timestamps = []
-        voc_data = []
-        nox_data = []
+        start, end, step, error = chart_range(max_points)
+        if error:
+            return error
+        hours = (end - start).total_seconds() / 3600
         
-        for record in records:
-            if record.timestamp:
-                # 转换为本地时间
-                local_time = utc_to_local(record.timestamp)
+        # 按桶聚合（一条GROUP BY语句），范围内原始记录不多时直接读取原始数据
+        if step:
+            series = bucket_chart_series(VOC_NOX_COLUMNS, start, end, step, hours, precision=0, node=node)
+            
+            if series is None:
+                # 指定时间范围内没有数据，返回空数据
+                return empty_voc_nox_response()
+            
+            times = series['times']
+            timestamps = series['labels']
+            voc_data = series['data']['sgp41_voc_index']
+            nox_data = series['data']['sgp41_nox_index']
+            voc_range = series['range']['sgp41_voc_index']
+            nox_range = series['range']['sgp41_nox_index']
+            band = series['bands'] if bands else None
+            resolution = step
+        else:
+            # 获取数据并按时间排序
+            records = raw_chart_records(VOC_NOX_COLUMNS, start, end,
+                                        band_columns(VOC_NOX_COLUMNS) if bands else (), node=node)
+            
+            if not records:
+                # 指定时间范围内没有数据
+                return empty_voc_nox_response()
+            
+            times = [record.timestamp for record in records]
+            timestamps = []
+            voc_data = []
+            nox_data = []
+            
+            for record in records:
+                if record.timestamp:
+                    timestamps.append(format_chart_label(record.timestamp, hours))
                 
-                # 根据时间范围格式化时间标签
-                if hours <= 24:
-                    # 24小时内显示小时:分钟
-                    timestamps.append(local_time.strftime('%H:%M'))
-                else:
-                    # 超过24小时显示月-日 小时:分钟
-                    timestamps.append(local_time.strftime('%m-%d %H:%M'))
+                # 使用SGP41的VOC/NOx数据
+                voc_data.append(record.sgp41_voc_index)
+                nox_data.append(record.sgp41_nox_index)
             
-            # 使用SGP41的VOC/NOx数据
-            voc_data.append(record.sgp41_voc_index)
-            nox_data.append(record.sgp41_nox_index)
+            # 计算统计信息
+            voc_valid_data = [v for v in voc_data if v is not None]
+            nox_valid_data = [v for v in nox_data if v is not None]
+            
+            voc_range = {
+                'min': min(voc_valid_data) if voc_valid_data else None,
+                'max': max(voc_valid_data) if voc_valid_data else None,
+                'avg': sum(voc_valid_data)/len(voc_valid_data) if voc_valid_data else None
+            }
+            nox_range = {
+                'min': min(nox_valid_data) if nox_valid_data else None,
+                'max': max(nox_valid_data) if nox_valid_data else None,
+                'avg': sum(nox_valid_data)/len(nox_valid_data) if nox_valid_data else None
+            }
+            band = raw_chart_bands(records, VOC_NOX_COLUMNS) if bands else None
+            resolution = 'raw'
         
-        # 计算统计信息
-        voc_valid_data = [v for v in voc_data if v is not None]
-        nox_valid_data = [v for v in nox_data if v is not None]
+        timestamps, (voc_data, nox_data), band = reduce_chart(
+            max_points, times, timestamps, [voc_data, nox_data], band)
         
-        return jsonify({
+        return jsonify(with_bands({
             'success': True,
-            'count': len(records),
+            'count': len(timestamps),
             'labels': timestamps,
             'datasets': [
                 {
@@ -296,19 +525,12 @@ def get_voc_nox_chart_data():
             'units': 'index',
             'source': 'SGP41',
             'timezone': f"UTC+{Config.TIMEZONE_OFFSET}",
+            'resolution': resolution,
             'range': {
-                'voc': {
-                    'min': min(voc_valid_data) if voc_valid_data else None,
-                    'max': max(voc_valid_data) if voc_valid_data else None,
-                    'avg': sum(voc_valid_data)/len(voc_valid_data) if voc_valid_data else None
-                },
-                'nox': {
-                    'min': min(nox_valid_data) if nox_valid_data else None,
-                    'max': max(nox_valid_data) if nox_valid_data else None,
-                    'avg': sum(nox_valid_data)/len(nox_valid_data) if nox_valid_data else None
-                }
+                'voc': voc_range,
+                'nox': nox_range
             }
-        })
+        }, band, {'sgp41_voc_index': 'voc', 'sgp41_nox_index': 'nox'}))
     
     except Exception as e:
         logger.error(f"获取VOC/NOx图表数据失败: {e}")
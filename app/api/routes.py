@@ -4,24 +4,110 @@ API路由模块
 """
 
 import time
-from flask import Blueprint, jsonify, request
-from app import db
-from app.models import SensorData
+from flask import Blueprint, current_app, jsonify, request
 from config.settings import Config
 from config.sensors import SensorConfig
 from app.utils.time_utils import get_local_now
+from app.storage.sqlite_tuning import get_active_pragmas
+from app.storage.query import (fetch_series, fetch_threshold, count_rows, time_bounds, database_size,
+                               latest_record, list_nodes, fetch_page, fill_history, iter_history,
+                               encode_cursor, decode_cursor)
 from config.logging_config import get_logger
 
 logger = get_logger(__name__)
 
 api_bp = Blueprint('api', __name__)
 
+ENVIRONMENT_UNITS = {
+    "co2": "ppm",
+    "temperature": "°C",
+    "humidity": "%",
+    "sraw_voc": "ticks",
+    "sraw_nox": "ticks",
+    "voc_index": "index",
+    "nox_index": "index"
+}
+
+
+def node_arg():
+    """?node= 节点过滤参数：返回 (节点, 错误响应)，未指定时节点为None（所有节点）"""
+    node = request.args.get('node', type=str) or None
+    if node is not None and not Config.NODE_ID_PATTERN.match(node):
+        return None, (jsonify({'error': '无效的节点标识'}), 400)
+    return node, None
+
+
+def token_error(name):
+    """校验 Authorization: Bearer <令牌>（令牌为配置项name）：不通过时返回错误响应，通过时返回None
+
+    未设置令牌时接口不可用（403），不允许无认证访问
+    """
+    import hmac
+    token = current_app.config.get(name)
+    if not token:
+        return jsonify({'success': False, 'error': f'未设置 {name}，接口不可用'}), 403
+    if not hmac.compare_digest(request.headers.get('Authorization', ''), f'Bearer {token}'):
+        return jsonify({'success': False, 'error': '未授权'}), 401
+    return None
+
+
+def remote_environment(node):
+    """其他节点没有本地传感器，当前数据取该节点最新存储的记录"""
+    from datetime import datetime
+    from app.storage.rollups import to_epoch
+    from app.utils.time_utils import utc_to_local
+    
+    model = current_app.sensor_model
+    record = latest_record(model.RECORD_COLUMNS, node=node)
+    if record is None:
+        return None
+    
+    data = model.row_to_dict(record)
+    # 超过两个采集周期没有新记录时视为离线
+    age = (datetime.utcnow() - record.timestamp).total_seconds()
+    freshness_threshold = max(SensorConfig.SCD40_CONFIG['poll_interval'], SensorConfig.DHT22_CONFIG['poll_interval'],
+                              Config.WRITE_BATCH_MAX_AGE) * 2
+    status = lambda *values: 'online' if age < freshness_threshold and any(v is not None for v in values) else 'offline'
+    
+    return {
+        "node": node,
+        "timestamp": int(to_epoch(record.timestamp)),
+        "iso_timestamp": utc_to_local(record.timestamp).isoformat(),
+        "local_timestamp": utc_to_local(record.timestamp).isoformat(),
+        "timezone": f"UTC+{Config.TIMEZONE_OFFSET}",
+        "sensors": {
+            "scd40": {
+                **data['scd40'],
+                "status": status(data['scd40']['co2'])
+            },
+            "dht22": {
+                **data['dht22'],
+                "status": status(data['dht22']['temperature'], data['dht22']['humidity'])
+            },
+            "sgp41": {
+                **data['sgp41'],
+                "status": status(data['sgp41']['voc_index'], data['sgp41']['nox_index'])
+            }
+        },
+        "units": ENVIRONMENT_UNITS
+    }
+
 @api_bp.route('/environment', methods=['GET'])
 def get_environment_data():
-    """获取当前所有传感器数据"""
+    """获取当前所有传感器数据（?node= 指定其他节点时返回该节点最新存储的记录）"""
     from flask import current_app
     
+    node, error = node_arg()
+    if error:
+        return error
+    
     try:
+        if node is not None and node != Config.NODE_ID:
+            response_data = remote_environment(node)
+            if response_data is None:
+                return jsonify({'error': f'节点 {node} 没有数据'}), 404
+            return jsonify(response_data)
+        
         sensor_manager = current_app.sensor_manager
         latest_data = sensor_manager.get_latest_data()
         sensor_status = sensor_manager.get_sensor_status()
@@ -33,6 +119,7 @@ def get_environment_data():
         local_now = get_local_now()
         
         response_data = {
+            "node": latest_data.get('node_id', Config.NODE_ID),
             "timestamp": int(latest_data['timestamp']) if latest_data['timestamp'] else int(time.time()),
             "iso_timestamp": local_now.isoformat(),
             "local_timestamp": local_now.isoformat(),
@@ -57,15 +144,7 @@ def get_environment_data():
                     "status": health_status['sgp41']
                 }
             },
-            "units": {
-                "co2": "ppm",
-                "temperature": "°C",
-                "humidity": "%",
-                "sraw_voc": "ticks",
-                "sraw_nox": "ticks",
-                "voc_index": "index",
-                "nox_index": "index"
-            }
+            "units": ENVIRONMENT_UNITS
         }
         
         return jsonify(response_data)
@@ -78,47 +157,266 @@ def get_environment_data():
             "timestamp": int(time.time())
         }), 500
 
+def parse_utc_arg(name):
+    """ISO格式的时间参数转为UTC naive datetime（不带时区时视为UTC），返回 (时间, 错误响应)"""
+    from datetime import datetime, timezone
+    
+    value = request.args.get(name, type=str)
+    if not value:
+        return None, None
+    try:
+        parsed = datetime.fromisoformat(value.replace('Z', '+00:00'))
+    except ValueError:
+        return None, (jsonify({'error': f'无效的{name}格式，请使用ISO格式'}), 400)
+    if parsed.tzinfo is not None:
+        parsed = parsed.astimezone(timezone.utc).replace(tzinfo=None)
+    return parsed, None
+
+def parse_fields(model, text):
+    """逗号分隔的字段列表：返回 (传感器列, 是否附带窗口统计, 错误响应)
+
+    每项为列名（scd40_co2）或传感器名（dht22，表示该传感器的全部列），window 表示附带窗口统计；
+    text为空时选择全部传感器列
+    """
+    from app.models import WINDOW_COLUMNS
+    
+    available = [name for name in model.RECORD_COLUMNS
+                 if name not in ('id', 'node_id', 'created_at') and name not in WINDOW_COLUMNS]
+    if not text:
+        return available, False, None
+    
+    selected = []
+    window = False
+    for token in (part.strip() for part in text.split(',')):
+        if not token:
+            continue
+        if token == 'window':
+            window = True
+            continue
+        names = [name for name in available if name == token or name.startswith(f'{token}_')]
+        if not names:
+            return None, False, (jsonify({'error': f'未知的字段: {token}', 'fields': available}), 400)
+        selected.extend(name for name in names if name not in selected)
+    if not selected:
+        return None, False, (jsonify({'error': '至少需要一个传感器字段', 'fields': available}), 400)
+    return selected, window, None
+
+def window_columns(selected):
+    """所选指标的窗口统计列（_min/_max/_count）"""
+    from app.models import WINDOW_METRICS
+    
+    return [f'{name}_{stat}' for name in selected if name in WINDOW_METRICS
+            for stat in ('min', 'max', 'count')]
+
+def history_fields(model):
+    """?fields= 投影参数：返回 (查询的列, 行序列化函数, 错误响应)，未指定时返回完整记录"""
+    from app.models import record_serializer
+    
+    text = request.args.get('fields', type=str)
+    if not text:
+        return model.RECORD_COLUMNS, model.row_to_dict, None
+    
+    selected, window, error = parse_fields(model, text)
+    if error:
+        return None, None, error
+    
+    columns = ['node_id'] + selected
+    if window:
+        columns += window_columns(selected)
+    return columns, record_serializer(selected, window=window), None
+
 @api_bp.route('/history', methods=['GET'])
 def get_history_data():
-    """获取历史数据"""
+    """获取历史数据（按时间倒序）
+    
+    参数: limit, start_time, end_time, node；fields 只查询和返回指定的列；
+    cursor 为上一页返回的 next，按 (timestamp, id) keyset分页续读；
+    stream=true 时逐页读取并流式输出，不受 MAX_HISTORY_LIMIT 限制
+    """
+    from flask import Response, stream_with_context
+    
+    node, error = node_arg()
+    if error:
+        return error
+    
+    start_dt, error = parse_utc_arg('start_time')
+    if error:
+        return error
+    end_dt, error = parse_utc_arg('end_time')
+    if error:
+        return error
+    
+    after = None
+    cursor = request.args.get('cursor', type=str)
+    if cursor:
+        try:
+            after = decode_cursor(cursor)
+        except ValueError:
+            return jsonify({'error': '无效的游标'}), 400
+    
+    stream = request.args.get('stream', 'false').lower() == 'true'
+    limit = request.args.get('limit', type=int)
+    if limit is not None and limit < 1:
+        return jsonify({'error': 'limit必须为正整数'}), 400
+    
+    model = current_app.sensor_model
+    columns, serialize, error = history_fields(model)
+    if error:
+        return error
+    
     try:
-        limit = min(request.args.get('limit', default=Config.DEFAULT_HISTORY_LIMIT, type=int), 
-                   Config.MAX_HISTORY_LIMIT)
-        
-        start_time = request.args.get('start_time', type=str)
-        end_time = request.args.get('end_time', type=str)
-        
-        query = SensorData.query
-        
-        if start_time:
-            try:
-                from datetime import datetime
-                start_dt = datetime.fromisoformat(start_time.replace('Z', '+00:00'))
-                query = query.filter(SensorData.timestamp >= start_dt)
-            except ValueError:
-                return jsonify({'error': '无效的起始时间格式，请使用ISO格式'}), 400
-        
-        if end_time:
-            try:
-                from datetime import datetime
-                end_dt = datetime.fromisoformat(end_time.replace('Z', '+00:00'))
-                query = query.filter(SensorData.timestamp <= end_dt)
-            except ValueError:
-                return jsonify({'error': '无效的结束时间格式，请使用ISO格式'}), 400
+        if stream:
+            rows = iter_history(columns, start=start_dt, end=end_dt, node=node, after=after,
+                                limit=limit, page_size=Config.HISTORY_PAGE_SIZE)
+            
+            # 记录的编码与jsonify相同（应用的JSON设置、紧凑分隔符）
+            dumps = lambda value: current_app.json.dumps(value, separators=(',', ':'))
+            
+            def generate():
+                # 与非流式响应相同的JSON结构，data数组每读取一页输出一次
+                yield '{"success":true,"node":%s,"data":[' % dumps(node)
+                count = 0
+                chunk = []
+                for row in rows:
+                    chunk.append(serialize(row))
+                    if len(chunk) >= Config.HISTORY_PAGE_SIZE:
+                        yield (',' if count else '') + dumps(chunk)[1:-1]
+                        count += len(chunk)
+                        chunk = []
+                if chunk:
+                    yield (',' if count else '') + dumps(chunk)[1:-1]
+                    count += len(chunk)
+                next_cursor = encode_cursor(rows.next_key) if rows.next_key else None
+                yield '],"count":%d,"limit":%s,"next":%s}' % (count, dumps(limit), dumps(next_cursor))
+            
+            return Response(stream_with_context(generate()), mimetype='application/json')
         
-        records = query.order_by(SensorData.timestamp.desc()).limit(limit).all()
+        limit = min(limit or Config.DEFAULT_HISTORY_LIMIT, Config.MAX_HISTORY_LIMIT)
+        records, next_key = fetch_page(columns, start=start_dt, end=end_dt, limit=limit, node=node, after=after)
+        records = fill_history(records, columns, node)
         
         return jsonify({
             'success': True,
             'count': len(records),
             'limit': limit,
-            'data': [record.to_dict() for record in records]
+            'node': node,
+            'data': [serialize(record) for record in records],
+            'next': encode_cursor(next_key) if next_key else None
         })
     
     except Exception as e:
         logger.error(f"获取历史数据失败: {e}")
         return jsonify({'error': '获取历史数据失败', 'message': str(e)}), 500
 
+@api_bp.route('/export', methods=['GET'])
+def export_data():
+    """批量导出（按时间升序流式输出范围内的全部记录，不受 MAX_HISTORY_LIMIT 限制）
+    
+    参数: start_time, end_time, node；metrics 与 /api/history 的 fields 相同（未指定时导出全部传感器列）；
+    format 为 ndjson（默认）或 csv；gzip=true 时输出gzip压缩文件
+    """
+    from flask import Response, stream_with_context
+    from app.storage.export import EXPORT_FORMATS, export_stream
+    
+    node, error = node_arg()
+    if error:
+        return error
+    
+    start_dt, error = parse_utc_arg('start_time')
+    if error:
+        return error
+    end_dt, error = parse_utc_arg('end_time')
+    if error:
+        return error
+    
+    fmt = request.args.get('format', 'ndjson').lower()
+    if fmt not in EXPORT_FORMATS:
+        return jsonify({'error': f'不支持的格式: {fmt}', 'formats': list(EXPORT_FORMATS)}), 400
+    compress = request.args.get('gzip', 'false').lower() == 'true'
+    
+    selected, window, error = parse_fields(current_app.sensor_model, request.args.get('metrics', type=str))
+    if error:
+        return error
+    columns = selected + window_columns(selected) if window else selected
+    
+    mimetype, extension = EXPORT_FORMATS[fmt]
+    filename = f"sensor_data_{node or 'all'}_{get_local_now():%Y%m%d_%H%M%S}.{extension}"
+    if compress:
+        mimetype, filename = 'application/gzip', f'{filename}.gz'
+    
+    logger.info(f"开始导出: {start_dt} ~ {end_dt}，节点 {node or '全部'}，{len(columns)} 列，{fmt}")
+    rows = iter_history(['node_id'] + columns, start=start_dt, end=end_dt, node=node,
+                        page_size=Config.EXPORT_PAGE_SIZE, descending=False)
+    chunks = export_stream(rows, columns, fmt=fmt, compress=compress, page_size=Config.EXPORT_PAGE_SIZE)
+    return Response(stream_with_context(chunks), mimetype=mimetype,
+                    headers={'Content-Disposition': f'attachment; filename="{filename}"'})
+
+@api_bp.route('/nodes', methods=['GET'])
+def get_nodes():
+    """有记录的节点列表及各节点的记录时间范围"""
+    try:
+        nodes = []
+        for node in list_nodes():
+            earliest, latest = time_bounds(node=node)
+            nodes.append({
+                'node': node,
+                'local': node == Config.NODE_ID,
+                'earliest_record': earliest.isoformat() if earliest else None,
+                'latest_record': latest.isoformat() if latest else None
+            })
+        
+        return jsonify({
+            'success': True,
+            'local_node': Config.NODE_ID,
+            'count': len(nodes),
+            'nodes': nodes
+        })
+    except Exception as e:
+        logger.error(f"获取节点列表失败: {e}")
+        return jsonify({'error': '获取节点列表失败', 'message': str(e)}), 500
+
+@api_bp.route('/ingest', methods=['POST'])
+def ingest_readings():
+    """接收其他节点上传的一批读数
+    
+    请求体为NDJSON（每行一条读数）或增量编码批次（Content-Type: application/x-sensor-delta+json），
+    可用 Content-Encoding: gzip 压缩；
+    读数中没有node_id时使用 ?node= 或 X-Node-Id 指定的节点；
+    Idempotency-Key 相同的批次只处理一次，重复提交返回上次的结果
+    """
+    from app.storage.ingest import IngestError
+    
+    service = current_app.ingest_service
+    if service is None:
+        return jsonify({'error': '批量接收未启用'}), 404
+    
+    denied = token_error('INGEST_TOKEN')
+    if denied:
+        return denied
+    
+    if request.content_length is not None and request.content_length > Config.INGEST_MAX_BYTES:
+        return jsonify({'error': '请求体超过大小限制'}), 413
+    
+    node = request.args.get('node') or request.headers.get('X-Node-Id') or None
+    if node is not None and not Config.NODE_ID_PATTERN.match(node):
+        return jsonify({'error': '无效的节点标识'}), 400
+    
+    try:
+        result = service.ingest(
+            request.get_data(cache=False),
+            encoding=request.headers.get('Content-Encoding'),
+            node=node,
+            key=request.headers.get('Idempotency-Key') or None,
+            content_type=request.mimetype
+        )
+        return jsonify({'success': True, **result})
+    except IngestError as e:
+        return jsonify({'success': False, 'error': str(e)}), e.status
+    except Exception as e:
+        # 写入失败时整批未生效，客户端应稍后重试同一批次
+        logger.error(f"接收上传批次失败: {e}")
+        return jsonify({'success': False, 'error': '写入失败，请稍后重试', 'message': str(e)}), 503
+
 @api_bp.route('/health', methods=['GET'])
 def health_check():
     """健康检查端点"""
@@ -126,8 +424,13 @@ def health_check():
     
     # 检查数据库
     db_status = "online"
+    db_pragmas = {}
     try:
-        db.session.execute("SELECT 1")
+        with current_app.storage.read_connection() as conn:
+            conn.exec_driver_sql("SELECT 1")
+        db_pragmas = get_active_pragmas(
+            current_app.storage.writer, current_app.config.get('SQLITE_PRAGMAS', {}).keys()
+        )
     except Exception as e:
         logger.error(f"数据库连接失败: {e}")
         db_status = "offline"
@@ -181,33 +484,39 @@ def health_check():
         },
         "sensor_status": sensor_manager.get_sensor_status(),
         "filter_stats": filter_stats,
-        "sgp41_filter_stats": sgp41_filter_stats
+        "sgp41_filter_stats": sgp41_filter_stats,
+        "write_queue": sensor_manager.writer.get_stats(),
+        "database_pragmas": db_pragmas,
+        "database_io": current_app.storage.get_stats(),
+        "ingest": current_app.ingest_service.get_stats() if current_app.ingest_service else None
     })
 
 @api_bp.route('/stats', methods=['GET'])
 def get_stats():
-    """获取统计信息"""
+    """获取统计信息（?node= 只统计该节点的记录）"""
+    node, error = node_arg()
+    if error:
+        return error
+    
     try:
-        import os
         from datetime import datetime, timedelta
-        from config.settings import Config
         
-        total_records = SensorData.query.count()
+        total_records = count_rows(node=node)
         
         day_ago = datetime.utcnow() - timedelta(days=1)
-        recent_records = SensorData.query.filter(SensorData.timestamp >= day_ago).count()
+        recent_records = count_rows(start=day_ago, node=node)
         
-        earliest = SensorData.query.order_by(SensorData.timestamp.asc()).first()
-        latest = SensorData.query.order_by(SensorData.timestamp.desc()).first()
+        earliest, latest = time_bounds(node=node)
         
         return jsonify({
             "success": True,
+            "node": node,
             "stats": {
                 "total_records": total_records,
                 "recent_24h_records": recent_records,
-                "earliest_record": earliest.timestamp.isoformat() if earliest else None,
-                "latest_record": latest.timestamp.isoformat() if latest else None,
-                "database_size": os.path.getsize(Config.DATABASE_PATH) if Config.DATABASE_PATH.exists() else 0
+                "earliest_record": earliest.isoformat() if earliest else None,
+                "latest_record": latest.isoformat() if latest else None,
+                "database_size": database_size()
             },
             "timezone": f"UTC+{Config.TIMEZONE_OFFSET}"
         })
@@ -215,6 +524,76 @@ def get_stats():
         logger.error(f"获取统计信息失败: {e}")
         return jsonify({"error": "获取统计信息失败", "message": str(e)}), 500
 
+@api_bp.route('/threshold', methods=['GET'])
+def get_threshold_periods():
+    """查询指标超过/低于阈值的时段（如最近一周CO₂超过1500ppm的小时）"""
+    node, error = node_arg()
+    if error:
+        return error
+    
+    try:
+        from datetime import datetime, timedelta
+        from app.storage.rollups import bucket_start, from_epoch, to_epoch
+        from app.utils.time_utils import utc_to_local
+        
+        metric = request.args.get('metric', default='scd40_co2', type=str)
+        above = request.args.get('above', type=float)
+        below = request.args.get('below', type=float)
+        hours = request.args.get('hours', default=168, type=int)
+        bucket = request.args.get('bucket', default=3600, type=int)
+        
+        if metric not in Config.ROLLUP_METRICS:
+            return jsonify({'error': f'不支持的指标，可选: {", ".join(Config.ROLLUP_METRICS)}'}), 400
+        if above is None and below is None:
+            return jsonify({'error': '需要指定above或below参数'}), 400
+        if bucket <= 0:
+            return jsonify({'error': 'bucket必须为正整数（秒）'}), 400
+        
+        start = datetime.utcnow() - timedelta(hours=hours)
+        rows = fetch_threshold(metric, above=above, below=below, start=start, node=node)
+        
+        # 按时段汇总满足条件的采样
+        periods = {}
+        for row in rows:
+            value = getattr(row, metric)
+            key = bucket_start(to_epoch(row.timestamp), bucket)
+            period = periods.get(key)
+            if period is None:
+                periods[key] = {'count': 1, 'min': value, 'max': value,
+                                'first': row.timestamp, 'last': row.timestamp}
+                continue
+            period['count'] += 1
+            period['min'] = min(period['min'], value)
+            period['max'] = max(period['max'], value)
+            period['last'] = row.timestamp
+        
+        return jsonify({
+            'success': True,
+            'metric': metric,
+            'node': node,
+            'above': above,
+            'below': below,
+            'hours': hours,
+            'bucket_seconds': bucket,
+            'samples': len(rows),
+            'count': len(periods),
+            'periods': [
+                {
+                    'start': utc_to_local(from_epoch(key)).isoformat(),
+                    'count': period['count'],
+                    'min': period['min'],
+                    'max': period['max'],
+                    'first': utc_to_local(period['first']).isoformat(),
+                    'last': utc_to_local(period['last']).isoformat()
+                }
+                for key, period in sorted(periods.items())
+            ],
+            'timezone': f"UTC+{Config.TIMEZONE_OFFSET}"
+        })
+    except Exception as e:
+        logger.error(f"查询阈值时段失败: {e}")
+        return jsonify({'error': '查询阈值时段失败', 'message': str(e)}), 500
+
 @api_bp.route('/sgp41/stats', methods=['GET'])
 def get_sgp41_stats():
     """获取SGP41传感器统计信息"""
@@ -244,6 +623,119 @@ def get_sgp41_stats():
             "message": str(e)
         }), 500
 
+@api_bp.route('/sgp41/raw', methods=['GET'])
+def get_sgp41_raw():
+    """读取SGP41每秒原始信号（环形文件）
+
+    参数: start/end 为UTC epoch秒（默认最近1小时）；format=binary 时直接返回
+    文件中的定长记录（<u4 时间, <u2 sraw_voc, <u2 sraw_nox），否则返回JSON
+    """
+    from flask import Response
+    
+    ring = current_app.raw_ring
+    if ring is None:
+        return jsonify({
+            "success": False,
+            "error": "未启用SGP41原始信号文件"
+        }), 404
+    
+    try:
+        end = request.args.get('end', default=int(time.time()), type=int)
+        start = request.args.get('start', default=end - 3600, type=int)
+        if start > end:
+            return jsonify({'error': '起始时间不能晚于结束时间'}), 400
+        
+        views = ring.read_range(start, end)
+        
+        if request.args.get('format') == 'binary':
+            return Response(
+                (view.tobytes() for view in views),
+                mimetype='application/octet-stream',
+                headers={'X-Record-Format': '<u4 timestamp, <u2 sraw_voc, <u2 sraw_nox'}
+            )
+        
+        total = sum(view.size for view in views)
+        if total > Config.MAX_RAW_POINTS:
+            return jsonify({
+                'error': f'时间范围内有{total}条记录，超过JSON上限{Config.MAX_RAW_POINTS}',
+                'message': '请缩小时间范围或使用format=binary'
+            }), 400
+        
+        return jsonify({
+            "success": True,
+            "count": total,
+            "start": start,
+            "end": end,
+            "timestamps": [t for view in views for t in view['timestamp'].tolist()],
+            "sraw_voc": [v for view in views for v in view['sraw_voc'].tolist()],
+            "sraw_nox": [v for view in views for v in view['sraw_nox'].tolist()],
+            "ring": ring.get_stats()
+        })
+    except Exception as e:
+        logger.error(f"读取SGP41原始信号失败: {e}")
+        return jsonify({"error": "读取原始信号失败", "message": str(e)}), 500
+
+@api_bp.route('/sgp41/checkpoint', methods=['GET'])
+def get_sgp41_checkpoint():
+    """查看SGP41算法状态检查点"""
+    sensor_manager = current_app.sensor_manager
+    if not sensor_manager or not sensor_manager.sgp41_state:
+        return jsonify({
+            "success": False,
+            "error": "未启用SGP41算法状态检查点"
+        }), 404
+    
+    try:
+        sgp41 = sensor_manager.sensors.get('sgp41')
+        return jsonify({
+            "success": True,
+            "checkpoint": sensor_manager.sgp41_state.get_status(),
+            "current_states": sgp41.get_algorithm_states() if sgp41 else None,
+            "interval_seconds": Config.SGP41_STATE_INTERVAL,
+            "min_uptime_seconds": Config.SGP41_STATE_MIN_UPTIME,
+            "current_uptime_seconds": round(sgp41.get_algorithm_uptime(), 1) if sgp41 else None,
+            "timestamp": int(time.time())
+        })
+    except Exception as e:
+        logger.error(f"获取SGP41检查点失败: {e}")
+        return jsonify({"error": "获取检查点失败", "message": str(e)}), 500
+
+@api_bp.route('/sgp41/checkpoint', methods=['POST'])
+def save_sgp41_checkpoint():
+    """立即保存SGP41算法状态检查点"""
+    denied = token_error('ADMIN_TOKEN')
+    if denied:
+        return denied
+    
+    sensor_manager = current_app.sensor_manager
+    if not sensor_manager or not sensor_manager.sgp41_state:
+        return jsonify({
+            "success": False,
+            "error": "未启用SGP41算法状态检查点"
+        }), 404
+    if not sensor_manager.sensors.get('sgp41'):
+        return jsonify({
+            "success": False,
+            "error": "SGP41传感器未初始化"
+        }), 404
+    
+    try:
+        checkpoint = sensor_manager.save_sgp41_state()
+        if checkpoint is None:
+            return jsonify({
+                "success": False,
+                "error": f"SGP41算法运行未满{Config.SGP41_STATE_MIN_UPTIME}秒，保留上一个检查点"
+            }), 409
+        return jsonify({
+            "success": True,
+            "message": "SGP41算法状态已保存",
+            "checkpoint": checkpoint,
+            "timestamp": int(time.time())
+        })
+    except Exception as e:
+        logger.error(f"保存SGP41检查点失败: {e}")
+        return jsonify({"error": "保存检查点失败", "message": str(e)}), 500
+
 @api_bp.route('/sgp41/self_test', methods=['POST'])
 def sgp41_self_test():
     """执行SGP41自检"""
@@ -491,14 +983,19 @@ def get_data_quality():
     from flask import current_app
     from datetime import datetime, timedelta
     
+    node, error = node_arg()
+    if error:
+        return error
+    
     try:
         sensor_manager = current_app.sensor_manager
         
         # 获取最近1小时的数据
         one_hour_ago = datetime.utcnow() - timedelta(hours=1)
-        records = SensorData.query.filter(
-            SensorData.timestamp >= one_hour_ago
-        ).order_by(SensorData.timestamp.desc()).limit(360).all()  # 最多360条（每小时最多3600秒，但可能采样没那么快）
+        records = fetch_series(
+            ['sgp41_voc_index', 'sgp41_nox_index', 'dht22_temperature', 'dht22_humidity'],
+            start=one_hour_ago, descending=True, limit=360, node=node
+        )  # 最多360条（每小时最多3600秒，但可能采样没那么快）
         
         quality_metrics = {
             "sgp41": {
@@ -646,5 +1143,177 @@ def reset_filter():
         return jsonify({
             "error": "重置过滤器失败",
             "message": str(e)
-        }), 500    
+        }), 500
+
+@api_bp.route('/partitions', methods=['GET'])
+def get_partitions():
+    """获取按月分区列表"""
+    from flask import current_app
+    
+    store = current_app.partition_store
+    if store is None:
+        return jsonify({
+            "success": False,
+            "error": "未启用分区存储"
+        }), 404
+    
+    return jsonify({
+        "success": True,
+        "partitions": store.get_partition_info(),
+        "timestamp": int(time.time())
+    })
+
+@api_bp.route('/partitions/<partition>', methods=['DELETE'])
+def drop_partition(partition):
+    """删除整个月份分区（格式 YYYY-MM）"""
+    from flask import current_app
+    
+    denied = token_error('ADMIN_TOKEN')
+    if denied:
+        return denied
+    
+    store = current_app.partition_store
+    if store is None:
+        return jsonify({
+            "success": False,
+            "error": "未启用分区存储"
+        }), 404
+    
+    try:
+        key = store.parse_key(partition)
+    except ValueError:
+        return jsonify({"success": False, "error": "无效的分区名，请使用YYYY-MM格式"}), 400
+    
+    try:
+        if not store.drop_partition(key):
+            return jsonify({"success": False, "error": f"分区不存在: {partition}"}), 404
+        
+        return jsonify({
+            "success": True,
+            "message": f"分区 {partition} 已删除",
+            "timestamp": int(time.time())
+        })
+    except Exception as e:
+        logger.error(f"删除分区失败: {e}")
+        return jsonify({"error": "删除分区失败", "message": str(e)}), 500
+
+@api_bp.route('/archive', methods=['GET'])
+def get_archive():
+    """获取列式归档的月份清单（含各指标的月度统计，可直接用于跨年对比）"""
+    from flask import current_app
+    
+    archive = current_app.archive
+    if archive is None:
+        return jsonify({
+            "success": False,
+            "error": "未启用列式归档"
+        }), 404
+    
+    try:
+        months = archive.get_archive_info()
+        return jsonify({
+            "success": True,
+            "months": months,
+            "total_size": sum(item['size'] for item in months),
+            "timestamp": int(time.time())
+        })
+    except Exception as e:
+        logger.error(f"获取归档信息失败: {e}")
+        return jsonify({"error": "获取归档信息失败", "message": str(e)}), 500
+
+@api_bp.route('/upload', methods=['GET'])
+def get_upload_status():
+    """获取存储转发上传状态（高水位、已上传条数、压缩率、重试状态）"""
+    from flask import current_app
+    
+    uploader = current_app.uploader
+    if uploader is None:
+        return jsonify({"error": "存储转发上传未启用"}), 404
+    
+    try:
+        return jsonify({
+            "success": True,
+            "upload": uploader.get_status(),
+            "timestamp": int(time.time())
+        })
+    except Exception as e:
+        logger.error(f"获取上传状态失败: {e}")
+        return jsonify({"error": "获取上传状态失败", "message": str(e)}), 500
+
+@api_bp.route('/upload/run', methods=['POST'])
+def run_upload():
+    """立即上传一次（网络恢复后不必等待退避间隔）"""
+    from flask import current_app
+    
+    denied = token_error('ADMIN_TOKEN')
+    if denied:
+        return denied
+    
+    uploader = current_app.uploader
+    if uploader is None:
+        return jsonify({"error": "存储转发上传未启用"}), 404
+    
+    if uploader.running:
+        uploader.trigger()
+        return jsonify({
+            "success": True,
+            "message": "上传已触发",
+            "timestamp": int(time.time())
+        }), 202
+    
+    try:
+        result = uploader.run_once()
+        return jsonify({
+            "success": True,
+            "result": result,
+            "timestamp": int(time.time())
+        })
+    except Exception as e:
+        logger.error(f"执行上传失败: {e}")
+        return jsonify({"error": "执行上传失败", "message": str(e)}), 500
+
+@api_bp.route('/retention', methods=['GET'])
+def get_retention_status():
+    """获取数据保留任务状态（上次运行时间、删除行数、回收空间）"""
+    from flask import current_app
+    
+    try:
+        return jsonify({
+            "success": True,
+            "retention": current_app.retention_manager.get_status(),
+            "database_size": database_size(),
+            "timestamp": int(time.time())
+        })
+    except Exception as e:
+        logger.error(f"获取数据保留状态失败: {e}")
+        return jsonify({"error": "获取数据保留状态失败", "message": str(e)}), 500
 
+@api_bp.route('/retention/run', methods=['POST'])
+def run_retention():
+    """立即执行一次数据保留任务"""
+    from flask import current_app
+    
+    denied = token_error('ADMIN_TOKEN')
+    if denied:
+        return denied
+    
+    retention_manager = current_app.retention_manager
+    if retention_manager.running:
+        # 后台线程运行中，唤醒它执行
+        retention_manager.trigger()
+        return jsonify({
+            "success": True,
+            "message": "数据保留任务已触发",
+            "timestamp": int(time.time())
+        }), 202
+    
+    try:
+        result = retention_manager.run_once()
+        return jsonify({
+            "success": True,
+            "result": result,
+            "timestamp": int(time.time())
+        })
+    except Exception as e:
+        logger.error(f"执行数据保留任务失败: {e}")
+        return jsonify({"error": "执行数据保留任务失败", "message": str(e)}), 500
@@ -3,15 +3,153 @@
 数据模型模块
 """
 
-from datetime import datetime
+import operator
+from datetime import datetime, timedelta, timezone
 from app import db
 
+EPOCH = datetime(1970, 1, 1)
+
+# 采集时按存储间隔聚合的指标：主列保存窗口内的平均值，另存最小值、最大值和采样数
+# 只有SGP41每秒采样；SCD40/DHT22每个存储间隔只读取一次，窗口统计只会是同一读数的副本
+WINDOW_METRICS = ['sgp41_voc_index', 'sgp41_nox_index']
+WINDOW_COLUMNS = [f"{metric}_{stat}" for metric in WINDOW_METRICS for stat in ('min', 'max', 'count')]
+
+
+def window_to_dict(row):
+    """窗口统计（最小值/最大值/采样数），没有统计的指标不返回"""
+    window = {}
+    for metric in WINDOW_METRICS:
+        count = getattr(row, f"{metric}_count", None)
+        if count:
+            window[metric] = {
+                'min': getattr(row, f"{metric}_min"),
+                'max': getattr(row, f"{metric}_max"),
+                'count': count
+            }
+    return window
+
+
+def record_serializer(columns, window=False):
+    """按列投影的行序列化函数：返回 row -> 与row_to_dict相同嵌套结构、只含指定列的字典
+
+    columns为传感器列名（如 scd40_co2 -> {'scd40': {'co2': ...}}）；window为True时
+    附带这些指标的窗口统计（行中需包含对应的 _min/_max/_count 列）。
+    各列的位置和所属分组只计算一次，逐行只做取值，用于 fields 参数的投影查询
+    """
+    columns = list(columns)
+    layout = {}
+    for index, name in enumerate(columns):
+        group, _, field = name.partition('_')
+        layout.setdefault(group, []).append((field, index))
+    layout = list(layout.items())
+    metrics = [name for name in columns if name in WINDOW_METRICS] if window else []
+    stats = [f"{metric}_{stat}" for metric in metrics for stat in ('min', 'max', 'count')]
+    getter = operator.attrgetter('timestamp', 'node_id', *columns, *stats)
+    value_count = len(columns)
+
+    def serialize(row):
+        timestamp, node, *values = getter(row)
+        record = {'timestamp': timestamp.isoformat() if timestamp else None, 'node_id': node}
+        for group, fields in layout:
+            record[group] = {field: values[index] for field, index in fields}
+        if window:
+            record['window'] = {
+                metric: {'min': values[i], 'max': values[i + 1], 'count': values[i + 2]}
+                for metric, i in zip(metrics, range(value_count, len(values), 3))
+                if values[i + 2]
+            }
+        return record
+
+    return serialize
+
+
+class EpochMillis(db.TypeDecorator):
+    """UTC naive datetime 以整数毫秒（epoch）存储"""
+    impl = db.Integer
+    cache_ok = True
+
+    @property
+    def python_type(self):
+        return datetime
+
+    def process_bind_param(self, value, dialect):
+        if value is None or isinstance(value, int):
+            return value
+        if value.tzinfo is not None:
+            value = value.astimezone(timezone.utc).replace(tzinfo=None)
+        return (value - EPOCH) // timedelta(milliseconds=1)
+
+    def process_result_value(self, value, dialect):
+        if value is None:
+            return None
+        return EPOCH + timedelta(milliseconds=value)
+
+    def result_processor(self, dialect, coltype):
+        # 范围扫描时逐行调用，直接返回闭包以减少调用层
+        epoch, delta = EPOCH, timedelta
+
+        def process(value):
+            return None if value is None else epoch + delta(0, value / 1000)
+        return process
+
+
+class ScaledInteger(db.TypeDecorator):
+    """定点小数：按固定倍数缩放后以小整数存储（如0.1°C分辨率的温度存为整数分度）"""
+    impl = db.SmallInteger
+    cache_ok = True
+
+    def __init__(self, scale=10):
+        super().__init__()
+        self.scale = scale
+
+    @property
+    def python_type(self):
+        return float
+
+    def process_bind_param(self, value, dialect):
+        if value is None:
+            return None
+        return int(round(value * self.scale))
+
+    def process_result_value(self, value, dialect):
+        if value is None:
+            return None
+        return value / self.scale
+
+    def result_processor(self, dialect, coltype):
+        scale = self.scale
+
+        def process(value):
+            return None if value is None else value / scale
+        return process
+
+
 class SensorData(db.Model):
     """三传感器数据模型"""
     __tablename__ = 'sensor_data'
+    __table_args__ = (
+        # 图表查询专用的部分覆盖索引：按时间范围读取单个指标，无需回表
+        db.Index('ix_sensor_data_co2_ts', 'timestamp', 'scd40_co2',
+                 sqlite_where=db.text('scd40_co2 IS NOT NULL')),
+        db.Index('ix_sensor_data_dht22_ts', 'timestamp', 'dht22_temperature', 'dht22_humidity',
+                 sqlite_where=db.text('dht22_temperature IS NOT NULL OR dht22_humidity IS NOT NULL')),
+        db.Index('ix_sensor_data_sgp41_ts', 'timestamp', 'sgp41_voc_index', 'sgp41_nox_index',
+                 sqlite_where=db.text('sgp41_voc_index IS NOT NULL OR sgp41_nox_index IS NOT NULL')),
+        # 按节点筛选的时间范围查询
+        db.Index('ix_sensor_data_node_ts', 'node_id', 'timestamp'),
+    )
+    
+    # 除timestamp外的所有数据列（历史查询使用）
+    RECORD_COLUMNS = [
+        'id', 'node_id', 'scd40_co2', 'scd40_temperature', 'scd40_humidity',
+        'dht22_temperature', 'dht22_humidity',
+        'sgp41_sraw_voc', 'sgp41_sraw_nox', 'sgp41_voc_index', 'sgp41_nox_index',
+        'created_at'
+    ] + WINDOW_COLUMNS
     
     id = db.Column(db.Integer, primary_key=True)
     timestamp = db.Column(db.DateTime, nullable=False, default=datetime.utcnow, index=True)
+    node_id = db.Column(db.String(64), nullable=True)      # 产生记录的节点（Config.NODE_ID）
     
     # SCD40数据
     scd40_co2 = db.Column(db.Integer, nullable=True)
@@ -28,33 +166,172 @@ class SensorData(db.Model):
     sgp41_voc_index = db.Column(db.Integer, nullable=True)    # VOC指数 (0-500)
     sgp41_nox_index = db.Column(db.Integer, nullable=True)    # NOx指数 (0-500)
     
+    # 存储间隔内的窗口统计（主列为平均值）
+    sgp41_voc_index_min = db.Column(db.Integer, nullable=True)
+    sgp41_voc_index_max = db.Column(db.Integer, nullable=True)
+    sgp41_voc_index_count = db.Column(db.Integer, nullable=True)
+    sgp41_nox_index_min = db.Column(db.Integer, nullable=True)
+    sgp41_nox_index_max = db.Column(db.Integer, nullable=True)
+    sgp41_nox_index_count = db.Column(db.Integer, nullable=True)
+    
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     
     def to_dict(self):
         """将数据对象转换为字典"""
+        return SensorData.row_to_dict(self)
+    
+    @staticmethod
+    def row_to_dict(row):
+        """将查询结果行（或模型对象）转换为字典"""
         return {
-            'id': self.id,
-            'timestamp': self.timestamp.isoformat() if self.timestamp else None,
+            'id': row.id,
+            'node_id': row.node_id,
+            'timestamp': row.timestamp.isoformat() if row.timestamp else None,
             'scd40': {
-                'co2': self.scd40_co2,
-                'temperature': self.scd40_temperature,
-                'humidity': self.scd40_humidity
+                'co2': row.scd40_co2,
+                'temperature': row.scd40_temperature,
+                'humidity': row.scd40_humidity
             },
             'dht22': {
-                'temperature': self.dht22_temperature,
-                'humidity': self.dht22_humidity
+                'temperature': row.dht22_temperature,
+                'humidity': row.dht22_humidity
             },
             'sgp41': {
-                'sraw_voc': self.sgp41_sraw_voc,
-                'sraw_nox': self.sgp41_sraw_nox,
-                'voc_index': self.sgp41_voc_index,
-                'nox_index': self.sgp41_nox_index
+                'sraw_voc': row.sgp41_sraw_voc,
+                'sraw_nox': row.sgp41_sraw_nox,
+                'voc_index': row.sgp41_voc_index,
+                'nox_index': row.sgp41_nox_index
             },
-            'created_at': self.created_at.isoformat() if self.created_at else None
+            'window': window_to_dict(row),
+            'created_at': row.created_at.isoformat() if row.created_at else None
         }
     
     def __repr__(self):
         return (f"<SensorData {self.id}: "
                 f"SCD40(CO2={self.scd40_co2}ppm), "
                 f"DHT22(T={self.dht22_temperature}°C, H={self.dht22_humidity}%), "
-                f"SGP41(VOC={self.sgp41_voc_index}, NOx={self.sgp41_nox_index})>")  
\ No newline at end of file
+                f"SGP41(VOC={self.sgp41_voc_index}, NOx={self.sgp41_nox_index})>")
+
+
+class SensorRollup(db.Model):
+    """指标汇总数据模型（按时间桶预聚合，供长时间范围图表使用）"""
+    __tablename__ = 'sensor_rollup'
+    __table_args__ = {'sqlite_with_rowid': False}
+    
+    tier = db.Column(db.Integer, primary_key=True)          # 桶宽度（秒）
+    metric = db.Column(db.String(32), primary_key=True)     # 指标名（SensorData列名）
+    bucket_start = db.Column(db.Integer, primary_key=True)  # 桶起始时间（UTC epoch秒）
+    node_id = db.Column(db.String(64), primary_key=True)    # 节点（放在主键最后，不筛选节点时仍按时间范围查找）
+    
+    count = db.Column(db.Integer, nullable=False, default=0)
+    min = db.Column(db.Float, nullable=True)
+    max = db.Column(db.Float, nullable=True)
+    sum = db.Column(db.Float, nullable=False, default=0)
+    last = db.Column(db.Float, nullable=True)
+    last_ts = db.Column(db.Float, nullable=True)            # 最后一个值的时间（UTC epoch秒）
+    
+    def __repr__(self):
+        return (f"<SensorRollup {self.metric}@{self.tier}s {self.bucket_start}: "
+                f"n={self.count}, min={self.min}, max={self.max}>")
+
+
+class CompactSensorData(db.Model):
+    """紧凑存储模型（STORAGE_SCHEMA=compact）
+
+    以（整数毫秒时间戳, 节点）为聚簇主键（WITHOUT ROWID），温湿度以0.1分辨率的小整数存储，
+    去掉id、created_at和始终为空的SCD40温湿度列。对外的字典格式与SensorData一致。
+    """
+    __tablename__ = 'sensor_data_compact'
+    __table_args__ = (
+        db.Index('ix_sensor_data_compact_node_ts', 'node_id', 'timestamp'),
+        {'sqlite_with_rowid': False},
+    )
+    
+    # 除timestamp外的所有数据列（历史查询使用）
+    RECORD_COLUMNS = [
+        'node_id', 'scd40_co2',
+        'dht22_temperature', 'dht22_humidity',
+        'sgp41_sraw_voc', 'sgp41_sraw_nox', 'sgp41_voc_index', 'sgp41_nox_index'
+    ] + WINDOW_COLUMNS
+    
+    timestamp = db.Column(EpochMillis, primary_key=True, autoincrement=False)
+    node_id = db.Column(db.String(64), primary_key=True)
+    
+    scd40_co2 = db.Column(db.Integer, nullable=True)
+    
+    dht22_temperature = db.Column(ScaledInteger(10), nullable=True)   # 0.1°C
+    dht22_humidity = db.Column(ScaledInteger(10), nullable=True)      # 0.1%
+    
+    sgp41_sraw_voc = db.Column(db.Integer, nullable=True)
+    sgp41_sraw_nox = db.Column(db.Integer, nullable=True)
+    sgp41_voc_index = db.Column(db.Integer, nullable=True)
+    sgp41_nox_index = db.Column(db.Integer, nullable=True)
+    
+    sgp41_voc_index_min = db.Column(db.Integer, nullable=True)
+    sgp41_voc_index_max = db.Column(db.Integer, nullable=True)
+    sgp41_voc_index_count = db.Column(db.SmallInteger, nullable=True)
+    sgp41_nox_index_min = db.Column(db.Integer, nullable=True)
+    sgp41_nox_index_max = db.Column(db.Integer, nullable=True)
+    sgp41_nox_index_count = db.Column(db.SmallInteger, nullable=True)
+    
+    def to_dict(self):
+        """将数据对象转换为字典"""
+        return CompactSensorData.row_to_dict(self)
+    
+    @staticmethod
+    def row_to_dict(row):
+        """转换为与SensorData.row_to_dict相同结构的字典
+
+        id使用毫秒时间戳（主键），created_at与timestamp相同，SCD40温湿度始终为空
+        """
+        timestamp = row.timestamp.isoformat() if row.timestamp else None
+        return {
+            'id': EpochMillis().process_bind_param(row.timestamp, None),
+            'node_id': row.node_id,
+            'timestamp': timestamp,
+            'scd40': {
+                'co2': row.scd40_co2,
+                'temperature': None,
+                'humidity': None
+            },
+            'dht22': {
+                'temperature': row.dht22_temperature,
+                'humidity': row.dht22_humidity
+            },
+            'sgp41': {
+                'sraw_voc': row.sgp41_sraw_voc,
+                'sraw_nox': row.sgp41_sraw_nox,
+                'voc_index': row.sgp41_voc_index,
+                'nox_index': row.sgp41_nox_index
+            },
+            'window': window_to_dict(row),
+            'created_at': timestamp
+        }
+    
+    def __repr__(self):
+        return (f"<CompactSensorData {self.timestamp}: "
+                f"SCD40(CO2={self.scd40_co2}ppm), "
+                f"DHT22(T={self.dht22_temperature}°C, H={self.dht22_humidity}%), "
+                f"SGP41(VOC={self.sgp41_voc_index}, NOx={self.sgp41_nox_index})>")
+
+
+class IngestBatch(db.Model):
+    """已接收的上传批次（按幂等键记录结果，重复提交直接返回）"""
+    __tablename__ = 'ingest_batch'
+    
+    key = db.Column(db.String(128), primary_key=True)       # 客户端提供的 Idempotency-Key
+    node_id = db.Column(db.String(64), nullable=True)       # 批次的默认节点
+    received_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow, index=True)
+    accepted = db.Column(db.Integer, nullable=False, default=0)
+    duplicates = db.Column(db.Integer, nullable=False, default=0)
+    rejected = db.Column(db.Integer, nullable=False, default=0)
+    
+    def __repr__(self):
+        return f"<IngestBatch {self.key}: +{self.accepted} ={self.duplicates} x{self.rejected}>"
+
+
+# 存储模式与原始数据模型的对应关系
+SENSOR_MODELS = {
+    'standard': SensorData,
+    'compact': CompactSensorData,
+}
@@ -0,0 +1,49 @@
+# app/sensors/aggregator.py
+"""
+采集窗口聚合模块 - 累计两次写入之间的每个采样（SGP41每秒一次），
+写入时输出各指标的平均值、最小值、最大值和采样数，写入频率不变但不丢失极值
+"""
+
+import threading
+
+
+class WindowAggregator:
+    """流式窗口聚合器（只保存累计量，不保存采样）"""
+
+    def __init__(self, metrics):
+        self.metrics = list(metrics)
+        self.lock = threading.Lock()
+        self.windows = {}
+
+    def add(self, metric, value):
+        """加入一个采样（空值忽略）"""
+        if value is None or metric not in self.metrics:
+            return
+        with self.lock:
+            window = self.windows.get(metric)
+            if window is None:
+                self.windows[metric] = [1, value, value, value]
+                return
+            window[0] += 1
+            window[1] += value
+            if value < window[2]:
+                window[2] = value
+            if value > window[3]:
+                window[3] = value
+
+    def add_sample(self, values):
+        """加入一组采样 {指标: 值}"""
+        for metric, value in values.items():
+            self.add(metric, value)
+
+    def snapshot(self):
+        """取出当前窗口的统计并开始新窗口
+
+        返回 {指标: {'count', 'mean', 'min', 'max'}}，窗口内没有采样的指标不返回
+        """
+        with self.lock:
+            windows, self.windows = self.windows, {}
+        return {
+            metric: {'count': count, 'mean': total / count, 'min': low, 'max': high}
+            for metric, (count, total, low, high) in windows.items()
+        }
@@ -0,0 +1,105 @@
+# app/sensors/algorithm_state.py
+"""
+SGP41气体指数算法状态检查点模块 - 定期将VOC/NOx算法学习到的基线状态保存到磁盘，
+服务重启时在检查点足够新的情况下恢复，避免重新学习
+"""
+
+import json
+import os
+import threading
+import time
+from pathlib import Path
+from config.logging_config import get_logger
+
+logger = get_logger(__name__)
+
+
+class AlgorithmStateStore:
+    """算法状态检查点文件（JSON，先写临时文件再原子替换）"""
+
+    VERSION = 2  # 版本2起记录算法运行时长，旧检查点可能保存于学习完成之前，不再恢复
+
+    def __init__(self, path, max_age=600, tuning=None):
+        self.path = Path(path)
+        self.max_age = max_age      # 检查点超过此时间（秒）不再恢复
+        self.tuning = tuning or {}  # 算法参数，变化后旧状态不再适用
+
+        self.lock = threading.Lock()
+        self.last_saved = None
+        self.last_restored = None
+        self.last_error = None
+
+    def save(self, states, uptime):
+        """保存算法状态及算法已运行的秒数，返回检查点内容"""
+        checkpoint = {
+            'version': self.VERSION,
+            'saved_at': time.time(),
+            'uptime': uptime,
+            'tuning': self.tuning,
+            'states': states
+        }
+
+        with self.lock:
+            try:
+                self.path.parent.mkdir(parents=True, exist_ok=True)
+                temp_path = self.path.with_suffix(self.path.suffix + '.tmp')
+                with open(temp_path, 'w', encoding='utf-8') as f:
+                    json.dump(checkpoint, f, ensure_ascii=False, indent=2)
+                    f.flush()
+                    os.fsync(f.fileno())
+                os.replace(temp_path, self.path)
+                self.last_saved = checkpoint
+                self.last_error = None
+            except Exception as e:
+                self.last_error = str(e)
+                logger.error(f"保存SGP41算法状态失败: {e}")
+                raise
+
+        logger.debug(f"SGP41算法状态已保存: {states}")
+        return checkpoint
+
+    def read(self):
+        """读取检查点文件（不存在或损坏时返回None）"""
+        if not self.path.exists():
+            return None
+        try:
+            with open(self.path, encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError) as e:
+            logger.warning(f"SGP41算法状态文件无法读取: {e}")
+            return None
+
+    def load(self):
+        """读取可用于恢复的检查点：版本和算法参数一致，且未超过max_age
+
+        返回 (checkpoint, reason)，不可用时checkpoint为None，reason说明原因
+        """
+        checkpoint = self.read()
+        if checkpoint is None:
+            return None, '没有检查点'
+        if checkpoint.get('version') != self.VERSION:
+            return None, f"检查点版本不匹配: {checkpoint.get('version')}"
+        if checkpoint.get('tuning') != self.tuning:
+            return None, '算法参数已变化'
+
+        age = time.time() - checkpoint.get('saved_at', 0)
+        if age > self.max_age:
+            return None, f"检查点已过期（{age:.0f}秒 > {self.max_age}秒）"
+        if not checkpoint.get('states'):
+            return None, '检查点没有算法状态'
+        return checkpoint, f"检查点保存于{age:.0f}秒前"
+
+    def get_status(self):
+        """检查点状态"""
+        checkpoint = self.read()
+        saved_at = checkpoint.get('saved_at') if checkpoint else None
+        return {
+            'path': str(self.path),
+            'max_age_seconds': self.max_age,
+            'saved_at': saved_at,
+            'age_seconds': round(time.time() - saved_at, 1) if saved_at else None,
+            'uptime_seconds': checkpoint.get('uptime') if checkpoint else None,
+            'states': checkpoint.get('states') if checkpoint else None,
+            'last_restored': self.last_restored,
+            'last_error': self.last_error
+        }
@@ -5,13 +5,20 @@
 传感器管理器模块 - 修复版本
 """
 
+import atexit
 import threading
 import time
 from datetime import datetime
 from app.sensors.scd40 import SCD40Sensor
 from app.sensors.dht22 import DHT22Sensor
 from app.sensors.sgp41 import SGP41Sensor
+from app.sensors.algorithm_state import AlgorithmStateStore
+from app.sensors.aggregator import WindowAggregator
+from app.models import WINDOW_METRICS
+from app.storage.deadband import DeadbandFilter
+from app.storage.writer import BatchWriter
 from config.sensors import SensorConfig
+from config.settings import Config
 from config.logging_config import get_logger
 
 logger = get_logger(__name__)
@@ -24,6 +31,7 @@ class SensorManager:
         self.sensors = {}
         self.sensor_status = {}
         self.latest_data = {
+            'node_id': Config.NODE_ID,
             'timestamp': None,
             'scd40': {'co2': None, 'temperature': None, 'humidity': None},
             'dht22': {'temperature': None, 'humidity': None},
@@ -42,6 +50,38 @@ class SensorManager:
         self.sgp41_thread = None
         self.sgp41_latest_data = None
         self.sgp41_data_lock = threading.Lock()
+        
+        # SGP41每秒原始信号写入环形文件（不经过数据库）
+        self.raw_ring = getattr(app, 'raw_ring', None)
+        self.raw_ring_last_read = None
+        
+        # 两次写入之间所有采样的流式聚合（写入时输出平均/最小/最大/采样数）
+        self.window = WindowAggregator(WINDOW_METRICS)
+        self.sgp41_window_last_read = None
+        
+        # SGP41算法状态检查点（重启后恢复学习到的基线）
+        self.sgp41_state = None
+        self.sgp41_state_saved_time = 0
+        if Config.SGP41_STATE_ENABLED:
+            self.sgp41_state = AlgorithmStateStore(
+                Config.SGP41_STATE_PATH,
+                max_age=Config.SGP41_STATE_MAX_AGE,
+                tuning=SensorConfig.SGP41_CONFIG['algorithm']
+            )
+
+        # 批量写入器（后台线程合并提交）
+        self.writer = BatchWriter(
+            app,
+            max_queue_size=Config.WRITE_QUEUE_SIZE,
+            batch_size=Config.WRITE_BATCH_SIZE,
+            max_batch_age=Config.WRITE_BATCH_MAX_AGE,
+            spool=getattr(app, 'write_spool', None),
+            replay_batch_size=Config.WRITE_SPOOL_REPLAY_BATCH,
+            retry_interval=Config.WRITE_SPOOL_RETRY_INTERVAL,
+            max_replay_attempts=Config.WRITE_SPOOL_MAX_ATTEMPTS,
+            deadband=DeadbandFilter(Config.DEADBAND_THRESHOLDS, Config.DEADBAND_HEARTBEAT)
+            if Config.DEADBAND_ENABLED else None
+        )
 
         # 初始化传感器
         self.initialize_sensors()
@@ -78,6 +118,7 @@ class SensorManager:
                 self.sensors['sgp41'] = SGP41Sensor()
                 self.sensor_status['sgp41'] = 'online'
                 logger.info("✅ SGP41传感器初始化成功")
+                self.restore_sgp41_state()
             except Exception as e:
                 logger.error(f"❌ SGP41传感器初始化失败: {e}")
                 self.sensors['sgp41'] = None
@@ -88,6 +129,7 @@ class SensorManager:
     def read_all_sensors(self):
         """读取所有传感器数据"""
         sensor_data = {
+            'node_id': Config.NODE_ID,
             'timestamp': time.time(),
             'scd40': {'co2': None, 'temperature': None, 'humidity': None},
             'dht22': {'temperature': None, 'humidity': None},
@@ -153,6 +195,22 @@ class SensorManager:
                     # 读取SGP41数据
                     sraw_voc, sraw_nox, voc_index, nox_index = self.sensors['sgp41'].read()
                     
+                    # 保存每秒原始信号（读取失败时read返回上次数据，按读取时间去重）
+                    read_time = self.sensors['sgp41'].last_read_time
+                    if self.raw_ring and sraw_voc is not None and sraw_nox is not None \
+                            and read_time and read_time != self.raw_ring_last_read:
+                        self.raw_ring.append(read_time, sraw_voc, sraw_nox)
+                        self.raw_ring_last_read = read_time
+                    
+                    # 每个新采样计入聚合窗口
+                    if read_time and read_time != self.sgp41_window_last_read:
+                        self.window.add_sample({'sgp41_voc_index': voc_index, 'sgp41_nox_index': nox_index})
+                        self.sgp41_window_last_read = read_time
+                    
+                    # 定期保存算法状态
+                    if self.sgp41_state and time.time() - self.sgp41_state_saved_time >= Config.SGP41_STATE_INTERVAL:
+                        self.save_sgp41_state()
+                    
                     # 更新缓存
                     with self.sgp41_data_lock:
                         self.sgp41_latest_data = {
@@ -170,46 +228,62 @@ class SensorManager:
                 time.sleep(5)
 
 
-    def store_sensor_data(self, sensor_data):
-        """存储传感器数据到数据库"""
+    def restore_sgp41_state(self):
+        """从检查点恢复SGP41算法状态（检查点过期或参数变化时跳过）"""
+        if not self.sgp41_state or not self.sensors.get('sgp41'):
+            return []
+        
+        checkpoint, reason = self.sgp41_state.load()
+        if not checkpoint:
+            logger.info(f"SGP41算法状态未恢复: {reason}")
+            return []
+        
         try:
-            from app.models import SensorData
-            
-            record = SensorData(
-                scd40_co2=sensor_data['scd40']['co2'],
-                scd40_temperature=None,
-                scd40_humidity=None,
-                dht22_temperature=sensor_data['dht22']['temperature'],
-                dht22_humidity=sensor_data['dht22']['humidity'],
-                sgp41_sraw_voc=sensor_data['sgp41']['sraw_voc'],
-                sgp41_sraw_nox=sensor_data['sgp41']['sraw_nox'],
-                sgp41_voc_index=sensor_data['sgp41']['voc_index'],
-                sgp41_nox_index=sensor_data['sgp41']['nox_index'],
-                timestamp=datetime.utcnow()
-            )
-            
-            # 使用应用上下文
-            if self.app:
-                with self.app.app_context():
-                    # 确保 db 被正确导入
-                    from app import db
-                    db.session.add(record)
-                    db.session.commit()
-                    return True
-            else:
-                # 如果没有应用上下文，记录日志但不存储
-                logger.warning("无法存储数据：缺少应用上下文")
-                return False
-                
+            restored = self.sensors['sgp41'].set_algorithm_states(checkpoint['states'], checkpoint.get('uptime', 0))
+            self.sgp41_state.last_restored = {'time': time.time(), 'algorithms': restored, 'reason': reason}
+            logger.info(f"✅ SGP41算法状态已恢复: {restored} ({reason})")
+            return restored
         except Exception as e:
-            logger.error(f"数据存储失败: {e}")
-            # 尝试回滚
-            try:
-                from app import db
-                db.session.rollback()
-            except:
-                pass
-            return False
+            logger.error(f"SGP41算法状态恢复失败: {e}")
+            return []
+    
+    def save_sgp41_state(self):
+        """保存SGP41算法状态检查点
+
+        算法运行不足 SGP41_STATE_MIN_UPTIME 时状态尚未学习完成，不保存（保留上一个检查点），返回None
+        """
+        self.sgp41_state_saved_time = time.time()
+        uptime = self.sensors['sgp41'].get_algorithm_uptime()
+        if uptime < Config.SGP41_STATE_MIN_UPTIME:
+            logger.debug(f"SGP41算法运行{uptime:.0f}秒，未满{Config.SGP41_STATE_MIN_UPTIME}秒，跳过保存检查点")
+            return None
+        states = self.sensors['sgp41'].get_algorithm_states()
+        return self.sgp41_state.save(states, round(uptime))
+    
+    def store_sensor_data(self, sensor_data):
+        """将传感器数据提交到批量写入队列"""
+        record = {
+            'scd40_co2': sensor_data['scd40']['co2'],
+            'scd40_temperature': None,
+            'scd40_humidity': None,
+            'dht22_temperature': sensor_data['dht22']['temperature'],
+            'dht22_humidity': sensor_data['dht22']['humidity'],
+            'sgp41_sraw_voc': sensor_data['sgp41']['sraw_voc'],
+            'sgp41_sraw_nox': sensor_data['sgp41']['sraw_nox'],
+            'sgp41_voc_index': sensor_data['sgp41']['voc_index'],
+            'sgp41_nox_index': sensor_data['sgp41']['nox_index'],
+            'timestamp': datetime.utcnow(),
+            'node_id': Config.NODE_ID
+        }
+        
+        # SGP41指数的主列保存窗口平均值（四舍五入为整数；没有采样时保留最新读数），并附带最小/最大/采样数
+        for metric, window in self.window.snapshot().items():
+            mean = window['mean']
+            record[metric] = int(round(mean)) if isinstance(window['min'], int) else round(mean, 2)
+            record[f'{metric}_min'] = window['min']
+            record[f'{metric}_max'] = window['max']
+            record[f'{metric}_count'] = window['count']
+        return self.writer.submit(record)
         
     def collection_worker(self):
         """数据采集工作线程"""
@@ -260,6 +334,10 @@ class SensorManager:
         
         self.running = True
 
+        # 启动批量写入线程，进程退出时写入剩余数据
+        self.writer.start(self.app)
+        atexit.register(self.stop_collection)
+
         # 启动主数据采集线程
         self.collection_thread = threading.Thread(
             target=self.collection_worker,
@@ -287,6 +365,18 @@ class SensorManager:
             self.collection_thread.join(timeout=5)
         if self.sgp41_thread:
             self.sgp41_thread.join(timeout=5)
+
+        # 保存最新的SGP41算法状态
+        if self.sensors.get('sgp41') and self.sgp41_state:
+            try:
+                self.save_sgp41_state()
+            except Exception:
+                pass
+
+        # 最后写入队列中剩余的数据
+        self.writer.stop()
+        if self.raw_ring:
+            self.raw_ring.flush()
         logger.info("所有数据采集线程已停止")
     
     def get_latest_data(self):
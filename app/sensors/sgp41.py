@@ -35,6 +35,7 @@ class SGP41Sensor:
         self.is_conditioned = False
         self.conditioning_start_time = 0
         self.last_read_time = 0
+        self.algorithm_start_time = 0  # 算法开始学习的时间（恢复检查点时按检查点的运行时长回推）
         self.last_data = {
             'sraw_voc': None,
             'sraw_nox': None,
@@ -123,6 +124,7 @@ class SGP41Sensor:
                 std_initial=nox_params.get('std_initial', 50),  # 默认50
                 gain_factor=nox_params['gain_factor']
             )
+            self.algorithm_start_time = time.time()
             
             logger.info(f"SGP41初始化成功 (I2C地址: 0x{self.config['i2c_address']:02x})")
             
@@ -371,6 +373,7 @@ class SGP41Sensor:
             'is_conditioned': self.is_conditioned,
             'conditioning_start_time': self.conditioning_start_time,
             'last_read_time': self.last_read_time,
+            'algorithm_uptime': round(self.get_algorithm_uptime(), 1),
             'last_data': self.last_data,
             'voc_filter_stats': self.voc_filter.get_stats(),
             'nox_filter_stats': self.nox_filter.get_stats(),
@@ -380,6 +383,35 @@ class SGP41Sensor:
             }
         }
     
+    def get_algorithm_states(self):
+        """获取VOC/NOx算法学习到的状态（均值和标准差估计）"""
+        states = {}
+        for name, algorithm in (('voc', self.voc_algorithm), ('nox', self.nox_algorithm)):
+            if algorithm is not None and hasattr(algorithm, 'get_states'):
+                states[name] = [float(value) for value in algorithm.get_states()]
+        return states
+    
+    def set_algorithm_states(self, states, uptime=0):
+        """恢复算法状态，跳过初始学习阶段，返回已恢复的算法名列表
+
+        uptime为保存状态时算法已运行的秒数，恢复后算法运行时长从该值继续计算
+        """
+        restored = []
+        for name, algorithm in (('voc', self.voc_algorithm), ('nox', self.nox_algorithm)):
+            values = states.get(name)
+            if values and algorithm is not None and hasattr(algorithm, 'set_states'):
+                algorithm.set_states(*values)
+                restored.append(name)
+        if restored:
+            self.algorithm_start_time = time.time() - uptime
+        return restored
+    
+    def get_algorithm_uptime(self):
+        """算法已运行（学习）的秒数"""
+        if not self.algorithm_start_time:
+            return 0
+        return time.time() - self.algorithm_start_time
+    
     def reset_filters(self):
         """重置数据过滤器"""
         self.voc_filter.reset()
@@ -0,0 +1,9 @@
+"""
+数据存储模块包
+"""
+
+from .writer import BatchWriter
+
+__all__ = [
+    'BatchWriter'
+]
@@ -0,0 +1,382 @@
+# app/storage/archive.py
+"""
+列式冷归档模块 - 已结束的月份按列保存为NumPy数组文件（每月每列一个.npy），
+查询时只内存映射需要的列，在线SQLite只保留最近的数据
+"""
+
+import json
+import re
+import shutil
+from collections import namedtuple
+from datetime import datetime
+from pathlib import Path
+
+import numpy as np
+from sqlalchemy import select
+
+from app.storage.query import keyset_range, page_key
+from config.logging_config import get_logger
+
+logger = get_logger(__name__)
+
+# 时间列使用微秒精度，空值为NaT
+TIME_DTYPE = 'datetime64[us]'
+
+
+def month_start(key):
+    """月份起点（UTC naive datetime）"""
+    return datetime(key[0], key[1], 1)
+
+
+def next_month(key):
+    """下一个月份"""
+    return (key[0] + 1, 1) if key[1] == 12 else (key[0], key[1] + 1)
+
+
+class ColumnarArchive:
+    """列式归档 - 目录结构为 <archive_dir>/YYYY-MM/<列名>.npy，manifest.json写入后月份才可见
+
+    字符串列（节点标识）按字典编码：列文件保存uint16编号，取值表记录在manifest的dictionaries中；
+    node为数据库所属节点，node_id为空的记录及没有取值表的旧归档都归为该节点
+    """
+
+    MONTH_PATTERN = re.compile(r'^(\d{4})-(\d{2})$')
+    MANIFEST = 'manifest.json'
+
+    def __init__(self, directory, table, node):
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.table = table
+        self.node = node
+
+        # 每列的存储类型：整数列和浮点列都用float64（NaN表示空值，53位内整数精确）
+        self.dtypes = {}
+        self.integer_columns = set()
+        self.dictionary_columns = set()
+        for column in table.columns:
+            python_type = column.type.python_type
+            if python_type is datetime:
+                self.dtypes[column.name] = TIME_DTYPE
+            elif python_type is str:
+                self.dtypes[column.name] = 'uint16'
+                self.dictionary_columns.add(column.name)
+            elif column.primary_key:
+                self.dtypes[column.name] = 'int64'
+            elif python_type is int:
+                self.dtypes[column.name] = 'float64'
+                self.integer_columns.add(column.name)
+            elif python_type is float:
+                self.dtypes[column.name] = 'float64'
+
+        # 时间相同的记录按次排序列区分先后（标准模式为id，紧凑模式为node_id），与在线查询的顺序一致
+        self.tiebreak = table.c[page_key(table)]
+
+        self.row_types = {}
+
+    # ---------- 月份定位 ----------
+
+    @staticmethod
+    def format_key(key):
+        """月份名，格式 YYYY-MM"""
+        return f"{key[0]:04d}-{key[1]:02d}"
+
+    def month_dir(self, key):
+        """月份目录"""
+        return self.directory / self.format_key(key)
+
+    def list_months(self):
+        """已归档的月份（按时间升序，只包含写入完成的月份）"""
+        keys = []
+        for path in self.directory.iterdir():
+            match = self.MONTH_PATTERN.match(path.name)
+            if match and (path / self.MANIFEST).exists():
+                keys.append((int(match.group(1)), int(match.group(2))))
+        return sorted(keys)
+
+    def months_for_range(self, start=None, end=None):
+        """与时间范围重叠的已归档月份"""
+        start_key = (start.year, start.month) if start else None
+        end_key = (end.year, end.month) if end else None
+        return [
+            key for key in self.list_months()
+            if (start_key is None or key >= start_key) and (end_key is None or key <= end_key)
+        ]
+
+    def overlaps(self, start=None, end=None):
+        """时间范围是否涉及已归档的月份"""
+        return bool(self.months_for_range(start, end))
+
+    def read_manifest(self, key):
+        """读取月份清单（行数、时间范围、各列统计）"""
+        with open(self.month_dir(key) / self.MANIFEST, encoding='utf-8') as f:
+            return json.load(f)
+
+    # ---------- 写入 ----------
+
+    def rows_to_arrays(self, rows):
+        """将查询结果行转换为按列的数组"""
+        arrays = {}
+        for name, dtype in self.dtypes.items():
+            values = [getattr(row, name) for row in rows]
+            if dtype == TIME_DTYPE:
+                arrays[name] = np.array(values, dtype=TIME_DTYPE)
+            elif dtype == 'int64':
+                arrays[name] = np.array(values, dtype='int64')
+            elif name in self.dictionary_columns:
+                # 写入时再统一编码（每月一个取值表），空值归为数据库所属节点
+                arrays[name] = np.array([self.node if v is None else v for v in values], dtype=object)
+            else:
+                arrays[name] = np.array([np.nan if v is None else v for v in values], dtype=dtype)
+        return arrays
+
+    def write_month(self, key, chunks):
+        """写入一个月的数据（chunks为按列数组的迭代器），已有归档时合并
+
+        先写入临时目录再替换，读取方看到的始终是完整的月份
+        """
+        parts = {name: [] for name in self.dtypes}
+        for arrays in chunks:
+            for name in parts:
+                parts[name].append(arrays[name])
+
+        target = self.month_dir(key)
+        if (target / self.MANIFEST).exists():
+            for name in parts:
+                parts[name].insert(0, self._decoded(key, name))
+
+        columns = {
+            name: np.concatenate(values) if values else np.array([], dtype=self.dtypes[name])
+            for name, values in parts.items()
+        }
+        tie = columns[self.tiebreak.name]
+        if tie.dtype == object:
+            tie = np.unique(tie.astype(str), return_inverse=True)[1]
+        order = np.lexsort((tie, columns['timestamp']))
+        columns = {name: values[order] for name, values in columns.items()}
+
+        dictionaries = {}
+        for name in self.dictionary_columns:
+            values, codes = np.unique(columns[name].astype(str), return_inverse=True)
+            dictionaries[name] = values.tolist()
+            columns[name] = codes.astype(self.dtypes[name])
+
+        staging = self.directory / f".{self.format_key(key)}.tmp"
+        shutil.rmtree(staging, ignore_errors=True)
+        staging.mkdir()
+        for name, values in columns.items():
+            np.save(staging / f"{name}.npy", values)
+        with open(staging / self.MANIFEST, 'w', encoding='utf-8') as f:
+            json.dump(self._build_manifest(key, columns, dictionaries), f, ensure_ascii=False, indent=2)
+
+        if target.exists():
+            retired = self.directory / f".{self.format_key(key)}.old"
+            shutil.rmtree(retired, ignore_errors=True)
+            target.rename(retired)
+            staging.rename(target)
+            shutil.rmtree(retired, ignore_errors=True)
+        else:
+            staging.rename(target)
+
+        rows = len(columns['timestamp'])
+        logger.info(f"归档已写入: {self.format_key(key)} ({rows} 行)")
+        return rows
+
+    def _build_manifest(self, key, columns, dictionaries):
+        """月份清单：行数、时间范围和各指标的统计值（供跨年对比直接使用）"""
+        timestamps = columns['timestamp']
+        stats = {}
+        for name, values in columns.items():
+            if values.dtype.kind != 'f':
+                continue
+            valid = values[~np.isnan(values)]
+            stats[name] = {
+                'count': int(valid.size),
+                'min': float(valid.min()) if valid.size else None,
+                'max': float(valid.max()) if valid.size else None,
+                'mean': float(valid.mean()) if valid.size else None
+            }
+
+        return {
+            'month': self.format_key(key),
+            'rows': int(timestamps.size),
+            'first': str(timestamps[0]) if timestamps.size else None,
+            'last': str(timestamps[-1]) if timestamps.size else None,
+            'archived_at': datetime.utcnow().isoformat(),
+            'dtypes': {name: str(values.dtype) for name, values in columns.items()},
+            'dictionaries': dictionaries,
+            'stats': stats
+        }
+
+    def archive_month(self, engine, key, batch_size=50000):
+        """从SQLite读取一个月的数据写入归档，返回归档行数（不删除源数据）"""
+        table = self.table
+        tiebreak = self.tiebreak
+        start, end = month_start(key), month_start(next_month(key))
+
+        def chunks():
+            last = None
+            while True:
+                stmt = select(table).where(table.c.timestamp < end)
+                if last is None:
+                    stmt = stmt.where(table.c.timestamp >= start)
+                else:
+                    stmt = stmt.where(
+                        (table.c.timestamp > last.timestamp) |
+                        ((table.c.timestamp == last.timestamp) & (tiebreak > getattr(last, tiebreak.name)))
+                    )
+                stmt = stmt.order_by(table.c.timestamp.asc(), tiebreak.asc()).limit(batch_size)
+                with engine.connect() as conn:
+                    rows = conn.execute(stmt).all()
+                if not rows:
+                    break
+                last = rows[-1]
+                yield self.rows_to_arrays(rows)
+
+        return self.write_month(key, chunks())
+
+    # ---------- 查询 ----------
+
+    def _load(self, key, name):
+        """内存映射单列（只读），归档后模型新增的列返回全空数组"""
+        path = self.month_dir(key) / f"{name}.npy"
+        if not path.exists() and name in self.dtypes:
+            rows = self.read_manifest(key)['rows']
+            dtype = self.dtypes[name]
+            if name in self.dictionary_columns:
+                return np.zeros(rows, dtype=dtype)
+            return np.full(rows, np.datetime64('NaT') if dtype == TIME_DTYPE else np.nan, dtype=dtype)
+        return np.load(path, mmap_mode='r')
+
+    def _dictionary(self, key, name):
+        """字典编码列的取值表（没有该列的旧归档全部属于数据库所属节点）"""
+        return self.read_manifest(key).get('dictionaries', {}).get(name) or [self.node]
+
+    def _decoded(self, key, name):
+        """整列读入内存，字典编码列还原为字符串"""
+        values = np.array(self._load(key, name))
+        if name in self.dictionary_columns:
+            return np.array(self._dictionary(key, name), dtype=object)[values]
+        return values
+
+    def _select(self, key, start, end, require, node=None):
+        """时间范围、节点和非空条件筛选后的行下标"""
+        timestamps = self._load(key, 'timestamp')
+        lo = np.searchsorted(timestamps, np.datetime64(start, 'us'), 'left') if start else 0
+        hi = np.searchsorted(timestamps, np.datetime64(end, 'us'), 'right') if end else len(timestamps)
+        index = np.arange(lo, hi)
+        if require and index.size:
+            mask = np.zeros(index.size, dtype=bool)
+            for name in require:
+                mask |= ~np.isnan(self._load(key, name)[lo:hi])
+            index = index[mask]
+        if node is not None and index.size:
+            dictionary = self._dictionary(key, 'node_id')
+            if node not in dictionary:
+                return index[:0]
+            index = index[self._load(key, 'node_id')[index] == dictionary.index(node)]
+        return index
+
+    def _after(self, key, index, after, descending):
+        """去掉after时间戳上次排序列不在after之后（倒序时为之前）的行（范围已从after的时间戳开始）"""
+        timestamps = self._load(key, 'timestamp')[index]
+        at = np.flatnonzero(timestamps == np.datetime64(after[0], 'us'))
+        if not at.size:
+            return index
+        ties = self._column_values(key, self.tiebreak.name, index[at])
+        drop = [i for i, tie in zip(at.tolist(), ties) if (tie >= after[1] if descending else tie <= after[1])]
+        return np.delete(index, drop)
+
+    def _to_python(self, name, values):
+        """数组转Python值：NaN/NaT转None，整数列还原为int"""
+        if values.dtype.kind == 'M':
+            return values.astype(TIME_DTYPE).tolist()
+        if values.dtype.kind != 'f':
+            return values.tolist()
+        nulls = np.isnan(values).tolist()
+        if name in self.integer_columns:
+            return [None if null else int(v) for v, null in zip(values.tolist(), nulls)]
+        return [None if null else v for v, null in zip(values.tolist(), nulls)]
+
+    def _column_values(self, key, name, index):
+        """按行下标读取一列的Python值"""
+        values = self._load(key, name)[index]
+        if name in self.dictionary_columns:
+            dictionary = self._dictionary(key, name)
+            return [dictionary[code] for code in values.tolist()]
+        return self._to_python(name, values)
+
+    def _row_type(self, columns):
+        """与SQL查询结果相同的属性访问方式（row.timestamp、row.<列名>）"""
+        row_type = self.row_types.get(columns)
+        if row_type is None:
+            row_type = namedtuple('ArchivedRow', ('timestamp',) + columns)
+            self.row_types[columns] = row_type
+        return row_type
+
+    def fetch(self, columns, start=None, end=None, require=None, descending=False, limit=None, node=None,
+              after=None):
+        """读取归档中的时间序列，返回与fetch_series相同结构的行（after见 StorageBackend.scan）"""
+        columns = tuple(columns)
+        row_type = self._row_type(columns)
+        start, end = keyset_range(start, end, after, descending)
+        keys = self.months_for_range(start, end)
+        if descending:
+            keys.reverse()
+
+        rows = []
+        for key in keys:
+            index = self._select(key, start, end, require, node)
+            if after is not None and index.size:
+                index = self._after(key, index, after, descending)
+            if descending:
+                index = index[::-1]
+            if limit:
+                index = index[:limit - len(rows)]
+            if not index.size:
+                continue
+
+            values = [self._to_python('timestamp', self._load(key, 'timestamp')[index])]
+            values += [self._column_values(key, name, index) for name in columns]
+            rows.extend(row_type._make(row) for row in zip(*values))
+
+            if limit and len(rows) >= limit:
+                break
+        return rows
+
+    def count(self, start=None, end=None, require=None, node=None):
+        """统计归档中的记录数"""
+        return sum(int(self._select(key, start, end, require, node).size)
+                   for key in self.months_for_range(start, end))
+
+    def bounds(self, node=None):
+        """归档中最早和最晚记录时间"""
+        keys = self.list_months()
+        if node is not None:
+            first = self.fetch([], node=node, limit=1)
+            last = self.fetch([], node=node, descending=True, limit=1)
+            return (first[0].timestamp if first else None, last[0].timestamp if last else None)
+        if not keys:
+            return None, None
+        first = self._load(keys[0], 'timestamp')
+        last = self._load(keys[-1], 'timestamp')
+        return (
+            first[0].astype(TIME_DTYPE).tolist() if first.size else None,
+            last[-1].astype(TIME_DTYPE).tolist() if last.size else None
+        )
+
+    def nodes(self):
+        """归档中出现过的节点标识"""
+        return {node for key in self.list_months() for node in self._dictionary(key, 'node_id')}
+
+    def get_archive_info(self):
+        """已归档月份的清单及文件大小"""
+        info = []
+        for key in self.list_months():
+            manifest = self.read_manifest(key)
+            manifest['size'] = sum(path.stat().st_size for path in self.month_dir(key).iterdir())
+            info.append(manifest)
+        return info
+
+    def total_size(self):
+        """归档文件总大小"""
+        return sum(item['size'] for item in self.get_archive_info())
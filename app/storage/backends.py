@@ -0,0 +1,712 @@
+# app/storage/backends.py
+"""
+存储后端模块 - 时间序列存储的统一接口（批量追加、按指标范围扫描、按时间桶聚合、最新记录、统计），
+API通过 app.storage.query 调用当前后端，更换存储引擎不需要修改端点
+"""
+
+import threading
+from collections import namedtuple
+from datetime import datetime, timedelta
+from pathlib import Path
+
+from sqlalchemy import Float, Integer, case, cast, select, func, or_, type_coerce
+
+from app.storage.query import after_clause, after_filter, keyset_range, page_key, series_statement
+from app.storage.rollups import (aggregate_rollups, aggregate_rows, apply_rollups, bucket_start, from_epoch,
+                                 rollup_tier, to_epoch, window_columns)
+from app.storage.sqlite_tuning import database_file_size
+from config.settings import Config
+from config.logging_config import get_logger
+
+logger = get_logger(__name__)
+
+# 聚合结果中每个指标一个桶（与汇总表行的属性相同）
+Bucket = namedtuple('Bucket', ('count', 'min', 'max', 'sum', 'last'))
+
+
+def typed_bucket(table, name, count, low, high, total, last):
+    """构造Bucket：整数列的最小/最大/最后一个值还原为int（汇总表和浮点聚合读出的是float）"""
+    if table.c[name].type.python_type is int:
+        low, high, last = (None if value is None else int(round(value)) for value in (low, high, last))
+    return Bucket(count, low, high, total, last)
+
+# 去重查找：按范围扫描时，同一节点相邻时间戳间隔超过该值就分成两段读取
+KEY_SCAN_GAP = timedelta(minutes=10)
+# 按键精确查找时每条IN查询的时间戳数
+KEY_LOOKUP_CHUNK = 500
+
+
+def epoch_seconds(column):
+    """时间戳列的整数epoch秒SQL表达式（紧凑模式为整数毫秒，标准模式为SQLite日期字符串）"""
+    from app.models import EpochMillis
+
+    if isinstance(column.type, EpochMillis):
+        return type_coerce(column, Integer) // 1000
+    return cast(func.strftime('%s', column), Integer)
+
+
+def keys_by_node(keys):
+    """(节点, 时间戳) 按节点分组，每组时间戳升序"""
+    grouped = {}
+    for node, timestamp in keys:
+        grouped.setdefault(node, []).append(timestamp)
+    return {node: sorted(times) for node, times in grouped.items()}
+
+
+def time_runs(times, gap):
+    """升序时间戳分成相邻间隔不超过gap的段，返回 [(段起点, 段终点)]"""
+    runs = []
+    for timestamp in times:
+        if runs and timestamp - runs[-1][1] <= gap:
+            runs[-1][1] = timestamp
+        else:
+            runs.append([timestamp, timestamp])
+    return [tuple(run) for run in runs]
+
+
+def quote(name):
+    """SQL标识符加引号（timestamp等列名在DuckDB中是关键字）"""
+    return f'"{name}"'
+
+
+class StorageBackend:
+    """存储后端接口
+
+    scan 返回的行支持 row.timestamp 和 row.<列名> 属性访问；
+    aggregate 返回按桶起点（UTC epoch秒，按本地时区对齐）排序的 [(bucket_start, {metric: Bucket})]；
+    查询方法的node参数只返回该节点的数据，为None时包含所有节点
+    """
+
+    name = None
+
+    def append_batch(self, records, rollup_records=None):
+        """在一个事务中追加一批记录（字段名与SensorData列名一致），失败时抛出异常
+
+        rollup_records: 用于更新汇总的完整采样（死区模式下records只含变化的值），默认与records相同
+        """
+        raise NotImplementedError
+
+    def scan(self, columns, start=None, end=None, require=None, descending=False, limit=None, node=None,
+             after=None):
+        """按时间顺序读取指定列；require中至少一列非空的记录才返回
+
+        columns包含次排序列（见 query.page_key）或指定after时，同一时间戳按次排序列排序；
+        after: (timestamp, 次排序列值)，只返回在其之后（倒序时为之前）的记录（keyset分页）
+        """
+        raise NotImplementedError
+
+    def aggregate(self, metrics, bucket_seconds, start, end=None, node=None):
+        """按时间桶聚合各指标的 count/min/max/sum/last（node为None时合并所有节点）"""
+        raise NotImplementedError
+
+    def count(self, start=None, end=None, require=None, node=None):
+        """统计时间范围内的记录数"""
+        raise NotImplementedError
+
+    def time_bounds(self, node=None):
+        """最早和最晚记录时间"""
+        raise NotImplementedError
+
+    def nodes(self):
+        """有记录的节点标识（升序）"""
+        raise NotImplementedError
+
+    def size(self):
+        """磁盘占用（字节）"""
+        raise NotImplementedError
+
+    def existing_keys(self, keys):
+        """keys（(节点, 时间戳)，时间为存储精度）中已存储的键，用于去重
+
+        只读取各节点时间戳所在的连续时间段（相邻间隔超过KEY_SCAN_GAP时分段），不扫描整个时间范围
+        """
+        keys = set(keys)
+        found = set()
+        for node, times in keys_by_node(keys).items():
+            for start, end in time_runs(times, KEY_SCAN_GAP):
+                found.update((node, row.timestamp)
+                             for row in self.scan(['node_id'], start=start, end=end, node=node))
+        return found & keys
+
+    def threshold(self, metric, above=None, below=None, start=None, end=None, node=None):
+        """指标大于above和/或小于below的采样（按时间升序，行包含timestamp和该指标）"""
+        rows = self.scan([metric], start=start, end=end, require=[metric], node=node)
+        return [
+            row for row in rows
+            if (above is None or getattr(row, metric) > above) and
+               (below is None or getattr(row, metric) < below)
+        ]
+
+    def latest(self, columns, require=None, node=None):
+        """最新一条记录（没有数据时返回None）"""
+        rows = self.scan(columns, require=require, descending=True, limit=1, node=node)
+        return rows[0] if rows else None
+
+    def stats(self, node=None):
+        """记录数、时间范围和磁盘占用（磁盘占用始终为整个存储）"""
+        earliest, latest = self.time_bounds(node=node)
+        return {
+            'backend': self.name,
+            'node': node,
+            'rows': self.count(node=node),
+            'earliest': earliest.isoformat() if earliest else None,
+            'latest': latest.isoformat() if latest else None,
+            'size': self.size()
+        }
+
+    def close(self):
+        """释放连接"""
+
+
+class SQLAlchemyBackend(StorageBackend):
+    """SQLite后端（SQLAlchemy Core）- 支持按月分区和列式归档，汇总表与原始数据同一事务更新"""
+
+    name = 'sqlite'
+
+    def __init__(self, storage, table, partition_store=None, archive=None):
+        self.storage = storage                  # DatabaseEngines（写连接 + 只读连接池）
+        self.table = table
+        self.partition_store = partition_store
+        self.archive = archive
+
+    # ---------- 写入 ----------
+
+    def append_batch(self, records, rollup_records=None):
+        table = self.table
+        # 只保留当前存储模式中存在的列（紧凑模式没有id、created_at等列）
+        rows = [{key: value for key, value in record.items() if key in table.c} for record in records]
+
+        rollup_records = records if rollup_records is None else rollup_records
+        if self.partition_store is not None:
+            self._append_partitioned(rows, rollup_records)
+            return
+
+        with self.storage.write_transaction() as conn:
+            if rows:
+                conn.execute(table.insert(), rows)
+
+            # 汇总表与原始数据在同一事务中更新
+            apply_rollups(conn, rollup_records)
+
+    def _append_partitioned(self, rows, rollup_records):
+        """分区模式：涉及的月份分区ATTACH到写连接上，分区记录与主库汇总表在同一事务中提交
+
+        一批记录涉及的月份超过MAX_ATTACHED时，每MAX_ATTACHED个月份一个事务
+        """
+        from app.storage.partitions import MAX_ATTACHED
+
+        store = self.partition_store
+        groups = store.group_rows(rows)
+        rollup_groups = store.group_rows(rollup_records)
+        keys = sorted(set(groups) | set(rollup_groups))
+        for i in range(0, len(keys), MAX_ATTACHED):
+            chunk = keys[i:i + MAX_ATTACHED]
+            written = {key: groups[key] for key in chunk if key in groups}
+            with self.storage.writer.connect() as conn, store.attached(conn, list(written)) as aliases:
+                with conn.begin():
+                    store.insert_rows(conn, aliases, written)
+                    apply_rollups(conn, [record for key in chunk for record in rollup_groups.get(key, [])])
+
+    # ---------- 查询 ----------
+
+    def scan(self, columns, start=None, end=None, require=None, descending=False, limit=None, node=None,
+             after=None):
+        """时间范围涉及已归档月份时自动合并归档数据（归档月份都早于在线数据）"""
+        archive = self.archive
+        start, end = keyset_range(start, end, after, descending)
+        if archive is None or not archive.overlaps(start, end):
+            return self._scan_live(columns, start, end, require, descending, limit, node, after)
+
+        if descending:
+            first = self._scan_live(columns, start, end, require, True, limit, node, after)
+            rest = lambda remaining: archive.fetch(columns, start, end, require, True, remaining, node, after)
+        else:
+            first = archive.fetch(columns, start, end, require, False, limit, node, after)
+            rest = lambda remaining: self._scan_live(columns, start, end, require, False, remaining, node, after)
+
+        if limit and len(first) >= limit:
+            return first
+        return list(first) + list(rest(limit - len(first) if limit else None))
+
+    def _scan_live(self, columns, start=None, end=None, require=None, descending=False, limit=None,
+                   node=None, after=None):
+        """从在线数据库（单表或分区）读取"""
+        if self.partition_store is None:
+            stmt = series_statement(self.table, columns, start, end, require,
+                                    descending=descending, limit=limit, node=node, after=after)
+            with self.storage.read_connection() as conn:
+                return conn.execute(stmt).all()
+
+        # 分区的union结果按 (timestamp, 次排序列) 排序，次排序列需要在查询结果中
+        key = page_key(self.table)
+        if after is not None and key not in columns:
+            columns = list(columns) + [key]
+
+        def build(table):
+            stmt = series_statement(table, columns, start, end, require, node=node)
+            return stmt if after is None else stmt.where(after_clause(table, after, descending))
+
+        return self.partition_store.fetch(build, start=start, end=end, descending=descending, limit=limit)
+
+    def aggregate(self, metrics, bucket_seconds, start, end=None, node=None):
+        """一条SQL按时间桶GROUP BY：桶宽度为汇总层级的整数倍时合并汇总表（代价只与桶数有关），
+        否则聚合范围内的原始数据；涉及分区或归档时读取原始数据后在内存中计算
+        """
+        tier = rollup_tier(bucket_seconds, metrics, start)
+        if tier is not None:
+            with self.storage.read_connection() as conn:
+                buckets = aggregate_rollups(conn, tier, bucket_seconds, metrics, start, end, node=node)
+            if buckets:
+                return [(key, {metric: typed_bucket(self.table, metric, *row[:5])
+                               for metric, row in values.items()})
+                        for key, values in buckets]
+
+        if self.partition_store is None and (self.archive is None or not self.archive.overlaps(start, end)):
+            return self._aggregate_live(metrics, bucket_seconds, start, end, node)
+
+        rows = self.scan(list(metrics) + window_columns(metrics), start=start, end=end, require=metrics,
+                         node=node)
+        records = [row._asdict() for row in rows]
+        buckets = {}
+        for (_, metric, bucket, _), agg in aggregate_rows(records, [bucket_seconds], metrics).items():
+            buckets.setdefault(bucket, {})[metric] = typed_bucket(
+                self.table, metric, agg['count'], agg['min'], agg['max'], agg['sum'], agg['last'])
+        return sorted(buckets.items())
+
+    def _aggregate_live(self, metrics, bucket_seconds, start, end=None, node=None):
+        """原始数据表上一条GROUP BY语句（桶边界与汇总表一致，带窗口统计的指标按采样数加权）
+
+        每个指标的最后一个值由窗口函数取桶内最晚的非空值；紧凑模式的定点列在SQL中按整数聚合，
+        读出后再除以倍数
+        """
+        table = self.table
+        offset = int(Config.TIMEZONE_OFFSET * 3600)
+        bucket = (epoch_seconds(table.c.timestamp) + offset) // bucket_seconds * bucket_seconds - offset
+
+        columns = [bucket.label('bucket')]
+        for index, name in enumerate(metrics):
+            value = type_coerce(table.c[name], Float)
+            low = high = value
+            weight = 1
+            if f'{name}_count' in table.c:
+                weight = func.coalesce(table.c[f'{name}_count'], 1)
+                low = func.coalesce(type_coerce(table.c[f'{name}_min'], Float), value)
+                high = func.coalesce(type_coerce(table.c[f'{name}_max'], Float), value)
+            columns += [
+                value.label(f'v{index}'),
+                case((table.c[name].isnot(None), weight)).label(f'w{index}'),
+                low.label(f'lo{index}'),
+                high.label(f'hi{index}'),
+                func.first_value(value).over(
+                    partition_by=bucket, order_by=(table.c[name].is_(None), table.c.timestamp.desc())
+                ).label(f'last{index}')
+            ]
+
+        rows = select(*columns).where(
+            table.c.timestamp >= from_epoch(bucket_start(to_epoch(start), bucket_seconds)),
+            or_(*[table.c[name].isnot(None) for name in metrics])
+        )
+        if end is not None:
+            rows = rows.where(table.c.timestamp <= end)
+        if node is not None:
+            rows = rows.where(table.c.node_id == node)
+        rows = rows.subquery()
+
+        aggregates = []
+        for index in range(len(metrics)):
+            aggregates += [
+                func.sum(rows.c[f'w{index}']), func.min(rows.c[f'lo{index}']), func.max(rows.c[f'hi{index}']),
+                func.sum(rows.c[f'v{index}'] * rows.c[f'w{index}']), func.max(rows.c[f'last{index}'])
+            ]
+        stmt = select(rows.c.bucket, *aggregates).group_by(rows.c.bucket).order_by(rows.c.bucket)
+
+        scales = [getattr(table.c[name].type, 'scale', None) or 1 for name in metrics]
+        with self.storage.read_connection() as conn:
+            results = conn.execute(stmt).all()
+
+        buckets = []
+        for row in results:
+            values = {}
+            for index, name in enumerate(metrics):
+                count, low, high, total, last = row[1 + index * 5: 6 + index * 5]
+                if count:
+                    scale = scales[index]
+                    values[name] = typed_bucket(table, name, count, low / scale, high / scale, total / scale,
+                                                last / scale)
+            buckets.append((row[0], values))
+        return buckets
+
+    def threshold(self, metric, above=None, below=None, start=None, end=None, node=None):
+        """条件在SQL中过滤；涉及归档月份时由通用实现合并归档数据"""
+        if self.archive is not None and self.archive.overlaps(start, end):
+            return super().threshold(metric, above, below, start, end, node)
+
+        def build(table):
+            stmt = series_statement(table, [metric], start, end, [metric], node=node)
+            if above is not None:
+                stmt = stmt.where(table.c[metric] > above)
+            if below is not None:
+                stmt = stmt.where(table.c[metric] < below)
+            return stmt
+
+        if self.partition_store is None:
+            with self.storage.read_connection() as conn:
+                return conn.execute(build(self.table).order_by(self.table.c.timestamp)).all()
+        return self.partition_store.fetch(build, start=start, end=end)
+
+    def count(self, start=None, end=None, require=None, node=None):
+        def build(table):
+            stmt = select(func.count()).select_from(table)
+            if node is not None:
+                stmt = stmt.where(table.c.node_id == node)
+            if start is not None:
+                stmt = stmt.where(table.c.timestamp >= start)
+            if end is not None:
+                stmt = stmt.where(table.c.timestamp <= end)
+            if require:
+                stmt = stmt.where(or_(*[table.c[name].isnot(None) for name in require]))
+            return stmt
+
+        archived = self.archive.count(start, end, require, node) if self.archive is not None else 0
+
+        if self.partition_store is None:
+            with self.storage.read_connection() as conn:
+                return archived + (conn.execute(build(self.table)).scalar() or 0)
+        return archived + sum(count or 0 for count in self.partition_store.scalars(build, start, end))
+
+    def time_bounds(self, node=None):
+        earliest, latest = self._live_time_bounds(node)
+
+        if self.archive is not None:
+            archived_earliest, archived_latest = self.archive.bounds(node)
+            earliest = archived_earliest or earliest
+            latest = latest or archived_latest
+        return earliest, latest
+
+    def _live_time_bounds(self, node=None):
+        """在线数据库中最早和最晚记录时间"""
+        store = self.partition_store
+        if store is None:
+            table = self.table
+            stmt = select(func.min(table.c.timestamp), func.max(table.c.timestamp))
+            if node is not None:
+                stmt = stmt.where(table.c.node_id == node)
+            with self.storage.read_connection() as conn:
+                return tuple(conn.execute(stmt).one())
+
+        earliest = store.fetch(lambda table: series_statement(table, [], node=node), limit=1)
+        latest = store.fetch(lambda table: series_statement(table, [], node=node), descending=True, limit=1)
+        return (
+            earliest[0].timestamp if earliest else None,
+            latest[0].timestamp if latest else None
+        )
+
+    def nodes(self):
+        """在线数据（单表或各分区）和归档中出现过的节点"""
+        def build(table):
+            return select(table.c.node_id).distinct()
+
+        if self.partition_store is None:
+            with self.storage.read_connection() as conn:
+                found = set(conn.execute(build(self.table)).scalars())
+        else:
+            store = self.partition_store
+            found = set()
+            for key in store.list_partitions():
+                with store.get_engine(key).connect() as conn:
+                    found.update(conn.execute(build(store.table)).scalars())
+        if self.archive is not None:
+            found |= self.archive.nodes()
+        return sorted(node for node in found if node is not None)
+
+    def existing_keys(self, keys):
+        """单表模式按 (node_id, timestamp) 索引精确查找这些键；分区或归档模式按时间段扫描"""
+        if self.partition_store is not None or self.archive is not None:
+            return super().existing_keys(keys)
+
+        table = self.table
+        found = set()
+        with self.storage.read_connection() as conn:
+            for node, times in keys_by_node(keys).items():
+                for i in range(0, len(times), KEY_LOOKUP_CHUNK):
+                    stmt = select(table.c.node_id, table.c.timestamp).where(
+                        table.c.node_id == node, table.c.timestamp.in_(times[i:i + KEY_LOOKUP_CHUNK])
+                    )
+                    found.update((row.node_id, row.timestamp) for row in conn.execute(stmt))
+        return found
+
+    def size(self):
+        """数据库文件总大小（含-wal/-shm文件和分区）"""
+        size = database_file_size(self.storage.database_path)
+        if self.partition_store is not None:
+            size += self.partition_store.total_size()
+        return size
+
+    def close(self):
+        self.storage.dispose()
+
+
+class DuckDBBackend(StorageBackend):
+    """DuckDB后端 - 列式存储的单文件数据库，聚合查询在引擎内完成（不使用汇总表）
+
+    需要安装 duckdb（可选依赖）；分区、归档和数据保留只作用于SQLite后端
+    """
+
+    name = 'duckdb'
+
+    def __init__(self, path, table):
+        try:
+            import duckdb
+        except ImportError:
+            raise RuntimeError('DuckDB后端需要安装duckdb: pip install duckdb')
+
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.table_name = table.name
+        self.conn = duckdb.connect(str(self.path))
+        self.write_lock = threading.Lock()
+
+        # 列类型与SQLAlchemy模型一致（紧凑模式的整数编码只用于SQLite，这里按逻辑类型存储）
+        self.columns = []
+        self.dtypes = {}
+        definitions = []
+        for column in table.columns:
+            python_type = column.type.python_type
+            if python_type is datetime:
+                sql_type, dtype = 'TIMESTAMP', 'datetime64[us]'
+            elif python_type is int:
+                sql_type, dtype = ('BIGINT', 'int64') if column.primary_key else ('INTEGER', 'float64')
+            elif python_type is str:
+                sql_type, dtype = 'VARCHAR', 'object'
+            else:
+                sql_type, dtype = 'DOUBLE', 'float64'
+            self.columns.append(column.name)
+            self.dtypes[column.name] = (sql_type, dtype)
+            definitions.append(f'{quote(column.name)} {sql_type}')
+
+        # 自增id由序列生成
+        self.id_column = 'id' if 'id' in table.c and table.c.id.primary_key else None
+        if self.id_column:
+            self.conn.execute(f'CREATE SEQUENCE IF NOT EXISTS "{self.table_name}_id_seq"')
+        self.conn.execute(f'CREATE TABLE IF NOT EXISTS {quote(self.table_name)} ({", ".join(definitions)})')
+        # 已有文件补建模型中新增的列
+        for definition in definitions:
+            self.conn.execute(f'ALTER TABLE {quote(self.table_name)} ADD COLUMN IF NOT EXISTS {definition}')
+        # 增加节点列之前写入的记录属于本机
+        if 'node_id' in self.columns:
+            self.conn.execute(f'UPDATE {quote(self.table_name)} SET "node_id" = ? WHERE "node_id" IS NULL',
+                              [Config.NODE_ID])
+
+        self.row_types = {}
+
+    def _cursor(self):
+        """每次操作使用独立游标（DuckDB连接对象不能跨线程共享）"""
+        return self.conn.cursor()
+
+    def _row_type(self, columns):
+        row_type = self.row_types.get(columns)
+        if row_type is None:
+            row_type = namedtuple('DuckDBRow', ('timestamp',) + columns)
+            self.row_types[columns] = row_type
+        return row_type
+
+    @staticmethod
+    def _where(start, end, require, node=None):
+        clauses, params = [], []
+        if node is not None:
+            clauses.append('"node_id" = ?')
+            params.append(node)
+        if start is not None:
+            clauses.append('"timestamp" >= ?')
+            params.append(start)
+        if end is not None:
+            clauses.append('"timestamp" <= ?')
+            params.append(end)
+        if require:
+            clauses.append('(' + ' OR '.join(f'{quote(name)} IS NOT NULL' for name in require) + ')')
+        return (' WHERE ' + ' AND '.join(clauses)) if clauses else '', params
+
+    # ---------- 写入 ----------
+
+    def append_batch(self, records, rollup_records=None):
+        """整批转换为NumPy数组后一次性插入（空值用NaN表示，聚合在查询时计算，不使用rollup_records）"""
+        import numpy as np
+
+        if not records:
+            return
+        columns = [name for name in self.columns if name != self.id_column]
+        now = datetime.utcnow()
+        arrays = {}
+        for name in columns:
+            _, dtype = self.dtypes[name]
+            if name == 'created_at':
+                values = [record.get(name) or now for record in records]
+            elif name == 'node_id':
+                values = [record.get(name) or Config.NODE_ID for record in records]
+            else:
+                values = [record.get(name) for record in records]
+            if dtype in ('datetime64[us]', 'object'):
+                arrays[name] = np.array(values, dtype=dtype)
+            else:
+                arrays[name] = np.array([np.nan if v is None else v for v in values], dtype=dtype)
+
+        # NumPy数组中的NaN插入后为NULL，整数列在此转换回整数类型
+        selects = [f'{quote(name)}::{self.dtypes[name][0]}' for name in columns]
+        target = [quote(name) for name in columns]
+        if self.id_column:
+            target.insert(0, quote(self.id_column))
+            selects.insert(0, f"nextval('{self.table_name}_id_seq')")
+
+        with self.write_lock:
+            cursor = self._cursor()
+            try:
+                cursor.register('batch', arrays)
+                cursor.execute(
+                    f'INSERT INTO {quote(self.table_name)} ({", ".join(target)}) '
+                    f'SELECT {", ".join(selects)} FROM batch'
+                )
+                cursor.unregister('batch')
+            finally:
+                cursor.close()
+
+    # ---------- 查询 ----------
+
+    def scan(self, columns, start=None, end=None, require=None, descending=False, limit=None, node=None,
+             after=None):
+        columns = tuple(columns)
+        key = self.id_column or 'node_id'
+        direction = 'DESC' if descending else 'ASC'
+        order = [f'"timestamp" {direction}']
+        where, params = self._where(*keyset_range(start, end, after, descending), require, node)
+        if after is not None:
+            comparison = '<' if descending else '>'
+            where += (' AND ' if where else ' WHERE ') + f'("timestamp", {quote(key)}) {comparison} (?, ?)'
+            params.extend(after)
+        if after is not None or key in columns:
+            order.append(f'{quote(key)} {direction}')
+        selects = ', '.join(quote(name) for name in ('timestamp',) + columns)
+        sql = (f'SELECT {selects} FROM {quote(self.table_name)}{where} '
+               f'ORDER BY {", ".join(order)}')
+        if limit:
+            sql += f' LIMIT {int(limit)}'
+
+        row_type = self._row_type(columns)
+        cursor = self._cursor()
+        try:
+            return [row_type._make(row) for row in cursor.execute(sql, params).fetchall()]
+        finally:
+            cursor.close()
+
+    def threshold(self, metric, above=None, below=None, start=None, end=None, node=None):
+        where, params = self._where(start, end, [metric], node)
+        for operator, value in (('>', above), ('<', below)):
+            if value is not None:
+                where += f' AND {quote(metric)} {operator} ?'
+                params.append(value)
+        row_type = self._row_type((metric,))
+        cursor = self._cursor()
+        try:
+            sql = (f'SELECT "timestamp", {quote(metric)} FROM {quote(self.table_name)}{where} '
+                   f'ORDER BY "timestamp"')
+            return [row_type._make(row) for row in cursor.execute(sql, params).fetchall()]
+        finally:
+            cursor.close()
+
+    def aggregate(self, metrics, bucket_seconds, start, end=None, node=None):
+        """GROUP BY时间桶，桶边界与汇总表一致（按本地时区对齐）"""
+        offset = Config.TIMEZONE_OFFSET * 3600
+        first_bucket = bucket_start(to_epoch(start), bucket_seconds)
+        bucket = (f'CAST(floor((epoch("timestamp") + {offset}) / {int(bucket_seconds)}) '
+                  f'* {int(bucket_seconds)} - {offset} AS BIGINT)')
+        selects = []
+        windowed = set(window_columns(metrics))
+        for name in metrics:
+            column = quote(name)
+            if f'{name}_count' in windowed:
+                # 窗口统计：按采样数加权，极值取窗口最小/最大值
+                weight = f'coalesce({quote(name + "_count")}, 1)'
+                low = f'coalesce({quote(name + "_min")}, {column})'
+                high = f'coalesce({quote(name + "_max")}, {column})'
+                selects.append(f'sum({weight}) FILTER (WHERE {column} IS NOT NULL), min({low}), max({high}), '
+                               f'sum({column} * {weight}), '
+                               f'arg_max({column}, "timestamp") FILTER (WHERE {column} IS NOT NULL)')
+                continue
+            selects.append(f'count({column}), min({column}), max({column}), sum({column}), '
+                           f'arg_max({column}, "timestamp") FILTER (WHERE {column} IS NOT NULL)')
+
+        where, params = self._where(None, end, metrics, node)
+        where += (' AND ' if where else ' WHERE ') + '"timestamp" >= ?'
+        params.append(from_epoch(first_bucket))
+        sql = (f'SELECT {bucket} AS bucket, {", ".join(selects)} FROM {quote(self.table_name)}'
+               f'{where} GROUP BY bucket ORDER BY bucket')
+
+        cursor = self._cursor()
+        try:
+            results = cursor.execute(sql, params).fetchall()
+        finally:
+            cursor.close()
+
+        buckets = []
+        for row in results:
+            values = {}
+            for index, name in enumerate(metrics):
+                count, low, high, total, last = row[1 + index * 5: 6 + index * 5]
+                if count:
+                    values[name] = Bucket(count, low, high, total, last)
+            buckets.append((row[0], values))
+        return buckets
+
+    def count(self, start=None, end=None, require=None, node=None):
+        where, params = self._where(start, end, require, node)
+        cursor = self._cursor()
+        try:
+            return cursor.execute(f'SELECT count(*) FROM {quote(self.table_name)}{where}', params).fetchone()[0]
+        finally:
+            cursor.close()
+
+    def time_bounds(self, node=None):
+        where, params = self._where(None, None, None, node)
+        cursor = self._cursor()
+        try:
+            return tuple(cursor.execute(
+                f'SELECT min("timestamp"), max("timestamp") FROM {quote(self.table_name)}{where}', params
+            ).fetchone())
+        finally:
+            cursor.close()
+
+    def nodes(self):
+        cursor = self._cursor()
+        try:
+            rows = cursor.execute(
+                f'SELECT DISTINCT "node_id" FROM {quote(self.table_name)} WHERE "node_id" IS NOT NULL'
+            ).fetchall()
+            return sorted(row[0] for row in rows)
+        finally:
+            cursor.close()
+
+    def size(self):
+        wal = self.path.with_name(self.path.name + '.wal')
+        return sum(path.stat().st_size for path in (self.path, wal) if path.exists())
+
+    def close(self):
+        self.conn.close()
+
+
+def create_backend(app):
+    """按 STORAGE_BACKEND 配置创建当前应用的存储后端"""
+    name = app.config.get('STORAGE_BACKEND', 'sqlite')
+    table = app.sensor_model.__table__
+    if name == 'duckdb':
+        return DuckDBBackend(app.config['DUCKDB_PATH'], table)
+    if name == 'segments':
+        from app.storage.segments import SegmentBackend
+        return SegmentBackend(app.config['SEGMENT_STORE_PATH'], table,
+                              block_seconds=app.config['SEGMENT_BLOCK_SECONDS'],
+                              fsync=app.config['SEGMENT_FSYNC'])
+    if name != 'sqlite':
+        raise ValueError(f"未知的存储后端: {name}")
+    return SQLAlchemyBackend(
+        app.storage, table,
+        partition_store=getattr(app, 'partition_store', None),
+        archive=getattr(app, 'archive', None)
+    )
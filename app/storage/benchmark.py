@@ -0,0 +1,291 @@
+# app/storage/benchmark.py
+"""
+存储后端基准测试模块 - 在临时目录中为每个后端写入相同的模拟数据，
+执行与API端点相同的查询，比较写入速度、查询耗时和磁盘占用；
+另有历史接口数据路径（改进前的ORM方式、Core完整记录/列投影、一次读取/分页流式）的耗时和RSS峰值对比
+"""
+
+import json
+import resource
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+from pathlib import Path
+
+import numpy as np
+
+from config.settings import Config
+from config.logging_config import get_logger
+
+logger = get_logger(__name__)
+
+# 与图表端点一致的指标分组
+CO2_COLUMNS = ['scd40_co2']
+TEMP_HUMI_COLUMNS = ['dht22_temperature', 'dht22_humidity']
+VOC_NOX_COLUMNS = ['sgp41_voc_index', 'sgp41_nox_index']
+
+
+def generate_batches(rows, batch_size, interval=5, seed=0):
+    """生成模拟采集数据（按interval秒一条，截止到当前时间），按批产出记录列表"""
+    rng = np.random.default_rng(seed)
+    end = datetime.utcnow().replace(microsecond=0)
+    start = end - timedelta(seconds=interval * (rows - 1))
+
+    co2 = 400 + np.abs(np.cumsum(rng.normal(0, 5, rows))) % 1600
+    temperature = 22 + np.cumsum(rng.normal(0, 0.02, rows)) % 8
+    humidity = 45 + np.cumsum(rng.normal(0, 0.05, rows)) % 30
+    voc = rng.integers(50, 300, rows)
+    nox = rng.integers(1, 50, rows)
+    # 部分记录缺少DHT22或SGP41数据，与实际采集情况一致
+    dht22_missing = rng.random(rows) < 0.05
+    sgp41_missing = rng.random(rows) < 0.1
+
+    for offset in range(0, rows, batch_size):
+        batch = []
+        for i in range(offset, min(offset + batch_size, rows)):
+            batch.append({
+                'timestamp': start + timedelta(seconds=interval * i),
+                'node_id': Config.NODE_ID,
+                'scd40_co2': int(co2[i]),
+                'scd40_temperature': None,
+                'scd40_humidity': None,
+                'dht22_temperature': None if dht22_missing[i] else round(float(temperature[i]), 1),
+                'dht22_humidity': None if dht22_missing[i] else round(float(humidity[i]), 1),
+                'sgp41_sraw_voc': None if sgp41_missing[i] else 30000 + int(voc[i]),
+                'sgp41_sraw_nox': None if sgp41_missing[i] else 15000 + int(nox[i]),
+                'sgp41_voc_index': None if sgp41_missing[i] else int(voc[i]),
+                'sgp41_nox_index': None if sgp41_missing[i] else int(nox[i]),
+            })
+        yield batch
+
+
+def open_backend(name, directory, table, create=True):
+    """在directory中创建一个空的后端实例（create为False时打开已有的SQLite测试数据库）"""
+    from app.storage.backends import SQLAlchemyBackend, DuckDBBackend
+
+    if name == 'sqlite':
+        from app.models import SensorRollup
+        from app.storage.engines import DatabaseEngines
+
+        storage = DatabaseEngines(str(Path(directory) / 'benchmark.db'), Config.SQLITE_PRAGMAS)
+        if create:
+            table.create(storage.writer)
+            SensorRollup.__table__.create(storage.writer)
+        return SQLAlchemyBackend(storage, table)
+    if name == 'duckdb':
+        return DuckDBBackend(Path(directory) / 'benchmark.duckdb', table)
+    if name == 'segments':
+        from app.storage.segments import SegmentBackend
+        return SegmentBackend(Path(directory) / 'segments', table, block_seconds=Config.SEGMENT_BLOCK_SECONDS)
+    raise ValueError(f"未知的存储后端: {name}")
+
+
+def workload(table):
+    """查询负载：名称 -> 以后端为参数的函数（与各API端点的访问方式一致）"""
+    from app.models import SENSOR_MODELS
+
+    record_columns = next(model.RECORD_COLUMNS for model in SENSOR_MODELS.values()
+                          if model.__table__ is table)
+    metrics = Config.ROLLUP_METRICS
+    now = datetime.utcnow()
+    day_ago = now - timedelta(hours=24)
+    week_ago = now - timedelta(days=7)
+
+    return {
+        'scan co2 24h': lambda b: b.scan(CO2_COLUMNS, start=day_ago, require=CO2_COLUMNS),
+        'scan temp/humi 7d': lambda b: b.scan(TEMP_HUMI_COLUMNS, start=week_ago, require=TEMP_HUMI_COLUMNS),
+        'scan voc/nox 7d': lambda b: b.scan(VOC_NOX_COLUMNS, start=week_ago, require=VOC_NOX_COLUMNS),
+        'history latest 100': lambda b: b.scan(record_columns, descending=True, limit=100),
+        'history node latest 100': lambda b: b.scan(record_columns, descending=True, limit=100,
+                                                    node=Config.NODE_ID),
+        'aggregate 5m 24h': lambda b: b.aggregate(metrics, 300, day_ago),
+        'aggregate 1h 7d': lambda b: b.aggregate(metrics, 3600, week_ago),
+        'aggregate 1d all': lambda b: b.aggregate(metrics, 86400, datetime(1970, 1, 1)),
+        'aggregate 10m 24h': lambda b: b.aggregate(metrics, 600, day_ago),
+        'threshold co2>1500 all': lambda b: b.threshold('scd40_co2', above=1500),
+        'threshold co2>1900 all': lambda b: b.threshold('scd40_co2', above=1900),
+        'latest': lambda b: b.latest(CO2_COLUMNS, require=CO2_COLUMNS),
+        'count all': lambda b: b.count(),
+        'count 24h': lambda b: b.count(start=day_ago),
+    }
+
+
+def benchmark_backend(name, table, rows, batch_size, repeat, directory):
+    """对单个后端执行写入和查询负载，返回 {指标: 值}"""
+    backend = open_backend(name, directory, table)
+    results = {}
+    try:
+        started = time.perf_counter()
+        for batch in generate_batches(rows, batch_size):
+            backend.append_batch(batch)
+        elapsed = time.perf_counter() - started
+        results['append rows/s'] = round(rows / elapsed) if elapsed else None
+
+        for label, query in workload(table).items():
+            timings = []
+            for _ in range(repeat):
+                started = time.perf_counter()
+                query(backend)
+                timings.append((time.perf_counter() - started) * 1000)
+            results[f'{label} (ms)'] = round(statistics.median(timings), 2)
+
+        results['size (MB)'] = round(backend.size() / 1024 / 1024, 2)
+    finally:
+        backend.close()
+    return results
+
+
+def run_benchmark(backends, rows=100000, batch_size=1000, repeat=5, schema=None, directory=None, keep=False):
+    """依次测试各后端，返回 {后端名: 结果}（后端不可用时结果为错误信息）"""
+    from app.models import SENSOR_MODELS
+
+    table = SENSOR_MODELS[schema or Config.STORAGE_SCHEMA].__table__
+    workdir = Path(directory) if directory else Path(tempfile.mkdtemp(prefix='storage_benchmark_'))
+    workdir.mkdir(parents=True, exist_ok=True)
+
+    results = {}
+    try:
+        for name in backends:
+            backend_dir = workdir / name
+            shutil.rmtree(backend_dir, ignore_errors=True)
+            backend_dir.mkdir()
+            logger.info(f"基准测试: {name} ({rows} 行, 批大小 {batch_size})")
+            try:
+                results[name] = benchmark_backend(name, table, rows, batch_size, repeat, backend_dir)
+            except Exception as e:
+                logger.error(f"基准测试 {name} 失败: {e}")
+                results[name] = {'error': str(e)}
+    finally:
+        if not keep:
+            shutil.rmtree(workdir, ignore_errors=True)
+    return results
+
+
+def history_cases(model, fields, backend):
+    """历史接口的数据路径：名称 -> 返回输出字节数的函数（需在应用上下文中执行）
+
+    - orm: 改进前的接口，ORM查询完整的模型对象（model.query...all()），逐个to_dict后整体序列化
+    - full records: Core一次读取时间范围内的完整记录，逐行row_to_dict后整体序列化
+    - full records (paged): 完整记录，按页读取并逐页序列化（stream=true）
+    - fields (paged): 只查询fields中的列，编译后的序列化函数逐页输出（fields=...&stream=true）
+    """
+    from sqlalchemy.orm import Session
+    from app.models import record_serializer
+    from app.storage.query import fetch_series, iter_history
+
+    def orm():
+        # 与改进前的 SensorData.query.order_by(...).all() 相同，会话绑定到测试数据库
+        with Session(backend.storage.reader) as session:
+            records = session.query(model).order_by(model.timestamp.desc()).all()
+            return len(json.dumps([record.to_dict() for record in records]))
+
+    def one_shot():
+        rows = fetch_series(model.RECORD_COLUMNS, descending=True)
+        return len(json.dumps([model.row_to_dict(row) for row in rows]))
+
+    def paged(columns, serialize):
+        def run():
+            size = 0
+            chunk = []
+            for row in iter_history(columns, page_size=Config.HISTORY_PAGE_SIZE):
+                chunk.append(serialize(row))
+                if len(chunk) >= Config.HISTORY_PAGE_SIZE:
+                    size += len(json.dumps(chunk))
+                    chunk = []
+            return size + len(json.dumps(chunk))
+        return run
+
+    return {
+        'idle': lambda: 0,
+        'orm': orm,
+        'full records': one_shot,
+        'full records (paged)': paged(model.RECORD_COLUMNS, model.row_to_dict),
+        'fields (paged)': paged(['node_id'] + list(fields), record_serializer(fields)),
+    }
+
+
+def run_history_case(directory, schema, label, fields):
+    """在当前进程中执行一个数据路径，返回耗时（秒）、进程RSS峰值（MB）和输出大小（MB）
+
+    由run_history_benchmark在独立的子进程中调用，RSS峰值只包含该数据路径（idle为进程本身的基线）
+    """
+    from flask import Flask
+    from app.models import SENSOR_MODELS
+
+    model = SENSOR_MODELS[schema]
+    backend = open_backend('sqlite', directory, model.__table__, create=False)
+    app = Flask(__name__)
+    app.sensor_model = model
+    app.storage_backend = backend
+    try:
+        with app.app_context():
+            case = history_cases(model, fields, backend)[label]
+            started = time.perf_counter()
+            output = case()
+            elapsed = time.perf_counter() - started
+    finally:
+        backend.close()
+
+    # Linux上ru_maxrss的单位为KB
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return {
+        'seconds': round(elapsed, 3),
+        'rss_mb': round(peak / 1024, 1),
+        'output_mb': round(output / 1024 / 1024, 1)
+    }
+
+
+def run_history_benchmark(app, sizes=(10000, 100000, 1000000), fields=CO2_COLUMNS, directory=None, keep=False):
+    """对每个数据量在临时SQLite数据库中比较历史接口各数据路径，返回 {行数: {路径: 结果}}
+
+    每个数据路径在单独的子进程中执行（python -m app.storage.benchmark），
+    结果包含耗时（秒）、子进程的RSS峰值（MB）和输出大小（MB）
+    """
+    from app.models import SENSOR_MODELS
+
+    model = app.sensor_model
+    schema = next(name for name, candidate in SENSOR_MODELS.items() if candidate is model)
+    workdir = Path(directory) if directory else Path(tempfile.mkdtemp(prefix='history_benchmark_'))
+    workdir.mkdir(parents=True, exist_ok=True)
+    root = Path(__file__).resolve().parents[2]
+
+    results = {}
+    try:
+        for rows in sizes:
+            size_dir = workdir / str(rows)
+            shutil.rmtree(size_dir, ignore_errors=True)
+            size_dir.mkdir()
+            backend = open_backend('sqlite', size_dir, model.__table__)
+            logger.info(f"历史接口基准测试: {rows} 行")
+            try:
+                for batch in generate_batches(rows, 5000):
+                    backend.append_batch(batch)
+            finally:
+                backend.close()
+
+            results[rows] = {}
+            for label in history_cases(model, fields, None):
+                completed = subprocess.run(
+                    [sys.executable, '-m', 'app.storage.benchmark', str(size_dir), schema, label, ','.join(fields)],
+                    cwd=root, capture_output=True, text=True
+                )
+                if completed.returncode != 0:
+                    error = (completed.stderr.strip().splitlines() or [f'退出码 {completed.returncode}'])[-1]
+                    logger.error(f"历史接口基准测试 {rows} 行 {label} 失败: {error}")
+                    results[rows][label] = {'error': error}
+                    continue
+                results[rows][label] = json.loads(completed.stdout.strip().splitlines()[-1])
+    finally:
+        if not keep:
+            shutil.rmtree(workdir, ignore_errors=True)
+    return results
+
+
+if __name__ == '__main__':
+    # 子进程入口：python -m app.storage.benchmark <目录> <存储模式> <数据路径> <fields>
+    directory, schema, label, fields = sys.argv[1:5]
+    print(json.dumps(run_history_case(directory, schema, label, fields.split(','))))
@@ -0,0 +1,183 @@
+# app/storage/deadband.py
+"""
+死区存储模块 - 每个指标只在变化超过阈值或超过心跳间隔时才写入原始表，
+读取时按阶梯序列（保持上一个值）还原
+"""
+
+import threading
+from collections import namedtuple
+from datetime import timedelta
+
+from app.storage.rollups import to_epoch
+
+# 不参与死区判断的字段
+META_FIELDS = ('id', 'timestamp', 'created_at', 'node_id')
+
+# 窗口统计字段随所属指标一起写入或省略
+WINDOW_STATS = ('min', 'max', 'count')
+
+_row_types = {}
+
+
+class DeadbandFilter:
+    """按指标的死区过滤器
+
+    thresholds: {列名: 阈值}，变化量超过阈值才写入；未列出的指标每次都写入
+    heartbeat: 秒，距离上次写入超过此时间时即使没有变化也写入一次
+    """
+
+    def __init__(self, thresholds, heartbeat=600):
+        self.thresholds = dict(thresholds)
+        self.heartbeat = heartbeat
+        self.window_fields = {
+            f'{name}_{stat}' for name in self.thresholds for stat in WINDOW_STATS
+        }
+
+        self.lock = threading.Lock()
+        self.last = {}      # (节点, 列名) -> (最后写入的值, epoch秒)
+        self.stats = {
+            'samples': 0,
+            'rows_stored': 0,
+            'values_suppressed': 0
+        }
+
+    def filter(self, records):
+        """过滤一批记录，返回 (要写入的记录, 新状态)
+
+        未变化的值置为None，所有值都未变化的记录整条跳过；
+        状态在写入成功后通过commit生效，写入失败时不会丢失变化
+        """
+        with self.lock:
+            state = dict(self.last)
+
+        rows = []
+        suppressed = 0
+        for record in records:
+            epoch = to_epoch(record['timestamp'])
+            node = record.get('node_id')
+            row = dict(record)
+            store = False
+
+            for name, value in record.items():
+                if name in META_FIELDS or name in self.window_fields or value is None:
+                    continue
+                threshold = self.thresholds.get(name)
+                if threshold is None:
+                    store = True
+                    continue
+
+                # 窗口内的极值超出阈值也视为变化，避免短时尖峰被省略
+                low = record.get(f'{name}_min', value)
+                high = record.get(f'{name}_max', value)
+                low = value if low is None else low
+                high = value if high is None else high
+
+                # 各节点独立判断，避免不同设备的读数互相抑制
+                previous = state.get((node, name))
+                if (previous is None or epoch - previous[1] >= self.heartbeat or
+                        max(abs(value - previous[0]), abs(low - previous[0]),
+                            abs(high - previous[0])) > threshold):
+                    state[(node, name)] = (value, epoch)
+                    store = True
+                else:
+                    row[name] = None
+                    for stat in WINDOW_STATS:
+                        if f'{name}_{stat}' in row:
+                            row[f'{name}_{stat}'] = None
+                    suppressed += 1
+
+            if store:
+                rows.append(row)
+
+        return rows, (state, len(records), len(rows), suppressed)
+
+    def commit(self, result):
+        """写入成功后更新状态和统计"""
+        state, samples, stored, suppressed = result
+        with self.lock:
+            self.last = state
+            self.stats['samples'] += samples
+            self.stats['rows_stored'] += stored
+            self.stats['values_suppressed'] += suppressed
+
+    def get_stats(self):
+        with self.lock:
+            stats = self.stats.copy()
+        stats['thresholds'] = self.thresholds
+        stats['heartbeat_seconds'] = self.heartbeat
+        stats['row_reduction'] = (
+            round(1 - stats['rows_stored'] / stats['samples'], 3) if stats['samples'] else None
+        )
+        return stats
+
+
+def _row_type(fields):
+    """还原后的行类型（与查询结果相同的属性访问方式）"""
+    fields = tuple(fields)
+    row_type = _row_types.get(fields)
+    if row_type is None:
+        row_type = _row_types[fields] = namedtuple('StepRow', fields)
+    return row_type
+
+
+def fill_steps(rows, columns, hold, seed=()):
+    """按时间升序的稀疏记录还原为阶梯序列：空值用hold秒内该指标上一个值填充
+
+    seed: 早于rows的记录（升序），只用于提供初始值
+    """
+    last = {}
+    for row in seed:
+        epoch = to_epoch(row.timestamp)
+        for name in columns:
+            value = getattr(row, name)
+            if value is not None:
+                last[name] = (value, epoch)
+
+    if not rows:
+        return []
+    row_type = _row_type(rows[0]._fields)
+    filled = []
+    for row in rows:
+        values = row._asdict()
+        epoch = to_epoch(row.timestamp)
+        for name in columns:
+            value = values[name]
+            if value is not None:
+                last[name] = (value, epoch)
+            elif name in last and epoch - last[name][1] <= hold:
+                values[name] = last[name][0]
+        filled.append(row_type(**values))
+    return filled
+
+
+def resample_steps(rows, columns, start, end, step, hold):
+    """将稀疏记录按阶梯序列重采样为从start到end、间隔step秒的等间隔点
+
+    每个点取该时刻之前hold秒内各指标最后写入的值，所有指标都没有值的点跳过
+    """
+    row_type = _row_type(('timestamp',) + tuple(columns))
+    last = {}
+    points = []
+    index = 0
+    current = start
+    interval = timedelta(seconds=step)
+
+    while current <= end:
+        while index < len(rows) and rows[index].timestamp <= current:
+            row = rows[index]
+            epoch = to_epoch(row.timestamp)
+            for name in columns:
+                value = getattr(row, name)
+                if value is not None:
+                    last[name] = (value, epoch)
+            index += 1
+
+        epoch = to_epoch(current)
+        values = [
+            last[name][0] if name in last and epoch - last[name][1] <= hold else None
+            for name in columns
+        ]
+        if any(value is not None for value in values):
+            points.append(row_type(current, *values))
+        current += interval
+    return points
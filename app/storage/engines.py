@@ -0,0 +1,135 @@
+# app/storage/engines.py
+"""
+数据库连接模块 - 读写分离：采集子系统独占一个长连接写入，
+API和图表通过只读连接池（mode=ro）查询，读写分别统计耗时
+"""
+
+import threading
+import time
+from contextlib import contextmanager
+from sqlalchemy import create_engine, event
+from app.storage.sqlite_tuning import install_sqlite_pragmas
+from config.logging_config import get_logger
+
+logger = get_logger(__name__)
+
+# 只读连接上无法或无需设置的PRAGMA（由写连接负责）
+WRITE_ONLY_PRAGMAS = {'journal_mode', 'auto_vacuum', 'synchronous'}
+
+
+class QueryStats:
+    """SQL执行统计（次数、耗时、慢查询、错误）"""
+
+    def __init__(self, name, slow_ms=200):
+        self.name = name
+        self.slow_ms = slow_ms
+        self.lock = threading.Lock()
+        self.stats = {
+            'statements': 0,
+            'errors': 0,
+            'slow': 0,
+            'total_ms': 0.0,
+            'max_ms': 0.0,
+            'last_ms': None,
+            'last_time': None
+        }
+
+    def install(self, engine):
+        """在引擎上注册执行计时事件"""
+        @event.listens_for(engine, 'before_cursor_execute')
+        def _before(conn, cursor, statement, parameters, context, executemany):
+            conn.info.setdefault('query_start', []).append(time.perf_counter())
+
+        @event.listens_for(engine, 'after_cursor_execute')
+        def _after(conn, cursor, statement, parameters, context, executemany):
+            started = conn.info['query_start'].pop()
+            self.record((time.perf_counter() - started) * 1000, statement)
+
+        @event.listens_for(engine, 'handle_error')
+        def _error(context):
+            starts = context.connection.info.get('query_start') if context.connection else None
+            if starts:
+                starts.pop()
+            with self.lock:
+                self.stats['errors'] += 1
+
+    def record(self, duration_ms, statement):
+        with self.lock:
+            stats = self.stats
+            stats['statements'] += 1
+            stats['total_ms'] += duration_ms
+            stats['max_ms'] = max(stats['max_ms'], duration_ms)
+            stats['last_ms'] = round(duration_ms, 2)
+            stats['last_time'] = time.time()
+            if duration_ms >= self.slow_ms:
+                stats['slow'] += 1
+                logger.debug(f"慢查询[{self.name}] {duration_ms:.1f}ms: {statement[:200]}")
+
+    def get_stats(self):
+        with self.lock:
+            stats = self.stats.copy()
+        stats['total_ms'] = round(stats['total_ms'], 2)
+        stats['max_ms'] = round(stats['max_ms'], 2)
+        stats['avg_ms'] = round(stats['total_ms'] / stats['statements'], 2) if stats['statements'] else None
+        stats['slow_threshold_ms'] = self.slow_ms
+        return stats
+
+
+class DatabaseEngines:
+    """读写分离的数据库引擎
+
+    writer: 连接池只有一个长连接，批量写入线程和数据保留任务依次借用
+    reader: mode=ro 只读连接池，读查询不会持有写锁（WAL模式下读写互不阻塞）
+    """
+
+    def __init__(self, database_path, pragmas=None, read_pool_size=4, slow_ms=200):
+        self.database_path = database_path
+        pragmas = pragmas or {}
+
+        self.write_stats = QueryStats('write', slow_ms)
+        self.read_stats = QueryStats('read', slow_ms)
+
+        self.writer = create_engine(
+            f"sqlite:///{database_path}",
+            pool_size=1,
+            max_overflow=0,
+            pool_timeout=60,
+            connect_args={'check_same_thread': False}
+        )
+        install_sqlite_pragmas(self.writer, pragmas)
+        self.write_stats.install(self.writer)
+
+        self.reader = create_engine(
+            f"sqlite:///file:{database_path}?mode=ro&uri=true",
+            pool_size=read_pool_size,
+            max_overflow=read_pool_size,
+            connect_args={'check_same_thread': False}
+        )
+        read_pragmas = {name: value for name, value in pragmas.items() if name not in WRITE_ONLY_PRAGMAS}
+        read_pragmas['query_only'] = 1
+        install_sqlite_pragmas(self.reader, read_pragmas)
+        self.read_stats.install(self.reader)
+
+    @contextmanager
+    def read_connection(self):
+        """借用一个只读连接"""
+        with self.reader.connect() as conn:
+            yield conn
+
+    @contextmanager
+    def write_transaction(self):
+        """借用写连接并开启事务（正常结束提交，异常回滚）"""
+        with self.writer.begin() as conn:
+            yield conn
+
+    def get_stats(self):
+        """读写两条路径的统计及连接池状态"""
+        return {
+            'write': {**self.write_stats.get_stats(), 'pool': self.writer.pool.status()},
+            'read': {**self.read_stats.get_stats(), 'pool': self.reader.pool.status()}
+        }
+
+    def dispose(self):
+        """关闭所有连接"""
+        self.writer.dispose()
+        self.reader.dispose()
@@ -0,0 +1,106 @@
+# app/storage/export.py
+"""
+批量导出模块 - 按时间升序逐页读取记录，编码为NDJSON或CSV文本块，可选gzip流式压缩；
+每次只在内存中保留一页记录，导出的行数不受限制
+"""
+
+import csv
+import io
+import json
+import operator
+import time
+import zlib
+from itertools import islice
+
+from app.utils.time_utils import utc_to_local
+from config.logging_config import get_logger
+
+logger = get_logger(__name__)
+
+# 格式 -> (MIME类型, 文件扩展名)
+EXPORT_FORMATS = {
+    'ndjson': ('application/x-ndjson', 'ndjson'),
+    'csv': ('text/csv', 'csv')
+}
+
+# 导出行的固定列（时间按 TIMEZONE_OFFSET 转换为本地时间，同时保留UTC时间）
+EXPORT_KEY_COLUMNS = ('local_time', 'utc_time', 'node_id')
+
+GZIP_LEVEL = 6
+
+
+def export_header(columns):
+    """导出文件的列名"""
+    return list(EXPORT_KEY_COLUMNS) + list(columns)
+
+
+def iter_pages(rows, columns, page_size):
+    """逐页把记录转换为与export_header对应的值列表"""
+    getter = operator.attrgetter('timestamp', 'node_id', *columns)
+    rows = iter(rows)
+    while True:
+        page = list(islice(rows, page_size))
+        if not page:
+            return
+        values = []
+        for row in page:
+            timestamp, node, *data = getter(row)
+            values.append([utc_to_local(timestamp).isoformat(), timestamp.isoformat(), node, *data])
+        yield values
+
+
+def encode_ndjson(pages, header):
+    """每页编码为一段NDJSON文本（每行一个JSON对象）"""
+    for page in pages:
+        yield ''.join(json.dumps(dict(zip(header, values)), ensure_ascii=False) + '\n' for values in page)
+
+
+def encode_csv(pages, header):
+    """每页编码为一段CSV文本，第一段带列名行（没有记录时只输出列名行）"""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer, lineterminator='\n')
+    writer.writerow(header)
+    for page in pages:
+        writer.writerows(page)
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue()
+
+
+def gzip_stream(chunks, level=GZIP_LEVEL):
+    """文本块流式压缩为gzip字节流（不在内存中累积整个文件）"""
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    for chunk in chunks:
+        data = compressor.compress(chunk.encode('utf-8'))
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+def export_stream(rows, columns, fmt='ndjson', compress=False, page_size=5000):
+    """按时间升序的记录编码为导出文件的数据块生成器
+
+    rows: 带 timestamp、node_id 及 columns 各列属性的行（通常为 iter_history(..., descending=False)）
+    """
+    header = export_header(columns)
+    encode = encode_csv if fmt == 'csv' else encode_ndjson
+    exported = 0
+
+    def pages():
+        nonlocal exported
+        for page in iter_pages(rows, columns, page_size):
+            exported += len(page)
+            yield page
+
+    chunks = encode(pages(), header)
+    if compress:
+        chunks = gzip_stream(chunks)
+
+    started = time.time()
+    for chunk in chunks:
+        yield chunk
+    logger.info(f"导出完成: {exported} 条记录 ({fmt}{'.gz' if compress else ''})，"
+                f"耗时 {time.time() - started:.1f}秒")
+
@@ -0,0 +1,198 @@
+# app/storage/importer.py
+"""
+历史日志导入模块 - 将 dual_sensor_monitor.py 写入 logs/ 的JSON行日志批量导入数据库
+
+日志中的时间为本地时间（无时区），按 TIMEZONE_OFFSET 转换为UTC后存储
+"""
+
+import json
+import os
+import time
+from datetime import datetime
+from pathlib import Path
+from config.logging_config import get_logger
+
+logger = get_logger(__name__)
+
+
+def iter_log_files(paths):
+    """展开文件/目录参数，返回按文件名排序的JSON日志文件（跳过 *_readable.log）"""
+    files = []
+    for path in map(Path, paths):
+        if path.is_dir():
+            files.extend(path.glob('sensor_data_*.log'))
+        elif path.exists():
+            files.append(path)
+    return sorted(f for f in set(files) if not f.name.endswith('_readable.log'))
+
+
+def parse_log_entry(entry):
+    """将 get_log_entry 格式的条目映射为SensorData记录（时间仍为本地时间）"""
+    text = entry.get('timestamp_iso') or entry.get('timestamp')
+    if not text:
+        return None
+    local_time = datetime.fromisoformat(text)
+
+    scd40 = entry.get('scd40') or {}
+    dht22 = entry.get('dht22') or {}
+    record = {
+        'timestamp': local_time,
+        'scd40_co2': int(scd40['co2_ppm']) if scd40.get('co2_ppm') is not None else None,
+        'scd40_temperature': scd40.get('temperature_c'),
+        'scd40_humidity': scd40.get('humidity_rh'),
+        'dht22_temperature': dht22.get('temperature_c'),
+        'dht22_humidity': dht22.get('humidity_rh'),
+    }
+    if all(value is None for key, value in record.items() if key != 'timestamp'):
+        return None
+    return record
+
+
+def complete_length(path):
+    """文件中最后一个以换行结尾的行的结束位置；末尾没有换行的行可能仍在写入，留到下次导入"""
+    with open(path, 'rb') as f:
+        end = f.seek(0, os.SEEK_END)
+        while end > 0:
+            start = max(0, end - 65536)
+            f.seek(start)
+            index = f.read(end - start).rfind(b'\n')
+            if index >= 0:
+                return start + index + 1
+            end = start
+    return 0
+
+
+def iter_log_records(path, offset=0, stats=None, end=None):
+    """逐行读取日志文件（生成器），产出 (读取后的字节偏移, 记录)
+
+    注释行、空行和无法解析的行跳过，计入 stats['invalid']；end 为读取的结束位置（应为行边界）
+    """
+    with open(path, 'rb') as f:
+        f.seek(offset)
+        for line in f:
+            if end is not None and offset + len(line) > end:
+                break
+            offset += len(line)
+            line = line.strip()
+            if not line or line.startswith(b'#'):
+                continue
+            try:
+                record = parse_log_entry(json.loads(line))
+            except (ValueError, TypeError, KeyError):
+                record = None
+            if record is None:
+                if stats is not None:
+                    stats['invalid'] += 1
+                continue
+            yield offset, record
+
+
+class LogImporter:
+    """日志批量导入器 - 分块写入，每块一个事务，进度保存在状态文件中以便中断后继续"""
+
+    def __init__(self, app, state_path, batch_size=5000, offset_hours=None, node=None):
+        from app.storage.writer import BatchWriter
+        from config.settings import Config
+
+        self.app = app
+        self.state_path = Path(state_path)
+        self.batch_size = batch_size
+        self.offset_hours = Config.TIMEZONE_OFFSET if offset_hours is None else offset_hours
+        # 日志本身不带节点标识，导入时统一归到指定节点（默认为本机）
+        self.node = node or Config.NODE_ID
+        # 复用批量写入器的写入逻辑（写连接、分区、汇总表在同一事务中更新）
+        self.writer = BatchWriter(app)
+
+        self.state = self._load_state()
+        self.stats = {'files': 0, 'lines': 0, 'inserted': 0, 'duplicates': 0, 'invalid': 0}
+
+    def _load_state(self):
+        if self.state_path.exists():
+            with open(self.state_path, encoding='utf-8') as f:
+                return json.load(f)
+        return {'files': {}}
+
+    def _save_state(self):
+        temp_path = self.state_path.with_suffix('.tmp')
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            json.dump(self.state, f, ensure_ascii=False, indent=2)
+        temp_path.replace(self.state_path)
+
+    def _write_chunk(self, records):
+        """去重后写入一块，返回写入条数"""
+        from app.storage.query import existing_keys, stored_time_normalizer
+        from app.utils.time_utils import local_to_utc
+
+        # 时间按存储精度归一化后再去重（紧凑模式为毫秒）
+        normalize = stored_time_normalizer()
+        unique = {}
+        for record in records:
+            timestamp = normalize(local_to_utc(record['timestamp'], self.offset_hours))
+            record['timestamp'] = timestamp
+            record['node_id'] = self.node
+            unique.setdefault((self.node, timestamp), record)
+
+        existing = existing_keys(unique)
+        rows = [record for key, record in sorted(unique.items(), key=lambda item: item[0][1])
+                if key not in existing]
+        self.stats['duplicates'] += len(records) - len(rows)
+
+        if rows and not self.writer.flush(rows):
+            raise RuntimeError('写入数据库失败，已导入的部分可通过重新运行继续')
+        self.stats['inserted'] += len(rows)
+        return len(rows)
+
+    def import_files(self, files, progress=None):
+        """导入日志文件列表（已完成的文件跳过，未完成的从上次位置继续）
+
+        每个文件只导入到最后一个完整的行，末尾不完整的行（日志仍在写入）下次导入时再读取
+        """
+        total_bytes = sum(f.stat().st_size for f in files)
+        done_bytes = 0
+        started = time.time()
+
+        with self.app.app_context():
+            for path in files:
+                key = str(path.resolve())
+                size = path.stat().st_size
+                end = complete_length(path)
+                offset = self.state['files'].get(key, 0)
+                if offset >= end:
+                    done_bytes += size
+                    continue
+
+                self.stats['files'] += 1
+                done_bytes += offset
+                chunk = []
+                for position, record in iter_log_records(path, offset, self.stats, end=end):
+                    chunk.append(record)
+                    self.stats['lines'] += 1
+                    if len(chunk) >= self.batch_size:
+                        self._write_chunk(chunk)
+                        chunk = []
+                        done_bytes += position - offset
+                        offset = position
+                        self.state['files'][key] = offset
+                        self._save_state()
+                        if progress:
+                            progress(self._progress(path, done_bytes, total_bytes, started))
+
+                if chunk:
+                    self._write_chunk(chunk)
+                done_bytes += size - offset
+                self.state['files'][key] = end
+                self._save_state()
+                if progress:
+                    progress(self._progress(path, done_bytes, total_bytes, started))
+
+        self.stats['duration_seconds'] = round(time.time() - started, 1)
+        return self.stats
+
+    def _progress(self, path, done_bytes, total_bytes, started):
+        elapsed = max(time.time() - started, 1e-6)
+        return {
+            'file': path.name,
+            'percent': round(done_bytes * 100 / total_bytes, 1) if total_bytes else 100.0,
+            'rows_per_second': int(self.stats['lines'] / elapsed),
+            **self.stats
+        }
@@ -0,0 +1,337 @@
+# app/storage/ingest.py
+"""
+批量接收模块 - 其他节点上传的读数（NDJSON或增量编码批次，可gzip压缩）逐条解析、按传感器有效范围校验，
+按 (节点, 时间戳) 去重后整批在一个事务中写入当前存储后端；
+带幂等键的批次记录处理结果，客户端重试同一批次时直接返回上次的结果
+"""
+
+import json
+import threading
+import zlib
+from datetime import datetime, timedelta, timezone
+
+from sqlalchemy import delete, insert, select
+
+from app.storage.delta import DELTA_CONTENT_TYPE, decode_batch
+from config.sensors import SensorConfig
+from config.settings import Config
+from config.logging_config import get_logger
+
+logger = get_logger(__name__)
+
+# 响应中最多列出的拒绝原因条数
+MAX_REPORTED_ERRORS = 20
+
+# 幂等键最大长度
+MAX_KEY_LENGTH = 128
+
+
+class IngestError(Exception):
+    """整批无法处理（请求体无法解码、超过大小限制），status为HTTP状态码"""
+
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.status = status
+
+
+def sensor_fields(table):
+    """各传感器可上传的列：传感器名 -> {列名: 有效范围字段名}
+
+    窗口统计列（<指标>_min/_max）按所属指标的有效范围校验，采样数只要求为正整数
+    """
+    fields = {}
+    for sensor in ('scd40', 'dht22', 'sgp41'):
+        config = SensorConfig.get_sensor_config(sensor)
+        columns = {}
+        for field in config.get('data_fields', []):
+            column = f'{sensor}_{field}'
+            if column not in table.c:
+                continue
+            columns[column] = field
+            for stat in ('min', 'max'):
+                if f'{column}_{stat}' in table.c:
+                    columns[f'{column}_{stat}'] = field
+        fields[sensor] = columns
+    return fields
+
+
+def decode_body(body, encoding=None, limit=None):
+    """按 Content-Encoding 解压请求体（gzip/deflate，也识别未声明的gzip），解压后超过limit字节时拒绝"""
+    limit = limit or Config.INGEST_MAX_DECODED_BYTES
+    encoding = (encoding or '').lower()
+    if encoding not in ('gzip', 'deflate') and not body.startswith(b'\x1f\x8b'):
+        if encoding not in ('', 'identity'):
+            raise IngestError(f'不支持的Content-Encoding: {encoding}', 415)
+        if len(body) > limit:
+            raise IngestError('请求体超过大小限制', 413)
+        return body
+
+    # 自动识别gzip和zlib头
+    decoder = zlib.decompressobj(32 + zlib.MAX_WBITS)
+    try:
+        data = decoder.decompress(body, limit + 1)
+    except zlib.error as e:
+        raise IngestError(f'请求体解压失败: {e}')
+    if len(data) > limit or decoder.unconsumed_tail:
+        raise IngestError('解压后的数据超过大小限制', 413)
+    return data
+
+
+def parse_timestamp(value):
+    """时间戳转为UTC naive datetime：数字为epoch秒，字符串为ISO格式（不带时区时视为UTC）"""
+    if isinstance(value, bool):
+        raise ValueError('无效的时间戳')
+    if isinstance(value, datetime):
+        return value
+    if isinstance(value, (int, float)):
+        return datetime(1970, 1, 1) + timedelta(seconds=value)
+    if isinstance(value, str):
+        parsed = datetime.fromisoformat(value.replace('Z', '+00:00'))
+        if parsed.tzinfo is not None:
+            parsed = parsed.astimezone(timezone.utc).replace(tzinfo=None)
+        return parsed
+    raise ValueError('无效的时间戳')
+
+
+class IngestService:
+    """批量接收服务 - 同一时间只处理一个批次，保证去重检查和写入之间没有其他上传插入"""
+
+    def __init__(self, app):
+        self.app = app
+        self.table = app.sensor_model.__table__
+        self.fields = sensor_fields(self.table)
+        self.int_columns = {column.name for column in self.table.columns
+                            if column.type.python_type is int and column.name != 'id'}
+        self.count_columns = {column.name for column in self.table.columns if column.name.endswith('_count')}
+        # 每条记录包含全部数据列（缺失为None），整批可以一次executemany写入
+        self.data_columns = [column for columns in self.fields.values() for column in columns]
+        self.data_columns += sorted(self.count_columns)
+        self.lock = threading.Lock()
+
+        self.stats_lock = threading.Lock()
+        self.stats = {
+            'batches': 0,
+            'replayed_batches': 0,
+            'accepted': 0,
+            'duplicates': 0,
+            'rejected': 0,
+            'failed_batches': 0,
+            'last_batch_time': None,
+            'last_error': None
+        }
+
+    # ---------- 解析和校验 ----------
+
+    def parse_reading(self, item, default_node, now):
+        """一条上传读数转换为存储记录，返回 (记录, 拒绝原因)
+
+        支持与数据表列名相同的扁平格式（scd40_co2: 800），
+        也支持与 latest_data 相同的按传感器分组格式（scd40: {co2: 800}）
+        """
+        if not isinstance(item, dict):
+            return None, '不是JSON对象'
+
+        flat = {}
+        for key, value in item.items():
+            if key in self.fields and isinstance(value, dict):
+                flat.update({f'{key}_{field}': field_value for field, field_value in value.items()})
+            else:
+                flat[key] = value
+
+        if 'timestamp' not in flat:
+            return None, '缺少timestamp'
+        try:
+            timestamp = parse_timestamp(flat['timestamp'])
+        except (ValueError, TypeError, OverflowError):
+            return None, '无效的时间戳'
+        if timestamp > now + timedelta(seconds=Config.INGEST_MAX_FUTURE_SECONDS):
+            return None, '时间戳晚于当前时间'
+
+        node = flat.get('node_id') or default_node
+        if not isinstance(node, str) or not Config.NODE_ID_PATTERN.match(node):
+            return None, '无效的节点标识'
+
+        record = {'timestamp': timestamp, 'node_id': node, **dict.fromkeys(self.data_columns)}
+        present = False
+        for sensor, columns in self.fields.items():
+            for column, field in columns.items():
+                value = flat.get(column)
+                if value is None:
+                    continue
+                if isinstance(value, bool) or not isinstance(value, (int, float)) or value != value:
+                    return None, f'{column} 不是数值'
+                if column in self.int_columns:
+                    if value != int(value):
+                        return None, f'{column} 应为整数'
+                    value = int(value)
+                # 主值和窗口极值都按该字段的有效范围校验
+                if not SensorConfig.validate_sensor_data(sensor, {field: value}):
+                    return None, f'{column} 超出有效范围'
+                record[column] = value
+                present = True
+
+        if not present:
+            return None, '没有有效的传感器数据'
+
+        for column in self.count_columns:
+            value = flat.get(column)
+            if value is None or record.get(column[:-len('_count')]) is None:
+                continue
+            if isinstance(value, bool) or not isinstance(value, int) or value < 1:
+                return None, f'{column} 应为正整数'
+            record[column] = value
+        return record, None
+
+    def parse_ndjson(self, data, default_node):
+        """逐行解析NDJSON，返回 (记录列表, 拒绝列表[(行号, 原因)])"""
+        now = datetime.utcnow()
+        records, errors = [], []
+        for number, line in enumerate(data.splitlines(), 1):
+            line = line.strip()
+            if not line:
+                continue
+            if len(records) + len(errors) >= Config.INGEST_MAX_RECORDS:
+                raise IngestError(f'每批最多 {Config.INGEST_MAX_RECORDS} 条记录', 413)
+            try:
+                item = json.loads(line)
+            except ValueError:
+                errors.append((number, '无法解析的JSON'))
+                continue
+            record, error = self.parse_reading(item, default_node, now)
+            if error:
+                errors.append((number, error))
+            else:
+                records.append(record)
+        return records, errors
+
+    def parse_delta(self, data, default_node):
+        """解析增量编码批次（app.storage.delta），返回 (记录列表, 拒绝列表[(序号, 原因)])
+
+        批次结构错误时整批拒绝；序号从1开始，与NDJSON的行号含义相同
+        """
+        try:
+            batch = json.loads(data)
+            if isinstance(batch, dict) and isinstance(batch.get('count'), int) \
+                    and batch['count'] > Config.INGEST_MAX_RECORDS:
+                raise IngestError(f'每批最多 {Config.INGEST_MAX_RECORDS} 条记录', 413)
+            items = decode_batch(batch)
+        except IngestError:
+            raise
+        except (ValueError, TypeError, OverflowError) as e:
+            raise IngestError(f'无法解析的增量批次: {e}')
+
+        now = datetime.utcnow()
+        records, errors = [], []
+        for number, item in enumerate(items, 1):
+            record, error = self.parse_reading(item, default_node, now)
+            if error:
+                errors.append((number, error))
+            else:
+                records.append(record)
+        return records, errors
+
+    # ---------- 幂等键 ----------
+
+    def _batch_table(self):
+        from app.models import IngestBatch
+        return IngestBatch.__table__
+
+    def find_batch(self, key):
+        """已处理过的批次结果（没有时返回None）"""
+        table = self._batch_table()
+        with self.app.storage.read_connection() as conn:
+            row = conn.execute(select(table).where(table.c.key == key)).first()
+        return row._asdict() if row else None
+
+    def record_batch(self, key, node, result):
+        """记录批次结果，同时清理过期的幂等键"""
+        table = self._batch_table()
+        now = datetime.utcnow()
+        with self.app.storage.write_transaction() as conn:
+            conn.execute(delete(table).where(
+                table.c.received_at < now - timedelta(seconds=Config.INGEST_KEY_TTL)))
+            conn.execute(insert(table).prefix_with('OR REPLACE').values(
+                key=key, node_id=node, received_at=now, accepted=result['accepted'],
+                duplicates=result['duplicates'], rejected=result['rejected']))
+
+    # ---------- 接收 ----------
+
+    def ingest(self, body, encoding=None, node=None, key=None, content_type=None):
+        """处理一个上传批次，返回结果字典；写入失败时抛出异常（客户端应重试同一批次）
+
+        node: 读数中没有node_id时使用的节点；key: 幂等键；
+        content_type: 为DELTA_CONTENT_TYPE时按增量编码批次解析，否则按NDJSON解析
+        """
+        from app.storage.query import existing_keys, stored_time_normalizer
+
+        if key is not None and (len(key) > MAX_KEY_LENGTH or not key.isprintable()):
+            raise IngestError('无效的Idempotency-Key')
+
+        with self.lock:
+            if key is not None:
+                previous = self.find_batch(key)
+                if previous is not None:
+                    with self.stats_lock:
+                        self.stats['replayed_batches'] += 1
+                    return {
+                        'accepted': previous['accepted'],
+                        'duplicates': previous['duplicates'],
+                        'rejected': previous['rejected'],
+                        'errors': [],
+                        'idempotency_key': key,
+                        'replayed': True
+                    }
+
+            data = decode_body(body, encoding)
+            if content_type == DELTA_CONTENT_TYPE:
+                records, errors = self.parse_delta(data, node)
+            else:
+                records, errors = self.parse_ndjson(data, node)
+
+            # 时间按存储精度归一化后去重（批次内重复、与已存储的记录重复）
+            normalize = stored_time_normalizer()
+            unique = {}
+            for record in records:
+                record['timestamp'] = normalize(record['timestamp'])
+                unique.setdefault((record['node_id'], record['timestamp']), record)
+
+            existing = existing_keys(unique)
+            rows = [record for item, record in unique.items() if item not in existing]
+            rows.sort(key=lambda record: record['timestamp'])
+
+            try:
+                if rows:
+                    self.app.storage_backend.append_batch(rows)
+            except Exception as e:
+                with self.stats_lock:
+                    self.stats['failed_batches'] += 1
+                    self.stats['last_error'] = str(e)
+                raise
+
+            result = {
+                'accepted': len(rows),
+                'duplicates': len(records) - len(rows),
+                'rejected': len(errors),
+                'errors': [{'line': number, 'error': error} for number, error in errors[:MAX_REPORTED_ERRORS]],
+                'idempotency_key': key,
+                'replayed': False
+            }
+            # 数据写入后才记录幂等键；两者之间中断时客户端重试，由 (节点, 时间戳) 去重保证不重复写入
+            if key is not None:
+                self.record_batch(key, node, result)
+
+        with self.stats_lock:
+            self.stats['batches'] += 1
+            self.stats['accepted'] += result['accepted']
+            self.stats['duplicates'] += result['duplicates']
+            self.stats['rejected'] += result['rejected']
+            self.stats['last_batch_time'] = datetime.utcnow().isoformat()
+
+        logger.info(f"接收上传批次: 写入 {result['accepted']} 条，重复 {result['duplicates']} 条，"
+                    f"拒绝 {result['rejected']} 条")
+        return result
+
+    def get_stats(self):
+        """接收统计"""
+        with self.stats_lock:
+            return self.stats.copy()
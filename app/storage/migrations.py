@@ -0,0 +1,149 @@
+# app/storage/migrations.py
+"""
+数据库迁移模块 - 为已有数据库补建列和索引，并检查查询计划
+"""
+
+from datetime import datetime, timedelta
+from sqlalchemy import inspect, select, func
+from config.logging_config import get_logger
+
+logger = get_logger(__name__)
+
+
+def ensure_columns(engine, table, defaults=None):
+    """补建模型中新增的列（create_all不会修改已存在的表）
+
+    可空列直接ADD COLUMN；新增列属于主键（不能ADD COLUMN）时重建表并复制数据。
+    defaults: {列名: 值}，补建的列用该值回填已有记录（如节点标识），否则为NULL
+    """
+    defaults = defaults or {}
+    existing = {column['name'] for column in inspect(engine).get_columns(table.name)}
+    missing = [column for column in table.columns if column.name not in existing]
+    if not missing:
+        return []
+
+    if any(not column.nullable for column in missing):
+        _rebuild_table(engine, table, existing, defaults)
+        added = [column.name for column in missing]
+        logger.info(f"已重建 {table.name} 并补建列: {added}")
+        return added
+
+    added = []
+    with engine.begin() as conn:
+        for column in missing:
+            column_type = column.type.compile(dialect=engine.dialect)
+            conn.exec_driver_sql(f'ALTER TABLE {table.name} ADD COLUMN "{column.name}" {column_type}')
+            if column.name in defaults:
+                conn.exec_driver_sql(f'UPDATE {table.name} SET "{column.name}" = ?', (defaults[column.name],))
+            added.append(column.name)
+
+    logger.info(f"已为 {table.name} 补建列: {added}")
+    return added
+
+
+def _rebuild_table(engine, table, existing, defaults):
+    """按模型重建表（SQLite不能修改主键）：旧表改名，建新表后复制数据，在一个事务中完成"""
+    old_name = f'{table.name}__old'
+    columns = [column.name for column in table.columns if column.name in existing or column.name in defaults]
+    targets = ', '.join(f'"{name}"' for name in columns)
+    values = ', '.join(f'"{name}"' if name in existing else '?' for name in columns)
+    params = tuple(defaults[name] for name in columns if name not in existing)
+
+    logger.info(f"正在重建表 {table.name}（大表可能需要较长时间）...")
+    with engine.begin() as conn:
+        indexes = inspect(conn).get_indexes(table.name)
+        # pysqlite不会为DDL自动开启事务，显式开始，中途失败时整体回滚
+        conn.exec_driver_sql('BEGIN IMMEDIATE')
+        # 索引名在数据库内唯一，先删除旧表的索引，新表创建时按模型重建
+        for index in indexes:
+            conn.exec_driver_sql(f'DROP INDEX IF EXISTS "{index["name"]}"')
+        conn.exec_driver_sql(f'ALTER TABLE {table.name} RENAME TO {old_name}')
+        table.create(conn)
+        conn.exec_driver_sql(
+            f'INSERT INTO {table.name} ({targets}) SELECT {values} FROM {old_name}',
+            params
+        )
+        conn.exec_driver_sql(f'DROP TABLE {old_name}')
+
+
+def ensure_indexes(engine, table):
+    """补建模型中声明但数据库中缺失的索引（create_all不会修改已存在的表）"""
+    existing = {index['name'] for index in inspect(engine).get_indexes(table.name)}
+    created = []
+
+    for index in table.indexes:
+        if index.name in existing:
+            continue
+        logger.info(f"正在创建索引 {index.name}（大表可能需要较长时间）...")
+        index.create(bind=engine)
+        created.append(index.name)
+
+    if created:
+        # 更新统计信息，让查询规划器选中新索引
+        with engine.begin() as conn:
+            conn.exec_driver_sql("ANALYZE")
+        logger.info(f"已创建索引: {created}")
+
+    return created
+
+
+def endpoint_queries(hours=168):
+    """构造各API端点使用的查询（参数值只影响结果，不影响查询计划）"""
+    from flask import current_app
+    from app.storage.query import page_key, series_statement
+    from app.api.charts import CO2_COLUMNS, TEMP_HUMI_COLUMNS, VOC_NOX_COLUMNS
+
+    model = current_app.sensor_model
+    table = model.__table__
+    time_limit = datetime.utcnow() - timedelta(hours=hours)
+    return {
+        'charts/co2': series_statement(
+            table, CO2_COLUMNS, start=time_limit, require=CO2_COLUMNS, descending=False),
+        'charts/temperature_humidity': series_statement(
+            table, TEMP_HUMI_COLUMNS, start=time_limit, require=TEMP_HUMI_COLUMNS, descending=False),
+        'charts/voc_nox': series_statement(
+            table, VOC_NOX_COLUMNS, start=time_limit, require=VOC_NOX_COLUMNS, descending=False),
+        'history': series_statement(
+            table, model.RECORD_COLUMNS, start=time_limit, descending=True, limit=100),
+        'history/cursor': series_statement(
+            table, model.RECORD_COLUMNS, start=time_limit, descending=True, limit=101,
+            after=(datetime.utcnow(), 0 if page_key(table) == 'id' else current_app.config['NODE_ID'])),
+        'history/node': series_statement(
+            table, model.RECORD_COLUMNS, start=time_limit, descending=True, limit=100,
+            node=current_app.config['NODE_ID']),
+        'stats/recent_24h': select(func.count()).select_from(table).where(
+            table.c.timestamp >= time_limit
+        ),
+    }
+
+
+def explain_query_plan(session, query):
+    """返回查询的EXPLAIN QUERY PLAN结果（每行为计划说明文本）"""
+    statement = getattr(query, 'statement', query)
+    dialect = session.get_bind().dialect
+    compiled = statement.compile(dialect=dialect)
+
+    def bound_value(name):
+        # 按列类型转换参数（DateTime转文本、紧凑模式时间转整数毫秒）
+        value = compiled.params[name]
+        process = compiled.binds[name].type.bind_processor(dialect)
+        return process(value) if process else value
+
+    params = tuple(bound_value(name) for name in compiled.positiontup)
+    rows = session.connection().exec_driver_sql(f"EXPLAIN QUERY PLAN {compiled}", params)
+    return [row[-1] for row in rows]
+
+
+def print_query_plans(session):
+    """打印所有端点查询的查询计划（启动检查）"""
+    print("\n查询计划检查:")
+    plans = {}
+    for name, query in endpoint_queries().items():
+        try:
+            plans[name] = explain_query_plan(session, query)
+        except Exception as e:
+            plans[name] = [f"无法获取查询计划: {e}"]
+        print(f"  {name}:")
+        for detail in plans[name]:
+            print(f"    {detail}")
+    return plans
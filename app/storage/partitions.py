@@ -0,0 +1,270 @@
+# app/storage/partitions.py
+"""
+按月分区存储模块 - 每月一个SQLite文件，查询时只ATTACH与时间范围重叠的分区
+"""
+
+import re
+import threading
+from contextlib import contextmanager
+from datetime import datetime
+from pathlib import Path
+from sqlalchemy import MetaData, create_engine, func, insert, select, union_all
+from sqlalchemy.pool import NullPool
+from app.storage.migrations import ensure_columns, ensure_indexes
+from app.storage.query import page_key
+from app.storage.sqlite_tuning import database_file_size, install_sqlite_pragmas
+from config.settings import Config
+from config.logging_config import get_logger
+
+logger = get_logger(__name__)
+
+# SQLite默认最多同时ATTACH 10个数据库
+MAX_ATTACHED = 10
+
+
+class MonthlyPartitionStore:
+    """按月分区存储 - 写入按时间落到对应月份文件，删除旧数据只需删除文件"""
+
+    FILE_PREFIX = 'sensor_data_'
+    FILE_PATTERN = re.compile(r'^sensor_data_(\d{4})_(\d{2})\.db$')
+
+    def __init__(self, directory, table, pragmas=None):
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.table = table
+        self.pragmas = pragmas or {}
+
+        self.engines = {}
+        self.engines_lock = threading.Lock()
+        self.schema_tables = {}
+
+        # 只读查询使用只读的内存主库，分区以 mode=ro 通过ATTACH挂载
+        self.reader_engine = create_engine('sqlite:///file::memory:?mode=ro&uri=true', poolclass=NullPool)
+
+    # ---------- 分区定位 ----------
+
+    @staticmethod
+    def partition_key(dt):
+        """时间所属分区，格式 (年, 月)"""
+        return dt.year, dt.month
+
+    @staticmethod
+    def format_key(key):
+        """分区名，格式 YYYY-MM"""
+        return f"{key[0]:04d}-{key[1]:02d}"
+
+    @staticmethod
+    def parse_key(name):
+        """解析 YYYY-MM 格式的分区名"""
+        dt = datetime.strptime(name, '%Y-%m')
+        return dt.year, dt.month
+
+    def partition_path(self, key):
+        """分区文件路径"""
+        return self.directory / f"{self.FILE_PREFIX}{key[0]:04d}_{key[1]:02d}.db"
+
+    def list_partitions(self):
+        """列出已存在的分区（按时间升序）"""
+        keys = []
+        for path in self.directory.iterdir():
+            match = self.FILE_PATTERN.match(path.name)
+            if match:
+                keys.append((int(match.group(1)), int(match.group(2))))
+        return sorted(keys)
+
+    def partitions_for_range(self, start=None, end=None):
+        """与时间范围重叠的已存在分区"""
+        start_key = self.partition_key(start) if start else None
+        end_key = self.partition_key(end) if end else None
+        return [
+            key for key in self.list_partitions()
+            if (start_key is None or key >= start_key) and (end_key is None or key <= end_key)
+        ]
+
+    # ---------- 写入 ----------
+
+    def get_engine(self, key):
+        """获取分区的写入引擎，不存在时创建分区文件和表结构"""
+        with self.engines_lock:
+            engine = self.engines.get(key)
+            if engine is None:
+                engine = create_engine(f"sqlite:///{self.partition_path(key)}")
+                install_sqlite_pragmas(engine, self.pragmas)
+                self.table.create(bind=engine, checkfirst=True)
+                ensure_columns(engine, self.table, {'node_id': Config.NODE_ID})
+                ensure_indexes(engine, self.table)
+                self.engines[key] = engine
+                logger.info(f"分区已打开: {self.format_key(key)}")
+            return engine
+
+    def open_all(self):
+        """打开全部已有分区（同时补建新增的列），返回分区数"""
+        keys = self.list_partitions()
+        for key in keys:
+            self.get_engine(key)
+        return len(keys)
+
+    def group_rows(self, rows):
+        """记录按所属分区分组"""
+        groups = {}
+        for row in rows:
+            groups.setdefault(self.partition_key(row['timestamp']), []).append(row)
+        return groups
+
+    @contextmanager
+    def attached(self, conn, keys, readonly=False):
+        """在连接上ATTACH一组分区（写入时不存在的分区先创建），退出时DETACH，产出 {分区: 别名}
+
+        SQLite不允许在事务中ATTACH/DETACH，须在连接开启事务之前进入；
+        写入时分区和主库在连接的同一个事务中提交
+        """
+        if not readonly:
+            for key in keys:
+                self.get_engine(key)
+        aliases = dict(zip(keys, self._attach(conn, keys, readonly)))
+        conn.commit()
+        try:
+            yield aliases
+        finally:
+            if conn.in_transaction():
+                conn.rollback()
+            for alias in aliases.values():
+                conn.exec_driver_sql(f"DETACH DATABASE {alias}")
+            conn.commit()
+
+    def insert_rows(self, conn, aliases, groups):
+        """在调用方的事务中写入已ATTACH的分区（groups为group_rows的结果）"""
+        for key, group in sorted(groups.items()):
+            conn.execute(insert(self._schema_table(aliases[key])), group)
+
+    def drop_partition(self, key):
+        """删除整个分区（O(1)，直接删除文件）"""
+        with self.engines_lock:
+            engine = self.engines.pop(key, None)
+            if engine is not None:
+                engine.dispose()
+
+        path = self.partition_path(key)
+        if not path.exists():
+            return False
+
+        size = 0
+        for suffix in ('', '-wal', '-shm'):
+            part = Path(f"{path}{suffix}")
+            if part.exists():
+                size += part.stat().st_size
+                part.unlink()
+        logger.info(f"分区已删除: {self.format_key(key)} ({size} 字节)")
+        return True
+
+    # ---------- 查询 ----------
+
+    def _schema_table(self, alias):
+        """同结构的schema限定表，用于访问ATTACH的分区"""
+        table = self.schema_tables.get(alias)
+        if table is None:
+            table = self.table.to_metadata(MetaData(), schema=alias)
+            self.schema_tables[alias] = table
+        return table
+
+    def _attach(self, conn, keys, readonly=False):
+        """在连接上ATTACH一组分区，返回别名列表（readonly时以 mode=ro 打开，需要连接启用URI文件名）"""
+        aliases = []
+        for key in keys:
+            alias = f"p_{key[0]:04d}_{key[1]:02d}"
+            path = self.partition_path(key)
+            target = f"{path.resolve().as_uri()}?mode=ro" if readonly else str(path)
+            conn.exec_driver_sql(f"ATTACH DATABASE ? AS {alias}", (target,))
+            aliases.append(alias)
+        return aliases
+
+    def fetch(self, build_select, start=None, end=None, descending=False, limit=None):
+        """只在重叠分区上执行查询，结果按时间排序
+
+        build_select: 接收表对象并返回该表上的select语句
+        """
+        keys = self.partitions_for_range(start, end)
+        if descending:
+            keys.reverse()
+
+        rows = []
+        for i in range(0, len(keys), MAX_ATTACHED):
+            chunk = keys[i:i + MAX_ATTACHED]
+            with self.reader_engine.connect() as conn:
+                aliases = self._attach(conn, chunk, readonly=True)
+                selects = [build_select(self._schema_table(alias)) for alias in aliases]
+                stmt = selects[0] if len(selects) == 1 else union_all(*selects)
+                # 按 (timestamp, 次排序列) 排序（次排序列在查询结果中时），与单表查询的顺序一致
+                selected = stmt.selected_columns
+                key = page_key(self.table)
+                order = [selected.timestamp] + ([selected[key]] if key in selected else [])
+                stmt = stmt.order_by(*[column.desc() if descending else column.asc() for column in order])
+                if limit:
+                    stmt = stmt.limit(limit - len(rows))
+                rows.extend(conn.execute(stmt).all())
+
+            if limit and len(rows) >= limit:
+                break
+        return rows
+
+    def scalars(self, build_select, start=None, end=None):
+        """在每个重叠分区上执行返回单值的查询（如计数），按分区顺序返回"""
+        results = []
+        for key in self.partitions_for_range(start, end):
+            with self.get_engine(key).connect() as conn:
+                results.append(conn.execute(build_select(self.table)).scalar())
+        return results
+
+    def get_partition_info(self):
+        """分区列表及文件大小（含-wal/-shm文件）"""
+        info = []
+        for key in self.list_partitions():
+            path = self.partition_path(key)
+            info.append({
+                'partition': self.format_key(key),
+                'file': path.name,
+                'size': database_file_size(path)
+            })
+        return info
+
+    def total_size(self):
+        """所有分区文件的总大小"""
+        return sum(item['size'] for item in self.get_partition_info())
+
+    def migrate_from(self, engine):
+        """将单表中的数据按月迁移到分区
+
+        每个月份一个事务：分区ATTACH到单表所在的连接上，复制和删除原数据一起提交；
+        复制时跳过分区中已存在的 (节点, 时间戳)，中断后重新运行不会重复
+        """
+        from app.storage.archive import month_start, next_month
+
+        table = self.table
+        # 复制语句中用别名引用单表，与分区中的同名表区分
+        source = table.alias('source')
+        columns = [column.name for column in table.columns if column.name != 'id']
+        moved = 0
+        while True:
+            with engine.connect() as conn:
+                earliest = conn.execute(select(func.min(table.c.timestamp))).scalar()
+                if earliest is None:
+                    break
+                key = self.partition_key(earliest)
+                start, end = month_start(key), month_start(next_month(key))
+
+                with self.attached(conn, [key]) as aliases:
+                    target = self._schema_table(aliases[key])
+                    stored = select(1).where(target.c.node_id.is_not_distinct_from(source.c.node_id),
+                                             target.c.timestamp == source.c.timestamp).exists()
+                    with conn.begin():
+                        conn.execute(insert(target).from_select(
+                            columns,
+                            select(*[source.c[name] for name in columns]).where(
+                                source.c.timestamp >= start, source.c.timestamp < end, ~stored)
+                        ))
+                        count = conn.execute(
+                            table.delete().where(table.c.timestamp >= start, table.c.timestamp < end)
+                        ).rowcount
+            moved += count
+            logger.info(f"已迁移 {self.format_key(key)} 的 {count} 条记录到分区（共 {moved} 条）")
+        return moved
@@ -0,0 +1,284 @@
+# app/storage/query.py
+"""
+查询层模块 - API端点统一通过此模块查询时间序列，由当前存储后端执行，
+屏蔽存储引擎以及单表/按月分区/列式归档的差异
+"""
+
+import base64
+import json
+import operator
+from datetime import datetime, timedelta
+
+from flask import current_app
+from sqlalchemy import literal, select, or_, tuple_
+
+from app.storage.deadband import fill_steps
+from config.settings import Config
+
+
+def read_connection():
+    """只读连接（API和图表的所有查询都走只读连接池）"""
+    return current_app.storage.read_connection()
+
+
+def _table():
+    """当前存储模式的原始数据表"""
+    return current_app.sensor_model.__table__
+
+
+def page_key(table):
+    """keyset分页的次排序列：有自增id的表用id，紧凑表（主键为 (timestamp, node_id)）用node_id"""
+    return 'id' if 'id' in table.c else 'node_id'
+
+
+def keyset_range(start, end, after, descending):
+    """after（上一页最后一行的 (timestamp, 次排序列值)）收窄后的时间范围，用于按时间索引定位和跳过分区/月份"""
+    if after is None:
+        return start, end
+    if descending:
+        return start, after[0] if end is None else min(end, after[0])
+    return after[0] if start is None else max(start, after[0]), end
+
+
+def after_filter(after, key, descending):
+    """行是否在after之后（倒序时为之前）的判断函数，供不执行SQL的存储使用"""
+    timestamp, tie = after
+    if descending:
+        return lambda row: row.timestamp < timestamp or (row.timestamp == timestamp and getattr(row, key) < tie)
+    return lambda row: row.timestamp > timestamp or (row.timestamp == timestamp and getattr(row, key) > tie)
+
+
+def after_clause(table, after, descending):
+    """(timestamp, 次排序列) 在after之后（倒序时为之前）的行值比较条件"""
+    columns = (table.c.timestamp, table.c[page_key(table)])
+    # 参数按列类型绑定（紧凑模式的时间为整数毫秒）
+    bound = tuple_(*[literal(value, column.type) for column, value in zip(columns, after)])
+    position = tuple_(*columns)
+    return position < bound if descending else position > bound
+
+
+def series_statement(table, columns, start=None, end=None, require=None,
+                     descending=None, limit=None, node=None, after=None):
+    """构造时间范围查询：返回timestamp及指定列，按时间排序
+
+    require: 列名列表，只返回其中至少一列非空的记录（与部分索引条件一致）
+    node: 只返回该节点的记录（使用 (node_id, timestamp) 索引）
+    after: 只返回 (timestamp, 次排序列) 在其之后（倒序时为之前）的记录（行值比较，keyset分页）
+    """
+    key = table.c[page_key(table)]
+    start, end = keyset_range(start, end, after, descending)
+    stmt = select(table.c.timestamp, *[table.c[name] for name in columns])
+    if node is not None:
+        stmt = stmt.where(table.c.node_id == node)
+    if start is not None:
+        stmt = stmt.where(table.c.timestamp >= start)
+    if end is not None:
+        stmt = stmt.where(table.c.timestamp <= end)
+    if require:
+        stmt = stmt.where(or_(*[table.c[name].isnot(None) for name in require]))
+    if after is not None:
+        stmt = stmt.where(after_clause(table, after, descending))
+    if descending is not None:
+        # 同一时间戳按次排序列排序只在分页需要时进行（查询列包含次排序列或指定after），
+        # 其余查询只按时间排序，可以使用各指标的覆盖部分索引
+        order = [table.c.timestamp] + ([key] if after is not None or key.name in columns else [])
+        stmt = stmt.order_by(*[column.desc() if descending else column.asc() for column in order])
+    if limit:
+        stmt = stmt.limit(limit)
+    return stmt
+
+
+def _backend():
+    """当前应用的存储后端（app.storage.backends）"""
+    return current_app.storage_backend
+
+
+def fetch_series(columns, start=None, end=None, require=None, descending=False, limit=None, node=None,
+                 after=None):
+    """按时间顺序读取指定列，返回行列表（row.timestamp 及各列属性）
+
+    node为None时返回所有节点的记录；SQLite后端的时间范围涉及已归档月份时自动合并归档数据；
+    after见 StorageBackend.scan
+    """
+    return _backend().scan(columns, start=start, end=end, require=require,
+                           descending=descending, limit=limit, node=node, after=after)
+
+
+def fetch_history(columns, start=None, end=None, limit=None, node=None):
+    """按时间倒序读取完整记录（历史接口）
+
+    死区存储模式下未变化的值为空，用保持时长内该指标更早的值填充（按节点分别填充）
+    """
+    rows = fetch_series(columns, start=start, end=end, descending=True, limit=limit, node=node)
+    return fill_history(rows, columns, node)
+
+
+def fill_history(rows, columns, node=None, descending=True):
+    """按时间排序（默认倒序）的记录在死区存储模式下按阶梯序列填充（非死区模式原样返回）"""
+    if not Config.DEADBAND_ENABLED or not rows:
+        return rows
+
+    ordered = rows[::-1] if descending else rows
+    metrics = [name for name in columns if name in Config.DEADBAND_THRESHOLDS]
+    oldest = ordered[0].timestamp
+    hold_start = oldest - timedelta(seconds=Config.DEADBAND_HOLD)
+    if node is not None or 'node_id' not in columns:
+        seed = fetch_series(metrics, start=hold_start, end=oldest, require=metrics, node=node)
+        filled = fill_steps(ordered, metrics, Config.DEADBAND_HOLD, seed=seed)
+        return filled[::-1] if descending else filled
+
+    filled = []
+    for name in sorted({row.node_id for row in rows}, key=str):
+        node_rows = [row for row in ordered if row.node_id == name]
+        seed = fetch_series(metrics, start=hold_start, end=oldest, require=metrics, node=name)
+        filled.extend(fill_steps(node_rows, metrics, Config.DEADBAND_HOLD, seed=seed))
+    # 与分页顺序一致：同一时间戳的记录按次排序列排列
+    key = page_key_column()
+    order = operator.attrgetter('timestamp', key) if key in rows[0]._fields else operator.attrgetter('timestamp')
+    filled.sort(key=order, reverse=descending)
+    return filled
+
+
+# ---------- keyset分页 ----------
+
+_EPOCH = datetime(1970, 1, 1)
+
+
+def page_key_column():
+    """当前存储模式的keyset分页次排序列"""
+    return page_key(_table())
+
+
+def encode_cursor(key):
+    """(timestamp, 次排序列值) 编码为不透明的游标字符串"""
+    timestamp, tie = key
+    payload = json.dumps([(timestamp - _EPOCH) // timedelta(microseconds=1), tie], separators=(',', ':'))
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    """游标字符串还原为 (timestamp, 次排序列值)，无效时抛出ValueError"""
+    try:
+        payload = json.loads(base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)))
+        micros, tie = payload
+        timestamp = _EPOCH + timedelta(microseconds=micros)
+    except (TypeError, ValueError, OverflowError):
+        raise ValueError('无效的游标')
+    expected = int if page_key_column() == 'id' else str
+    if isinstance(micros, bool) or not isinstance(micros, int) or isinstance(tie, bool) \
+            or not isinstance(tie, expected):
+        raise ValueError('无效的游标')
+    return timestamp, tie
+
+
+def fetch_page(columns, start=None, end=None, limit=100, node=None, after=None, descending=True):
+    """按 (timestamp, 次排序列) keyset分页读取，返回 (行列表, 下一页的键或None)
+
+    after: 上一页最后一行的 (timestamp, 次排序列值)。每页只向存储后端发出一次从游标位置开始、
+    按 (timestamp, 次排序列) 排序的有界扫描（limit+1行，不使用OFFSET，代价与页码无关）；
+    同一时间戳的多条记录（不同节点）按次排序列区分，分页边界落在其中时也不会遗漏或重复
+    """
+    key = page_key_column()
+    if key not in columns:
+        columns = list(columns) + [key]
+
+    rows = fetch_series(columns, start=start, end=end, descending=descending, limit=limit + 1,
+                        node=node, after=after)
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    next_key = (rows[-1].timestamp, getattr(rows[-1], key)) if has_more else None
+    return rows, next_key
+
+
+def iter_history(columns, start=None, end=None, node=None, after=None, limit=None, page_size=1000,
+                 descending=True):
+    """按时间倒序（descending=False时升序）逐页生成记录（流式历史接口、导出），内存占用只与page_size有关
+
+    每页单独执行一次短查询，不会在整个导出期间持有读事务（WAL检查点不受影响）；
+    limit为None时读取到范围末尾；返回的生成器结束时 .next_key 为下一页的键
+    """
+    return _HistoryIterator(columns, start, end, node, after, limit, page_size, descending)
+
+
+class _HistoryIterator:
+    """iter_history 的生成器（结束后通过next_key取得续读位置）"""
+
+    def __init__(self, columns, start, end, node, after, limit, page_size, descending=True):
+        self.args = (columns, start, end, node)
+        self.next_key = after
+        self.limit = limit
+        self.page_size = page_size
+        self.descending = descending
+
+    def __iter__(self):
+        columns, start, end, node = self.args
+        emitted = 0
+        while True:
+            size = self.page_size if self.limit is None else min(self.page_size, self.limit - emitted)
+            if size <= 0:
+                return
+            rows, next_key = fetch_page(columns, start=start, end=end, limit=size, node=node,
+                                        after=self.next_key, descending=self.descending)
+            # 读到最后一页时无需续读（limit截断时保留位置）
+            self.next_key = next_key
+            for row in fill_history(rows, columns, node, descending=self.descending):
+                yield row
+            emitted += len(rows)
+            if next_key is None:
+                return
+
+
+def fetch_buckets(metrics, bucket_seconds, start, end=None, node=None):
+    """按时间桶聚合，返回按桶起点排序的 [(bucket_start, {metric: 桶})]（node为None时合并所有节点）"""
+    return _backend().aggregate(metrics, bucket_seconds, start, end, node=node)
+
+
+def fetch_threshold(metric, above=None, below=None, start=None, end=None, node=None):
+    """指标超过/低于阈值的采样（分段存储后端按块的最小/最大值跳过不可能满足条件的块）"""
+    return _backend().threshold(metric, above=above, below=below, start=start, end=end, node=node)
+
+
+def latest_record(columns, require=None, node=None):
+    """最新一条记录"""
+    return _backend().latest(columns, require=require, node=node)
+
+
+def list_nodes():
+    """有记录的节点标识（升序）"""
+    return _backend().nodes()
+
+
+def stored_time_normalizer():
+    """返回按存储精度归一化时间的函数（紧凑模式截断为毫秒），用于与已存储的时间比较
+
+    DuckDB和分段存储后端按微秒保存，不需要归一化
+    """
+    if _backend().name != 'sqlite':
+        return lambda value: value
+    column_type = _table().c.timestamp.type
+    dialect = current_app.storage.writer.dialect
+    bind = column_type.bind_processor(dialect)
+    result = column_type.result_processor(dialect, None)
+    if bind is None or result is None:
+        return lambda value: value
+    return lambda value: result(bind(value))
+
+
+def existing_keys(keys):
+    """keys（(节点, 时间戳)，时间为存储精度）中已存储的键（含分区和归档），用于去重"""
+    return _backend().existing_keys(keys)
+
+
+def count_rows(start=None, end=None, require=None, node=None):
+    """统计时间范围内的记录数"""
+    return _backend().count(start=start, end=end, require=require, node=node)
+
+
+def time_bounds(node=None):
+    """最早和最晚记录时间"""
+    return _backend().time_bounds(node=node)
+
+
+def database_size():
+    """存储占用的磁盘空间（SQLite后端含分区）"""
+    return _backend().size()
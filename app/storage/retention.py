@@ -0,0 +1,290 @@
+# app/storage/retention.py
+"""
+数据保留模块 - 后台分块删除过期数据，并定期执行增量VACUUM和ANALYZE
+"""
+
+import threading
+import time
+from datetime import datetime, timedelta
+from sqlalchemy import text
+from config.logging_config import get_logger
+
+logger = get_logger(__name__)
+
+
+class RetentionManager:
+    """数据保留管理器 - 按表/汇总层级的最长保留天数清理数据"""
+
+    def __init__(self, app=None, policies=None, interval=3600, chunk_size=500,
+                 chunk_pause=0.2, vacuum_pages=2000, analyze_interval=86400,
+                 archive=None, archive_after_days=None):
+        self.app = app
+        self.policies = policies or {}
+        self.archive = archive                  # 列式归档（None表示不归档，过期数据直接删除）
+        self.archive_after_days = archive_after_days
+        self.interval = interval                # 两次清理之间的间隔（秒）
+        self.chunk_size = chunk_size            # 每个删除事务的最大行数
+        self.chunk_pause = chunk_pause          # 两个删除事务之间的暂停（秒），让出写锁
+        self.vacuum_pages = vacuum_pages        # 每次增量VACUUM释放的最大页数
+        self.analyze_interval = analyze_interval
+
+        self.retention_thread = None
+        self.running = False
+        self.wakeup = threading.Event()
+        self.run_lock = threading.Lock()
+
+        self.last_result = None
+        self.last_analyze_time = 0
+        self.total_rows_removed = 0
+        self.total_bytes_reclaimed = 0
+
+    def start(self, app=None):
+        """启动后台清理线程"""
+        if self.running:
+            return
+
+        if app:
+            self.app = app
+
+        self.running = True
+        self.retention_thread = threading.Thread(
+            target=self.retention_worker,
+            daemon=True,
+            name="RetentionThread"
+        )
+        self.retention_thread.start()
+        logger.info(f"数据保留线程已启动 (间隔: {self.interval}秒, 策略: {self.policies})")
+
+    def stop(self):
+        """停止后台清理线程"""
+        self.running = False
+        self.wakeup.set()
+        if self.retention_thread:
+            self.retention_thread.join(timeout=5)
+
+    def trigger(self):
+        """立即唤醒清理线程执行一次"""
+        self.wakeup.set()
+
+    def retention_worker(self):
+        """清理工作线程"""
+        while self.running:
+            try:
+                self.run_once()
+            except Exception as e:
+                logger.error(f"数据保留任务失败: {e}")
+
+            self.wakeup.wait(self.interval)
+            self.wakeup.clear()
+
+    # ---------- 清理 ----------
+
+    def run_once(self):
+        """执行一次完整的清理、增量VACUUM和ANALYZE"""
+        from app.storage.query import database_size
+
+        with self.run_lock, self.app.app_context():
+            started = time.time()
+            now = datetime.utcnow()
+            # 删除与批量写入共用同一个写连接，分块之间让出给写入线程
+            engine = self.app.storage.writer
+            size_before = database_size()
+
+            rows_removed = {}
+            partitions_dropped = []
+
+            # 先把已结束的旧月份移入归档，再按保留策略删除
+            months_archived = []
+            if self.archive is not None and self.archive_after_days is not None:
+                months_archived = self._archive_raw(engine, now - timedelta(days=self.archive_after_days))
+
+            for name, days in self.policies.items():
+                if days is None:
+                    continue
+                cutoff = now - timedelta(days=days)
+
+                if name == 'sensor_data':
+                    removed, dropped = self._prune_raw(engine, cutoff)
+                    partitions_dropped.extend(dropped)
+                elif name.startswith('rollup_'):
+                    removed = self._prune_rollup(engine, int(name.split('_', 1)[1]), cutoff)
+                else:
+                    logger.warning(f"未知的保留策略: {name}")
+                    continue
+                rows_removed[name] = removed
+
+            vacuum_pages = self._incremental_vacuum(engine)
+
+            analyzed = False
+            if time.time() - self.last_analyze_time >= self.analyze_interval:
+                with engine.begin() as conn:
+                    conn.exec_driver_sql("ANALYZE")
+                self.last_analyze_time = time.time()
+                analyzed = True
+
+            bytes_reclaimed = max(0, size_before - database_size())
+            total_removed = sum(rows_removed.values())
+            self.total_rows_removed += total_removed
+            self.total_bytes_reclaimed += bytes_reclaimed
+
+            self.last_result = {
+                'started_at': started,
+                'finished_at': time.time(),
+                'duration_seconds': round(time.time() - started, 3),
+                'rows_removed': rows_removed,
+                'partitions_dropped': partitions_dropped,
+                'months_archived': months_archived,
+                'vacuum_pages_freed': vacuum_pages,
+                'bytes_reclaimed': bytes_reclaimed,
+                'analyzed': analyzed
+            }
+
+            if total_removed or partitions_dropped or months_archived:
+                logger.info(f"数据保留任务完成: 删除 {total_removed} 行, 分区 {partitions_dropped}, "
+                            f"归档 {months_archived}, 回收 {bytes_reclaimed} 字节")
+            return self.last_result
+
+    def archive_before(self, cutoff):
+        """立即把cutoff所在月份之前的原始数据移入列式归档并释放空间，返回归档的月份"""
+        if self.archive is None:
+            return []
+
+        with self.run_lock, self.app.app_context():
+            engine = self.app.storage.writer
+            archived = self._archive_raw(engine, cutoff)
+            self._incremental_vacuum(engine)
+        if archived:
+            logger.info(f"手动归档完成: {archived}")
+        return archived
+
+    @staticmethod
+    def _time_value(engine, table, dt):
+        """时间在数据库中的存储值，用于原生SQL比较（DateTime为文本，紧凑模式为整数毫秒）"""
+        process = table.c.timestamp.type.bind_processor(engine.dialect)
+        return process(dt) if process else dt
+
+    def _delete_in_chunks(self, engine, table, column, cutoff, where=''):
+        """分块删除 column < cutoff 的行，每块一个短事务
+
+        每块按主键选出最多chunk_size行再删除（汇总表和紧凑表为WITHOUT ROWID，用主键元组），
+        同一时间值的行再多也不会卡住；本块没有删除任何行时结束
+        """
+        extra = f" AND {where}" if where else ''
+        keys = ', '.join(key.name for key in table.primary_key.columns)
+        target = f"({keys})" if len(table.primary_key.columns) > 1 else keys
+        removed = 0
+
+        while True:
+            with engine.begin() as conn:
+                result = conn.execute(
+                    text(f"DELETE FROM {table.name} WHERE {target} IN ("
+                         f"SELECT {keys} FROM {table.name} WHERE {column} < :cutoff{extra} LIMIT :limit)"),
+                    {'cutoff': cutoff, 'limit': self.chunk_size}
+                )
+                deleted = result.rowcount or 0
+                removed += deleted
+
+            # 全部删除完成，或后台线程被停止（手动调用run_once时不受影响）
+            if deleted == 0 or (self.retention_thread is not None and not self.running):
+                break
+            time.sleep(self.chunk_pause)
+
+        return removed
+
+    def _prune_raw(self, engine, cutoff):
+        """清理原始数据：分区模式下整月过期的分区直接删除文件"""
+        store = getattr(self.app, 'partition_store', None)
+        table = self.app.sensor_model.__table__
+        cutoff_value = self._time_value(engine, table, cutoff)
+        if store is None:
+            return self._delete_in_chunks(engine, table, 'timestamp', cutoff_value), []
+
+        removed = 0
+        dropped = []
+        cutoff_key = store.partition_key(cutoff)
+        for key in store.list_partitions():
+            if key < cutoff_key:
+                store.drop_partition(key)
+                dropped.append(store.format_key(key))
+            elif key == cutoff_key:
+                removed += self._delete_in_chunks(store.get_engine(key), table, 'timestamp', cutoff_value)
+        return removed, dropped
+
+    def _archive_raw(self, engine, cutoff):
+        """将cutoff所在月份之前的原始数据按月写入列式归档，并从在线数据库删除"""
+        from sqlalchemy import func, select
+        from app.storage.archive import month_start, next_month
+
+        store = getattr(self.app, 'partition_store', None)
+        cutoff_key = (cutoff.year, cutoff.month)
+        archived = []
+
+        if store is not None:
+            for key in store.list_partitions():
+                if key >= cutoff_key:
+                    break
+                self.archive.archive_month(store.get_engine(key), key)
+                store.drop_partition(key)
+                archived.append(store.format_key(key))
+            return archived
+
+        table = self.app.sensor_model.__table__
+        while True:
+            with engine.connect() as conn:
+                earliest = conn.execute(select(func.min(table.c.timestamp))).scalar()
+            if earliest is None or (earliest.year, earliest.month) >= cutoff_key:
+                break
+
+            key = (earliest.year, earliest.month)
+            self.archive.archive_month(engine, key)
+            end_value = self._time_value(engine, table, month_start(next_month(key)))
+            self._delete_in_chunks(engine, table, 'timestamp', end_value)
+            archived.append(self.archive.format_key(key))
+
+            if self.retention_thread is not None and not self.running:
+                break
+        return archived
+
+    def _prune_rollup(self, engine, tier, cutoff):
+        """清理指定层级的过期汇总桶"""
+        from app.models import SensorRollup
+        from app.storage.rollups import to_epoch
+        return self._delete_in_chunks(
+            engine, SensorRollup.__table__, 'bucket_start', int(to_epoch(cutoff)),
+            where=f"tier = {int(tier)}"
+        )
+
+    def _incremental_vacuum(self, engine):
+        """增量VACUUM，释放空闲页（需要auto_vacuum=INCREMENTAL）"""
+        with engine.connect() as conn:
+            mode = conn.exec_driver_sql("PRAGMA auto_vacuum").scalar()
+            if mode != 2:
+                logger.debug("数据库未启用auto_vacuum=INCREMENTAL，跳过增量VACUUM"
+                             "（可运行 python manage_db.py vacuum 转换）")
+                return 0
+
+            free_before = conn.exec_driver_sql("PRAGMA freelist_count").scalar()
+            # sqlite3模块把该PRAGMA当作无结果语句只执行一步（只释放一页），
+            # executescript会把语句执行完，一次释放最多vacuum_pages页
+            conn.connection.driver_connection.executescript(
+                f"PRAGMA incremental_vacuum({int(self.vacuum_pages)})"
+            )
+            free_after = conn.exec_driver_sql("PRAGMA freelist_count").scalar()
+            conn.commit()
+            # 非阻塞检查点，让释放的页真正从数据库文件截断
+            conn.exec_driver_sql("PRAGMA wal_checkpoint(PASSIVE)").fetchall()
+        return max(0, free_before - free_after)
+
+    def get_status(self):
+        """获取保留任务状态"""
+        return {
+            'running': self.running,
+            'policies': self.policies,
+            'archive_after_days': self.archive_after_days if self.archive is not None else None,
+            'interval_seconds': self.interval,
+            'chunk_size': self.chunk_size,
+            'last_run': self.last_result,
+            'last_analyze_time': self.last_analyze_time or None,
+            'total_rows_removed': self.total_rows_removed,
+            'total_bytes_reclaimed': self.total_bytes_reclaimed
+        }
@@ -0,0 +1,164 @@
+# app/storage/ring.py
+"""
+SGP41原始信号环形文件模块 - 固定大小的二进制文件通过mmap写入，
+保存每秒的sraw_voc/sraw_nox，不产生任何SQLite写入
+"""
+
+import mmap
+import os
+import struct
+import threading
+from pathlib import Path
+
+import numpy as np
+
+from config.logging_config import get_logger
+
+logger = get_logger(__name__)
+
+# 文件头：魔数、版本、记录大小、容量、已写入总数
+HEADER_FORMAT = '<8sIIQQ'
+HEADER_SIZE = 64
+MAGIC = b'SGPRAW01'
+VERSION = 1
+
+# 记录：UTC epoch秒（uint32） + sraw_voc ticks（uint16） + sraw_nox ticks（uint16）
+RECORD_DTYPE = np.dtype([('timestamp', '<u4'), ('sraw_voc', '<u2'), ('sraw_nox', '<u2')])
+RECORD_FORMAT = '<IHH'
+
+
+class RawRingFile:
+    """定长环形文件 - 写满后覆盖最旧的记录，磁盘占用 = 64 + 容量 × 8 字节"""
+
+    def __init__(self, path, capacity, flush_every=60):
+        self.path = Path(path)
+        self.capacity = int(capacity)
+        self.flush_every = flush_every          # 每写入多少条记录调用一次msync
+
+        self.lock = threading.Lock()
+        self.file = None
+        self.mm = None
+        self.records = None
+        self.count = 0
+        self.last_timestamp = 0
+        self.unflushed = 0
+
+        self._open()
+
+    def _open(self):
+        """打开或创建环形文件（容量不一致时重建）"""
+        size = HEADER_SIZE + self.capacity * RECORD_DTYPE.itemsize
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+
+        exists = self.path.exists() and self.path.stat().st_size == size
+        if exists:
+            with open(self.path, 'rb') as f:
+                magic, version, record_size, capacity, count = struct.unpack_from(
+                    HEADER_FORMAT, f.read(HEADER_SIZE))
+            exists = (magic == MAGIC and version == VERSION and
+                      record_size == RECORD_DTYPE.itemsize and capacity == self.capacity)
+            if not exists:
+                logger.warning(f"环形文件格式不匹配，将重建: {self.path}")
+
+        if not exists:
+            with open(self.path, 'wb') as f:
+                f.truncate(size)
+            count = 0
+
+        self.file = open(self.path, 'r+b')
+        self.mm = mmap.mmap(self.file.fileno(), size)
+        # 直接映射到文件内容的结构化数组视图，读取时不复制
+        self.records = np.frombuffer(self.mm, dtype=RECORD_DTYPE, count=self.capacity, offset=HEADER_SIZE)
+        self.count = count
+        self._write_header()
+
+        if self.count:
+            self.last_timestamp = int(self.records[(self.count - 1) % self.capacity]['timestamp'])
+        logger.info(f"SGP41原始信号环形文件已打开: {self.path} "
+                    f"(容量 {self.capacity} 条, 已写入 {self.count} 条)")
+
+    def _write_header(self):
+        struct.pack_into(HEADER_FORMAT, self.mm, 0,
+                         MAGIC, VERSION, RECORD_DTYPE.itemsize, self.capacity, self.count)
+
+    def append(self, timestamp, sraw_voc, sraw_nox):
+        """追加一条记录（时间倒退时按上一条时间写入，保证文件内时间单调）"""
+        timestamp = max(int(timestamp), self.last_timestamp)
+        with self.lock:
+            slot = self.count % self.capacity
+            struct.pack_into(RECORD_FORMAT, self.mm, HEADER_SIZE + slot * RECORD_DTYPE.itemsize,
+                             timestamp, int(sraw_voc) & 0xFFFF, int(sraw_nox) & 0xFFFF)
+            # 先写记录再更新计数，读取方不会看到未写完的记录
+            self.count += 1
+            self._write_header()
+            self.last_timestamp = timestamp
+
+            self.unflushed += 1
+            if self.unflushed >= self.flush_every:
+                self.mm.flush()
+                self.unflushed = 0
+
+    def segments(self):
+        """按时间顺序返回有效记录的视图（最多两段，不复制）
+
+        写满后跳过即将被覆盖的最旧一条，避免读到正在写入的记录
+        """
+        count = self.count
+        if count < self.capacity:
+            return [self.records[:count]]
+        next_slot = count % self.capacity
+        return [self.records[next_slot + 1:], self.records[:next_slot]]
+
+    def read_range(self, start=None, end=None):
+        """读取时间范围内的记录 [start, end]（epoch秒），返回结构化数组视图列表
+
+        每段内时间单调递增，使用二分查找定位，返回的是文件映射的切片而非副本
+        """
+        views = []
+        for segment in self.segments():
+            if not segment.size:
+                continue
+            timestamps = segment['timestamp']
+            lo = np.searchsorted(timestamps, start, 'left') if start is not None else 0
+            hi = np.searchsorted(timestamps, end, 'right') if end is not None else segment.size
+            if hi > lo:
+                views.append(segment[lo:hi])
+        return views
+
+    def flush(self):
+        """将映射内容同步到磁盘"""
+        with self.lock:
+            if self.mm is not None:
+                self.mm.flush()
+                self.unflushed = 0
+
+    def close(self):
+        """同步并关闭文件（之前返回的视图不能再使用）"""
+        self.flush()
+        with self.lock:
+            self.records = None
+            if self.mm is not None:
+                try:
+                    self.mm.close()
+                except BufferError:
+                    # 仍有视图引用映射，交给进程退出时释放
+                    pass
+                self.mm = None
+            if self.file is not None:
+                self.file.close()
+                self.file = None
+
+    def get_stats(self):
+        """环形文件状态"""
+        segments = self.segments()
+        stored = sum(segment.size for segment in segments)
+        first = next((s for s in segments if s.size), None)
+        return {
+            'path': str(self.path),
+            'capacity': self.capacity,
+            'file_size': os.path.getsize(self.path),
+            'total_written': self.count,
+            'stored': int(stored),
+            'oldest': int(first['timestamp'][0]) if first is not None else None,
+            'newest': self.last_timestamp or None
+        }
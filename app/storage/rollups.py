@@ -0,0 +1,220 @@
+# app/storage/rollups.py
+"""
+汇总表模块 - 按 1分钟/5分钟/1小时/1天 时间桶增量维护各指标的 count/min/max/sum/last
+"""
+
+from collections import namedtuple
+from datetime import datetime, timedelta
+from sqlalchemy import select, func, delete, case
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from config.settings import Config
+from config.logging_config import get_logger
+
+logger = get_logger(__name__)
+
+EPOCH = datetime(1970, 1, 1)
+
+# 多个节点合并后的汇总桶（与汇总表行的属性相同）
+RollupRow = namedtuple('RollupRow', ('count', 'min', 'max', 'sum', 'last', 'last_ts'))
+
+
+def to_epoch(dt):
+    """UTC naive datetime 转 epoch 秒"""
+    return (dt - EPOCH).total_seconds()
+
+
+def from_epoch(seconds):
+    """epoch 秒转 UTC naive datetime"""
+    return EPOCH + timedelta(seconds=seconds)
+
+
+def bucket_start(epoch_seconds, tier):
+    """计算时间桶起点（按本地时区对齐，保证日桶与本地自然日一致）"""
+    offset = Config.TIMEZONE_OFFSET * 3600
+    return int((epoch_seconds + offset) // tier * tier - offset)
+
+
+def window_columns(metrics):
+    """指标对应的窗口统计列（<指标>_min/_max/_count，只有窗口聚合的指标才有）"""
+    from app.models import WINDOW_METRICS
+
+    return [f"{metric}_{stat}" for metric in metrics if metric in WINDOW_METRICS
+            for stat in ('min', 'max', 'count')]
+
+
+def aggregate_rows(rows, tiers=None, metrics=None):
+    """将一批原始记录聚合为汇总增量
+
+    rows: 记录字典列表（字段名与SensorData列名一致，含timestamp）
+    记录带有窗口统计时，按采样数加权平均值，最小/最大值取窗口极值
+    返回: {(tier, metric, bucket_start, node_id): {'count','min','max','sum','last','last_ts'}}
+    （记录中没有node_id时节点为None）
+    """
+    tiers = tiers or Config.ROLLUP_TIERS
+    metrics = metrics or Config.ROLLUP_METRICS
+    aggregates = {}
+
+    for row in rows:
+        ts = row.get('timestamp')
+        if ts is None:
+            continue
+        epoch = to_epoch(ts)
+        node = row.get('node_id')
+
+        for metric in metrics:
+            value = row.get(metric)
+            if value is None:
+                continue
+            count = row.get(f'{metric}_count') or 1
+            low = row.get(f'{metric}_min')
+            high = row.get(f'{metric}_max')
+            low = value if low is None else low
+            high = value if high is None else high
+
+            for tier in tiers:
+                key = (tier, metric, bucket_start(epoch, tier), node)
+                agg = aggregates.get(key)
+                if agg is None:
+                    aggregates[key] = {
+                        'count': count, 'min': low, 'max': high, 'sum': value * count,
+                        'last': value, 'last_ts': epoch
+                    }
+                    continue
+
+                agg['count'] += count
+                agg['sum'] += value * count
+                if low < agg['min']:
+                    agg['min'] = low
+                if high > agg['max']:
+                    agg['max'] = high
+                if epoch >= agg['last_ts']:
+                    agg['last'] = value
+                    agg['last_ts'] = epoch
+
+    return aggregates
+
+
+def upsert_statement(table):
+    """汇总增量的UPSERT语句：与已有桶合并"""
+    stmt = sqlite_insert(table)
+    excluded = stmt.excluded
+    return stmt.on_conflict_do_update(
+        index_elements=[table.c.tier, table.c.metric, table.c.bucket_start, table.c.node_id],
+        set_={
+            'count': table.c.count + excluded['count'],
+            'min': func.min(func.coalesce(table.c.min, excluded['min']), excluded['min']),
+            'max': func.max(func.coalesce(table.c.max, excluded['max']), excluded['max']),
+            'sum': table.c.sum + excluded['sum'],
+            'last': case(
+                (excluded.last_ts >= func.coalesce(table.c.last_ts, 0), excluded.last),
+                else_=table.c.last
+            ),
+            'last_ts': func.max(func.coalesce(table.c.last_ts, 0), excluded.last_ts),
+        }
+    )
+
+
+def apply_rollups(connection, rows):
+    """在给定连接（同一事务）中将一批原始记录合并到汇总表"""
+    from app.models import SensorRollup
+
+    aggregates = aggregate_rows(rows)
+    if not aggregates:
+        return 0
+
+    params = [
+        {'tier': tier, 'metric': metric, 'bucket_start': start, 'node_id': node or Config.NODE_ID, **agg}
+        for (tier, metric, start, node), agg in aggregates.items()
+    ]
+    connection.execute(upsert_statement(SensorRollup.__table__), params)
+    return len(params)
+
+
+def rollup_tier(bucket_seconds, metrics, start):
+    """能合并为bucket_seconds宽的桶的最粗汇总层级（桶宽为层级的整数倍），返回None表示应聚合原始数据
+
+    指标不全在汇总表中、或该层级按保留策略已删除start之前的桶时不使用汇总表
+    """
+    if not set(metrics) <= set(Config.ROLLUP_METRICS):
+        return None
+    for tier in sorted(Config.ROLLUP_TIERS, reverse=True):
+        if bucket_seconds % tier:
+            continue
+        days = Config.RETENTION_POLICIES.get(f'rollup_{tier}') if Config.RETENTION_ENABLED else None
+        if days is not None and start < datetime.utcnow() - timedelta(days=days):
+            return None
+        return tier
+    return None
+
+
+def aggregate_rollups(connection, tier, bucket_seconds, metrics, start, end=None, node=None):
+    """一条SQL把tier层级的汇总桶GROUP BY合并为bucket_seconds宽的桶（bucket_seconds为tier的整数倍）
+
+    读取的汇总行数只与桶数有关；最后一个值取last_ts最晚的汇总行（窗口函数），
+    node为None时合并所有节点。返回按桶起点排序的 [(bucket_start, {metric: RollupRow})]
+    """
+    from app.models import SensorRollup
+
+    table = SensorRollup.__table__
+    offset = int(Config.TIMEZONE_OFFSET * 3600)
+    bucket = (table.c.bucket_start + offset) // bucket_seconds * bucket_seconds - offset
+    ranked = select(
+        bucket.label('bucket'), table.c.metric, table.c.count, table.c.min, table.c.max, table.c.sum,
+        table.c.last_ts,
+        func.first_value(table.c.last).over(partition_by=(bucket, table.c.metric),
+                                            order_by=table.c.last_ts.desc()).label('last')
+    ).where(
+        table.c.tier == tier,
+        table.c.metric.in_(metrics),
+        table.c.bucket_start >= bucket_start(to_epoch(start), bucket_seconds)
+    )
+    if end is not None:
+        ranked = ranked.where(table.c.bucket_start <= to_epoch(end))
+    if node is not None:
+        ranked = ranked.where(table.c.node_id == node)
+    ranked = ranked.subquery()
+
+    stmt = select(
+        ranked.c.bucket, ranked.c.metric, func.sum(ranked.c.count), func.min(ranked.c.min),
+        func.max(ranked.c.max), func.sum(ranked.c.sum), func.max(ranked.c.last), func.max(ranked.c.last_ts)
+    ).group_by(ranked.c.bucket, ranked.c.metric).order_by(ranked.c.bucket)
+
+    buckets = {}
+    for bucket_key, metric, *values in connection.execute(stmt):
+        buckets.setdefault(bucket_key, {})[metric] = RollupRow(*values)
+    return list(buckets.items())
+
+
+def rebuild_rollups(session, window=timedelta(days=1)):
+    """清空并根据原始数据重建汇总表（按天分段流式处理）
+    
+    注意：应在采集服务停止时运行，否则重建期间写入的数据会被重复计入
+    """
+    from app.models import SensorRollup
+    from app.storage.query import fetch_series, time_bounds
+
+    earliest, latest = time_bounds()
+    session.execute(delete(SensorRollup.__table__))
+    session.commit()
+    if earliest is None:
+        return 0
+
+    metrics = Config.ROLLUP_METRICS
+    columns = ['node_id'] + metrics + window_columns(metrics)
+    # 从本地自然日起点开始，保证每段都不会拆开日桶
+    cursor = from_epoch(bucket_start(to_epoch(earliest), 86400))
+    total = 0
+
+    while cursor <= latest:
+        segment_end = cursor + window
+        rows = fetch_series(columns, start=cursor, end=segment_end - timedelta(microseconds=1),
+                            require=metrics)
+        records = [row._asdict() for row in rows]
+        apply_rollups(session.connection(), records)
+        session.commit()
+
+        total += len(records)
+        logger.info(f"汇总表重建进度: {cursor.date()} ({total} 条原始记录)")
+        cursor = segment_end
+
+    return total
@@ -0,0 +1,878 @@
+# app/storage/segments.py
+"""
+分段时序存储模块 - 每个指标一个只追加的分段文件，由固定时长（默认1小时）的压缩块组成：
+时间戳按delta-of-delta编码、数值按与前一个值的XOR编码，按字节重排后zlib压缩；
+内存中保存每个块的起止时间、最小/最大值和计数，范围查询和阈值查询按块跳过；
+每个节点一个子目录，查询时合并各节点的结果
+"""
+
+import heapq
+import json
+import os
+import struct
+import threading
+import zlib
+from bisect import bisect_left, bisect_right, insort
+from collections import OrderedDict, namedtuple
+from pathlib import Path
+
+import numpy as np
+
+from app.storage.backends import StorageBackend, typed_bucket
+from app.storage.query import after_filter, keyset_range, page_key
+from app.storage.rollups import bucket_start, to_epoch, window_columns
+from config.settings import Config
+from config.logging_config import get_logger
+
+logger = get_logger(__name__)
+
+# 分段文件头：魔数、版本（补齐到16字节）
+FILE_MAGIC = b'SEGMENT1'
+FILE_VERSION = 1
+FILE_HEADER = struct.Struct('<8sI')
+FILE_HEADER_SIZE = 16
+
+# 块头：校验和、采样数、块起点（epoch秒）、首末时间（epoch微秒）、最小、最大、总和、最后一个值、
+# 头部代号（0表示直接写入的补录块）、时间戳和数值压缩后的长度
+BLOCK_HEADER = struct.Struct('<IIqqqddddQII')
+
+# 头部文件（当前未封存块的原始记录）：魔数、代号、列名JSON长度
+HEAD_MAGIC = b'SEGHEAD1'
+HEAD_HEADER = struct.Struct('<8sQI')
+
+# 行序列：每条记录一个点（数值为id），用于不限定指标的扫描和计数
+ROWS = '_rows'
+
+BlockInfo = namedtuple('BlockInfo', (
+    'period', 'first', 'last', 'count', 'min', 'max', 'sum', 'last_value',
+    'generation', 'offset', 'times_length', 'values_length'
+))
+
+
+def _shuffle(array):
+    """按字节重排（所有值的同一字节放在一起），差分后高位字节多为0，压缩率更高"""
+    return array.view(np.uint8).reshape(-1, 8).T.tobytes()
+
+
+def _unshuffle(data, dtype):
+    raw = np.frombuffer(data, dtype=np.uint8).reshape(8, -1).T
+    return np.ascontiguousarray(raw).view(dtype).ravel()
+
+
+def encode_times(times):
+    """时间戳（epoch微秒，升序）delta-of-delta编码：首个值、首个间隔、之后为间隔的变化量"""
+    codes = np.empty_like(times)
+    codes[:1] = times[:1]
+    if len(times) > 1:
+        deltas = np.diff(times)
+        codes[1] = deltas[0]
+        codes[2:] = np.diff(deltas)
+    return zlib.compress(_shuffle(codes))
+
+
+def decode_times(data):
+    codes = _unshuffle(zlib.decompress(data), np.int64)
+    times = np.empty_like(codes)
+    times[:1] = codes[:1]
+    if len(codes) > 1:
+        times[1:] = codes[0] + np.cumsum(np.cumsum(codes[1:]))
+    return times
+
+
+def encode_values(values):
+    """数值XOR编码：每个值的二进制与前一个值异或，变化小的序列大部分位为0"""
+    bits = values.astype(np.float64).view(np.uint64)
+    codes = bits.copy()
+    codes[1:] ^= bits[:-1]
+    return zlib.compress(_shuffle(codes))
+
+
+def decode_values(data):
+    codes = _unshuffle(zlib.decompress(data), np.uint64)
+    return np.bitwise_xor.accumulate(codes).view(np.float64)
+
+
+def to_micros(dt):
+    """UTC naive datetime 转 epoch 微秒"""
+    return round(to_epoch(dt) * 1_000_000)
+
+
+class SegmentFile:
+    """单个指标的分段文件：只追加的压缩块 + 内存中的块索引
+
+    打开时只读取块头建立索引，末尾不完整或校验失败的块（写入中断）被截断
+    """
+
+    def __init__(self, path):
+        self.path = Path(path)
+        self.blocks = {}     # 块起点 -> [BlockInfo]（同一时段可能有补录块）
+        self.periods = []    # 有数据的块起点（升序）
+        self.file = None
+        self.end = FILE_HEADER_SIZE
+        self._open()
+
+    def _open(self):
+        if not self.path.exists() or self.path.stat().st_size < FILE_HEADER_SIZE:
+            with open(self.path, 'wb') as f:
+                f.write(FILE_HEADER.pack(FILE_MAGIC, FILE_VERSION).ljust(FILE_HEADER_SIZE, b'\0'))
+
+        self.file = open(self.path, 'r+b')
+        fd = self.file.fileno()
+        magic, version = FILE_HEADER.unpack_from(os.pread(fd, FILE_HEADER.size, 0))
+        if magic != FILE_MAGIC or version != FILE_VERSION:
+            self.file.close()
+            raise RuntimeError(f"分段文件格式不匹配: {self.path}")
+
+        size = os.fstat(fd).st_size
+        offset, last = FILE_HEADER_SIZE, None
+        while offset + BLOCK_HEADER.size <= size:
+            info = self._header(offset)
+            end = offset + BLOCK_HEADER.size + info.times_length + info.values_length
+            if end > size:
+                break
+            self._index(info)
+            last = info
+            offset = end
+
+        # 只有最后一个块可能在写入时中断，校验其内容
+        if last is not None:
+            try:
+                self._payload(last)
+            except ValueError:
+                self._unindex(last)
+                offset = last.offset
+
+        if size > offset:
+            logger.warning(f"分段文件 {self.path.name} 末尾有 {size - offset} 字节不完整的数据，已截断")
+            self.file.truncate(offset)
+        self.end = offset
+
+    def _header(self, offset):
+        fields = BLOCK_HEADER.unpack(os.pread(self.file.fileno(), BLOCK_HEADER.size, offset))
+        _, count, period, first, last, low, high, total, last_value, generation, times_length, values_length = fields
+        return BlockInfo(period, first, last, count, low, high, total, last_value,
+                         generation, offset, times_length, values_length)
+
+    def _index(self, info):
+        blocks = self.blocks.get(info.period)
+        if blocks is None:
+            self.blocks[info.period] = [info]
+            insort(self.periods, info.period)
+        else:
+            blocks.append(info)
+
+    def _unindex(self, info):
+        blocks = self.blocks[info.period]
+        blocks.remove(info)
+        if not blocks:
+            del self.blocks[info.period]
+            self.periods.remove(info.period)
+
+    def _payload(self, info):
+        """读取并校验块内容，返回 (时间戳压缩数据, 数值压缩数据)"""
+        length = BLOCK_HEADER.size + info.times_length + info.values_length
+        data = os.pread(self.file.fileno(), length, info.offset)
+        checksum = struct.unpack_from('<I', data)[0]
+        if len(data) < length or zlib.crc32(data[4:]) != checksum:
+            raise ValueError(f"分段文件 {self.path.name} 的块校验失败（偏移 {info.offset}）")
+        body = data[BLOCK_HEADER.size:]
+        return body[:info.times_length], body[info.times_length:]
+
+    def append(self, period, times, values, generation=0):
+        """追加一个块（times升序、values无空值），由调用方统一sync"""
+        times_data = encode_times(times)
+        values_data = encode_values(values)
+        info = BlockInfo(
+            period, int(times[0]), int(times[-1]), len(times),
+            float(values.min()), float(values.max()), float(values.sum()), float(values[-1]),
+            generation, self.end, len(times_data), len(values_data)
+        )
+        header = BLOCK_HEADER.pack(0, info.count, info.period, info.first, info.last, info.min, info.max,
+                                   info.sum, info.last_value, info.generation,
+                                   info.times_length, info.values_length)
+        body = header[4:] + times_data + values_data
+        data = struct.pack('<I', zlib.crc32(body)) + body
+
+        self.file.seek(self.end)
+        self.file.write(data)
+        self.end += len(data)
+        self._index(info)
+        return info
+
+    def read(self, info):
+        """解码一个块，返回 (时间戳数组, 数值数组)"""
+        times_data, values_data = self._payload(info)
+        return decode_times(times_data), decode_values(values_data)
+
+    def has_block(self, period, generation):
+        return any(info.generation == generation for info in self.blocks.get(period, ()))
+
+    def select(self, start_period, end_period):
+        """块起点在 [start_period, end_period] 内的块（按时段升序）"""
+        low = bisect_left(self.periods, start_period)
+        high = bisect_right(self.periods, end_period)
+        return [(period, self.blocks[period]) for period in self.periods[low:high]]
+
+    def sync(self, fsync=True):
+        self.file.flush()
+        if fsync:
+            os.fsync(self.file.fileno())
+
+    def close(self):
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+
+
+class NodeSegments:
+    """单个节点的分段存储（一个目录，每个指标一个分段文件）
+
+    最新时段的记录先追加到头部文件（fsync后才返回），时段结束时按指标压缩为块追加到各分段文件；
+    早于当前时段的记录（补录、导入、缓冲回放）直接写为补录块。各文件分别追加，
+    写入中断时同一批记录可能只有部分指标落盘（回放时按时间戳去重）
+    """
+
+    def __init__(self, directory, table, node, block_seconds=3600, fsync=True, cache_blocks=256):
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.node = node
+        self.block_seconds = int(block_seconds)
+        self.fsync = fsync
+        self.offset = Config.TIMEZONE_OFFSET * 3600
+
+        # 节点标识由目录决定，不单独存储
+        self.columns = [column.name for column in table.columns
+                        if column.name not in ('id', 'timestamp', 'created_at', 'node_id')]
+        self.int_columns = {column.name for column in table.columns
+                            if column.type.python_type is int}
+        self.has_id = 'id' in table.c
+        self.key = page_key(table)
+
+        self.lock = threading.RLock()
+        self.files = {name: SegmentFile(self.directory / f'{name}.seg') for name in [ROWS] + self.columns}
+        self.cache = OrderedDict()     # (指标, 偏移) -> 解码后的块
+        self.cache_blocks = cache_blocks
+        self.row_types = {}
+        self.stats_counters = {'blocks_read': 0, 'blocks_skipped': 0, 'cache_hits': 0}
+
+        self.next_id = 1 + int(max(
+            (info.max for blocks in self.files[ROWS].blocks.values() for info in blocks), default=0))
+        self._open_head()
+
+    # ---------- 头部（当前时段） ----------
+
+    def _head_format(self, columns):
+        return struct.Struct('<q' + 'd' * len(columns))
+
+    def _open_head(self):
+        """打开头部文件；上次封存中断时先完成封存"""
+        self.head_path = self.directory / 'head.bin'
+        self.head_times = []
+        self.head_rows = []
+        self.head_arrays = None
+        self.generation = 1
+        columns = [ROWS] + self.columns
+
+        if self.head_path.exists() and self.head_path.stat().st_size >= HEAD_HEADER.size:
+            with open(self.head_path, 'rb') as f:
+                magic, generation, length = HEAD_HEADER.unpack(f.read(HEAD_HEADER.size))
+                if magic == HEAD_MAGIC:
+                    columns = json.loads(f.read(length))
+                    self.generation = generation
+                    record = self._head_format(columns)
+                    data = f.read()
+                    usable = len(data) - len(data) % record.size
+                    for values in record.iter_unpack(data[:usable]):
+                        self.head_times.append(values[0])
+                        self.head_rows.append(values[1:])
+                    if usable < len(data):
+                        logger.warning(f"分段存储头部文件末尾有 {len(data) - usable} 字节不完整的数据，已丢弃")
+            if self.head_rows:
+                self.next_id = max(self.next_id, 1 + int(max(row[0] for row in self.head_rows)))
+
+        self.head_columns = columns
+        if self.head_rows and (columns != [ROWS] + self.columns or any(
+                file.has_block(self.head_period, self.generation) for file in self.files.values())):
+            # 列变化或上次封存中断：封存现有记录后以当前列重新开始
+            self._seal_head()
+        else:
+            self._reset_head(self.generation, keep=True)
+        if self.head_rows:
+            logger.info(f"分段存储头部有 {len(self.head_rows)} 条未封存记录")
+
+    @property
+    def head_period(self):
+        if not self.head_times:
+            return None
+        return bucket_start(self.head_times[0] / 1_000_000, self.block_seconds)
+
+    def _reset_head(self, generation, keep=False):
+        """重写头部文件（keep时保留当前记录）"""
+        self.generation = generation
+        self.head_columns = [ROWS] + self.columns
+        if not keep:
+            self.head_times, self.head_rows = [], []
+        self.head_arrays = None
+
+        header = json.dumps(self.head_columns).encode('utf-8')
+        record = self._head_format(self.head_columns)
+        temp = self.head_path.with_suffix('.tmp')
+        with open(temp, 'wb') as f:
+            f.write(HEAD_HEADER.pack(HEAD_MAGIC, generation, len(header)) + header)
+            f.write(b''.join(record.pack(t, *row) for t, row in zip(self.head_times, self.head_rows)))
+            f.flush()
+            if self.fsync:
+                os.fsync(f.fileno())
+        os.replace(temp, self.head_path)
+
+    def _append_head(self, times, matrix):
+        record = self._head_format(self.head_columns)
+        rows = [tuple(row) for row in matrix.tolist()]
+        with open(self.head_path, 'ab') as f:
+            f.write(b''.join(record.pack(t, *row) for t, row in zip(times.tolist(), rows)))
+            f.flush()
+            if self.fsync:
+                os.fsync(f.fileno())
+        self.head_times.extend(times.tolist())
+        self.head_rows.extend(rows)
+        self.head_arrays = None
+
+    def _seal_head(self, times=None, matrix=None):
+        """将头部记录（及同一时段的新记录）压缩为块写入各分段文件，然后清空头部"""
+        if self.head_rows:
+            head_times = np.array(self.head_times, dtype=np.int64)
+            head_matrix = np.array(self.head_rows, dtype=np.float64).reshape(len(self.head_rows), -1)
+            if times is not None and len(times):
+                head_times = np.concatenate([head_times, times])
+                head_matrix = np.concatenate([head_matrix, matrix])
+            touched = set()
+            self._write_blocks(self.head_period, head_times, head_matrix, self.head_columns,
+                               self.generation, touched)
+            for file in touched:
+                file.sync(self.fsync)
+        self._reset_head(self.generation + 1)
+
+    def _head_series(self, name):
+        """头部中某指标的 (时间戳, 数值)（去掉空值）"""
+        if self.head_arrays is None:
+            times = np.array(self.head_times, dtype=np.int64)
+            matrix = np.array(self.head_rows, dtype=np.float64).reshape(len(self.head_rows), -1)
+            order = np.argsort(times, kind='stable')
+            self.head_arrays = (times[order], matrix[order])
+        times, matrix = self.head_arrays
+        if name not in self.head_columns or not len(times):
+            return None
+        values = matrix[:, self.head_columns.index(name)]
+        mask = ~np.isnan(values)
+        return times[mask], values[mask]
+
+    # ---------- 写入 ----------
+
+    def _write_blocks(self, period, times, matrix, columns, generation, touched):
+        order = np.argsort(times, kind='stable')
+        times, matrix = times[order], matrix[order]
+        for index, name in enumerate(columns):
+            file = self.files.get(name)
+            if file is None:
+                continue
+            values = matrix[:, index]
+            mask = ~np.isnan(values)
+            if not mask.any():
+                continue
+            if generation and file.has_block(period, generation):
+                # 上次封存中断时已写入的指标
+                continue
+            file.append(period, times[mask], values[mask], generation)
+            touched.add(file)
+
+    def append_batch(self, records, rollup_records=None):
+        """最新时段的记录追加到头部，更早的时段直接写为补录块（不使用rollup_records）"""
+        if not records:
+            return
+        columns = [ROWS] + self.columns
+        times = np.array([to_micros(record['timestamp']) for record in records], dtype=np.int64)
+        matrix = np.array([
+            [np.nan] + [np.nan if record.get(name) is None else record.get(name) for name in self.columns]
+            for record in records
+        ], dtype=np.float64)
+        periods = ((times // 1_000_000 + self.offset) // self.block_seconds * self.block_seconds
+                   - self.offset)
+
+        with self.lock:
+            if self.has_id:
+                matrix[:, 0] = np.arange(self.next_id, self.next_id + len(records))
+                self.next_id += len(records)
+            else:
+                matrix[:, 0] = 0
+
+            head_period = self.head_period
+            latest = int(periods.max())
+            if head_period is not None and latest > head_period:
+                # 进入新时段：封存头部（连同本批中属于该时段的记录）
+                mask = periods == head_period
+                self._seal_head(times[mask], matrix[mask])
+                times, matrix, periods = times[~mask], matrix[~mask], periods[~mask]
+                head_period = None
+            current = latest if head_period is None else head_period
+
+            touched = set()
+            for period in np.unique(periods).tolist():
+                if period == current:
+                    continue
+                mask = periods == period
+                self._write_blocks(period, times[mask], matrix[mask], columns, 0, touched)
+            for file in touched:
+                file.sync(self.fsync)
+
+            mask = periods == current
+            if mask.any():
+                self._append_head(times[mask], matrix[mask])
+
+    # ---------- 读取 ----------
+
+    def _decode(self, name, info):
+        key = (name, info.offset)
+        with self.lock:
+            cached = self.cache.get(key)
+            if cached is not None:
+                self.cache.move_to_end(key)
+                self.stats_counters['cache_hits'] += 1
+                return cached
+        decoded = self.files[name].read(info)
+        with self.lock:
+            self.stats_counters['blocks_read'] += 1
+            self.cache[key] = decoded
+            if len(self.cache) > self.cache_blocks:
+                self.cache.popitem(last=False)
+        return decoded
+
+    def _bounds(self, start, end):
+        """查询范围（epoch微秒）"""
+        return (
+            to_micros(start) if start is not None else -2 ** 62,
+            to_micros(end) if end is not None else 2 ** 62
+        )
+
+    def _periods(self, names, start_us, end_us):
+        """涉及的时段：各指标有块的时段 + 头部时段（升序）"""
+        start_period = bucket_start(start_us // 1_000_000, self.block_seconds) if start_us > -2 ** 62 else -2 ** 62
+        end_period = end_us // 1_000_000
+        periods = set()
+        with self.lock:
+            for name in names:
+                file = self.files.get(name)
+                if file is not None:
+                    periods.update(period for period, _ in file.select(start_period, end_period))
+            head_period = self.head_period
+        if head_period is not None and start_period <= head_period <= end_period:
+            periods.add(head_period)
+        return sorted(periods)
+
+    def _series(self, name, period, start_us, end_us, keep=None):
+        """一个时段内某指标在范围内的 (时间戳, 数值)，按时间升序
+
+        keep: 按块的 (最小值, 最大值) 判断是否需要读取，返回False的块直接跳过
+        """
+        file = self.files.get(name)
+        if file is None:
+            return np.empty(0, dtype=np.int64), np.empty(0)
+        with self.lock:
+            blocks = list(file.blocks.get(period, ()))
+            head = self._head_series(name) if period == self.head_period else None
+
+        parts = []
+        for info in blocks:
+            if info.last < start_us or info.first > end_us or (keep and not keep(info.min, info.max)):
+                self.stats_counters['blocks_skipped'] += 1
+                continue
+            parts.append(self._decode(name, info))
+        if head is not None:
+            parts.append(head)
+        if not parts:
+            return np.empty(0, dtype=np.int64), np.empty(0)
+
+        if len(parts) == 1:
+            times, values = parts[0]
+        else:
+            times = np.concatenate([part[0] for part in parts])
+            values = np.concatenate([part[1] for part in parts])
+            order = np.argsort(times, kind='stable')
+            times, values = times[order], values[order]
+
+        low = np.searchsorted(times, start_us, side='left')
+        high = np.searchsorted(times, end_us, side='right')
+        return times[low:high], values[low:high]
+
+    @staticmethod
+    def _align(base, times, values, fill=np.nan):
+        """将 (times, values) 对齐到base时间戳，缺少的点为fill"""
+        aligned = np.full(len(base), fill, dtype=np.float64)
+        if len(times) and len(base):
+            index = np.minimum(np.searchsorted(times, base), len(times) - 1)
+            hit = times[index] == base
+            aligned[hit] = values[index[hit]]
+        return aligned
+
+    def _period_rows(self, period, columns, require, start_us, end_us):
+        """一个时段内的记录：返回 (时间戳数组, {列名: 数值数组})"""
+        ids = None
+        if require:
+            base = [self._series(name, period, start_us, end_us)[0] for name in require]
+            base = np.unique(np.concatenate(base)) if base else np.empty(0, dtype=np.int64)
+        else:
+            base, ids = self._series(ROWS, period, start_us, end_us)
+        if not len(base):
+            return base, {}
+
+        values = {}
+        for name in columns:
+            if name in ('created_at', 'node_id'):
+                continue
+            if name == 'id':
+                if ids is None:
+                    ids = self._align(base, *self._series(ROWS, period, start_us, end_us))
+                values[name] = ids
+            else:
+                values[name] = self._align(base, *self._series(name, period, start_us, end_us))
+        return base, values
+
+    def _row_type(self, columns):
+        row_type = self.row_types.get(columns)
+        if row_type is None:
+            row_type = namedtuple('SegmentRow', ('timestamp',) + columns)
+            self.row_types[columns] = row_type
+        return row_type
+
+    def _to_rows(self, columns, base, values, descending):
+        """数组转为行（空值为None，整数列还原为int）"""
+        if descending:
+            base = base[::-1]
+        stamps = base.astype('datetime64[us]').tolist()
+        lists = []
+        for name in columns:
+            if name == 'created_at':
+                lists.append([None] * len(base))
+                continue
+            if name == 'node_id':
+                lists.append([self.node] * len(base))
+                continue
+            items = (values[name][::-1] if descending else values[name]).tolist()
+            if name in self.int_columns:
+                lists.append([None if value != value else int(value) for value in items])
+            else:
+                lists.append([None if value != value else value for value in items])
+        row_type = self._row_type(columns)
+        return [row_type(*items) for items in zip(stamps, *lists)]
+
+    def scan(self, columns, start=None, end=None, require=None, descending=False, limit=None, after=None):
+        """按时段读取；有require时只读取require指标有块的时段，有limit时读够即停止
+
+        after: 范围从after的时间戳开始，该时间戳上的记录按次排序列过滤（只可能在第一个有数据的时段）
+        """
+        columns = tuple(columns)
+        keep = None
+        if after is not None:
+            start, end = keyset_range(start, end, after, descending)
+            keep = after_filter(after, self.key, descending)
+            if self.key not in columns:
+                columns += (self.key,)
+        start_us, end_us = self._bounds(start, end)
+        periods = self._periods(require or [ROWS], start_us, end_us)
+        if descending:
+            periods.reverse()
+
+        rows = []
+        for period in periods:
+            base, values = self._period_rows(period, columns, require, start_us, end_us)
+            if not len(base):
+                continue
+            batch = self._to_rows(columns, base, values, descending)
+            if keep is not None:
+                batch = [row for row in batch if keep(row)]
+                keep = None
+            rows.extend(batch)
+            if limit and len(rows) >= limit:
+                return rows[:limit]
+        return rows
+
+    def threshold(self, metric, above=None, below=None, start=None, end=None):
+        """最小/最大值不可能满足条件的块不解码"""
+        start_us, end_us = self._bounds(start, end)
+        keep = lambda low, high: ((above is None or high > above) and (below is None or low < below))
+        rows = []
+        for period in self._periods([metric], start_us, end_us):
+            times, values = self._series(metric, period, start_us, end_us, keep=keep)
+            mask = np.ones(len(values), dtype=bool)
+            if above is not None:
+                mask &= values > above
+            if below is not None:
+                mask &= values < below
+            if mask.any():
+                rows.extend(self._to_rows((metric,), times[mask], {metric: values[mask]}, False))
+        return rows
+
+    def aggregate(self, metrics, bucket_seconds, start, end=None):
+        """按时间桶聚合（桶边界与汇总表一致）；带窗口统计的指标按采样数加权
+
+        桶宽度为块时长的整数倍时，完全在范围内的块直接使用块头中的统计，不解码；
+        返回 {bucket: {metric: [count, min, max, sum, last, last_time]}}，由SegmentBackend合并各节点
+        """
+        first_bucket = bucket_start(to_epoch(start), bucket_seconds)
+        start_us = first_bucket * 1_000_000
+        end_us = self._bounds(None, end)[1]
+        weighted = set(window_columns(metrics))
+        whole_blocks = bucket_seconds % self.block_seconds == 0
+        buckets = {}
+
+        def merge(bucket, metric, count, low, high, total, last, last_time):
+            current = buckets.setdefault(bucket, {}).get(metric)
+            if current is None:
+                buckets[bucket][metric] = [count, low, high, total, last, last_time]
+                return
+            current[0] += count
+            current[1] = min(current[1], low)
+            current[2] = max(current[2], high)
+            current[3] += total
+            if last_time >= current[5]:
+                current[4], current[5] = last, last_time
+
+        for metric in metrics:
+            count_file = self.files.get(f'{metric}_count') if f'{metric}_count' in weighted else None
+            for period in self._periods([metric], start_us, end_us):
+                with self.lock:
+                    blocks = list(self.files[metric].blocks.get(period, ())) if metric in self.files else []
+                    in_head = period == self.head_period
+                    # 该时段没有窗口统计时与普通指标相同
+                    is_weighted = count_file is not None and (in_head or period in count_file.blocks)
+                if (whole_blocks and not is_weighted and not in_head and blocks and
+                        all(start_us <= info.first and info.last <= end_us for info in blocks)):
+                    bucket = bucket_start(period, bucket_seconds)
+                    for info in blocks:
+                        merge(bucket, metric, info.count, info.min, info.max, info.sum,
+                              info.last_value, info.last)
+                    self.stats_counters['blocks_skipped'] += len(blocks)
+                    continue
+
+                times, values = self._series(metric, period, start_us, end_us)
+                if not len(times):
+                    continue
+                weights, low, high = np.ones(len(values)), values, values
+                if is_weighted:
+                    weights = self._align(times, *self._series(f'{metric}_count', period, start_us, end_us), fill=1)
+                    low = np.fmin(self._align(times, *self._series(f'{metric}_min', period, start_us, end_us)), values)
+                    high = np.fmax(self._align(times, *self._series(f'{metric}_max', period, start_us, end_us)), values)
+
+                keys = (times // 1_000_000 + self.offset) // bucket_seconds * bucket_seconds - self.offset
+                starts = np.flatnonzero(np.r_[True, keys[1:] != keys[:-1]])
+                ends = np.r_[starts[1:], len(keys)] - 1
+                counts = np.add.reduceat(weights, starts)
+                sums = np.add.reduceat(values * weights, starts)
+                lows = np.minimum.reduceat(low, starts)
+                highs = np.maximum.reduceat(high, starts)
+                for i, bucket in enumerate(keys[starts].tolist()):
+                    merge(bucket, metric, int(counts[i]), float(lows[i]), float(highs[i]), float(sums[i]),
+                          float(values[ends[i]]), int(times[ends[i]]))
+        return buckets
+
+    def count(self, start=None, end=None, require=None):
+        """没有require时完全在范围内的块直接使用块头中的计数"""
+        start_us, end_us = self._bounds(start, end)
+        total = 0
+        for period in self._periods(require or [ROWS], start_us, end_us):
+            if require:
+                total += len(self._period_rows(period, (), require, start_us, end_us)[0])
+                continue
+            with self.lock:
+                blocks = list(self.files[ROWS].blocks.get(period, ()))
+                in_head = period == self.head_period
+            if not in_head and all(start_us <= info.first and info.last <= end_us for info in blocks):
+                total += sum(info.count for info in blocks)
+            else:
+                total += len(self._series(ROWS, period, start_us, end_us)[0])
+        return total
+
+    def time_bounds(self):
+        with self.lock:
+            file = self.files[ROWS]
+            firsts = [min(info.first for info in file.blocks[file.periods[0]])] if file.periods else []
+            lasts = [max(info.last for info in file.blocks[file.periods[-1]])] if file.periods else []
+            if self.head_times:
+                firsts.append(min(self.head_times))
+                lasts.append(max(self.head_times))
+        if not firsts:
+            return None, None
+        to_datetime = lambda micros: np.datetime64(int(micros), 'us').tolist()
+        return to_datetime(min(firsts)), to_datetime(max(lasts))
+
+    def size(self):
+        return sum(path.stat().st_size for path in self.directory.iterdir() if path.is_file())
+
+    def segment_stats(self):
+        """块数、数据点数、头部记录数和块跳过情况"""
+        with self.lock:
+            return {
+                'blocks': sum(len(infos) for file in self.files.values() for infos in file.blocks.values()),
+                'points': sum(info.count for file in self.files.values()
+                              for infos in file.blocks.values() for info in infos),
+                'head_rows': len(self.head_rows),
+                **self.stats_counters
+            }
+
+    def close(self):
+        with self.lock:
+            for file in self.files.values():
+                file.close()
+
+
+class SegmentBackend(StorageBackend):
+    """分段时序存储后端 - 每个节点一个子目录（<SEGMENT_STORE_PATH>/<节点>/），查询时合并各节点
+
+    汇总由原始数据在查询时计算（不使用汇总表）；分区、归档和数据保留只作用于SQLite后端
+    """
+
+    name = 'segments'
+
+    def __init__(self, directory, table, block_seconds=3600, fsync=True, cache_blocks=256):
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.table = table
+        self.block_seconds = int(block_seconds)
+        self.fsync = fsync
+        self.cache_blocks = cache_blocks
+        self.lock = threading.RLock()
+
+        self._migrate_flat_layout()
+        self.stores = {}
+        for path in sorted(self.directory.iterdir()):
+            if path.is_dir() and Config.NODE_ID_PATTERN.match(path.name):
+                self.stores[path.name] = self._open_store(path.name)
+        # 记录id在所有节点间唯一
+        self.next_id = max((store.next_id for store in self.stores.values()), default=1)
+
+    def _open_store(self, node):
+        return NodeSegments(self.directory / node, self.table, node, block_seconds=self.block_seconds,
+                            fsync=self.fsync, cache_blocks=self.cache_blocks)
+
+    def _migrate_flat_layout(self):
+        """增加节点之前的文件直接位于存储目录下，移动到本机节点的子目录"""
+        files = [path for path in self.directory.iterdir()
+                 if path.is_file() and (path.suffix == '.seg' or path.name == 'head.bin')]
+        if not files:
+            return
+        target = self.directory / Config.NODE_ID
+        target.mkdir(exist_ok=True)
+        for path in files:
+            os.replace(path, target / path.name)
+        logger.info(f"分段存储文件已移动到节点目录: {target}")
+
+    def _selected(self, node):
+        """查询涉及的节点存储"""
+        with self.lock:
+            if node is None:
+                return list(self.stores.values())
+            store = self.stores.get(node)
+            return [store] if store is not None else []
+
+    # ---------- 写入 ----------
+
+    def append_batch(self, records, rollup_records=None):
+        """按节点分组后写入各节点的存储"""
+        groups = {}
+        for record in records:
+            groups.setdefault(record.get('node_id') or Config.NODE_ID, []).append(record)
+
+        with self.lock:
+            for node, group in groups.items():
+                store = self.stores.get(node)
+                if store is None:
+                    store = self.stores[node] = self._open_store(node)
+                store.next_id = max(store.next_id, self.next_id)
+                store.append_batch(group)
+                self.next_id = store.next_id
+
+    # ---------- 读取 ----------
+
+    @staticmethod
+    def _merge(results, descending=False, limit=None, key=None):
+        """合并各节点按时间排序的结果（同一时间戳按key列排序）"""
+        if len(results) == 1:
+            rows = results[0]
+        else:
+            order = (lambda row: (row.timestamp, getattr(row, key))) if key else (lambda row: row.timestamp)
+            rows = list(heapq.merge(*results, key=order, reverse=descending))
+        return rows[:limit] if limit else rows
+
+    def scan(self, columns, start=None, end=None, require=None, descending=False, limit=None, node=None,
+             after=None):
+        results = [store.scan(columns, start, end, require, descending, limit, after)
+                   for store in self._selected(node)]
+        key = page_key(self.table)
+        if not results:
+            return []
+        return self._merge(results, descending, limit, key if after is not None or key in columns else None)
+
+    def threshold(self, metric, above=None, below=None, start=None, end=None, node=None):
+        results = [store.threshold(metric, above, below, start, end) for store in self._selected(node)]
+        return self._merge(results) if results else []
+
+    def aggregate(self, metrics, bucket_seconds, start, end=None, node=None):
+        """各节点分别聚合后按桶合并（最后一个值取时间最晚的节点）"""
+        buckets = {}
+        for store in self._selected(node):
+            for bucket, bucket_metrics in store.aggregate(metrics, bucket_seconds, start, end).items():
+                target = buckets.setdefault(bucket, {})
+                for metric, totals in bucket_metrics.items():
+                    current = target.get(metric)
+                    if current is None:
+                        target[metric] = list(totals)
+                        continue
+                    current[0] += totals[0]
+                    current[1] = min(current[1], totals[1])
+                    current[2] = max(current[2], totals[2])
+                    current[3] += totals[3]
+                    if totals[5] >= current[5]:
+                        current[4], current[5] = totals[4], totals[5]
+
+        return [
+            (bucket, {metric: typed_bucket(self.table, metric, *totals[:5])
+                      for metric, totals in bucket_metrics.items()})
+            for bucket, bucket_metrics in sorted(buckets.items())
+        ]
+
+    def count(self, start=None, end=None, require=None, node=None):
+        return sum(store.count(start, end, require) for store in self._selected(node))
+
+    def time_bounds(self, node=None):
+        bounds = [store.time_bounds() for store in self._selected(node)]
+        firsts = [first for first, _ in bounds if first is not None]
+        lasts = [last for _, last in bounds if last is not None]
+        return (min(firsts) if firsts else None, max(lasts) if lasts else None)
+
+    def nodes(self):
+        with self.lock:
+            return sorted(self.stores)
+
+    def size(self):
+        return sum(path.stat().st_size for path in self.directory.rglob('*') if path.is_file())
+
+    def stats(self, node=None):
+        """在通用统计之外返回块数、压缩率和块跳过情况"""
+        stats = super().stats(node)
+        totals = {'blocks': 0, 'head_rows': 0}
+        for store in self._selected(node):
+            for key, value in store.segment_stats().items():
+                totals[key] = totals.get(key, 0) + value
+        points = totals.pop('points', 0)
+        size = sum(store.size() for store in self._selected(node))
+        stats.update({
+            'block_seconds': self.block_seconds,
+            # 未压缩时每个点为8字节时间戳 + 8字节数值
+            'compression_ratio': round(points * 16 / max(size, 1), 1),
+            **totals
+        })
+        return stats
+
+    def close(self):
+        with self.lock:
+            for store in self.stores.values():
+                store.close()
@@ -0,0 +1,223 @@
+# app/storage/spool.py
+"""
+写入缓冲文件模块 - 数据库不可写（被锁、磁盘满、文件损坏）时，
+采集数据追加到本地只追加文件，数据库恢复后由写入线程按顺序批量回放
+"""
+
+import json
+import os
+import struct
+import threading
+import zlib
+from datetime import datetime
+from pathlib import Path
+from config.logging_config import get_logger
+
+logger = get_logger(__name__)
+
+# 文件头：魔数、版本、已回放到的偏移量
+HEADER_FORMAT = '<8sIQ'
+HEADER_SIZE = 64
+MAGIC = b'SPOOL001'
+VERSION = 1
+
+# 记录：长度 + CRC32 + JSON内容
+RECORD_HEADER = struct.Struct('<II')
+
+# 需要还原为datetime的字段
+TIME_FIELDS = ('timestamp', 'created_at')
+
+
+def encode_record(record):
+    """记录编码为带长度和校验和的二进制帧"""
+    payload = json.dumps(
+        {key: value.isoformat() if isinstance(value, datetime) else value for key, value in record.items()},
+        ensure_ascii=False, separators=(',', ':')
+    ).encode('utf-8')
+    return RECORD_HEADER.pack(len(payload), zlib.crc32(payload)) + payload
+
+
+def decode_record(payload):
+    """二进制内容还原为记录"""
+    record = json.loads(payload)
+    for key in TIME_FIELDS:
+        if record.get(key):
+            record[key] = datetime.fromisoformat(record[key])
+    return record
+
+
+class WriteSpool:
+    """崩溃安全的写入缓冲文件
+
+    记录只追加并fsync；文件头保存已回放的偏移量，回放成功后推进；
+    打开时从该偏移量校验每条记录，末尾不完整或校验失败的部分（写入中断）被截断
+    """
+
+    def __init__(self, path, fsync=True, dead_letter_path=None):
+        self.path = Path(path)
+        self.fsync = fsync
+        # 多次回放都无法写入的记录移入死信文件（NDJSON，修复后可通过 /api/ingest 重新导入）
+        self.dead_letter_path = Path(dead_letter_path) if dead_letter_path else \
+            self.path.with_name(self.path.name + '.dead.ndjson')
+
+        self.lock = threading.Lock()
+        self.file = None
+        self.offset = HEADER_SIZE   # 下一条待回放记录的位置
+        self.end = HEADER_SIZE      # 文件中有效数据的末尾
+        self.pending = 0
+
+        self.stats = {
+            'spooled': 0,
+            'replayed': 0,
+            'truncated_bytes': 0,
+            'dead_lettered': 0,
+            'last_spooled_time': None,
+            'last_replay_time': None
+        }
+
+        self._open()
+
+    def _open(self):
+        """打开或创建缓冲文件，并恢复未回放的记录"""
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+
+        valid = self.path.exists() and self.path.stat().st_size >= HEADER_SIZE
+        if valid:
+            with open(self.path, 'rb') as f:
+                magic, version, offset = struct.unpack_from(HEADER_FORMAT, f.read(HEADER_SIZE))
+            valid = magic == MAGIC and version == VERSION
+            if not valid:
+                # 不认识的文件不覆盖，改名保留
+                backup = self.path.with_suffix(self.path.suffix + '.invalid')
+                os.replace(self.path, backup)
+                logger.warning(f"写入缓冲文件格式不匹配，已改名为 {backup}")
+
+        if not valid:
+            with open(self.path, 'wb') as f:
+                f.write(struct.pack(HEADER_FORMAT, MAGIC, VERSION, HEADER_SIZE).ljust(HEADER_SIZE, b'\0'))
+            offset = HEADER_SIZE
+
+        self.file = open(self.path, 'r+b')
+        # 偏移量超出文件大小说明清空过程中断（记录已全部回放）
+        if offset > os.fstat(self.file.fileno()).st_size:
+            offset = HEADER_SIZE
+        self.offset = max(offset, HEADER_SIZE)
+
+        # 校验尚未回放的记录，截断写入中断留下的残缺记录
+        position, count = self.offset, 0
+        for position, _ in self._scan(self.offset):
+            count += 1
+        size = os.fstat(self.file.fileno()).st_size
+        if size > position:
+            self.stats['truncated_bytes'] = size - position
+            logger.warning(f"写入缓冲文件末尾有 {size - position} 字节不完整的数据，已截断")
+            self.file.truncate(position)
+            self._sync()
+
+        self.end = position
+        self.pending = count
+        if count:
+            logger.info(f"写入缓冲文件中有 {count} 条记录待回放: {self.path}")
+
+    def _scan(self, offset, limit=None):
+        """从offset开始逐条读取完整有效的记录，产出 (记录结束位置, 内容)"""
+        self.file.seek(offset)
+        read = 0
+        while limit is None or read < limit:
+            header = self.file.read(RECORD_HEADER.size)
+            if len(header) < RECORD_HEADER.size:
+                return
+            length, checksum = RECORD_HEADER.unpack(header)
+            payload = self.file.read(length)
+            if len(payload) < length or zlib.crc32(payload) != checksum:
+                return
+            offset += RECORD_HEADER.size + length
+            read += 1
+            yield offset, payload
+
+    def _sync(self):
+        self.file.flush()
+        if self.fsync:
+            os.fsync(self.file.fileno())
+
+    def _write_offset(self, offset):
+        self.file.seek(0)
+        self.file.write(struct.pack(HEADER_FORMAT, MAGIC, VERSION, offset))
+        self._sync()
+
+    def append(self, records):
+        """追加一批记录（返回前已同步到磁盘）"""
+        if not records:
+            return 0
+        data = b''.join(encode_record(record) for record in records)
+        with self.lock:
+            self.file.seek(self.end)
+            self.file.write(data)
+            self._sync()
+            self.end += len(data)
+            self.pending += len(records)
+            self.stats['spooled'] += len(records)
+            self.stats['last_spooled_time'] = datetime.utcnow().isoformat()
+        return len(records)
+
+    def read_batch(self, limit):
+        """读取下一批待回放的记录，返回 (记录列表, 批次结束位置)"""
+        with self.lock:
+            records, position = [], self.offset
+            for position, payload in self._scan(self.offset, limit):
+                records.append(decode_record(payload))
+            return records, position
+
+    def commit(self, position, count):
+        """标记回放成功，全部回放后清空文件"""
+        with self.lock:
+            self.pending = max(self.pending - count, 0)
+            self.stats['replayed'] += count
+            self.stats['last_replay_time'] = datetime.utcnow().isoformat()
+            if position >= self.end:
+                # 全部回放完成：先记录偏移量再截断，任何时刻崩溃都不会重复回放
+                self._write_offset(position)
+                self.file.truncate(HEADER_SIZE)
+                self._write_offset(HEADER_SIZE)
+                self.offset = self.end = HEADER_SIZE
+                self.pending = 0
+            else:
+                self._write_offset(position)
+                self.offset = position
+
+    def dead_letter(self, records):
+        """追加无法写入的记录到死信文件（返回前已同步到磁盘）"""
+        lines = ''.join(
+            json.dumps({key: value.isoformat() if isinstance(value, datetime) else value
+                        for key, value in record.items()}, ensure_ascii=False) + '\n'
+            for record in records
+        )
+        with self.lock:
+            with open(self.dead_letter_path, 'a', encoding='utf-8') as f:
+                f.write(lines)
+                f.flush()
+                if self.fsync:
+                    os.fsync(f.fileno())
+            self.stats['dead_lettered'] += len(records)
+        return len(records)
+
+    def has_pending(self):
+        return self.pending > 0
+
+    def close(self):
+        with self.lock:
+            if self.file is not None:
+                self._sync()
+                self.file.close()
+                self.file = None
+
+    def get_stats(self):
+        """缓冲文件状态"""
+        with self.lock:
+            return {
+                'path': str(self.path),
+                'pending': self.pending,
+                'pending_bytes': self.end - self.offset,
+                'dead_letter_path': str(self.dead_letter_path),
+                **self.stats
+            }
@@ -0,0 +1,67 @@
+# app/storage/sqlite_tuning.py
+"""
+SQLite连接调优模块 - 在每个新连接上应用PRAGMA配置
+"""
+
+import weakref
+from pathlib import Path
+from sqlalchemy import event
+from config.logging_config import get_logger
+
+logger = get_logger(__name__)
+
+# 引擎 -> 最近一次新建连接上读回的PRAGMA值（健康检查读取，不必借用写连接）
+_active_pragmas = weakref.WeakKeyDictionary()
+
+
+def install_sqlite_pragmas(engine, pragmas):
+    """为引擎注册connect事件，在每个新建的DBAPI连接上执行PRAGMA"""
+    if engine.dialect.name != 'sqlite' or not pragmas:
+        return False
+
+    @event.listens_for(engine, 'connect')
+    def _apply_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        active = {}
+        try:
+            for name, value in pragmas.items():
+                cursor.execute(f"PRAGMA {name}={value}")
+            for name in pragmas:
+                row = cursor.execute(f"PRAGMA {name}").fetchone()
+                active[name] = row[0] if row else None
+        finally:
+            cursor.close()
+        _active_pragmas[engine] = active
+
+    logger.info(f"SQLite PRAGMA配置已注册: {pragmas}")
+    return True
+
+
+def get_active_pragmas(engine, names):
+    """读取实际生效的PRAGMA值
+
+    优先使用connect事件中读回的值；引擎还没有建立过连接时才借用一个连接查询
+    """
+    cached = _active_pragmas.get(engine)
+    if cached is not None and all(name in cached for name in names):
+        return {name: cached[name] for name in names}
+
+    active = {}
+    with engine.connect() as conn:
+        for name in names:
+            try:
+                active[name] = conn.exec_driver_sql(f"PRAGMA {name}").scalar()
+            except Exception as e:
+                logger.debug(f"读取PRAGMA {name} 失败: {e}")
+                active[name] = None
+    return active
+
+
+def database_file_size(path):
+    """SQLite数据库占用的磁盘空间：主文件加 -wal、-shm 文件（字节）"""
+    size = 0
+    for suffix in ('', '-wal', '-shm'):
+        part = Path(f"{path}{suffix}")
+        if part.exists():
+            size += part.stat().st_size
+    return size
@@ -0,0 +1,318 @@
+# app/storage/uploader.py
+"""
+存储转发上传模块 - 边缘节点后台线程把本机尚未上传的记录按批次增量编码、gzip压缩后
+推送到中心节点的 /api/ingest，网络中断时指数退避重试，恢复后从上次确认的位置继续
+"""
+
+import gzip
+import json
+import random
+import threading
+import time
+import urllib.error
+import urllib.request
+from datetime import datetime, timedelta
+from pathlib import Path
+
+from app.storage.delta import DELTA_CONTENT_TYPE, column_scale, encode_batch
+from config.settings import Config
+from config.logging_config import get_logger
+
+logger = get_logger(__name__)
+
+# 不上传的列（id和写入时间由中心节点生成，节点标识放在批次头部）
+SKIPPED_COLUMNS = ('id', 'timestamp', 'node_id', 'created_at')
+
+# 可重试的HTTP状态码（其余4xx视为配置错误，同样按退避间隔重试，但记录为错误）
+RETRYABLE_STATUS = (408, 429, 500, 502, 503, 504)
+
+_EPOCH = datetime(1970, 1, 1)
+_MICROSECOND = timedelta(microseconds=1)
+
+
+class UploadError(Exception):
+    """批次未被中心节点确认，status为HTTP状态码（网络错误时为None）"""
+
+    def __init__(self, message, status=None):
+        super().__init__(message)
+        self.status = status
+
+
+class Uploader:
+    """存储转发上传器
+
+    高水位（最后一条已确认记录的时间戳）保存在状态文件中，只在中心节点确认后推进：
+    - 中心节点按 (节点, 时间戳) 去重，确认前中断时重发同一批次不会产生重复
+    - 写入缓冲文件中有待回放的记录时暂停上传，避免较早的记录晚于高水位写入而被跳过
+    """
+
+    def __init__(self, app=None, url=None, token=None, state_path=None, node=None,
+                 batch_size=2000, interval=300, timeout=30, retry_min=10, retry_max=900,
+                 compress_level=6):
+        self.app = app
+        self.url = url
+        self.token = token
+        self.state_path = Path(state_path or Config.UPLOAD_STATE_PATH)
+        self.node = node or Config.NODE_ID
+        self.batch_size = batch_size
+        self.interval = interval            # 追平后两次上传之间的间隔（秒）
+        self.timeout = timeout              # 单次请求超时（秒）
+        self.retry_min = retry_min          # 首次失败后的重试间隔（秒），之后每次翻倍
+        self.retry_max = retry_max          # 重试间隔上限（秒）
+        self.compress_level = compress_level
+
+        self.upload_thread = None
+        self.running = False
+        self.wakeup = threading.Event()
+        self.run_lock = threading.Lock()
+
+        self.state = self._load_state()
+        self.failures = 0
+        self.next_attempt = None
+        self.last_result = None
+
+        self.stats_lock = threading.Lock()
+        self.stats = {
+            'batches': 0,
+            'rows': 0,
+            'bytes_encoded': 0,
+            'bytes_sent': 0,
+            'rejected': 0,
+            'failed_attempts': 0,
+            'last_success_time': None,
+            'last_error': None
+        }
+
+    # ---------- 状态文件 ----------
+
+    def _load_state(self):
+        """读取高水位；状态文件属于其他上传地址或节点时从头开始"""
+        state = {'url': self.url, 'node_id': self.node, 'last_timestamp': None, 'uploaded': 0}
+        if not self.state_path.exists():
+            return state
+        try:
+            with open(self.state_path, encoding='utf-8') as f:
+                saved = json.load(f)
+        except (OSError, ValueError) as e:
+            logger.error(f"上传状态文件读取失败，从头开始上传: {e}")
+            return state
+
+        if saved.get('url') != self.url or saved.get('node_id') != self.node:
+            logger.warning(f"上传地址或节点已变更（{saved.get('url')} -> {self.url}），从头开始上传")
+            return state
+        state.update(saved)
+        return state
+
+    def _save_state(self):
+        temp_path = self.state_path.with_suffix('.tmp')
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            json.dump(self.state, f, ensure_ascii=False, indent=2)
+        temp_path.replace(self.state_path)
+
+    @property
+    def high_water_mark(self):
+        """最后一条已确认记录的时间戳（UTC），尚未上传过时为None"""
+        value = self.state.get('last_timestamp')
+        return datetime.fromisoformat(value) if value else None
+
+    # ---------- 后台线程 ----------
+
+    def start(self, app=None):
+        """启动后台上传线程"""
+        if self.running:
+            return
+
+        if app:
+            self.app = app
+
+        self.running = True
+        self.upload_thread = threading.Thread(
+            target=self.upload_worker,
+            daemon=True,
+            name="UploadThread"
+        )
+        self.upload_thread.start()
+        logger.info(f"上传线程已启动 (目标: {self.url}, 批大小: {self.batch_size}, 间隔: {self.interval}秒)")
+
+    def stop(self):
+        """停止后台上传线程"""
+        self.running = False
+        self.wakeup.set()
+        if self.upload_thread:
+            self.upload_thread.join(timeout=self.timeout + 5)
+
+    def trigger(self):
+        """立即唤醒上传线程执行一次（同时清除退避等待）"""
+        self.wakeup.set()
+
+    def upload_worker(self):
+        """上传工作线程：追平后按interval等待，失败后按退避间隔等待"""
+        while self.running:
+            try:
+                self.run_once()
+            except Exception as e:
+                logger.error(f"上传任务失败: {e}")
+
+            delay = self.retry_delay() if self.failures else self.interval
+            self.next_attempt = time.time() + delay
+            self.wakeup.wait(delay)
+            self.wakeup.clear()
+
+    def retry_delay(self):
+        """指数退避间隔（带随机抖动，避免多个节点在网络恢复后同时重试）"""
+        delay = min(self.retry_max, self.retry_min * 2 ** min(self.failures - 1, 16))
+        return delay * random.uniform(0.5, 1.0)
+
+    # ---------- 上传 ----------
+
+    def _columns(self):
+        """上传的列及其量化倍数"""
+        table = self.app.sensor_model.__table__
+        return {column.name: column_scale(column) for column in table.columns
+                if column.name not in SKIPPED_COLUMNS}
+
+    def read_batch(self, scales):
+        """读取高水位之后的下一批本机记录（按时间升序）
+
+        死区存储模式下未变化的值按阶梯序列填充后上传，中心节点不需要知道本机的死区配置
+        """
+        from app.storage.deadband import fill_steps
+        from app.storage.query import fetch_series
+
+        # 紧凑模式按毫秒存储时间，查询条件无法排除高水位本身，多取一条后在这里排除
+        mark = self.high_water_mark
+        rows = fetch_series(list(scales), start=mark, limit=self.batch_size + 1, node=self.node)
+        if mark is not None:
+            rows = [row for row in rows if row.timestamp > mark]
+        rows = rows[:self.batch_size]
+        if not Config.DEADBAND_ENABLED or not rows:
+            return rows
+
+        metrics = [name for name in scales if name in Config.DEADBAND_THRESHOLDS]
+        first = rows[0].timestamp
+        seed = fetch_series(metrics, start=first - timedelta(seconds=Config.DEADBAND_HOLD),
+                            end=first - _MICROSECOND, require=metrics, node=self.node)
+        return fill_steps(rows, metrics, Config.DEADBAND_HOLD, seed=seed)
+
+    def send(self, body, key):
+        """POST一个压缩后的批次，返回中心节点的处理结果"""
+        headers = {
+            'Content-Type': DELTA_CONTENT_TYPE,
+            'Content-Encoding': 'gzip',
+            'Idempotency-Key': key,
+            'X-Node-Id': self.node
+        }
+        if self.token:
+            headers['Authorization'] = f'Bearer {self.token}'
+        request = urllib.request.Request(self.url, data=body, headers=headers, method='POST')
+
+        try:
+            with urllib.request.urlopen(request, timeout=self.timeout) as response:
+                result = json.loads(response.read().decode('utf-8'))
+        except urllib.error.HTTPError as e:
+            try:
+                message = json.loads(e.read().decode('utf-8')).get('error', e.reason)
+            except (ValueError, AttributeError):
+                message = e.reason
+            raise UploadError(f'HTTP {e.code}: {message}', e.code)
+        except (urllib.error.URLError, OSError, ValueError) as e:
+            raise UploadError(f'网络错误: {getattr(e, "reason", e)}')
+
+        if not result.get('success'):
+            raise UploadError(f"中心节点未确认批次: {result.get('error')}")
+        return result
+
+    def upload_batch(self, rows, scales):
+        """编码、压缩并发送一批记录，确认后推进高水位，返回发送的字节数"""
+        batch = encode_batch(rows, scales, node=self.node)
+        encoded = json.dumps(batch, separators=(',', ':')).encode('utf-8')
+        body = gzip.compress(encoded, compresslevel=self.compress_level)
+
+        # 同一批记录的幂等键相同，确认丢失后重发时中心节点直接返回上次的结果
+        first, last = ((row.timestamp - _EPOCH) // _MICROSECOND for row in (rows[0], rows[-1]))
+        key = f'{self.node}-{first}-{last}-{len(rows)}'
+        result = self.send(body, key)
+
+        self.state['last_timestamp'] = rows[-1].timestamp.isoformat()
+        self.state['uploaded'] = self.state.get('uploaded', 0) + len(rows)
+        self._save_state()
+
+        with self.stats_lock:
+            self.stats['batches'] += 1
+            self.stats['rows'] += len(rows)
+            self.stats['bytes_encoded'] += len(encoded)
+            self.stats['bytes_sent'] += len(body)
+            self.stats['rejected'] += result.get('rejected', 0)
+            self.stats['last_success_time'] = time.time()
+        if result.get('rejected'):
+            logger.warning(f"中心节点拒绝了 {result['rejected']} 条记录: {result.get('errors')}")
+        logger.debug(f"上传 {len(rows)} 条记录 ({len(encoded)} -> {len(body)} 字节)")
+        return len(body)
+
+    def run_once(self):
+        """上传高水位之后的全部记录，直到追平、失败或线程停止，返回本次结果"""
+        with self.run_lock, self.app.app_context():
+            started = time.time()
+            scales = self._columns()
+            result = {'rows': 0, 'batches': 0, 'bytes_sent': 0, 'caught_up': False, 'error': None}
+            manual = not self.running
+
+            while self.running or manual:
+                spool = getattr(self.app, 'write_spool', None)
+                if spool is not None and spool.has_pending():
+                    result['error'] = '写入缓冲文件中有待回放的记录，暂停上传'
+                    break
+
+                rows = self.read_batch(scales)
+                if not rows:
+                    result['caught_up'] = True
+                    break
+
+                try:
+                    sent = self.upload_batch(rows, scales)
+                except UploadError as e:
+                    # 批次过大时减半后立即重试
+                    if e.status == 413 and self.batch_size > 1:
+                        self.batch_size = max(1, self.batch_size // 2)
+                        logger.warning(f"批次超过中心节点的大小限制，批大小减为 {self.batch_size}")
+                        continue
+                    self.failures += 1
+                    result['error'] = str(e)
+                    with self.stats_lock:
+                        self.stats['failed_attempts'] += 1
+                        self.stats['last_error'] = str(e)
+                    log = logger.warning if e.status is None or e.status in RETRYABLE_STATUS else logger.error
+                    log(f"上传失败（连续第 {self.failures} 次）: {e}")
+                    break
+
+                self.failures = 0
+                result['rows'] += len(rows)
+                result['batches'] += 1
+                result['bytes_sent'] += sent
+                if len(rows) < self.batch_size:
+                    result['caught_up'] = True
+                    break
+
+            result['duration_seconds'] = round(time.time() - started, 3)
+            self.last_result = result
+            return result
+
+    def get_status(self):
+        """上传状态（高水位、累计统计、上次结果、下次尝试时间）"""
+        with self.stats_lock:
+            stats = self.stats.copy()
+        stats['compression_ratio'] = (
+            round(stats['bytes_sent'] / stats['bytes_encoded'], 3) if stats['bytes_encoded'] else None
+        )
+        return {
+            'url': self.url,
+            'node_id': self.node,
+            'running': self.running,
+            'high_water_mark': self.state.get('last_timestamp'),
+            'uploaded_total': self.state.get('uploaded', 0),
+            'batch_size': self.batch_size,
+            'consecutive_failures': self.failures,
+            'next_attempt': self.next_attempt,
+            'last_result': self.last_result,
+            'stats': stats
+        }
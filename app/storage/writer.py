@@ -0,0 +1,345 @@
+# app/storage/writer.py
+"""
+批量写入模块 - 后台线程合并提交传感器数据，
+数据库不可写时转存到写入缓冲文件，恢复后按顺序回放
+"""
+
+import queue
+import threading
+import time
+from sqlalchemy.exc import OperationalError
+from config.logging_config import get_logger
+
+logger = get_logger(__name__)
+
+# 停止信号
+_STOP = object()
+
+# 数据库暂时不可写（被锁、磁盘满、I/O错误），回放失败时一直重试，不移入死信文件
+TRANSIENT_ERRORS = (OperationalError, OSError)
+
+
+class BatchWriter:
+    """批量写入器 - 采集线程入队，写入线程按批次合并提交"""
+
+    def __init__(self, app=None, max_queue_size=1000, batch_size=50, max_batch_age=60,
+                 spool=None, replay_batch_size=5000, retry_interval=10, max_replay_attempts=5,
+                 deadband=None):
+        self.app = app
+        self.queue = queue.Queue(maxsize=max_queue_size)
+        self.batch_size = batch_size
+        self.max_batch_age = max_batch_age  # 秒，批次最长等待时间
+
+        # 写入缓冲文件（WriteSpool），为None时写入失败的数据丢弃
+        self.spool = spool
+        self.replay_batch_size = replay_batch_size
+        self.retry_interval = retry_interval  # 秒，数据库写入失败后多久重试回放
+        self.max_replay_attempts = max_replay_attempts  # 同一批连续失败该次数后逐条写入，失败的记录移入死信文件
+        self.last_replay_attempt = 0
+        self.replay_failures = 0
+
+        # 死区过滤器（DeadbandFilter），为None时每条记录完整写入
+        self.deadband = deadband
+
+        self.writer_thread = None
+        self.running = False
+
+        # 统计信息
+        self.stats_lock = threading.Lock()
+        self.stats = {
+            'queued': 0,
+            'written': 0,
+            'dropped': 0,
+            'failed': 0,
+            'spooled': 0,
+            'replayed': 0,
+            'dead_lettered': 0,
+            'batches': 0,
+            'last_batch_size': 0,
+            'last_flush_time': None,
+            'last_flush_duration_ms': None,
+            'last_error': None
+        }
+
+    def start(self, app=None):
+        """启动写入线程"""
+        if self.running:
+            return
+
+        if app:
+            self.app = app
+
+        self.running = True
+        self.writer_thread = threading.Thread(
+            target=self.writer_worker,
+            daemon=True,
+            name="BatchWriterThread"
+        )
+        self.writer_thread.start()
+        logger.info(f"批量写入线程已启动 (批大小: {self.batch_size}, 最长等待: {self.max_batch_age}秒)")
+
+    def stop(self, timeout=10):
+        """停止写入线程，并写入队列中剩余的数据"""
+        if not self.running:
+            return
+
+        self.running = False
+        try:
+            self.queue.put(_STOP, timeout=1)
+        except queue.Full:
+            pass
+
+        if self.writer_thread:
+            self.writer_thread.join(timeout=timeout)
+
+        # 线程未能处理的剩余数据在此写入
+        remaining = self._drain()
+        if remaining:
+            self.flush(remaining)
+        if self.spool:
+            self.replay_spool(force=True)
+            self.spool.close()
+        logger.info("批量写入线程已停止")
+
+    def submit(self, record):
+        """提交一条记录（字段名与SensorData列名一致），不阻塞采集线程"""
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            with self.stats_lock:
+                self.stats['dropped'] += 1
+            logger.warning(f"写入队列已满 ({self.queue.maxsize})，丢弃一条记录")
+            return False
+
+        with self.stats_lock:
+            self.stats['queued'] += 1
+        return True
+
+    def writer_worker(self):
+        """写入工作线程"""
+        batch = []
+        batch_started = None
+
+        while True:
+            # 计算当前批次剩余等待时间
+            if batch:
+                wait = max(0, self.max_batch_age - (time.monotonic() - batch_started))
+            else:
+                wait = 1.0
+
+            try:
+                item = self.queue.get(timeout=wait)
+            except queue.Empty:
+                item = None
+
+            if item is _STOP:
+                batch.extend(self._drain())
+                break
+
+            if item is not None:
+                if not batch:
+                    batch_started = time.monotonic()
+                batch.append(item)
+
+            # 达到批大小或等待时间上限时提交
+            if batch and (len(batch) >= self.batch_size or
+                          time.monotonic() - batch_started >= self.max_batch_age):
+                self.flush(batch)
+                batch = []
+
+            # 缓冲文件中有数据时定期尝试回放
+            if self.spool and self.spool.has_pending():
+                self.replay_spool()
+
+            if not self.running and self.queue.empty():
+                break
+
+        if batch:
+            self.flush(batch)
+
+    def _drain(self):
+        """取出队列中的全部记录"""
+        items = []
+        while True:
+            try:
+                item = self.queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is not _STOP:
+                items.append(item)
+        return items
+
+    def flush(self, batch):
+        """在一个事务中写入一批记录
+
+        缓冲文件中还有未回放的数据时直接追加到缓冲文件，保证写入顺序；
+        数据库写入失败时转存到缓冲文件，只有转存也失败时数据才丢失
+        """
+        if not batch:
+            return True
+
+        if not self.app:
+            logger.warning("无法存储数据：缺少应用上下文")
+            return False
+
+        self._with_node(batch)
+        if self.spool and self.spool.has_pending():
+            return self._spool(batch)
+
+        start = time.perf_counter()
+        try:
+            self._write(batch)
+        except Exception as e:
+            logger.error(f"批量写入失败 ({len(batch)}条): {e}")
+            with self.stats_lock:
+                self.stats['last_error'] = str(e)
+            if self.spool:
+                self.last_replay_attempt = time.monotonic()
+                return self._spool(batch)
+            with self.stats_lock:
+                self.stats['failed'] += len(batch)
+            return False
+
+        duration_ms = (time.perf_counter() - start) * 1000
+        with self.stats_lock:
+            self.stats['written'] += len(batch)
+            self.stats['batches'] += 1
+            self.stats['last_batch_size'] = len(batch)
+            self.stats['last_flush_time'] = time.time()
+            self.stats['last_flush_duration_ms'] = round(duration_ms, 2)
+
+        logger.debug(f"批量写入 {len(batch)} 条记录，耗时 {duration_ms:.1f}ms")
+        return True
+
+    def _write(self, batch):
+        """通过当前存储后端在一个事务中写入，失败时抛出异常
+
+        死区模式下原始表只写入变化的值，汇总表仍使用全部采样
+        """
+        if self.deadband is None:
+            self.app.storage_backend.append_batch(batch)
+            return
+
+        rows, result = self.deadband.filter(batch)
+        self.app.storage_backend.append_batch(rows, rollup_records=batch)
+        self.deadband.commit(result)
+
+    def _spool(self, batch):
+        """追加到缓冲文件"""
+        try:
+            self.spool.append(batch)
+        except Exception as e:
+            logger.error(f"写入缓冲文件失败，丢弃 {len(batch)} 条记录: {e}")
+            with self.stats_lock:
+                self.stats['failed'] += len(batch)
+            return False
+
+        with self.stats_lock:
+            self.stats['spooled'] += len(batch)
+        logger.warning(f"{len(batch)} 条记录已暂存到写入缓冲文件（待回放 {self.spool.pending} 条）")
+        return True
+
+    def replay_spool(self, force=False):
+        """按顺序将缓冲文件中的记录批量写回数据库，返回回放条数
+
+        每批一个事务，成功后才推进缓冲文件的偏移量；失败时等待retry_interval后重试。
+        同一批因数据错误（非TRANSIENT_ERRORS）连续失败max_replay_attempts次后逐条写入，
+        无法写入的记录移入死信文件，不会阻塞后面的记录
+        """
+        if not self.spool or not self.spool.has_pending():
+            return 0
+        if not force and time.monotonic() - self.last_replay_attempt < self.retry_interval:
+            return 0
+        self.last_replay_attempt = time.monotonic()
+
+        replayed = 0
+        while self.spool.has_pending():
+            records, position = self.spool.read_batch(self.replay_batch_size)
+            if not records:
+                break
+            rows = records
+            try:
+                # 偏移量推进前进程退出时，这一批可能已经写入，按 (节点, 时间戳) 跳过
+                rows = self._without_existing(records)
+                if rows:
+                    self._write(rows)
+                written = len(rows)
+            except Exception as e:
+                self.replay_failures += 1
+                with self.stats_lock:
+                    self.stats['last_error'] = str(e)
+                if isinstance(e, TRANSIENT_ERRORS) or self.replay_failures < self.max_replay_attempts:
+                    logger.warning(f"写入缓冲文件回放失败（第{self.replay_failures}次），"
+                                   f"{self.retry_interval}秒后重试: {e}")
+                    break
+
+                logger.error(f"写入缓冲文件中的一批记录连续 {self.replay_failures} 次回放失败，"
+                             f"逐条写入并隔离无法写入的记录: {e}")
+                try:
+                    written = self._write_each(rows)
+                except TRANSIENT_ERRORS as e:
+                    logger.warning(f"逐条回放中断，{self.retry_interval}秒后重试: {e}")
+                    break
+
+            self.replay_failures = 0
+            self.spool.commit(position, len(records))
+            replayed += len(records)
+            with self.stats_lock:
+                self.stats['replayed'] += written
+                self.stats['written'] += written
+
+        if replayed:
+            logger.info(f"写入缓冲文件已回放 {replayed} 条记录（剩余 {self.spool.pending} 条）")
+        return replayed
+
+    def _write_each(self, rows):
+        """逐条写入，无法写入的记录移入死信文件，返回写入条数
+
+        数据库暂时不可写（TRANSIENT_ERRORS）时抛出，已写入的记录在下次回放时按 (节点, 时间戳) 跳过
+        """
+        written = 0
+        for row in rows:
+            try:
+                self._write([row])
+            except TRANSIENT_ERRORS:
+                raise
+            except Exception as e:
+                self.spool.dead_letter([row])
+                with self.stats_lock:
+                    self.stats['dead_lettered'] += 1
+                logger.error(f"记录 ({row.get('node_id')}, {row.get('timestamp')}) 无法写入，"
+                             f"已移入死信文件 {self.spool.dead_letter_path}: {e}")
+            else:
+                written += 1
+        return written
+
+    def _with_node(self, records):
+        """没有节点标识的记录（本机采集、升级前的缓冲文件）标记为本机节点"""
+        node = self.app.config['NODE_ID']
+        for record in records:
+            if not record.get('node_id'):
+                record['node_id'] = node
+        return records
+
+    def _without_existing(self, records):
+        """去掉数据库中已存在相同 (节点, 时间戳) 的记录（时间按存储精度比较）"""
+        from app.storage.query import existing_keys, stored_time_normalizer
+
+        self._with_node(records)
+        with self.app.app_context():
+            normalize = stored_time_normalizer()
+            for record in records:
+                record['timestamp'] = normalize(record['timestamp'])
+            existing = existing_keys({(record['node_id'], record['timestamp']) for record in records})
+        return [record for record in records if (record['node_id'], record['timestamp']) not in existing]
+
+    def get_stats(self):
+        """获取写入统计"""
+        with self.stats_lock:
+            stats = self.stats.copy()
+        stats['queue_size'] = self.queue.qsize()
+        stats['queue_capacity'] = self.queue.maxsize
+        stats['running'] = self.running
+        stats['spool'] = self.spool.get_stats() if self.spool else None
+        stats['deadband'] = self.deadband.get_stats() if self.deadband else None
+        return stats
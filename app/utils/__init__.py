@@ -4,12 +4,15 @@
 """
 
 from .time_utils import utc_to_local, get_local_now, format_local_time
+from .downsample import lttb_indices, select_indices
 from .data_utils import generate_sample_data, generate_co2_sample_data, generate_temp_humi_sample_data
 
 __all__ = [
     'utc_to_local',
     'get_local_now',
     'format_local_time',
+    'lttb_indices',
+    'select_indices',
     'generate_sample_data',
     'generate_co2_sample_data',
     'generate_temp_humi_sample_data'
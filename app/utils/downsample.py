@@ -0,0 +1,89 @@
+# app/utils/downsample.py
+"""
+降采样工具模块 - 图表点数超过上限时按 Largest-Triangle-Three-Buckets (LTTB) 选点，
+保留峰谷等视觉特征；区间（最小/最大值）按选中点覆盖的原始点取包络
+"""
+
+import numpy as np
+
+
+def to_seconds(times):
+    """datetime列表转为epoch秒（float数组）"""
+    return np.array(times, dtype='datetime64[us]').astype(np.int64) / 1e6
+
+
+def to_array(values):
+    """可能含None的数值列表转为float数组（None为NaN）"""
+    return np.array(values, dtype=float)
+
+
+def lttb_indices(x, y, threshold):
+    """LTTB选点：返回从 (x, y) 中选出的threshold个点的下标（升序，包含首尾点）
+
+    首尾点之外的点按下标均分为 threshold-2 个桶，每个桶选与上一个选中点、
+    下一个桶平均点组成的三角形面积最大的点。桶的平均点和桶内面积一次性向量化计算，
+    只有“上一个选中点”需要按桶顺序传递
+    """
+    n = len(x)
+    if threshold >= n or threshold < 3:
+        return np.arange(n)
+
+    edges = np.linspace(1, n - 1, threshold - 1).astype(np.intp)
+    counts = np.diff(edges)
+    # 每个桶的下一个桶的平均点（最后一个桶为末尾点）
+    next_x = np.append(np.add.reduceat(x[:n - 1], edges[:-1])[1:] / counts[1:], x[-1])
+    next_y = np.append(np.add.reduceat(y[:n - 1], edges[:-1])[1:] / counts[1:], y[-1])
+
+    selected = np.empty(threshold, dtype=np.intp)
+    selected[0] = 0
+    selected[-1] = n - 1
+    a = 0
+    for i in range(threshold - 2):
+        lo, hi = edges[i], edges[i + 1]
+        ax, ay = x[a], y[a]
+        area = np.abs((ax - next_x[i]) * (y[lo:hi] - ay) - (ax - x[lo:hi]) * (next_y[i] - ay))
+        a = lo + int(np.argmax(area))
+        selected[i + 1] = a
+    return selected
+
+
+def select_indices(x, series, max_points):
+    """多个数据集共用横轴时的选点：返回选中点的下标数组，不需要降采样时返回None
+
+    每个数据集分到 max_points/数据集数 的点数，只在非空值上做LTTB，各数据集选中的下标取并集；
+    空值段的起点也保留，降采样后图表中的断线位置不变
+    """
+    n = len(x)
+    if not max_points or n <= max_points or not series:
+        return None
+
+    budget = max(max_points // len(series), 3)
+    chosen = [np.array([0, n - 1])]
+    for values in series:
+        y = to_array(values)
+        valid = ~np.isnan(y)
+        positions = np.flatnonzero(valid)
+        if len(positions) > budget:
+            positions = positions[lttb_indices(x[valid], y[valid], budget)]
+        chosen.append(positions)
+        # 空值段的起点（有值 -> 无值）
+        chosen.append(np.flatnonzero(valid[:-1] & ~valid[1:]) + 1)
+    return np.unique(np.concatenate(chosen))
+
+
+def envelope(values, indices, stat):
+    """每个选中点到下一个选中点之前的原始点的最小值（stat='min'）或最大值（stat='max'），忽略空值
+
+    values全部为整数时返回整数；区间内全部为空时为None
+    """
+    y = to_array(values)
+    reducer = np.fmin if stat == 'min' else np.fmax
+    reduced = reducer.reduceat(y, indices)
+    valid = ~np.isnan(y)
+    integral = bool(np.all(np.mod(y[valid], 1) == 0))
+    return [None if value != value else (int(value) if integral else value) for value in reduced.tolist()]
+
+
+def pick(values, indices):
+    """按下标取列表中的元素"""
+    return [values[i] for i in indices.tolist()]
@@ -15,6 +15,12 @@ def utc_to_local(utc_dt, offset_hours=None):
         offset_hours = Config.TIMEZONE_OFFSET
     return utc_dt + timedelta(hours=offset_hours)
 
+def local_to_utc(local_dt, offset_hours=None):
+    """将本地时间转换为UTC时间"""
+    if offset_hours is None:
+        offset_hours = Config.TIMEZONE_OFFSET
+    return local_dt - timedelta(hours=offset_hours)
+
 def get_local_now():
     """获取当前本地时间"""
     return datetime.utcnow() + timedelta(hours=Config.TIMEZONE_OFFSET)
@@ -4,11 +4,25 @@
 """
 
 import os
+import re
+import socket
 from pathlib import Path
 
 # 项目基础目录
 BASE_DIR = Path(__file__).parent.parent
 
+
+def default_node_id():
+    """本机节点标识：/etc/machine-id 的前12位，读取失败时使用主机名"""
+    try:
+        machine_id = Path('/etc/machine-id').read_text().strip()
+        if machine_id:
+            return machine_id[:12]
+    except OSError:
+        pass
+    return re.sub(r'[^A-Za-z0-9_.-]', '-', socket.gethostname()).lstrip('.')[:64] or 'local'
+
+
 class Config:
     """应用配置类"""
     
@@ -30,9 +44,153 @@ class Config:
         'pool_pre_ping': True,
     }
     
+    # SQLite连接PRAGMA（每个新连接建立时执行，busy_timeout放在最前）
+    SQLITE_PRAGMAS = {
+        'busy_timeout': 5000,       # 毫秒，锁等待时间
+        'auto_vacuum': 'INCREMENTAL',  # 新建数据库支持增量VACUUM（已有数据库需执行一次VACUUM）
+        'journal_mode': 'WAL',      # 读写并发，写入不阻塞读取
+        'synchronous': 'NORMAL',    # WAL模式下只在检查点fsync
+        'cache_size': -8000,        # 负数表示KiB，约8MB
+        'mmap_size': 67108864,      # 64MB内存映射读取
+        'temp_store': 'MEMORY',     # 临时表和排序放在内存
+    }
+    
+    # 读写分离：写入使用单个长连接，API查询使用只读连接池
+    READ_POOL_SIZE = int(os.getenv('READ_POOL_SIZE', 4))
+    SLOW_QUERY_MS = int(os.getenv('SLOW_QUERY_MS', 200))   # 超过此耗时计为慢查询
+    
+    # 启动时打印各端点查询的EXPLAIN QUERY PLAN
+    EXPLAIN_QUERIES_ON_STARTUP = os.getenv('EXPLAIN_QUERIES_ON_STARTUP', 'True').lower() == 'true'
+    
+    # ========== 节点配置 ==========
+    # 每条记录保存产生它的节点标识（多个房间的数据可汇总到一个数据库），未设置时使用machine-id
+    NODE_ID = os.getenv('NODE_ID') or default_node_id()
+    NODE_ID_PATTERN = re.compile(r'^[A-Za-z0-9_-][A-Za-z0-9_.-]{0,63}$')   # 也用作目录名，不能以.开头
+    
+    # ========== 存储模式配置 ==========
+    # standard: sensor_data表（DateTime时间戳、浮点数值）
+    # compact:  sensor_data_compact表（整数毫秒时间戳聚簇主键、定点小整数，行大小约为一半）
+    STORAGE_SCHEMA = os.getenv('STORAGE_SCHEMA', 'standard').lower()
+    
+    # ========== 分区存储配置 ==========
+    STORAGE_PARTITIONING = os.getenv('STORAGE_PARTITIONING', 'none').lower()  # none / monthly
+    PARTITION_DIR = BASE_DIR / os.getenv('PARTITION_DIR', 'partitions')
+    
+    # ========== 汇总表配置 ==========
+    ROLLUP_TIERS = [60, 300, 3600, 86400]   # 1分钟 / 5分钟 / 1小时 / 1天
+    ROLLUP_METRICS = [
+        'scd40_co2',
+        'dht22_temperature', 'dht22_humidity',
+        'sgp41_sraw_voc', 'sgp41_sraw_nox', 'sgp41_voc_index', 'sgp41_nox_index'
+    ]
+    
+    # ========== 数据保留配置 ==========
+    RETENTION_ENABLED = os.getenv('RETENTION_ENABLED', 'True').lower() == 'true'
+    RETENTION_POLICIES = {   # 最长保留天数，None表示永久保留
+        'sensor_data': int(os.getenv('RETENTION_RAW_DAYS', 180)),
+        'rollup_60': 14,
+        'rollup_300': 90,
+        'rollup_3600': 730,
+        'rollup_86400': None,
+    }
+    RETENTION_INTERVAL = int(os.getenv('RETENTION_INTERVAL', 3600))  # 清理间隔（秒）
+    RETENTION_CHUNK_SIZE = 500         # 每个删除事务的最大行数
+    RETENTION_CHUNK_PAUSE = 0.2        # 删除事务之间的暂停（秒）
+    RETENTION_VACUUM_PAGES = 2000      # 每次增量VACUUM释放的最大页数
+    RETENTION_ANALYZE_INTERVAL = 86400 # ANALYZE间隔（秒）
+    
+    # ========== 列式归档配置 ==========
+    # 启用后，结束超过ARCHIVE_AFTER_DAYS天的月份由保留任务移入列式归档（每月每列一个.npy文件）
+    # 注意：RETENTION_RAW_DAYS应大于ARCHIVE_AFTER_DAYS，否则数据会在归档前被删除
+    ARCHIVE_ENABLED = os.getenv('ARCHIVE_ENABLED', 'False').lower() == 'true'
+    ARCHIVE_DIR = BASE_DIR / os.getenv('ARCHIVE_DIR', 'archive')
+    ARCHIVE_AFTER_DAYS = int(os.getenv('ARCHIVE_AFTER_DAYS', 30))
+    
+    # ========== SGP41原始信号环形文件 ==========
+    # 每秒的sraw_voc/sraw_nox写入固定大小的mmap环形文件（每条8字节，30天约20MB）
+    SGP41_RAW_RING_ENABLED = os.getenv('SGP41_RAW_RING_ENABLED', 'True').lower() == 'true'
+    SGP41_RAW_RING_PATH = BASE_DIR / os.getenv('SGP41_RAW_RING_PATH', 'sgp41_raw.ring')
+    SGP41_RAW_RING_DAYS = int(os.getenv('SGP41_RAW_RING_DAYS', 30))
+    
+    # ========== SGP41算法状态检查点 ==========
+    # Sensirion建议只在中断不超过约10分钟时恢复状态，否则应重新学习
+    SGP41_STATE_ENABLED = os.getenv('SGP41_STATE_ENABLED', 'True').lower() == 'true'
+    SGP41_STATE_PATH = BASE_DIR / os.getenv('SGP41_STATE_PATH', 'sgp41_algorithm_state.json')
+    SGP41_STATE_INTERVAL = int(os.getenv('SGP41_STATE_INTERVAL', 300))  # 保存间隔（秒）
+    SGP41_STATE_MAX_AGE = int(os.getenv('SGP41_STATE_MAX_AGE', 600))    # 可恢复的最长时间（秒）
+    SGP41_STATE_MIN_UPTIME = int(os.getenv('SGP41_STATE_MIN_UPTIME', 10800))  # 算法运行满此时间（秒）后才保存
+    
+    # ========== 存储后端 ==========
+    # sqlite（默认，支持分区/归档/数据保留）、duckdb（需安装duckdb）或 segments（分段时序存储）
+    # 可用 python manage_db.py benchmark-backends 按实际数据量比较
+    STORAGE_BACKEND = os.getenv('STORAGE_BACKEND', 'sqlite')
+    DUCKDB_PATH = BASE_DIR / os.getenv('DUCKDB_PATH', 'sensor_data.duckdb')
+    SEGMENT_STORE_PATH = BASE_DIR / os.getenv('SEGMENT_STORE_PATH', 'segments')
+    SEGMENT_BLOCK_SECONDS = int(os.getenv('SEGMENT_BLOCK_SECONDS', 3600))  # 块时长（秒），应能整除86400
+    SEGMENT_FSYNC = os.getenv('SEGMENT_FSYNC', 'True').lower() == 'true'
+    
+    # ========== 死区存储 ==========
+    # 启用后各指标只在变化超过阈值或超过心跳间隔时写入原始表，图表和历史接口按阶梯序列还原
+    DEADBAND_ENABLED = os.getenv('DEADBAND_ENABLED', 'False').lower() == 'true'
+    DEADBAND_THRESHOLDS = {
+        'scd40_co2': float(os.getenv('DEADBAND_CO2', 10)),                  # ppm
+        'dht22_temperature': float(os.getenv('DEADBAND_TEMPERATURE', 0.2)), # °C
+        'dht22_humidity': float(os.getenv('DEADBAND_HUMIDITY', 0.5)),       # %
+        'sgp41_voc_index': float(os.getenv('DEADBAND_VOC_INDEX', 2)),
+        'sgp41_nox_index': float(os.getenv('DEADBAND_NOX_INDEX', 1)),
+    }
+    DEADBAND_HEARTBEAT = int(os.getenv('DEADBAND_HEARTBEAT', 600))  # 秒，没有变化时最长写入间隔
+    # 读取时一个值最多保持多久（心跳间隔加上采集间隔的余量），超过视为数据缺失
+    DEADBAND_HOLD = int(os.getenv('DEADBAND_HOLD', DEADBAND_HEARTBEAT + 60))
+    
+    # ========== 批量写入配置 ==========
+    WRITE_QUEUE_SIZE = int(os.getenv('WRITE_QUEUE_SIZE', 1000))       # 写入队列容量
+    WRITE_BATCH_SIZE = int(os.getenv('WRITE_BATCH_SIZE', 50))         # 每批最多记录数
+    WRITE_BATCH_MAX_AGE = float(os.getenv('WRITE_BATCH_MAX_AGE', 60)) # 批次最长等待时间（秒）
+    
+    # 数据库不可写时（被锁、VACUUM、备份、磁盘满）数据暂存到缓冲文件，恢复后按顺序回放
+    WRITE_SPOOL_ENABLED = os.getenv('WRITE_SPOOL_ENABLED', 'True').lower() == 'true'
+    WRITE_SPOOL_PATH = BASE_DIR / os.getenv('WRITE_SPOOL_PATH', 'write_spool.bin')
+    WRITE_SPOOL_REPLAY_BATCH = int(os.getenv('WRITE_SPOOL_REPLAY_BATCH', 5000))       # 回放时每个事务的记录数
+    WRITE_SPOOL_RETRY_INTERVAL = float(os.getenv('WRITE_SPOOL_RETRY_INTERVAL', 10))   # 回放重试间隔（秒）
+    WRITE_SPOOL_MAX_ATTEMPTS = int(os.getenv('WRITE_SPOOL_MAX_ATTEMPTS', 5))          # 同一批回放失败几次后隔离无法写入的记录
+    WRITE_SPOOL_DEAD_LETTER_PATH = BASE_DIR / os.getenv('WRITE_SPOOL_DEAD_LETTER_PATH', 'write_spool.dead.ndjson')
+    
+    # ========== 批量接收配置（其他节点上传读数） ==========
+    INGEST_ENABLED = os.getenv('INGEST_ENABLED', 'False').lower() == 'true'        # 还需设置INGEST_TOKEN，否则不启用
+    INGEST_TOKEN = os.getenv('INGEST_TOKEN', '')                                   # 上传需带 Authorization: Bearer <令牌>
+    INGEST_MAX_BYTES = int(os.getenv('INGEST_MAX_BYTES', 8 * 1024 * 1024))         # 请求体（压缩后）上限
+    INGEST_MAX_DECODED_BYTES = int(os.getenv('INGEST_MAX_DECODED_BYTES', 64 * 1024 * 1024))  # 解压后上限
+    INGEST_MAX_RECORDS = int(os.getenv('INGEST_MAX_RECORDS', 50000))               # 每批最多记录数
+    INGEST_MAX_FUTURE_SECONDS = int(os.getenv('INGEST_MAX_FUTURE_SECONDS', 300))   # 允许的节点时钟超前量
+    INGEST_KEY_TTL = int(os.getenv('INGEST_KEY_TTL', 7 * 86400))                   # 幂等键保留时长（秒）
+    
+    # 管理操作（删除分区、立即清理/上传、保存SGP41检查点）需带 Authorization: Bearer <令牌>，
+    # 默认与INGEST_TOKEN相同；未设置时这些接口不可用
+    ADMIN_TOKEN = os.getenv('ADMIN_TOKEN', INGEST_TOKEN)
+    
+    # ========== 存储转发上传（边缘节点 -> 中心节点） ==========
+    # 本机记录按批次增量编码、gzip压缩后推送到中心节点的 /api/ingest，高水位保存在状态文件中
+    UPLOAD_ENABLED = os.getenv('UPLOAD_ENABLED', 'False').lower() == 'true'
+    UPLOAD_URL = os.getenv('UPLOAD_URL', '')       # 例如 http://central.local:5000/api/ingest
+    UPLOAD_TOKEN = os.getenv('UPLOAD_TOKEN', '')   # 中心节点的 INGEST_TOKEN
+    UPLOAD_STATE_PATH = BASE_DIR / os.getenv('UPLOAD_STATE_PATH', 'upload_state.json')
+    UPLOAD_BATCH_SIZE = int(os.getenv('UPLOAD_BATCH_SIZE', 2000))
+    UPLOAD_INTERVAL = int(os.getenv('UPLOAD_INTERVAL', 300))       # 追平后的上传间隔（秒）
+    UPLOAD_TIMEOUT = int(os.getenv('UPLOAD_TIMEOUT', 30))          # 单次请求超时（秒）
+    UPLOAD_RETRY_MIN = int(os.getenv('UPLOAD_RETRY_MIN', 10))      # 失败后的首次重试间隔（秒），之后每次翻倍
+    UPLOAD_RETRY_MAX = int(os.getenv('UPLOAD_RETRY_MAX', 900))     # 重试间隔上限（秒）
+    UPLOAD_COMPRESS_LEVEL = int(os.getenv('UPLOAD_COMPRESS_LEVEL', 6))
+    
     # ========== API配置 ==========
     DEFAULT_HISTORY_LIMIT = 100
     MAX_HISTORY_LIMIT = 1000
+    HISTORY_PAGE_SIZE = 1000   # 流式历史接口每次从数据库读取的记录数
+    EXPORT_PAGE_SIZE = int(os.getenv('EXPORT_PAGE_SIZE', 5000))   # 导出接口每次从数据库读取和输出的记录数
+    CHART_MAX_POINTS = int(os.getenv('CHART_MAX_POINTS', 800))   # 图表默认最多点数（超过时LTTB降采样，0为不降采样）
+    CHART_RAW_MAX_ROWS = int(os.getenv('CHART_RAW_MAX_ROWS', 20160))   # 省略step时原始记录不超过该数（约7天）则LTTB降采样原始数据，否则按桶聚合
+    CHART_MAX_BUCKETS = 10000   # 图表指定step时最多的时间桶数
+    MAX_RAW_POINTS = 86400   # SGP41原始信号JSON接口单次最多返回的记录数
     DATA_CACHE_DURATION = 2  # 秒
     
     # ========== 时区配置 ==========
@@ -55,12 +213,21 @@ class DevelopmentConfig(Config):
     """开发环境配置"""
     DEBUG = True
     SQLALCHEMY_ECHO = False  # 设置为True可查看SQL日志
+    SQLITE_PRAGMAS = {
+        **Config.SQLITE_PRAGMAS,
+        'synchronous': 'FULL',      # 开发环境优先保证数据完整
+    }
 
 
 class ProductionConfig(Config):
     """生产环境配置"""
     DEBUG = False
     SECRET_KEY = os.getenv('SECRET_KEY', 'production_secret_key_change_me')
+    SQLITE_PRAGMAS = {
+        **Config.SQLITE_PRAGMAS,
+        'cache_size': -16000,       # 约16MB
+        'mmap_size': 134217728,     # 128MB
+    }
 
 
 class TestingConfig(Config):
@@ -70,6 +237,12 @@ class TestingConfig(Config):
     DATABASE_NAME = 'test_sensor_data.db'
     DATABASE_PATH = BASE_DIR / DATABASE_NAME
     SQLALCHEMY_DATABASE_URI = f'sqlite:///{DATABASE_PATH}'
+    SQLITE_PRAGMAS = {
+        'busy_timeout': 5000,
+        'journal_mode': 'MEMORY',   # 测试数据无需持久化日志
+        'synchronous': 'OFF',
+        'temp_store': 'MEMORY',
+    }
 
 
 # 配置映射
@@ -0,0 +1,314 @@
+#!/usr/bin/env python3
+"""
+数据库管理工具
+
+用法:
+  python manage_db.py partitions                列出按月分区
+  python manage_db.py partition-migrate         将单表中的数据迁移到按月分区
+  python manage_db.py drop-partition 2025-01    删除指定月份分区
+  python manage_db.py rebuild-rollups           根据原始数据重建汇总表
+  python manage_db.py vacuum                    完整VACUUM（并启用增量VACUUM）
+  python manage_db.py compact-migrate           将sensor_data复制到紧凑表sensor_data_compact
+  python manage_db.py import-logs logs/         导入dual_sensor_monitor的JSON行日志（可中断后继续）
+  python manage_db.py archive --days 30         将结束超过30天的月份移入列式归档
+  python manage_db.py archive-list              列出已归档的月份
+  python manage_db.py benchmark-backends --rows 1000000   比较各存储后端的写入和查询性能
+  python manage_db.py benchmark-history --rows 10000,100000,1000000   比较历史接口完整记录与列投影的耗时和内存
+"""
+
+import argparse
+import sys
+from pathlib import Path
+
+# 添加项目目录到Python路径
+sys.path.insert(0, str(Path(__file__).parent))
+
+from config.settings import current_config
+from config.logging_config import setup_logging
+
+logger = setup_logging(app_name='manage_db', log_level='info', log_to_file=False)
+
+
+def get_app():
+    """创建不启动传感器采集的应用实例"""
+    from app import create_app
+    return create_app(current_config, init_sensors=False)
+
+
+def cmd_partitions(args):
+    """列出分区"""
+    app = get_app()
+    if app.partition_store is None:
+        print("未启用分区存储（设置 STORAGE_PARTITIONING=monthly）")
+        return 1
+
+    for item in app.partition_store.get_partition_info():
+        print(f"  {item['partition']}  {item['size'] / 1024 / 1024:8.2f} MB  {item['file']}")
+    return 0
+
+
+def cmd_partition_migrate(args):
+    """将单表数据迁移到分区"""
+    app = get_app()
+    if app.partition_store is None:
+        print("未启用分区存储（设置 STORAGE_PARTITIONING=monthly）")
+        return 1
+
+    from app import db
+    with app.app_context():
+        moved = app.partition_store.migrate_from(db.engine)
+    print(f"✅ 已迁移 {moved} 条记录")
+    return 0
+
+
+def cmd_drop_partition(args):
+    """删除分区"""
+    app = get_app()
+    if app.partition_store is None:
+        print("未启用分区存储（设置 STORAGE_PARTITIONING=monthly）")
+        return 1
+
+    store = app.partition_store
+    if store.drop_partition(store.parse_key(args.partition)):
+        print(f"✅ 分区 {args.partition} 已删除")
+        return 0
+    print(f"❌ 分区不存在: {args.partition}")
+    return 1
+
+
+def cmd_rebuild_rollups(args):
+    """重建汇总表"""
+    app = get_app()
+
+    from app import db
+    from app.storage.rollups import rebuild_rollups
+    with app.app_context():
+        total = rebuild_rollups(db.session)
+    print(f"✅ 汇总表已重建（处理 {total} 条原始记录）")
+    return 0
+
+
+def cmd_vacuum(args):
+    """完整VACUUM，同时将已有数据库转换为auto_vacuum=INCREMENTAL"""
+    app = get_app()
+
+    from app import db
+    with app.app_context():
+        with db.engine.connect() as conn:
+            conn.exec_driver_sql("PRAGMA auto_vacuum=INCREMENTAL")
+            conn.exec_driver_sql("VACUUM")
+            mode = conn.exec_driver_sql("PRAGMA auto_vacuum").scalar()
+    print(f"✅ VACUUM完成 (auto_vacuum={mode})")
+    return 0
+
+
+def cmd_compact_migrate(args):
+    """将标准表数据复制到紧凑表（按 (timestamp, id) 分页，可重复运行）"""
+    app = get_app()
+
+    from sqlalchemy import func, insert, literal, select, tuple_
+    from app import db
+    from app.models import CompactSensorData, SensorData
+    source = SensorData.__table__
+    target = CompactSensorData.__table__
+    node = app.config['NODE_ID']
+    columns = [source.c.id, source.c.timestamp] + [
+        func.coalesce(source.c.node_id, literal(node)).label('node_id') if name == 'node_id' else source.c[name]
+        for name in CompactSensorData.RECORD_COLUMNS
+    ]
+
+    with app.app_context():
+        # 从紧凑表已有的最新时间（毫秒）处继续复制，该毫秒内已复制的记录由主键冲突跳过
+        resume = db.session.execute(select(func.max(target.c.timestamp))).scalar()
+        last = None
+        copied = ignored = 0
+        while True:
+            stmt = select(*columns).order_by(source.c.timestamp.asc(), source.c.id.asc()).limit(args.batch_size)
+            if last is not None:
+                stmt = stmt.where(tuple_(source.c.timestamp, source.c.id) > tuple_(*last))
+            elif resume is not None:
+                stmt = stmt.where(source.c.timestamp >= resume)
+            rows = db.session.execute(stmt).mappings().all()
+            if not rows:
+                break
+
+            # 同一节点毫秒精度下时间相同的记录只保留第一条，其余计入ignored
+            records = [{name: row[name] for name in ['timestamp'] + CompactSensorData.RECORD_COLUMNS}
+                       for row in rows]
+            inserted = db.session.execute(insert(target).prefix_with('OR IGNORE'), records).rowcount
+            db.session.commit()
+            copied += inserted
+            ignored += len(rows) - inserted
+            last = (rows[-1]['timestamp'], rows[-1]['id'])
+            logger.info(f"已复制 {copied} 条记录到紧凑表，跳过 {ignored} 条")
+
+    if ignored:
+        print(f"⚠️ 跳过 {ignored} 条记录（紧凑表中已有相同节点、相同毫秒时间的记录）")
+    print(f"✅ 已复制 {copied} 条记录，设置 STORAGE_SCHEMA=compact 后重启服务即可使用紧凑表")
+    return 0
+
+
+def cmd_import_logs(args):
+    """导入dual_sensor_monitor.py的历史日志"""
+    app = get_app()
+
+    from app.storage.importer import LogImporter, iter_log_files
+    files = iter_log_files(args.paths)
+    if not files:
+        print(f"❌ 没有找到日志文件: {', '.join(args.paths)}")
+        return 1
+
+    state_path = Path(args.state)
+    if args.restart and state_path.exists():
+        state_path.unlink()
+
+    def show_progress(progress):
+        print(f"\r  {progress['percent']:5.1f}%  {progress['file']}  "
+              f"已读 {progress['lines']} 行, 写入 {progress['inserted']}, "
+              f"重复 {progress['duplicates']}, 无效 {progress['invalid']}, "
+              f"{progress['rows_per_second']} 行/秒", end='', flush=True)
+
+    print(f"导入 {len(files)} 个日志文件（进度文件: {state_path}）")
+    importer = LogImporter(app, state_path, batch_size=args.batch_size, node=args.node)
+    try:
+        stats = importer.import_files(files, progress=show_progress)
+    except Exception as e:
+        print(f"\n❌ 导入中断: {e}")
+        return 1
+
+    print(f"\n✅ 导入完成: 写入 {stats['inserted']} 条, 重复 {stats['duplicates']} 条, "
+          f"无效 {stats['invalid']} 行, 耗时 {stats['duration_seconds']} 秒")
+    return 0
+
+
+def cmd_archive(args):
+    """将旧月份移入列式归档"""
+    app = get_app()
+    if app.archive is None:
+        print("未启用列式归档（设置 ARCHIVE_ENABLED=true）")
+        return 1
+
+    from datetime import datetime, timedelta
+    months = app.retention_manager.archive_before(datetime.utcnow() - timedelta(days=args.days))
+    print(f"✅ 已归档月份: {', '.join(months) if months else '无'}")
+    return 0
+
+
+def cmd_archive_list(args):
+    """列出已归档的月份"""
+    app = get_app()
+    if app.archive is None:
+        print("未启用列式归档（设置 ARCHIVE_ENABLED=true）")
+        return 1
+
+    for item in app.archive.get_archive_info():
+        print(f"  {item['month']}  {item['rows']:>9} 行  {item['size'] / 1024 / 1024:8.2f} MB")
+    return 0
+
+
+def cmd_benchmark_backends(args):
+    """对各存储后端执行相同的负载"""
+    from app.storage.benchmark import run_benchmark
+
+    backends = [name.strip() for name in args.backends.split(',') if name.strip()]
+    print(f"基准测试: {', '.join(backends)}  ({args.rows} 行, 批大小 {args.batch_size}, 每项重复 {args.repeat} 次)")
+    results = run_benchmark(backends, rows=args.rows, batch_size=args.batch_size, repeat=args.repeat,
+                            schema=args.schema, directory=args.dir, keep=args.keep)
+
+    labels = []
+    for result in results.values():
+        labels.extend(label for label in result if label not in labels)
+    print(f"\n{'':<28}" + ''.join(f"{name:>14}" for name in results))
+    for label in labels:
+        values = [result.get(label) for result in results.values()]
+        if label == 'error':
+            print(f"{label:<28}" + ''.join(f"{str(value or '')[:13]:>14}" for value in values))
+            continue
+        print(f"{label:<28}" + ''.join(f"{'' if value is None else value:>14}" for value in values))
+
+    errors = {name: result['error'] for name, result in results.items() if 'error' in result}
+    for name, error in errors.items():
+        print(f"❌ {name}: {error}")
+    return 1 if errors else 0
+
+
+def cmd_benchmark_history(args):
+    """比较历史接口各数据路径的耗时和RSS峰值（每个数据路径在单独的子进程中执行）"""
+    from app.storage.benchmark import run_history_benchmark
+
+    sizes = [int(value) for value in args.rows.split(',') if value.strip()]
+    fields = [name.strip() for name in args.fields.split(',') if name.strip()]
+    app = get_app()
+    print(f"历史接口基准测试: {', '.join(map(str, sizes))} 行, fields={','.join(fields)}")
+    results = run_history_benchmark(app, sizes=sizes, fields=fields, directory=args.dir, keep=args.keep)
+
+    print(f"\n{'rows':>9}  {'path':<22}{'seconds':>10}{'RSS MB':>10}{'output MB':>11}")
+    for rows, cases in results.items():
+        for label, result in cases.items():
+            if 'error' in result:
+                print(f"{rows:>9}  {label:<22}失败: {result['error']}")
+                continue
+            print(f"{rows:>9}  {label:<22}{result['seconds']:>10}{result['rss_mb']:>10}{result['output_mb']:>11}")
+    return 0
+
+
+def main():
+    """主函数"""
+    parser = argparse.ArgumentParser(description='传感器数据库管理工具')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    subparsers.add_parser('partitions', help='列出按月分区').set_defaults(func=cmd_partitions)
+
+    subparsers.add_parser('partition-migrate', help='将单表数据迁移到按月分区').set_defaults(
+        func=cmd_partition_migrate)
+
+    drop_parser = subparsers.add_parser('drop-partition', help='删除指定月份分区')
+    drop_parser.add_argument('partition', help='分区名，格式 YYYY-MM')
+    drop_parser.set_defaults(func=cmd_drop_partition)
+
+    subparsers.add_parser('rebuild-rollups', help='根据原始数据重建汇总表').set_defaults(func=cmd_rebuild_rollups)
+
+    subparsers.add_parser('vacuum', help='完整VACUUM并启用增量VACUUM').set_defaults(func=cmd_vacuum)
+
+    compact_parser = subparsers.add_parser('compact-migrate', help='将标准表数据复制到紧凑表')
+    compact_parser.add_argument('--batch-size', type=int, default=5000, help='每批复制的记录数')
+    compact_parser.set_defaults(func=cmd_compact_migrate)
+
+    import_parser = subparsers.add_parser('import-logs', help='导入dual_sensor_monitor的JSON行日志')
+    import_parser.add_argument('paths', nargs='*', default=['logs'], help='日志文件或目录（默认logs/）')
+    import_parser.add_argument('--batch-size', type=int, default=5000, help='每个事务写入的记录数')
+    import_parser.add_argument('--state', default='logs/.import_state.json', help='导入进度文件')
+    import_parser.add_argument('--restart', action='store_true', help='忽略进度文件，从头导入')
+    import_parser.add_argument('--node', help='日志所属节点标识（默认为本机 NODE_ID）')
+    import_parser.set_defaults(func=cmd_import_logs)
+
+    archive_parser = subparsers.add_parser('archive', help='将旧月份移入列式归档')
+    archive_parser.add_argument('--days', type=int, default=current_config.ARCHIVE_AFTER_DAYS,
+                                help='归档结束超过多少天的月份')
+    archive_parser.set_defaults(func=cmd_archive)
+
+    subparsers.add_parser('archive-list', help='列出已归档的月份').set_defaults(func=cmd_archive_list)
+
+    benchmark_parser = subparsers.add_parser('benchmark-backends', help='比较各存储后端的写入和查询性能')
+    benchmark_parser.add_argument('--backends', default='sqlite,duckdb,segments', help='逗号分隔的后端名')
+    benchmark_parser.add_argument('--rows', type=int, default=100000, help='模拟数据行数（5秒一条）')
+    benchmark_parser.add_argument('--batch-size', type=int, default=1000, help='每批追加的记录数')
+    benchmark_parser.add_argument('--repeat', type=int, default=5, help='每个查询重复次数（取中位数）')
+    benchmark_parser.add_argument('--schema', choices=['standard', 'compact'], help='存储模式（默认当前配置）')
+    benchmark_parser.add_argument('--dir', help='测试数据目录（默认临时目录）')
+    benchmark_parser.add_argument('--keep', action='store_true', help='保留测试数据')
+    benchmark_parser.set_defaults(func=cmd_benchmark_backends)
+
+    history_parser = subparsers.add_parser('benchmark-history', help='比较历史接口各数据路径的耗时和RSS峰值')
+    history_parser.add_argument('--rows', default='10000,100000,1000000', help='逗号分隔的数据量（5秒一条）')
+    history_parser.add_argument('--fields', default='scd40_co2', help='投影路径查询的列（逗号分隔）')
+    history_parser.add_argument('--dir', help='测试数据目录（默认临时目录）')
+    history_parser.add_argument('--keep', action='store_true', help='保留测试数据')
+    history_parser.set_defaults(func=cmd_benchmark_history)
+
+    args = parser.parse_args()
+    return args.func(args)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
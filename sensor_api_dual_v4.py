@@ -13,7 +13,7 @@ from pathlib import Path
 sys.path.insert(0, str(Path(__file__).parent))
 
 # 导入配置
-from config.settings import Config
+from config.settings import Config, current_config
 from config.logging_config import setup_logging
 from app.utils.time_utils import get_local_now
 
@@ -60,8 +60,8 @@ def test_sensors(app):
 
 def main():
     """主函数"""
-    # 创建Flask应用
-    app = create_app()
+    # 创建Flask应用（按FLASK_ENV选择配置类）
+    app = create_app(current_config)
     
     print("=" * 60)
     print("树莓派三传感器环境监测系统 v5.0")
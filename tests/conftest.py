@@ -0,0 +1,70 @@
+# tests/conftest.py
+"""
+测试公共夹具 - 每个测试使用临时目录中的独立数据库和缓冲文件，不启动传感器采集
+"""
+
+import sys
+import types
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+# 非树莓派环境没有 board 模块（config.sensors 导入时需要引脚定义），测试中不访问硬件
+try:
+    import board  # noqa: F401
+except ImportError:
+    board = types.ModuleType('board')
+    board.D4 = 4
+    sys.modules['board'] = board
+
+from config.settings import Config  # noqa: E402
+
+
+@pytest.fixture
+def make_app(tmp_path, monkeypatch):
+    """创建应用的工厂：overrides 覆盖 Config 中的配置项"""
+    from app import create_app
+    apps = []
+
+    def factory(**overrides):
+        database_path = tmp_path / 'test.db'
+        settings = {
+            'DATABASE_PATH': database_path,
+            'SQLALCHEMY_DATABASE_URI': f'sqlite:///{database_path}',
+            'PARTITION_DIR': tmp_path / 'partitions',
+            'ARCHIVE_DIR': tmp_path / 'archive',
+            'WRITE_SPOOL_PATH': tmp_path / 'write_spool.bin',
+            'WRITE_SPOOL_DEAD_LETTER_PATH': tmp_path / 'write_spool.dead.ndjson',
+            'SGP41_RAW_RING_ENABLED': False,
+            'SGP41_STATE_PATH': tmp_path / 'sgp41_algorithm_state.json',
+            'DUCKDB_PATH': tmp_path / 'sensor_data.duckdb',
+            'SEGMENT_STORE_PATH': tmp_path / 'segments',
+            'UPLOAD_STATE_PATH': tmp_path / 'upload_state.json',
+            'UPLOAD_ENABLED': False,
+            'RETENTION_ENABLED': False,
+            'EXPLAIN_QUERIES_ON_STARTUP': False,
+        }
+        settings.update(overrides)
+        for name, value in settings.items():
+            monkeypatch.setattr(Config, name, value, raising=False)
+        app = create_app(Config, init_sensors=False)
+        apps.append(app)
+        return app
+
+    yield factory
+
+    for app in apps:
+        app.storage.dispose()
+
+
+@pytest.fixture
+def app(make_app):
+    """默认配置的应用"""
+    return make_app()
+
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
@@ -0,0 +1,51 @@
+# tests/test_algorithm_state.py
+"""
+SGP41算法状态检查点测试
+"""
+
+import json
+import time
+from types import SimpleNamespace
+
+import pytest
+
+from config.settings import Config
+
+# app.sensors 包导入时需要传感器驱动库
+manager = pytest.importorskip('app.sensors.manager')
+from app.sensors.algorithm_state import AlgorithmStateStore  # noqa: E402
+
+STATES = {'voc': [1.0, 2.0], 'nox': [3.0, 4.0]}
+
+
+def test_checkpoint_keeps_uptime(tmp_path):
+    store = AlgorithmStateStore(tmp_path / 'state.json')
+    store.save(STATES, 12000)
+
+    checkpoint, reason = store.load()
+    assert checkpoint['states'] == STATES
+    assert checkpoint['uptime'] == 12000
+    assert store.get_status()['uptime_seconds'] == 12000
+
+
+def test_checkpoint_without_uptime_is_not_restored(tmp_path):
+    path = tmp_path / 'state.json'
+    path.write_text(json.dumps({'version': 1, 'saved_at': time.time(), 'tuning': {}, 'states': STATES}))
+
+    checkpoint, reason = AlgorithmStateStore(path).load()
+    assert checkpoint is None
+    assert '版本' in reason
+
+
+@pytest.mark.parametrize('uptime, saved', [(Config.SGP41_STATE_MIN_UPTIME - 1, False),
+                                           (Config.SGP41_STATE_MIN_UPTIME, True)])
+def test_state_saved_only_after_min_uptime(tmp_path, uptime, saved):
+    store = AlgorithmStateStore(tmp_path / 'state.json')
+    store.save({'voc': [9.0, 9.0]}, Config.SGP41_STATE_MIN_UPTIME)
+    sensor = SimpleNamespace(get_algorithm_uptime=lambda: uptime, get_algorithm_states=lambda: STATES)
+    owner = SimpleNamespace(sgp41_state=store, sgp41_state_saved_time=0, sensors={'sgp41': sensor})
+
+    checkpoint = manager.SensorManager.save_sgp41_state(owner)
+
+    assert (checkpoint is not None) == saved
+    assert store.load()[0]['states'] == (STATES if saved else {'voc': [9.0, 9.0]})
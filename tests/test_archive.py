@@ -0,0 +1,35 @@
+# tests/test_archive.py
+"""
+列式归档测试 - 整数精度和节点标识
+"""
+
+from datetime import datetime, timedelta
+
+from sqlalchemy import insert
+
+from app.storage.archive import ColumnarArchive
+
+KEY = (2024, 1)
+LARGE = 2 ** 24 + 1  # float32无法精确表示
+
+
+def test_archive_keeps_large_integers_and_null_node(app, tmp_path):
+    table = app.sensor_model.__table__
+    start = datetime(2024, 1, 10)
+    rows = [
+        {'timestamp': start, 'node_id': None, 'sgp41_sraw_voc': LARGE},
+        {'timestamp': start + timedelta(minutes=1), 'node_id': 'node-b', 'sgp41_sraw_voc': LARGE + 2},
+        {'timestamp': start + timedelta(minutes=2), 'node_id': 'node-b', 'sgp41_sraw_voc': None}
+    ]
+    with app.storage.write_transaction() as conn:
+        conn.execute(insert(table), rows)
+
+    archive = ColumnarArchive(tmp_path / 'archive', table, 'node-a')
+    assert archive.archive_month(app.storage.writer, KEY) == 3
+
+    fetched = archive.fetch(['node_id', 'sgp41_sraw_voc'])
+    assert [(row.node_id, row.sgp41_sraw_voc) for row in fetched] == [
+        ('node-a', LARGE), ('node-b', LARGE + 2), ('node-b', None)
+    ]
+    assert archive.count(node='node-a') == 1
+    assert archive.nodes() == {'node-a', 'node-b'}
@@ -0,0 +1,65 @@
+# tests/test_auth.py
+"""
+认证测试 - 批量接收和管理接口的令牌校验
+"""
+
+import json
+
+import pytest
+
+TOKEN = 'secret-token'
+READING = json.dumps({'timestamp': '2024-01-01T00:00:00', 'node_id': 'edge-1', 'scd40_co2': 800})
+
+
+def bearer(token):
+    return {'Authorization': f'Bearer {token}'}
+
+
+def test_ingest_disabled_by_default(make_app):
+    client = make_app(INGEST_ENABLED=False, INGEST_TOKEN='', ADMIN_TOKEN='').test_client()
+    assert client.post('/api/ingest', data=READING).status_code == 404
+
+
+def test_ingest_not_enabled_without_token(make_app):
+    app = make_app(INGEST_ENABLED=True, INGEST_TOKEN='', ADMIN_TOKEN='')
+    assert app.ingest_service is None
+    assert app.test_client().post('/api/ingest', data=READING).status_code == 404
+
+
+def test_ingest_requires_token(make_app):
+    client = make_app(INGEST_ENABLED=True, INGEST_TOKEN=TOKEN).test_client()
+
+    assert client.post('/api/ingest', data=READING).status_code == 401
+    assert client.post('/api/ingest', data=READING, headers=bearer('wrong')).status_code == 401
+
+    response = client.post('/api/ingest', data=READING, headers=bearer(TOKEN))
+    assert response.status_code == 200
+    assert response.json['accepted'] == 1
+
+
+ADMIN_REQUESTS = [
+    ('post', '/api/retention/run'),
+    ('post', '/api/upload/run'),
+    ('post', '/api/sgp41/checkpoint'),
+    ('delete', '/api/partitions/2024-01'),
+]
+
+
+@pytest.mark.parametrize('method, url', ADMIN_REQUESTS)
+def test_admin_endpoints_refused_without_configured_token(make_app, method, url):
+    client = make_app(INGEST_TOKEN='', ADMIN_TOKEN='').test_client()
+    assert getattr(client, method)(url, headers=bearer('')).status_code == 403
+
+
+@pytest.mark.parametrize('method, url', ADMIN_REQUESTS)
+def test_admin_endpoints_require_token(make_app, method, url):
+    client = make_app(ADMIN_TOKEN=TOKEN).test_client()
+    assert getattr(client, method)(url).status_code == 401
+    assert getattr(client, method)(url, headers=bearer('wrong')).status_code == 401
+
+
+def test_retention_run_with_token(make_app):
+    client = make_app(ADMIN_TOKEN=TOKEN).test_client()
+    response = client.post('/api/retention/run', headers=bearer(TOKEN))
+    assert response.status_code == 200
+    assert response.json['success']
@@ -0,0 +1,79 @@
+# tests/test_charts.py
+"""
+图表测试 - 自动桶宽度选择，汇总表聚合与原始数据聚合的一致性
+"""
+
+from datetime import datetime, timedelta
+
+import pytest
+
+from app.api.charts import auto_step
+from app.storage.benchmark import generate_batches
+from app.storage.rollups import aggregate_rows, bucket_start, from_epoch, to_epoch
+
+METRICS = ['scd40_co2', 'dht22_temperature', 'sgp41_voc_index']
+
+
+@pytest.mark.parametrize('hours', [1, 6, 24, 168])
+def test_auto_step_keeps_raw_resolution_for_dashboard_ranges(hours):
+    """1~168小时的图表读取原始数据（LTTB降采样），不按桶平均"""
+    assert auto_step(hours * 3600, 800) is None
+
+
+def test_auto_step_buckets_long_ranges():
+    assert auto_step(30 * 86400, 800) == 3600
+    assert auto_step(365 * 86400, 800) == 43200
+    assert auto_step(365 * 86400, 0) is None
+
+
+def test_default_chart_is_lttb_downsampled(app):
+    for batch in generate_batches(2880, 1000, interval=30):
+        app.storage_backend.append_batch(batch)
+
+    data = app.test_client().get('/api/charts/co2?max_points=200').get_json()
+
+    assert data['resolution'] == 'raw'
+    assert data['count'] <= 200
+
+
+def fill(app):
+    """2天的30秒间隔数据，每3条有VOC指数的记录中有1条带窗口统计"""
+    for batch in generate_batches(5760, 1000, interval=30):
+        for i, record in enumerate(batch):
+            value = record['sgp41_voc_index']
+            windowed = value is not None and i % 3 == 0
+            record['sgp41_voc_index_min'] = value - 5 if windowed else None
+            record['sgp41_voc_index_max'] = value + 5 if windowed else None
+            record['sgp41_voc_index_count'] = 30 if windowed else None
+        app.storage_backend.append_batch(batch)
+
+
+@pytest.mark.parametrize('schema', ['standard', 'compact'])
+def test_rollup_aggregation_matches_live(make_app, schema):
+    """同一桶宽度下，汇总表、原始表GROUP BY和内存聚合的结果一致"""
+    app = make_app(STORAGE_SCHEMA=schema)
+    fill(app)
+    backend = app.storage_backend
+    end = datetime.utcnow()
+    start = from_epoch(bucket_start(to_epoch(end - timedelta(hours=30)), 3600))
+
+    with app.app_context():
+        rolled = dict(backend.aggregate(METRICS, 3600, start, end))
+        live = dict(backend._aggregate_live(METRICS, 3600, start, end))
+        rows = backend.scan(METRICS + ['node_id', 'sgp41_voc_index_min', 'sgp41_voc_index_max',
+                                       'sgp41_voc_index_count'],
+                            start=start, end=end, require=METRICS)
+    expected = {
+        (bucket, metric): agg
+        for (_, metric, bucket, _), agg in aggregate_rows([row._asdict() for row in rows], [3600], METRICS).items()
+    }
+
+    assert rolled.keys() == live.keys()
+    assert len(expected) == len(live) * len(METRICS)
+    for (bucket, metric), agg in expected.items():
+        for result in (rolled[bucket][metric], live[bucket][metric]):
+            assert result.count == agg['count']
+            assert result.min == pytest.approx(agg['min'])
+            assert result.max == pytest.approx(agg['max'])
+            assert result.sum == pytest.approx(agg['sum'])
+            assert result.last == pytest.approx(agg['last'])
@@ -0,0 +1,45 @@
+# tests/test_compact_migrate.py
+"""
+紧凑表迁移测试 - 时间相同的记录跨分页时不丢失
+"""
+
+from argparse import Namespace
+from datetime import datetime, timedelta
+
+from sqlalchemy import func, insert, select
+
+import manage_db
+from app.models import CompactSensorData, SensorData
+
+
+def compact_rows(app):
+    table = CompactSensorData.__table__
+    with app.storage.read_connection() as conn:
+        return conn.execute(select(table.c.timestamp, table.c.node_id).order_by(table.c.timestamp)).all()
+
+
+def test_rows_sharing_timestamp_across_pages_are_copied(app, monkeypatch, capsys):
+    start = datetime(2024, 1, 1)
+    rows = []
+    for i in range(6):
+        # 每个时间点3个节点，分页大小为4时同一时间点的记录跨页
+        for node in ('node-a', 'node-b', None):
+            rows.append({'timestamp': start + timedelta(seconds=i), 'node_id': node, 'scd40_co2': 400 + i})
+    # 与上一条同节点、同毫秒的记录，紧凑表中只能保留一条
+    rows.append({'timestamp': start + timedelta(seconds=5, microseconds=300), 'node_id': 'node-a', 'scd40_co2': 1})
+    with app.storage.write_transaction() as conn:
+        conn.execute(insert(SensorData.__table__), rows)
+
+    monkeypatch.setattr(manage_db, 'get_app', lambda: app)
+    assert manage_db.cmd_compact_migrate(Namespace(batch_size=4)) == 0
+
+    copied = compact_rows(app)
+    assert len(copied) == 18
+    assert {node for _, node in copied} == {'node-a', 'node-b', app.config['NODE_ID']}
+    assert '跳过 1 条' in capsys.readouterr().out
+
+    # 重复运行不产生新记录，已有的最后一毫秒内的记录计入跳过
+    assert manage_db.cmd_compact_migrate(Namespace(batch_size=4)) == 0
+    assert len(compact_rows(app)) == 18
+    with app.storage.read_connection() as conn:
+        assert conn.execute(select(func.count()).select_from(SensorData.__table__)).scalar() == 19
@@ -0,0 +1,178 @@
+# tests/test_deadband.py
+"""
+死区存储测试 - 按节点的阈值/心跳判断、窗口尖峰、写入失败时状态不变、保持时长和阶梯还原
+"""
+
+import random
+from collections import namedtuple
+from datetime import datetime, timedelta
+
+import pytest
+
+from app.api.charts import raw_chart_records
+from app.storage.deadband import DeadbandFilter, fill_steps, resample_steps
+from app.storage.writer import BatchWriter
+from config.settings import Config
+
+START = datetime(2024, 1, 1)
+Row = namedtuple('Row', ('timestamp', 'scd40_co2'))
+
+
+def at(seconds, node='node-a', **values):
+    return {'timestamp': START + timedelta(seconds=seconds), 'node_id': node, **values}
+
+
+def test_threshold_and_heartbeat_per_node():
+    deadband = DeadbandFilter({'scd40_co2': 10}, heartbeat=600)
+    records = [
+        at(0, scd40_co2=800),
+        at(30, scd40_co2=805),
+        at(30, node='node-b', scd40_co2=805),     # 其他节点的读数不被node-a抑制
+        at(60, scd40_co2=811),                    # 变化超过阈值
+        at(90, scd40_co2=815),
+        at(660, scd40_co2=815),                   # 距上次写入超过心跳间隔
+        at(690, node='node-b', scd40_co2=806),    # 同样超过心跳间隔
+    ]
+    rows, result = deadband.filter(records)
+    deadband.commit(result)
+
+    assert [(row['node_id'], (row['timestamp'] - START).seconds) for row in rows] == [
+        ('node-a', 0), ('node-b', 30), ('node-a', 60), ('node-a', 660), ('node-b', 690)
+    ]
+    stats = deadband.get_stats()
+    assert (stats['samples'], stats['rows_stored'], stats['values_suppressed']) == (7, 5, 2)
+
+
+def test_unfiltered_columns_keep_row_with_suppressed_value():
+    deadband = DeadbandFilter({'scd40_co2': 10})
+    rows, _ = deadband.filter([at(0, scd40_co2=800, scd40_temperature=21.0),
+                               at(30, scd40_co2=801, scd40_temperature=21.0)])
+    assert [(row['scd40_co2'], row['scd40_temperature']) for row in rows] == [(800, 21.0), (None, 21.0)]
+
+
+def test_window_spike_forces_write():
+    deadband = DeadbandFilter({'sgp41_voc_index': 5})
+    window = lambda value, low, high: {'sgp41_voc_index': value, 'sgp41_voc_index_min': low,
+                                       'sgp41_voc_index_max': high, 'sgp41_voc_index_count': 30}
+    rows, _ = deadband.filter([
+        at(0, **window(100, 98, 102)),
+        at(30, **window(101, 99, 103)),     # 平均值和极值都在死区内
+        at(60, **window(101, 100, 140)),    # 平均值不变，窗口内的尖峰超出阈值
+        at(90, **window(102, 60, 103)),
+    ])
+
+    assert [(row['timestamp'] - START).seconds for row in rows] == [0, 60, 90]
+    assert rows[1]['sgp41_voc_index_max'] == 140 and rows[2]['sgp41_voc_index_min'] == 60
+
+
+def test_suppressed_value_drops_window_stats():
+    deadband = DeadbandFilter({'sgp41_voc_index': 5})
+    rows, _ = deadband.filter([
+        at(0, sgp41_voc_index=100, sgp41_voc_index_count=30, scd40_co2=800),
+        at(30, sgp41_voc_index=101, sgp41_voc_index_min=99, sgp41_voc_index_max=103,
+           sgp41_voc_index_count=30, scd40_co2=800),
+    ])
+    assert {name: rows[1][name] for name in rows[1] if name.startswith('sgp41')} == dict.fromkeys(
+        ['sgp41_voc_index', 'sgp41_voc_index_min', 'sgp41_voc_index_max', 'sgp41_voc_index_count'])
+
+
+def test_state_unchanged_when_write_fails(app, monkeypatch):
+    deadband = DeadbandFilter({'scd40_co2': 10})
+    deadband.commit(deadband.filter([at(0, scd40_co2=800)])[1])
+    state = dict(deadband.last)
+
+    def failing_append(records, rollup_records=None):
+        raise OSError('disk full')
+
+    monkeypatch.setattr(app.storage_backend, 'append_batch', failing_append)
+    changed = [at(30, scd40_co2=850)]
+    assert not BatchWriter(app, deadband=deadband).flush(changed)
+    assert deadband.last == state
+    assert deadband.get_stats()['samples'] == 1
+
+    # 重试时变化仍被判断为需要写入
+    monkeypatch.undo()
+    assert BatchWriter(app, deadband=deadband).flush(changed)
+    assert [row.scd40_co2 for row in app.storage_backend.scan(['scd40_co2'])] == [850]
+    assert deadband.last[('node-a', 'scd40_co2')][0] == 850
+
+
+def test_fill_steps_stops_after_hold():
+    rows = [Row(START + timedelta(seconds=seconds), value)
+            for seconds, value in [(0, 800), (300, None), (600, None), (700, None), (720, 830), (1500, None)]]
+    filled = fill_steps(rows, ['scd40_co2'], hold=660)
+    assert [row.scd40_co2 for row in filled] == [800, 800, 800, None, 830, None]
+
+    # seed提供rows之前的值
+    seeded = fill_steps(rows[1:3], ['scd40_co2'], hold=660, seed=rows[:1])
+    assert [row.scd40_co2 for row in seeded] == [800, 800]
+
+
+def test_resample_steps_leaves_gaps_after_hold():
+    rows = [Row(START, 800), Row(START + timedelta(seconds=1000), 820)]
+    points = resample_steps(rows, ['scd40_co2'], START, START + timedelta(seconds=1100), 100, hold=660)
+    assert [((point.timestamp - START).seconds, point.scd40_co2) for point in points] == [
+        (0, 800), (100, 800), (200, 800), (300, 800), (400, 800), (500, 800), (600, 800),
+        (1000, 820), (1100, 820)
+    ]
+
+
+def full_resolution(nodes=('node-a', 'node-b'), count=240, seed=3):
+    """30秒间隔的完整序列：CO2缓慢漂移，偶尔跳变（SCD40温度不在死区指标中，每条记录都写入）"""
+    rng = random.Random(seed)
+    records = []
+    levels = {node: 800.0 for node in nodes}
+    for i in range(count):
+        for node in nodes:
+            levels[node] += rng.choice([0, 0, 0, 1, -1, 3]) + (rng.choice([40, -40]) if i % 47 == 5 else 0)
+            records.append(at(30 * i, node=node, scd40_co2=int(levels[node]), scd40_temperature=21.0))
+    return records
+
+
+@pytest.fixture
+def deadband_app(make_app):
+    app = make_app(DEADBAND_ENABLED=True)
+    writer = BatchWriter(app, deadband=DeadbandFilter(Config.DEADBAND_THRESHOLDS, Config.DEADBAND_HEARTBEAT))
+    records = full_resolution()
+    for i in range(0, len(records), 50):
+        assert writer.flush(records[i:i + 50])
+    assert writer.deadband.get_stats()['values_suppressed'] > len(records) // 2
+    return app, records
+
+
+def assert_reconstructed(expected, actual):
+    """还原值与完整序列相差不超过阈值，时间点一一对应"""
+    threshold = Config.DEADBAND_THRESHOLDS['scd40_co2']
+    assert [key for key, _ in actual] == [key for key, _ in expected]
+    for (key, value), (_, truth) in zip(actual, expected):
+        assert abs(value - truth) <= threshold, key
+
+
+def test_history_reconstruction_matches_full_resolution(deadband_app):
+    app, records = deadband_app
+    client = app.test_client()
+    data, cursor = [], None
+    while True:
+        query = {'limit': 100, **({'cursor': cursor} if cursor else {})}
+        body = client.get('/api/history', query_string=query).json
+        data.extend(body['data'])
+        cursor = body['next']
+        if not cursor:
+            break
+
+    expected = sorted((((record['timestamp'], record['node_id']), record['scd40_co2']) for record in records),
+                      reverse=True)
+    actual = [((datetime.fromisoformat(item['timestamp']), item['node_id']), item['scd40']['co2'])
+              for item in data]
+    assert_reconstructed(expected, actual)
+
+
+def test_chart_reconstruction_matches_full_resolution(deadband_app):
+    app, records = deadband_app
+    start, end = START + timedelta(minutes=15), START + timedelta(minutes=90)
+    with app.app_context():
+        points = raw_chart_records(['scd40_co2'], start, end, node='node-b')
+
+    expected = [(record['timestamp'], record['scd40_co2']) for record in records
+                if record['node_id'] == 'node-b' and start <= record['timestamp'] <= end]
+    assert_reconstructed(expected, [(point.timestamp, point.scd40_co2) for point in points])
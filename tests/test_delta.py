@@ -0,0 +1,90 @@
+# tests/test_delta.py
+"""
+增量编码测试 - 空值间隔、量化倍数的往返编解码，以及格式错误的批次
+"""
+
+from collections import namedtuple
+from datetime import datetime, timedelta
+
+import pytest
+
+from app.models import CompactSensorData, SensorData
+from app.storage.delta import FORMAT_VERSION, column_scale, decode_batch, encode_batch
+
+Row = namedtuple('Row', ('timestamp', 'scd40_co2', 'scd40_temperature', 'dht22_humidity'))
+SCALES = {'scd40_co2': 1, 'scd40_temperature': 100, 'dht22_humidity': 10}
+START = datetime(2024, 1, 1, 0, 0, 0, 250000)
+
+
+def sample_rows():
+    return [
+        Row(START, 800, 21.37, 45.5),
+        Row(START + timedelta(seconds=30), None, 21.4, None),
+        Row(START + timedelta(seconds=60, microseconds=7), None, None, 44.1),
+        Row(START + timedelta(seconds=90), 812, -3.05, None),
+        Row(START + timedelta(seconds=120), 790, 21.37, 46.0),
+    ]
+
+
+def test_round_trip_with_null_gaps():
+    rows = sample_rows()
+    batch = encode_batch(rows, SCALES, node='edge-1')
+
+    assert batch['count'] == len(rows)
+    # 空值保持为None，之后的差值相对于上一个非空值
+    assert batch['columns']['scd40_co2']['values'] == [800, None, None, 12, -22]
+
+    items = decode_batch(batch)
+    assert [item['timestamp'] for item in items] == [row.timestamp for row in rows]
+    assert all(item['node_id'] == 'edge-1' for item in items)
+    for item, row in zip(items, rows):
+        for name in SCALES:
+            value = getattr(row, name)
+            assert item.get(name) == (None if value is None else pytest.approx(value))
+    # 整数列还原为int，量化的浮点列为float
+    assert type(items[0]['scd40_co2']) is int and type(items[0]['scd40_temperature']) is float
+
+
+def test_empty_columns_are_omitted():
+    rows = [Row(START, 800, None, None)]
+    batch = encode_batch(rows, SCALES)
+    assert list(batch['columns']) == ['scd40_co2']
+    assert 'node_id' not in decode_batch(batch)[0]
+
+
+def test_column_scales():
+    assert column_scale(SensorData.__table__.c.scd40_co2) == 1
+    assert column_scale(SensorData.__table__.c.scd40_temperature) == 100
+    assert column_scale(CompactSensorData.__table__.c.dht22_temperature) == 10
+
+
+def valid_batch():
+    return encode_batch(sample_rows(), SCALES)
+
+
+def corrupt(change):
+    batch = valid_batch()
+    change(batch)
+    return batch
+
+
+@pytest.mark.parametrize('batch', [
+    [],
+    corrupt(lambda batch: batch.update(format=FORMAT_VERSION + 1)),
+    corrupt(lambda batch: batch.update(count=batch['count'] + 1)),
+    corrupt(lambda batch: batch.update(count=True)),
+    corrupt(lambda batch: batch['timestamp'].pop()),
+    corrupt(lambda batch: batch['timestamp'].__setitem__(2, None)),
+    corrupt(lambda batch: batch['timestamp'].__setitem__(1, 30.5)),
+    corrupt(lambda batch: batch.update(columns=[])),
+    corrupt(lambda batch: batch['columns']['scd40_co2']['values'].pop()),
+    corrupt(lambda batch: batch['columns']['scd40_co2'].update(values='800')),
+    corrupt(lambda batch: batch['columns']['scd40_co2']['values'].__setitem__(3, True)),
+    corrupt(lambda batch: batch['columns']['scd40_co2']['values'].__setitem__(3, 1.5)),
+    corrupt(lambda batch: batch['columns']['scd40_temperature'].update(scale=0)),
+    corrupt(lambda batch: batch['columns']['scd40_temperature'].update(scale=True)),
+    corrupt(lambda batch: batch['columns']['scd40_temperature'].update(scale=2.5)),
+])
+def test_malformed_batches_rejected(batch):
+    with pytest.raises(ValueError):
+        decode_batch(batch)
@@ -0,0 +1,25 @@
+# tests/test_health.py
+"""
+健康检查测试
+"""
+
+import pytest
+
+from app.storage.sqlite_tuning import get_active_pragmas
+
+
+def test_pragmas_are_read_from_connect_hook(app, monkeypatch):
+    """写连接建立后，读取PRAGMA不再借用写连接"""
+    writer = app.storage.writer
+    names = app.config['SQLITE_PRAGMAS'].keys()
+
+    def borrowed():
+        pytest.fail('借用了写连接')
+
+    with app.storage.write_transaction():
+        # 写连接被占用时仍可读取
+        monkeypatch.setattr(writer, 'connect', borrowed)
+        active = get_active_pragmas(writer, names)
+
+    assert active['journal_mode'] == 'wal'
+    assert active['busy_timeout'] == app.config['SQLITE_PRAGMAS']['busy_timeout']
@@ -0,0 +1,66 @@
+# tests/test_importer.py
+"""
+历史日志导入测试 - 去重、续传位置和仍在写入的不完整行
+"""
+
+import json
+from datetime import datetime, timedelta
+
+from app.storage.importer import LogImporter
+
+START = datetime(2024, 1, 1, 8, 0, 0)
+
+
+def entry(minutes, co2=800):
+    timestamp = START + timedelta(minutes=minutes)
+    return json.dumps({
+        'timestamp_iso': timestamp.isoformat(),
+        'scd40': {'co2_ppm': co2, 'temperature_c': 21.5, 'humidity_rh': 40.0},
+        'dht22': {'temperature_c': 21.0, 'humidity_rh': 42.0}
+    }) + '\n'
+
+
+def importer(app, tmp_path):
+    return LogImporter(app, tmp_path / 'import_state.json', batch_size=2, offset_hours=0, node='logger')
+
+
+def stored(app):
+    return [(row.timestamp, row.scd40_co2) for row in app.storage_backend.scan(['scd40_co2'])]
+
+
+def test_partial_last_line_is_left_for_next_run(app, tmp_path):
+    log = tmp_path / 'sensor_data_20240101.log'
+    complete = '# 注释行\n' + ''.join(entry(i) for i in range(4))
+    partial = entry(4)
+    log.write_text(complete + partial[:25])
+
+    stats = importer(app, tmp_path).import_files([log])
+    assert (stats['inserted'], stats['invalid']) == (4, 0)
+    state = json.loads((tmp_path / 'import_state.json').read_text())
+    assert state['files'][str(log.resolve())] == len(complete.encode())
+
+    # 日志继续写入后，从不完整行的开头继续导入
+    with open(log, 'a') as f:
+        f.write(partial[25:] + entry(5))
+    stats = importer(app, tmp_path).import_files([log])
+    assert (stats['inserted'], stats['duplicates'], stats['invalid']) == (2, 0, 0)
+    assert [timestamp for timestamp, _ in stored(app)] == [START + timedelta(minutes=i) for i in range(6)]
+
+    # 已导入完的文件跳过
+    stats = importer(app, tmp_path).import_files([log])
+    assert (stats['files'], stats['lines']) == (0, 0)
+
+
+def test_duplicates_skipped_within_and_across_files(app, tmp_path):
+    first = tmp_path / 'sensor_data_20240101.log'
+    first.write_text(entry(0) + entry(1) + entry(1, co2=900) + 'not json\n')
+    stats = importer(app, tmp_path).import_files([first])
+    assert (stats['inserted'], stats['duplicates'], stats['invalid']) == (2, 1, 1)
+
+    # 另一个文件中与已存储记录时间相同的条目跳过，已存储的值不变
+    second = tmp_path / 'sensor_data_20240102.log'
+    second.write_text(entry(1, co2=1000) + entry(2))
+    stats = importer(app, tmp_path).import_files([first, second])
+    assert (stats['inserted'], stats['duplicates']) == (1, 1)
+    assert stored(app) == [(START, 800), (START + timedelta(minutes=1), 800), (START + timedelta(minutes=2), 800)]
+    assert {row.node_id for row in app.storage_backend.scan(['node_id'])} == {'logger'}
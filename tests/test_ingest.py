@@ -0,0 +1,135 @@
+# tests/test_ingest.py
+"""
+批量接收测试 - 逐行拒绝原因、去重、幂等键重放和大小限制
+"""
+
+import gzip
+import json
+from datetime import datetime, timedelta
+
+import pytest
+
+TOKEN = 'secret-token'
+START = datetime(2024, 1, 1)
+
+
+def reading(minutes=0, node='edge-1', **values):
+    return {'timestamp': (START + timedelta(minutes=minutes)).isoformat(), 'node_id': node,
+            **(values or {'scd40_co2': 800})}
+
+
+def ndjson(*items):
+    return '\n'.join(item if isinstance(item, str) else json.dumps(item) for item in items)
+
+
+@pytest.fixture
+def ingest_app(make_app):
+    return make_app(INGEST_ENABLED=True, INGEST_TOKEN=TOKEN)
+
+
+@pytest.fixture
+def post(ingest_app):
+    client = ingest_app.test_client()
+
+    def send(body, key=None, **headers):
+        headers['Authorization'] = f'Bearer {TOKEN}'
+        if key is not None:
+            headers['Idempotency-Key'] = key
+        return client.post('/api/ingest', data=body, headers=headers)
+
+    return send
+
+
+def stored(app):
+    return [(row.node_id, row.timestamp, row.scd40_co2)
+            for row in app.storage_backend.scan(['node_id', 'scd40_co2'])]
+
+
+def test_rejected_lines_are_reported(ingest_app, post):
+    future = (datetime.utcnow() + timedelta(hours=1)).isoformat()
+    body = ndjson(
+        reading(0),
+        '{"timestamp": "2024-01-01T00:01:00", "scd40_co2": ',
+        reading(2, scd40_co2=6000),
+        dict(reading(3), timestamp=future),
+        reading(4, node='bad node/'),
+        reading(5, sgp41_voc_index=120, sgp41_voc_index_count=2.5),
+        '',
+        reading(7, sgp41_voc_index=120, sgp41_voc_index_count=3),
+    )
+
+    response = post(body)
+    assert response.status_code == 200
+    result = response.json
+    assert (result['accepted'], result['duplicates'], result['rejected']) == (2, 0, 5)
+    assert result['errors'] == [
+        {'line': 2, 'error': '无法解析的JSON'},
+        {'line': 3, 'error': 'scd40_co2 超出有效范围'},
+        {'line': 4, 'error': '时间戳晚于当前时间'},
+        {'line': 5, 'error': '无效的节点标识'},
+        {'line': 6, 'error': 'sgp41_voc_index_count 应为正整数'},
+    ]
+    assert [timestamp for _, timestamp, _ in stored(ingest_app)] == [START, START + timedelta(minutes=7)]
+    assert ingest_app.ingest_service.get_stats()['rejected'] == 5
+
+
+def test_duplicates_within_batch_and_against_stored_rows(ingest_app, post):
+    first = post(ndjson(reading(0), reading(0, scd40_co2=900), reading(0, node='edge-2'))).json
+    assert (first['accepted'], first['duplicates'], first['rejected']) == (2, 1, 0)
+
+    second = post(ndjson(reading(0, scd40_co2=1000), reading(1))).json
+    assert (second['accepted'], second['duplicates'], second['rejected']) == (1, 1, 0)
+
+    # 同一批次内先出现的记录被保留，已存储的记录不被覆盖
+    assert sorted(stored(ingest_app)) == [
+        ('edge-1', START, 800),
+        ('edge-1', START + timedelta(minutes=1), 800),
+        ('edge-2', START, 800),
+    ]
+
+
+def test_idempotency_key_replay_does_not_write(ingest_app, post, monkeypatch):
+    body = ndjson(reading(0), reading(1), reading(1))
+    first = post(body, key='batch-1').json
+    assert (first['accepted'], first['duplicates'], first['replayed']) == (2, 1, False)
+
+    writes = []
+    monkeypatch.setattr(ingest_app.storage_backend, 'append_batch', lambda *args, **kwargs: writes.append(args))
+    # 重放时不解析请求体，即使内容不同也返回上次的结果
+    replay = post(ndjson(reading(5)), key='batch-1').json
+    assert replay['replayed'] is True
+    assert (replay['accepted'], replay['duplicates'], replay['rejected']) == (2, 1, 0)
+    assert writes == []
+    assert ingest_app.ingest_service.get_stats()['replayed_batches'] == 1
+
+    monkeypatch.undo()
+    assert len(stored(ingest_app)) == 2
+
+
+@pytest.mark.parametrize('headers', [{'Content-Encoding': 'gzip'}, {}])
+def test_gzip_bomb_rejected(make_app, headers):
+    app = make_app(INGEST_ENABLED=True, INGEST_TOKEN=TOKEN, INGEST_MAX_DECODED_BYTES=64 * 1024)
+    line = json.dumps(reading(0)) + '\n'
+    bomb = gzip.compress((line * (1024 * 1024 // len(line))).encode())
+    assert len(bomb) < 64 * 1024
+
+    response = app.test_client().post('/api/ingest', data=bomb,
+                                      headers={'Authorization': f'Bearer {TOKEN}', **headers})
+    assert response.status_code == 413
+    assert stored(app) == []
+
+
+def test_record_limit(make_app):
+    app = make_app(INGEST_ENABLED=True, INGEST_TOKEN=TOKEN, INGEST_MAX_RECORDS=3)
+    client = app.test_client()
+    headers = {'Authorization': f'Bearer {TOKEN}'}
+
+    too_many = ndjson(*(reading(i) for i in range(4)))
+    assert client.post('/api/ingest', data=too_many, headers=headers).status_code == 413
+    assert stored(app) == []
+
+    # 拒绝的行也计入条数，空行不计入
+    assert client.post('/api/ingest', data=ndjson(reading(0), '', 'x', reading(1)),
+                       headers=headers).json['accepted'] == 2
+    assert client.post('/api/ingest', data=ndjson(reading(2), '', 'x', '{}', reading(3)),
+                       headers=headers).status_code == 413
@@ -0,0 +1,156 @@
+# tests/test_pagination.py
+"""
+历史数据keyset分页测试 - 多节点共享时间戳时分页不遗漏、不重复
+"""
+
+import json
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy import delete
+
+from app.storage.query import decode_cursor, encode_cursor, iter_history, page_key_column
+from app.storage.writer import BatchWriter
+
+NODES = ('node-a', 'node-b', 'node-c')
+TIMESTAMPS = 10
+
+# 存储配置：SQLite单表（标准/紧凑）、按月分区、列式归档、DuckDB、分段存储
+STORAGES = {
+    'standard': {},
+    'compact': {'STORAGE_SCHEMA': 'compact'},
+    'monthly': {'STORAGE_PARTITIONING': 'monthly'},
+    'archive': {'ARCHIVE_ENABLED': True},
+    'duckdb': {'STORAGE_BACKEND': 'duckdb'},
+    'segments': {'STORAGE_BACKEND': 'segments'},
+}
+
+
+def fill(app):
+    """每个时间点每个节点一条记录（跨两个月份）"""
+    start = datetime(2024, 1, 1)
+    records = [
+        {'timestamp': start + timedelta(days=5 * i), 'node_id': node, 'scd40_co2': 400 + i}
+        for i in range(TIMESTAMPS) for node in NODES
+    ]
+    BatchWriter(app).flush(records)
+    if app.archive is not None:
+        # 第一个月移入归档，分页跨越归档和在线数据
+        table = app.sensor_model.__table__
+        app.archive.archive_month(app.storage.writer, (2024, 1))
+        with app.storage.write_transaction() as conn:
+            conn.execute(delete(table).where(table.c.timestamp < datetime(2024, 2, 1)))
+    return records
+
+
+@pytest.fixture
+def scans(app_for_storage, monkeypatch):
+    """记录存储后端scan的调用次数"""
+    backend = app_for_storage.storage_backend
+    calls = []
+    scan = backend.scan
+
+    def counting_scan(*args, **kwargs):
+        calls.append(kwargs)
+        return scan(*args, **kwargs)
+
+    monkeypatch.setattr(backend, 'scan', counting_scan)
+    return calls
+
+
+@pytest.fixture(params=list(STORAGES))
+def app_for_storage(make_app, request):
+    return make_app(**STORAGES[request.param])
+
+
+def keys(records):
+    return [(record['timestamp'], record['node_id']) for record in records]
+
+
+def read_pages(client, **params):
+    """按next游标读完所有页，返回 (记录列表, 页数)"""
+    records, pages, cursor = [], 0, None
+    while True:
+        query = dict(params, **({'cursor': cursor} if cursor else {}))
+        body = client.get('/api/history', query_string=query).get_json()
+        assert body['success']
+        records.extend(body['data'])
+        pages += 1
+        cursor = body['next']
+        if not cursor:
+            return records, pages
+
+
+@pytest.mark.parametrize('limit', [1, 2, 4, 7])
+def test_pages_cover_every_row_once(app_for_storage, scans, limit):
+    app = app_for_storage
+    fill(app)
+
+    records, pages = read_pages(app.test_client(), limit=limit)
+
+    assert len(records) == TIMESTAMPS * len(NODES)
+    assert len(set(keys(records))) == len(records)
+    assert [record['timestamp'] for record in records] == sorted((r['timestamp'] for r in records), reverse=True)
+    assert pages == -(-len(records) // limit)
+    # 每页只向存储后端发出一次有界扫描（limit+1行），游标之后的页带after
+    assert len(scans) == pages
+    assert all(call['limit'] == limit + 1 for call in scans)
+    assert [call['after'] is not None for call in scans] == [False] + [True] * (pages - 1)
+
+
+def test_iteration_in_both_directions(app_for_storage):
+    app = app_for_storage
+    records = fill(app)
+    expected = sorted(keys(records))
+    with app.app_context():
+        ascending = list(iter_history(['node_id', 'scd40_co2'], page_size=4, descending=False))
+        descending = list(iter_history(['node_id', 'scd40_co2'], page_size=4))
+    assert [(row.timestamp, row.node_id) for row in ascending] == expected
+    assert [(row.timestamp, row.node_id) for row in descending] == expected[::-1]
+
+
+def test_stream_matches_pages(app, client):
+    fill(app)
+    paged, _ = read_pages(client, limit=4)
+
+    body = client.get('/api/history', query_string={'stream': 'true'}).get_json()
+    assert body['count'] == len(paged)
+    assert keys(body['data']) == keys(paged)
+    assert body['next'] is None
+
+
+def test_stream_encodes_records_like_jsonify(app, client):
+    """流式输出的记录与jsonify的编码完全相同（紧凑分隔符、按键排序）"""
+    fill(app)
+    query = {'limit': 5}
+
+    def data_text(body):
+        start = body.index('"data":[') + len('"data":[')
+        end = body.index('}]', start) + 1
+        return body[start:end]
+
+    paged = client.get('/api/history', query_string=query).get_data(as_text=True)
+    streamed = client.get('/api/history', query_string=dict(query, stream='true')).get_data(as_text=True)
+    assert data_text(streamed) == data_text(paged)
+    assert json.loads(streamed)['data'] == json.loads(paged)['data']
+
+
+def test_stream_limit_returns_cursor(app, client):
+    fill(app)
+    first = client.get('/api/history', query_string={'stream': 'true', 'limit': 5}).get_json()
+    assert first['count'] == 5
+    rest, _ = read_pages(client, limit=100, cursor=first['next'])
+    assert len(set(keys(first['data'] + rest))) == TIMESTAMPS * len(NODES)
+
+
+def test_cursor_round_trip(app):
+    with app.app_context():
+        key = (datetime(2024, 1, 1, 0, 0, 0, 123456), 42 if page_key_column() == 'id' else 'node-a')
+        assert decode_cursor(encode_cursor(key)) == key
+
+
+@pytest.mark.parametrize('cursor', ['not-a-cursor', 'WzEsIngiXQ', 'InN0cmluZyI', 'WzEuNSwyXQ'])
+def test_invalid_cursor_rejected(client, cursor):
+    """无法解码、结构错误或次排序列类型不符（标准表为整数id）的游标返回400"""
+    response = client.get('/api/history', query_string={'cursor': cursor})
+    assert response.status_code == 400
@@ -0,0 +1,81 @@
+# tests/test_partitions.py
+"""
+按月分区测试 - 分区写入与汇总表同一事务、迁移、只读查询
+"""
+
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy import func, insert, select
+from sqlalchemy.exc import OperationalError
+
+import app.storage.backends as backends
+from app.models import SensorRollup
+from app.storage.partitions import MonthlyPartitionStore
+
+START = datetime(2024, 1, 20)
+
+
+def readings(count, start=START, step=timedelta(days=1)):
+    return [{'timestamp': start + step * i, 'node_id': 'edge-1', 'scd40_co2': 500 + i} for i in range(count)]
+
+
+def partition_rows(store):
+    return sum(store.scalars(lambda table: select(func.count()).select_from(table)))
+
+
+def rollup_rows(app):
+    with app.storage.read_connection() as conn:
+        return conn.execute(select(func.count()).select_from(SensorRollup.__table__)).scalar()
+
+
+@pytest.fixture
+def partitioned(make_app):
+    return make_app(STORAGE_PARTITIONING='monthly')
+
+
+def test_partition_rows_and_rollups_commit_together(partitioned, monkeypatch):
+    store = partitioned.partition_store
+    records = readings(60)   # 1月到3月
+
+    def failing_rollups(conn, records):
+        raise RuntimeError('crash before commit')
+
+    monkeypatch.setattr(backends, 'apply_rollups', failing_rollups)
+    with pytest.raises(RuntimeError):
+        partitioned.storage_backend.append_batch(records)
+    assert partition_rows(store) == 0
+
+    monkeypatch.undo()
+    partitioned.storage_backend.append_batch(records)
+    assert store.list_partitions() == [(2024, 1), (2024, 2), (2024, 3)]
+    assert partition_rows(store) == 60
+    assert rollup_rows(partitioned) > 0
+
+
+def test_migrate_moves_each_month_once(app, tmp_path):
+    table = app.sensor_model.__table__
+    with app.storage.write_transaction() as conn:
+        conn.execute(insert(table), readings(80))
+    store = MonthlyPartitionStore(tmp_path / 'migrated', table)
+    # 模拟上次迁移在复制后中断：分区中已有部分记录
+    with store.get_engine((2024, 1)).begin() as conn:
+        conn.execute(insert(table), readings(3))
+
+    assert store.migrate_from(app.storage.writer) == 80
+    assert partition_rows(store) == 80
+    with app.storage.read_connection() as conn:
+        assert conn.execute(select(func.count()).select_from(table)).scalar() == 0
+
+
+def test_reader_attaches_partitions_read_only(partitioned):
+    store = partitioned.partition_store
+    partitioned.storage_backend.append_batch(readings(4))
+    key = store.list_partitions()[0]
+
+    with store.reader_engine.connect() as conn, store.attached(conn, [key], readonly=True) as aliases:
+        with pytest.raises(OperationalError, match='readonly'):
+            conn.exec_driver_sql(f"DELETE FROM {aliases[key]}.{store.table.name}")
+
+    rows = store.fetch(lambda table: select(table.c.timestamp, table.c.scd40_co2))
+    assert [row.scd40_co2 for row in rows] == [500, 501, 502, 503]
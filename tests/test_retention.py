@@ -0,0 +1,92 @@
+# tests/test_retention.py
+"""
+数据保留测试 - 分块删除、增量VACUUM和磁盘占用统计
+"""
+
+import os
+from datetime import datetime, timedelta
+
+from sqlalchemy import func, insert, select
+
+from app.models import SensorRollup
+from app.storage.query import database_size
+from app.storage.rollups import to_epoch
+from app.storage.writer import BatchWriter
+
+
+def manager_for(app, chunk_size=10):
+    manager = app.retention_manager
+    manager.chunk_size = chunk_size
+    manager.chunk_pause = 0
+    return manager
+
+
+def count(app, table):
+    with app.storage.read_connection() as conn:
+        return conn.execute(select(func.count()).select_from(table)).scalar()
+
+
+def test_prune_rollup_with_shared_bucket_start(app):
+    """同一桶起始时间的行数超过chunk_size时仍能删完（多节点汇总表）"""
+    manager = manager_for(app)
+    table = SensorRollup.__table__
+    now = datetime.utcnow()
+    old = int(to_epoch(now - timedelta(days=30)))
+    recent = int(to_epoch(now))
+    rows = [
+        {'tier': 60, 'metric': 'scd40_co2', 'bucket_start': start, 'node_id': f'node-{i}',
+         'count': 1, 'min': 1.0, 'max': 1.0, 'sum': 1.0, 'last': 1.0, 'last_ts': float(start)}
+        for start in (old, recent) for i in range(35)
+    ]
+    with app.storage.write_transaction() as conn:
+        conn.execute(insert(table), rows)
+
+    removed = manager._prune_rollup(app.storage.writer, 60, now - timedelta(days=14))
+
+    assert removed == 35
+    assert count(app, table) == 35
+
+
+def test_prune_raw_with_shared_timestamp(make_app):
+    """紧凑模式（WITHOUT ROWID）下同一时间戳的多节点记录按主键分块删除"""
+    app = make_app(STORAGE_SCHEMA='compact')
+    manager = manager_for(app)
+    now = datetime.utcnow().replace(microsecond=0)
+    stamps = (now - timedelta(days=200), now)
+    BatchWriter(app).flush([
+        {'timestamp': stamp, 'node_id': f'node-{i}', 'scd40_co2': 500}
+        for stamp in stamps for i in range(25)
+    ])
+
+    removed, dropped = manager._prune_raw(app.storage.writer, now - timedelta(days=180))
+
+    assert (removed, dropped) == (25, [])
+    assert count(app, app.sensor_model.__table__) == 25
+
+
+def test_run_once_vacuums_all_free_pages(app):
+    """增量VACUUM释放全部空闲页（不超过vacuum_pages时），而不是只释放一页"""
+    manager = manager_for(app, chunk_size=5000)
+    manager.vacuum_pages = 100000
+    now = datetime.utcnow()
+    BatchWriter(app).flush([
+        {'timestamp': now - timedelta(days=365, minutes=i), 'scd40_co2': 500, 'dht22_temperature': 21.5}
+        for i in range(20000)
+    ])
+
+    result = manager.run_once()
+
+    assert result['rows_removed']['sensor_data'] == 20000
+    assert result['vacuum_pages_freed'] > 1
+    with app.storage.writer.connect() as conn:
+        assert conn.exec_driver_sql("PRAGMA freelist_count").scalar() == 0
+
+
+def test_database_size_includes_wal(app):
+    BatchWriter(app).flush([{'timestamp': datetime(2024, 1, 1), 'scd40_co2': 500}])
+    path = app.storage.database_path
+    files = [f"{path}{suffix}" for suffix in ('', '-wal', '-shm')]
+
+    with app.app_context():
+        assert database_size() == sum(os.path.getsize(name) for name in files if os.path.exists(name))
+        assert database_size() > os.path.getsize(path)
@@ -0,0 +1,208 @@
+# tests/test_segments.py
+"""
+分段存储测试 - 多个块的往返读写、重新打开、写入中断后的恢复、阈值查询和聚合
+"""
+
+import random
+from datetime import datetime, timedelta
+
+import pytest
+
+from app.models import SensorData
+from app.storage.segments import BLOCK_HEADER, ROWS, SegmentBackend, to_micros
+from app.storage.writer import BatchWriter
+
+TABLE = SensorData.__table__
+COLUMNS = ['node_id', 'scd40_co2', 'scd40_temperature', 'sgp41_voc_index']
+START = datetime(2024, 3, 1)
+
+
+def make_records(count=120, nodes=('node-a',), seed=1):
+    """每7分钟（带微秒）一条记录，跨越多个1小时的块；部分数值为空"""
+    rng = random.Random(seed)
+    records = []
+    for i in range(count):
+        for index, node in enumerate(nodes):
+            records.append({
+                'timestamp': START + timedelta(minutes=7 * i, seconds=index, microseconds=rng.randrange(1_000_000)),
+                'node_id': node,
+                'scd40_co2': None if i % 9 == 4 else rng.randrange(400, 2000),
+                'scd40_temperature': None if i % 5 == 2 else round(rng.uniform(15, 30), 3),
+                'sgp41_voc_index': rng.randrange(1, 500),
+                'sgp41_voc_index_min': None,
+                'sgp41_voc_index_max': None,
+                'sgp41_voc_index_count': None,
+            })
+    return records
+
+
+def open_store(path):
+    return SegmentBackend(path, TABLE, fsync=False)
+
+
+def write(backend, records, batch=10):
+    for i in range(0, len(records), batch):
+        backend.append_batch(records[i:i + batch])
+
+
+def as_rows(records):
+    return [(record['timestamp'], *(record[name] for name in COLUMNS)) for record in records]
+
+
+def stored(backend):
+    return [tuple(row) for row in backend.scan(COLUMNS)]
+
+
+@pytest.fixture
+def store_path(tmp_path):
+    return tmp_path / 'segments'
+
+
+def test_round_trip_across_blocks(store_path):
+    records = make_records()
+    backend = open_store(store_path)
+    write(backend, records)
+
+    rows = backend.scan(COLUMNS)
+    assert [tuple(row) for row in rows] == as_rows(records)
+    # 整数列还原为int，空值为None
+    assert all(type(row.scd40_co2) in (int, type(None)) for row in rows)
+    assert any(row.scd40_co2 is None for row in rows)
+    # 最新时段在头部，之前的时段已封存为块
+    stats = backend.stores['node-a'].segment_stats()
+    assert stats['blocks'] > 10 and stats['head_rows'] > 0
+    backend.close()
+
+
+def test_reopen_returns_identical_rows(store_path):
+    records = make_records(nodes=('node-a', 'node-b'))
+    backend = open_store(store_path)
+    write(backend, records)
+    before = stored(backend)
+    bounds = backend.time_bounds()
+    backend.close()
+
+    reopened = open_store(store_path)
+    assert stored(reopened) == before
+    assert reopened.time_bounds() == bounds
+    assert reopened.nodes() == ['node-a', 'node-b']
+    # 重新打开后继续写入，id不重复
+    reopened.append_batch([dict(records[-1], timestamp=records[-1]['timestamp'] + timedelta(minutes=1))])
+    ids = [row.id for row in reopened.scan(['id'])]
+    assert len(ids) == len(set(ids)) == len(records) + 1
+    reopened.close()
+
+
+def test_truncated_head_drops_partial_record(store_path):
+    records = make_records()
+    backend = open_store(store_path)
+    write(backend, records)
+    backend.close()
+
+    head = store_path / 'node-a' / 'head.bin'
+    with open(head, 'r+b') as f:
+        f.truncate(head.stat().st_size - 3)
+
+    reopened = open_store(store_path)
+    assert stored(reopened) == as_rows(records[:-1])
+    reopened.append_batch(records[-1:])
+    assert stored(reopened) == as_rows(records)
+    reopened.close()
+
+
+def test_truncated_segment_drops_last_block(store_path):
+    records = make_records()
+    backend = open_store(store_path)
+    write(backend, records)
+    lost = max((info for infos in backend.stores['node-a'].files['scd40_co2'].blocks.values() for info in infos),
+               key=lambda info: info.offset)
+    backend.close()
+
+    path = store_path / 'node-a' / 'scd40_co2.seg'
+    with open(path, 'r+b') as f:
+        f.truncate(path.stat().st_size - 5)
+
+    reopened = open_store(store_path)
+    expected = [
+        dict(record, scd40_co2=None) if lost.first <= to_micros(record['timestamp']) <= lost.last else record
+        for record in records
+    ]
+    assert stored(reopened) == as_rows(expected)
+    # 截断后的文件可以继续追加
+    later = [dict(record, timestamp=record['timestamp'] + timedelta(days=1)) for record in records[:20]]
+    write(reopened, later)
+    reopened.close()
+
+    again = open_store(store_path)
+    assert stored(again) == as_rows(expected + later)
+    again.close()
+
+
+def test_corrupted_block_is_discarded(store_path):
+    records = make_records()
+    backend = open_store(store_path)
+    write(backend, records)
+    rows_file = backend.stores['node-a'].files[ROWS]
+    last = max((info for infos in rows_file.blocks.values() for info in infos), key=lambda info: info.offset)
+    backend.close()
+
+    # 最后一个块的内容损坏（长度完整，校验和不符）
+    with open(store_path / 'node-a' / f'{ROWS}.seg', 'r+b') as f:
+        f.seek(last.offset + BLOCK_HEADER.size)
+        byte = f.read(1)
+        f.seek(last.offset + BLOCK_HEADER.size)
+        f.write(bytes([byte[0] ^ 0xFF]))
+
+    reopened = open_store(store_path)
+    kept = [record for record in records if not last.first <= to_micros(record['timestamp']) <= last.last]
+    assert stored(reopened) == as_rows(kept)
+    reopened.close()
+
+
+@pytest.mark.parametrize('above, below', [(1500, None), (None, 600), (800, 1200), (1999, None), (None, 0)])
+def test_threshold_matches_brute_force(store_path, above, below):
+    records = make_records(nodes=('node-a', 'node-b'))
+    backend = open_store(store_path)
+    write(backend, records)
+
+    expected = [
+        (record['timestamp'], record['scd40_co2']) for record in records
+        if record['scd40_co2'] is not None and (above is None or record['scd40_co2'] > above) and
+        (below is None or record['scd40_co2'] < below)
+    ]
+    assert [tuple(row) for row in backend.threshold('scd40_co2', above=above, below=below)] == expected
+    window = (START + timedelta(hours=3), START + timedelta(hours=9))
+    assert [tuple(row) for row in backend.threshold('scd40_co2', above=above, below=below, start=window[0],
+                                                   end=window[1])] == [
+        row for row in expected if window[0] <= row[0] <= window[1]]
+    backend.close()
+
+
+@pytest.mark.parametrize('bucket_seconds', [600, 3600, 86400])
+def test_aggregate_matches_sqlite(app, store_path, bucket_seconds):
+    records = make_records(nodes=('node-a', 'node-b'))
+    for index, record in enumerate(records[::3]):
+        # 部分记录带窗口统计，按采样数加权
+        record.update(sgp41_voc_index_min=record['sgp41_voc_index'] - 5,
+                      sgp41_voc_index_max=record['sgp41_voc_index'] + index % 7, sgp41_voc_index_count=3)
+    assert BatchWriter(app).flush(records)
+    backend = open_store(store_path)
+    write(backend, records)
+
+    metrics = ['scd40_co2', 'scd40_temperature', 'sgp41_voc_index']
+    for start, end in [(START, None), (START + timedelta(minutes=95), START + timedelta(hours=7, minutes=20))]:
+        expected = app.storage_backend.aggregate(metrics, bucket_seconds, start, end)
+        actual = backend.aggregate(metrics, bucket_seconds, start, end)
+        assert [bucket for bucket, _ in actual] == [bucket for bucket, _ in expected]
+        for (_, values), (_, reference) in zip(actual, expected):
+            assert values.keys() == reference.keys()
+            for metric, bucket in values.items():
+                other = reference[metric]
+                assert (bucket.count, bucket.min, bucket.max, bucket.last) == \
+                       (other.count, other.min, other.max, other.last)
+                assert bucket.sum == pytest.approx(other.sum)
+                # 整数列的最小/最大/最后一个值为int
+                expected_type = float if metric == 'scd40_temperature' else int
+                assert {type(bucket.min), type(bucket.max), type(bucket.last)} == {expected_type}
+                assert {type(other.min), type(other.max), type(other.last)} == {expected_type}
+    backend.close()
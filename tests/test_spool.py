@@ -0,0 +1,98 @@
+# tests/test_spool.py
+"""
+写入缓冲文件回放测试
+"""
+
+import json
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy.exc import OperationalError
+
+from app.storage.query import count_rows, existing_keys
+from app.storage.writer import BatchWriter
+
+BAD_CO2 = -1
+
+
+def readings(count, start=datetime(2024, 1, 1)):
+    return [{'timestamp': start + timedelta(seconds=30 * i), 'scd40_co2': 500 + i} for i in range(count)]
+
+
+@pytest.fixture
+def writer(app, monkeypatch):
+    """回放时含 BAD_CO2 的批次总是写入失败（模拟数据错误）"""
+    backend = app.storage_backend
+    append_batch = backend.append_batch
+
+    def failing_append(records, rollup_records=None):
+        if any(record.get('scd40_co2') == BAD_CO2 for record in records):
+            raise ValueError('invalid reading')
+        return append_batch(records, rollup_records=rollup_records)
+
+    monkeypatch.setattr(backend, 'append_batch', failing_append)
+    return BatchWriter(app, spool=app.write_spool, replay_batch_size=100, max_replay_attempts=3)
+
+
+def test_always_failing_batch_is_dead_lettered(app, writer):
+    records = readings(10)
+    records[4]['scd40_co2'] = BAD_CO2
+    app.write_spool.append(records)
+    app.write_spool.append(readings(5, start=datetime(2024, 1, 2)))
+
+    # 前两次整批失败，缓冲文件不推进
+    for _ in range(2):
+        assert writer.replay_spool(force=True) == 0
+        assert app.write_spool.pending == 15
+
+    # 第三次逐条写入，失败的记录移入死信文件，后面的批次继续回放
+    assert writer.replay_spool(force=True) == 15
+    assert not app.write_spool.has_pending()
+    assert writer.get_stats()['dead_lettered'] == 1
+    with app.app_context():
+        assert count_rows() == 14
+
+    lines = app.write_spool.dead_letter_path.read_text(encoding='utf-8').splitlines()
+    assert [json.loads(line)['scd40_co2'] for line in lines] == [BAD_CO2]
+
+
+def test_transient_errors_are_retried(app, writer, monkeypatch):
+    """数据库暂时不可写时不隔离记录，恢复后整批回放"""
+    app.write_spool.append(readings(10))
+    append_batch = app.storage_backend.append_batch
+
+    def locked(records, rollup_records=None):
+        raise OperationalError('INSERT', {}, Exception('database is locked'))
+
+    monkeypatch.setattr(app.storage_backend, 'append_batch', locked)
+    for _ in range(5):
+        assert writer.replay_spool(force=True) == 0
+    assert app.write_spool.pending == 10
+    assert writer.get_stats()['dead_lettered'] == 0
+
+    monkeypatch.setattr(app.storage_backend, 'append_batch', append_batch)
+    assert writer.replay_spool(force=True) == 10
+    with app.app_context():
+        assert count_rows() == 10
+
+
+def test_replay_skips_already_written_records(app, writer):
+    records = readings(10)
+    writer.flush([dict(record) for record in records[:6]])
+    app.write_spool.append(records)
+
+    assert writer.replay_spool(force=True) == 10
+    with app.app_context():
+        assert count_rows() == 10
+
+
+@pytest.mark.parametrize('partitioning', ['none', 'monthly'])
+def test_existing_keys_only_returns_requested_keys(make_app, partitioning):
+    app = make_app(STORAGE_PARTITIONING=partitioning)
+    BatchWriter(app).flush(readings(10))
+    node = app.config['NODE_ID']
+    stamps = [record['timestamp'] for record in readings(10)]
+    wanted = {(node, stamps[2]), (node, stamps[7]), ('other', stamps[3]), (node, stamps[0] - timedelta(days=1))}
+
+    with app.app_context():
+        assert existing_keys(wanted) == {(node, stamps[2]), (node, stamps[7])}
@@ -0,0 +1,144 @@
+# tests/test_uploader.py
+"""
+存储转发上传测试 - 高水位只在确认后推进、确认丢失后以相同幂等键重发、413时批大小减半、
+写入缓冲文件有待回放记录时暂停
+"""
+
+import gzip
+import json
+from datetime import datetime, timedelta
+
+import pytest
+
+from app.storage.delta import decode_batch
+from app.storage.uploader import UploadError, Uploader
+from app.storage.writer import BatchWriter
+
+START = datetime(2024, 1, 1)
+ROWS = 10
+
+
+class Central:
+    """模拟中心节点：按幂等键记录已处理的批次，fail为每次发送前调用的钩子"""
+
+    def __init__(self):
+        self.batches = {}
+        self.keys = []
+        self.fail = None
+
+    def send(self, body, key):
+        items = decode_batch(json.loads(gzip.decompress(body)))
+        self.keys.append(key)
+        if self.fail:
+            self.fail(key, items)
+        replayed = key in self.batches
+        self.batches.setdefault(key, items)
+        return {'success': True, 'accepted': 0 if replayed else len(items), 'rejected': 0, 'replayed': replayed}
+
+    @property
+    def timestamps(self):
+        return [item['timestamp'] for items in self.batches.values() for item in items]
+
+
+@pytest.fixture
+def local(app):
+    node = app.config['NODE_ID']
+    BatchWriter(app).flush([
+        {'timestamp': START + timedelta(seconds=30 * i), 'node_id': node, 'scd40_co2': 500 + i}
+        for i in range(ROWS)
+    ])
+    return [START + timedelta(seconds=30 * i) for i in range(ROWS)]
+
+
+@pytest.fixture
+def central():
+    return Central()
+
+
+@pytest.fixture
+def make_uploader(app, tmp_path, central, monkeypatch):
+    def factory(batch_size=4):
+        uploader = Uploader(app, url='http://central/api/ingest', state_path=tmp_path / 'upload_state.json',
+                            node=app.config['NODE_ID'], batch_size=batch_size)
+        monkeypatch.setattr(uploader, 'send', central.send)
+        return uploader
+    return factory
+
+
+def test_uploads_everything_in_batches(local, central, make_uploader):
+    uploader = make_uploader()
+    result = uploader.run_once()
+
+    assert result['caught_up'] and result['rows'] == ROWS and result['batches'] == 3
+    assert central.timestamps == local
+    assert uploader.high_water_mark == local[-1]
+    # 追平后没有新记录可上传
+    assert uploader.run_once()['rows'] == 0
+    assert len(central.keys) == 3
+
+
+def test_high_water_mark_advances_only_after_confirmation(local, central, make_uploader):
+    def reject_second(key, items):
+        if len(central.keys) == 2:
+            raise UploadError('HTTP 503: 服务不可用', 503)
+    central.fail = reject_second
+
+    uploader = make_uploader()
+    result = uploader.run_once()
+    assert result['rows'] == 4 and result['error']
+    assert uploader.high_water_mark == local[3]
+    assert uploader.failures == 1
+
+    # 重新打开状态文件，从确认的位置继续
+    central.fail = None
+    resumed = make_uploader()
+    assert resumed.high_water_mark == local[3]
+    resumed.run_once()
+    assert central.timestamps == local
+    assert resumed.state['uploaded'] == ROWS
+
+
+def test_lost_ack_resends_same_key(local, central, make_uploader):
+    def drop_first_ack(key, items):
+        if len(central.keys) == 1:
+            # 中心节点已写入，但响应在网络中丢失
+            central.batches[key] = items
+            raise UploadError('网络错误: timed out')
+    central.fail = drop_first_ack
+
+    uploader = make_uploader()
+    assert uploader.run_once()['error']
+    assert uploader.high_water_mark is None
+
+    uploader.run_once()
+    assert central.keys[0] == central.keys[1]
+    assert len(set(central.keys)) == 3
+    assert central.timestamps == local
+
+
+def test_payload_too_large_halves_batch_size(local, central, make_uploader):
+    def limit(key, items):
+        if len(items) > 2:
+            raise UploadError('HTTP 413: 请求体超过大小限制', 413)
+    central.fail = limit
+
+    uploader = make_uploader(batch_size=8)
+    result = uploader.run_once()
+
+    assert uploader.batch_size == 2
+    assert result['caught_up'] and result['error'] is None
+    assert central.timestamps == local
+    assert all(len(items) <= 2 for items in central.batches.values())
+
+
+def test_paused_while_spool_has_pending_records(app, local, central, make_uploader, monkeypatch):
+    monkeypatch.setattr(app.write_spool, 'has_pending', lambda: True)
+    uploader = make_uploader()
+
+    result = uploader.run_once()
+    assert result['rows'] == 0 and not result['caught_up'] and '缓冲' in result['error']
+    assert central.keys == []
+    assert uploader.high_water_mark is None
+
+    monkeypatch.setattr(app.write_spool, 'has_pending', lambda: False)
+    assert uploader.run_once()['rows'] == ROWS